@@ -0,0 +1,124 @@
+#ifndef DESAN_AVAILABLE_CHECK_WALKER_H
+#define DESAN_AVAILABLE_CHECK_WALKER_H
+
+#include "DESAN/CheckGraphBuilder.h"
+
+#include "llvm/ADT/ArrayRef.h"
+#include "llvm/ADT/BitVector.h"
+#include "llvm/ADT/DenseMap.h"
+#include "llvm/ADT/ScopedHashTable.h"
+#include "llvm/ADT/SmallVector.h"
+#include "llvm/Support/Allocator.h"
+
+#include <cstdint>
+#include <tuple>
+#include <utility>
+
+namespace llvm {
+class BasicBlock;
+class Function;
+class Instruction;
+class Value;
+} // namespace llvm
+
+namespace desan {
+
+class ShadowBarrierModel;
+
+class AvailableCheckWalker {
+public:
+  explicit AvailableCheckWalker(CheckGraphBuilder &Builder);
+
+  void findRedundantChecks(const CheckGraphBuilder::VariableCheckGroups &Groups,
+                           llvm::SmallVectorImpl<unsigned> &Redundant);
+
+  void setEliminateWrites(bool Eliminate) { EliminateWrites = Eliminate; }
+
+private:
+  struct AnchoredCheck {
+    llvm::Instruction *Anchor = nullptr;
+    unsigned Check = 0;
+    unsigned Group = 0;
+    unsigned Location = 0;
+    unsigned Base = 0;
+  };
+
+  struct AvailableCheck {
+    bool Available = false;
+    uint64_t AccessSize = 0;
+    bool WriteAvailable = false;
+    uint64_t WriteSize = 0;
+    unsigned Generation = 0;
+    unsigned Epoch = 0;
+  };
+
+  struct AvailableInterval {
+    int64_t Begin = 0;
+    int64_t End = 0;
+    unsigned Generation = 0;
+    unsigned Epoch = 0;
+    bool Write = false;
+    const AvailableInterval *Next = nullptr;
+  };
+
+  using LocationKey =
+      std::tuple<unsigned, unsigned, int64_t, const llvm::Value *>;
+  using AvailableCheckTable = llvm::ScopedHashTable<unsigned, AvailableCheck>;
+  using BarrierTable = llvm::ScopedHashTable<unsigned, unsigned>;
+  using IntervalTable =
+      llvm::ScopedHashTable<unsigned, const AvailableInterval *>;
+  using BlockChecks =
+      llvm::DenseMap<const llvm::BasicBlock *,
+                     llvm::SmallVector<AnchoredCheck, 4>>;
+
+  void walkFunction(llvm::Function &F, BlockChecks &Checks,
+                    llvm::SmallVectorImpl<unsigned> &Redundant);
+
+  void processBlock(llvm::BasicBlock *BB, const BlockChecks &Checks,
+                    llvm::SmallVectorImpl<unsigned> &Redundant);
+
+  void processCheck(const AnchoredCheck &Check,
+                    llvm::SmallVectorImpl<unsigned> &Redundant);
+
+  bool isCoveredByInterval(const AnchoredCheck &Check,
+                           const CheckedVariable &Var);
+
+  void makeIntervalAvailable(const AnchoredCheck &Check,
+                             const CheckedVariable &Var);
+
+  unsigned getLocation(unsigned Group, const CheckedVariable &Var);
+
+  unsigned getBase(const CheckedVariable &Var);
+
+  bool usesFreeBarriers(const CheckedVariable &Var) const;
+
+  unsigned getBarrierEpoch(const AnchoredCheck &Check,
+                           const CheckedVariable &Var, bool ByBase) const;
+
+  bool passedBarrier(unsigned Epoch, const AnchoredCheck &Check,
+                     const CheckedVariable &Var, bool ByBase);
+
+  bool mayHaveBarrier(const AnchoredCheck &Check, const CheckedVariable &Var,
+                      bool ByBase);
+
+  CheckGraphBuilder &Builder;
+  AvailableCheckTable AvailableChecks;
+  BarrierTable BarrierEpochs;
+  IntervalTable AvailableIntervals;
+  BarrierTable BaseBarrierEpochs;
+  llvm::BumpPtrAllocator IntervalAllocator;
+  llvm::DenseMap<LocationKey, unsigned> Locations;
+  llvm::DenseMap<std::pair<unsigned, const llvm::Value *>, unsigned> Bases;
+  llvm::BitVector GroupsWithBarriers;
+  llvm::BitVector BasesWithBarriers;
+  ShadowBarrierModel *Barriers = nullptr;
+  llvm::SmallVector<const llvm::Instruction *, 16> BarrierPath;
+  unsigned CurrentGeneration = 0;
+  unsigned LastGeneration = 0;
+  unsigned LastEpoch = 0;
+  bool EliminateWrites = false;
+};
+
+} // namespace desan
+
+#endif // DESAN_AVAILABLE_CHECK_WALKER_H
@@ -0,0 +1,65 @@
+#ifndef DESAN_CHECK_COALESCER_H
+#define DESAN_CHECK_COALESCER_H
+
+#include "DESAN/CheckGraphBuilder.h"
+
+#include "llvm/ADT/ArrayRef.h"
+#include "llvm/ADT/DenseMap.h"
+#include "llvm/ADT/SetVector.h"
+#include "llvm/ADT/SmallVector.h"
+
+#include <cstdint>
+
+namespace llvm {
+class BasicBlock;
+class Function;
+class Instruction;
+class Value;
+} // namespace llvm
+
+namespace desan {
+
+class CheckCoalescer {
+public:
+  explicit CheckCoalescer(CheckGraphBuilder &Builder);
+
+  unsigned coalesceChecks(const CheckGraphBuilder::VariableCheckGroups &Groups,
+                          llvm::SmallVectorImpl<unsigned> &Replaced);
+
+  llvm::ArrayRef<llvm::Function *> changedFunctions() const {
+    return ChangedFunctions.getArrayRef();
+  }
+
+private:
+  struct TracePosition {
+    const llvm::BasicBlock *Head = nullptr;
+    unsigned Index = 0;
+  };
+
+  struct ClusterMember {
+    unsigned Check = 0;
+    llvm::Instruction *Anchor = nullptr;
+    int64_t Begin = 0;
+    int64_t End = 0;
+  };
+
+  void computeTraces(llvm::Function &F);
+
+  bool comesBefore(const llvm::Instruction *LHS,
+                   const llvm::Instruction *RHS) const;
+
+  bool isCleanPath(llvm::Instruction *From, llvm::Instruction *To) const;
+
+  bool coalesceRun(llvm::ArrayRef<ClusterMember> Run, llvm::Value *Root,
+                   AccessType Access, bool Recover,
+                   llvm::SmallVectorImpl<unsigned> &Replaced);
+
+  CheckGraphBuilder &Builder;
+  llvm::DenseMap<const llvm::BasicBlock *, TracePosition> Traces;
+  llvm::DenseMap<const llvm::BasicBlock *, llvm::BasicBlock *> TraceSuccessors;
+  llvm::SetVector<llvm::Function *> ChangedFunctions;
+};
+
+} // namespace desan
+
+#endif // DESAN_CHECK_COALESCER_H
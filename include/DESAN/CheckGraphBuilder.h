@@ -2,12 +2,18 @@
 #define DESAN_CHECK_GRAPH_BUILDER_H
 
 #include "DESAN/CheckedVariableAnalyzer.h"
+#include "DESAN/DominanceIndex.h"
+#include "DESAN/ReachabilityIndex.h"
 
 #include "llvm/ADT/ArrayRef.h"
+#include "llvm/ADT/DenseMap.h"
+#include "llvm/ADT/DenseSet.h"
 #include "llvm/ADT/SmallVector.h"
 #include "llvm/IR/BasicBlock.h"
 #include "llvm/IR/InstrTypes.h"
+#include "llvm/IR/PassManager.h"
 #include "llvm/IR/Value.h"
+#include "llvm/Support/Allocator.h"
 #include "llvm/Support/raw_ostream.h"
 
 #include <map>
@@ -19,23 +25,40 @@
 #include <vector>
 
 namespace llvm {
+class AAResults;
 class DominatorTree;
 class Function;
+class LazyValueInfo;
+class LoopInfo;
+class MemorySSA;
 class Module;
+class ScalarEvolution;
+class TargetLibraryInfo;
 } // namespace llvm
 
 namespace desan {
 
+class CheckedVariableInfo;
+
 struct VariableKey {
   SanitizerKind Sanitizer = SanitizerKind::Unknown;
   llvm::Value *Base = nullptr;
-  llvm::SmallVector<llvm::Value *, 4> Offsets;
+  llvm::ArrayRef<llvm::Value *> Offsets;
   bool HasStaticByteOffset = false;
   int64_t StaticByteOffset = 0;
+  unsigned Hash = 0;
 };
 
-struct VariableKeyLess {
-  bool operator()(const VariableKey &LHS, const VariableKey &RHS) const;
+struct VariableKeyInfo {
+  static VariableKey getEmptyKey();
+  static VariableKey getTombstoneKey();
+  static unsigned getHashValue(const VariableKey &Key);
+  static bool isEqual(const VariableKey &LHS, const VariableKey &RHS);
+};
+
+struct VariableCheckGroup {
+  VariableKey Key;
+  llvm::SmallVector<unsigned, 8> Checks;
 };
 
 struct CheckNode {
@@ -61,41 +84,121 @@ struct CheckGraph {
 class CheckGraphBuilder {
 public:
   using CheckStat = SanitizerCheckCollector::CheckStat;
-  using CoreCheckKey = std::pair<SanitizerKind, std::string>;
-  using VariableCheckGroups =
-      std::map<VariableKey, llvm::SmallVector<CheckedVariable, 8>,
-               VariableKeyLess>;
+  using CoreCheckKey = std::pair<SanitizerKind, CheckTypeId>;
+  using VariableCheckGroups = std::vector<VariableCheckGroup>;
 
-  CheckGraphBuilder(llvm::Module &M, llvm::ArrayRef<CheckStat> CoreChecks);
+  CheckGraphBuilder(llvm::Module &M, llvm::ArrayRef<CheckStat> CoreChecks,
+                    llvm::FunctionAnalysisManager *FAM = nullptr);
   ~CheckGraphBuilder();
 
+  llvm::Module &getModule() const { return M; }
+
+  void analyzeFunctions(unsigned Threads);
+
   const VariableCheckGroups &groupChecksByVariable();
 
+  const VariableCheckGroups &groupChecksInFunction(llvm::Function &F);
+
+  void invalidateFunction(llvm::Function &F);
+
+  const CheckedVariable &getCheck(unsigned Index) const {
+    return Checks[Index];
+  }
+
   std::unique_ptr<CheckGraph> buildGraphForVariable(CheckedVariable Var);
 
+  std::unique_ptr<CheckGraph>
+  buildGraphForGroup(const VariableCheckGroup &Group);
+
   void computeReachability(CheckGraph &Graph);
 
   void computeDominance(CheckGraph &Graph);
 
+  llvm::DominatorTree &getDominatorTree(llvm::Function &F);
+
+  llvm::LoopInfo &getLoopInfo(llvm::Function &F);
+
+  llvm::ScalarEvolution &getScalarEvolution(llvm::Function &F);
+
+  llvm::AAResults &getAliasAnalysis(llvm::Function &F);
+
+  const llvm::TargetLibraryInfo &getTargetLibraryInfo(llvm::Function &F);
+
+  llvm::MemorySSA &getMemorySSA(llvm::Function &F);
+
+  llvm::LazyValueInfo *getLazyValueInfo(llvm::Function &F);
+
+  llvm::Value *getUnifiedBase(llvm::Value *Base) const;
+
+  llvm::Value *getUnifiedValue(llvm::Value *V) const;
+
 private:
-  VariableKey makeVariableKey(const CheckedVariable &Var) const;
+  struct FunctionAnalyses;
+
+  FunctionAnalyses &getFunctionAnalyses(llvm::Function &F);
+
+  VariableKey makeVariableKey(const CheckedVariable &Var);
+
+  llvm::ArrayRef<llvm::Value *>
+  internOffsets(llvm::ArrayRef<llvm::Value *> Offsets);
 
   bool isCoreCheck(const SanitizerCheckCollector::ClassifiedCheck &Check) const;
 
-  bool isReachable(const CheckNode &From, const CheckNode &To) const;
+  bool isReachable(const CheckNode &From, const CheckNode &To);
 
-  llvm::DominatorTree &getDominatorTree(llvm::Function &F);
+  void addCheck(CheckedVariable Var);
+
+  void addFunctionChecks(llvm::Function &F);
+
+  void
+  unifyFunctionChecks(llvm::Function &F,
+                      llvm::MutableArrayRef<CheckedVariable> FunctionChecks);
+
+  void uniteBases(llvm::Value *Base, llvm::Value *Root);
+
+  void releaseChecks();
+
+  const CheckedVariableInfo &getCheckedVariables(llvm::Function &F);
+
+  DominanceIndex &getDominanceIndex(llvm::Function &F);
+
+  ReachabilityIndex &getReachabilityIndex(llvm::Function &F);
 
   llvm::Module &M;
+  llvm::FunctionAnalysisManager *FAM = nullptr;
   std::set<CoreCheckKey> CoreCheckSet;
   CheckedVariableAnalyzer Analyzer;
   SanitizerCheckCollector Collector;
+  std::vector<CheckedVariable> Checks;
   VariableCheckGroups Groups;
+  llvm::DenseMap<VariableKey, unsigned, VariableKeyInfo> GroupIndices;
+  llvm::DenseSet<llvm::ArrayRef<llvm::Value *>> OffsetPool;
+  llvm::BumpPtrAllocator OffsetAllocator;
+  llvm::DenseMap<llvm::Value *, llvm::Value *> UnifiedBases;
+  llvm::DenseMap<llvm::Value *, llvm::Value *> UnifiedValues;
+  std::map<const llvm::Function *, std::unique_ptr<CheckedVariableInfo>>
+      AnalyzedVariables;
   std::map<llvm::Function *, std::unique_ptr<llvm::DominatorTree>>
       DominatorTrees;
+  std::map<llvm::Function *, std::unique_ptr<FunctionAnalyses>>
+      FunctionAnalysisCache;
+  std::map<llvm::Function *, std::unique_ptr<DominanceIndex>>
+      DominanceIndices;
+  std::map<llvm::Function *, std::unique_ptr<ReachabilityIndex>>
+      ReachabilityIndices;
   bool GroupsComputed = false;
 };
 
+llvm::Instruction *findCheckAnchor(llvm::CallBase *CB);
+
+bool isSanitizerRuntimeCall(const llvm::CallBase &CB);
+
+bool isRecoverableCheck(const llvm::CallBase &CB);
+
+bool isSanitizerReportBlock(const llvm::BasicBlock &BB);
+
+bool mayChangeShadow(const llvm::Instruction &I);
+
 void printVariableKey(llvm::raw_ostream &OS, const VariableKey &Key);
 
 void printCheckGraph(llvm::raw_ostream &OS, const CheckGraph &Graph);
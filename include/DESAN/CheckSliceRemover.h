@@ -4,13 +4,17 @@
 #include "DESAN/CheckGraphBuilder.h"
 #include "DESAN/SanitizerCheckCollector.h"
 
+#include "llvm/ADT/ArrayRef.h"
+#include "llvm/ADT/DenseMap.h"
 #include "llvm/ADT/SmallPtrSet.h"
 #include "llvm/ADT/SmallVector.h"
 #include "llvm/IR/BasicBlock.h"
 #include "llvm/IR/InstrTypes.h"
 #include "llvm/IR/Instruction.h"
+#include "llvm/IR/ValueHandle.h"
 
 #include <cstddef>
+#include <memory>
 
 namespace llvm {
 class Function;
@@ -37,11 +41,70 @@ public:
 
   bool removeCheckSlice(CheckNode *N);
 
+  std::size_t removeCheckSlices(llvm::ArrayRef<llvm::CallBase *> Calls);
+
   std::size_t cleanupDeadInstructions();
 
   bool simplifyCFG();
 
+  void releaseFunction(const llvm::Function &F);
+
+  bool changedFunction(const llvm::Function &F) const {
+    return ChangedFunctions.contains(&F);
+  }
+
+  bool changedCFG(const llvm::Function &F) const {
+    return CFGChangedFunctions.contains(&F);
+  }
+
+  bool changedModule() const { return !ChangedFunctions.empty(); }
+
 private:
+  struct InstructionOwnership {
+    bool SanitizerOnly = false;
+    llvm::SmallVector<llvm::CallBase *, 2> Owners;
+  };
+
+  struct BlockOwnership {
+    unsigned NonSanitizerInstructions = 0;
+    llvm::SmallVector<llvm::CallBase *, 2> Checks;
+    llvm::SmallVector<llvm::CallBase *, 2> Owners;
+  };
+
+  struct FunctionOwnership {
+    llvm::DenseMap<const llvm::Instruction *, InstructionOwnership>
+        Instructions;
+    llvm::DenseMap<const llvm::BasicBlock *, BlockOwnership> Blocks;
+    llvm::DenseMap<const llvm::CallBase *, CheckSlice> Slices;
+  };
+
+  FunctionOwnership &getOwnership(llvm::Function &F);
+
+  void computeOwnership(llvm::Function &F, FunctionOwnership &Ownership);
+
+  const FunctionOwnership *lookupOwnership(const llvm::Function *F) const;
+
+  CheckSlice takeCheckSlice(llvm::CallBase *CB);
+
+  void releaseOwnership(FunctionOwnership &Ownership, llvm::CallBase *CB,
+                        const CheckSlice &Slice);
+
+  bool hasLiveOwners(const llvm::Instruction *I) const;
+
+  void forgetInstruction(llvm::Instruction *I);
+
+  void forgetBlock(llvm::BasicBlock *BB);
+
+  void eraseInstruction(llvm::Instruction *I);
+
+  void noteChanged(const llvm::Function *F, bool CFGChanged);
+
+  bool classifySanitizerOnlyInstruction(llvm::Instruction *I) const;
+
+  void buildCheckSlice(CheckSlice &Slice, llvm::CallBase *CB);
+
+  bool eraseCheckSlice(llvm::CallBase *CB);
+
   bool addInstruction(CheckSlice &Slice, llvm::Instruction *I);
 
   bool addBlock(CheckSlice &Slice, llvm::BasicBlock *BB);
@@ -67,9 +130,18 @@ private:
 
   std::size_t eraseDeadSliceInstructions(CheckSlice &Slice);
 
+  void addDeadCandidates(llvm::Instruction *I);
+
+  void addBlockCandidate(llvm::BasicBlock *BB);
+
   llvm::Module &M;
   SanitizerCheckCollector Collector;
-  llvm::SmallPtrSet<llvm::Function *, 8> TouchedFunctions;
+  llvm::SmallVector<llvm::WeakTrackingVH, 64> DeadCandidates;
+  llvm::SmallVector<llvm::WeakVH, 16> BlockCandidates;
+  llvm::DenseMap<const llvm::Function *, std::unique_ptr<FunctionOwnership>>
+      Ownerships;
+  llvm::SmallPtrSet<const llvm::Function *, 8> ChangedFunctions;
+  llvm::SmallPtrSet<const llvm::Function *, 8> CFGChangedFunctions;
 };
 
 } // namespace desan
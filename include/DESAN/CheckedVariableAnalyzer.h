@@ -3,7 +3,7 @@
 
 #include "DESAN/SanitizerCheckCollector.h"
 
-#include "llvm/ADT/SmallPtrSet.h"
+#include "llvm/ADT/DenseMap.h"
 #include "llvm/ADT/SmallVector.h"
 #include "llvm/IR/InstrTypes.h"
 #include "llvm/IR/Value.h"
@@ -11,9 +11,11 @@
 
 #include <cstdint>
 #include <optional>
+#include <utility>
 
 namespace llvm {
 class DataLayout;
+class Function;
 } // namespace llvm
 
 namespace desan {
@@ -40,6 +42,9 @@ struct CheckedVariable {
 
 class CheckedVariableAnalyzer {
 public:
+  CheckedVariableAnalyzer() = default;
+  explicit CheckedVariableAnalyzer(const SanitizerCheckCollector &Classifier);
+
   std::optional<CheckedVariable> analyzeCheck(llvm::CallBase *CB);
 
   CheckedVariable traceCheckedValue(llvm::Value *V);
@@ -51,6 +56,24 @@ public:
 private:
   using ClassifiedCheck = SanitizerCheckCollector::ClassifiedCheck;
 
+  enum class TraceMode : unsigned {
+    CheckedValue,
+    ASanAddress,
+  };
+
+  template <typename KeyT, typename ResultT> struct TraceMemo {
+    llvm::DenseMap<KeyT, ResultT> Results;
+    llvm::DenseMap<KeyT, unsigned> Active;
+    unsigned CutLevel = ~0U;
+
+    template <typename ComputeFn, typename CutFn>
+    ResultT get(KeyT Key, unsigned Depth, ComputeFn Compute, CutFn Cut);
+
+    void clear();
+  };
+
+  void enterFunction(const llvm::Value *V);
+
   std::optional<ClassifiedCheck> classifyCheck(llvm::CallBase *CB) const;
 
   llvm::Value *getCheckedOperand(llvm::CallBase *CB,
@@ -74,26 +97,43 @@ private:
 
   uint64_t inferAccessSizeFromUses(llvm::Value *CheckedValue);
 
+  uint64_t inferAccessSizeFromUsesImpl(llvm::Value *CheckedValue);
+
+  uint64_t inferSizeFromValueDef(llvm::Value *V, const llvm::DataLayout *DL,
+                                 unsigned Depth);
+
+  uint64_t inferSizeFromValueDefImpl(llvm::Value *V,
+                                     const llvm::DataLayout *DL,
+                                     unsigned Depth);
+
   CheckedVariable traceASanCheckedAddress(llvm::Value *V);
 
-  CheckedVariable traceASanCheckedAddressImpl(
-      llvm::Value *V, llvm::SmallPtrSetImpl<llvm::Value *> &Visited,
-      unsigned Depth);
+  CheckedVariable traceValue(llvm::Value *V, TraceMode Mode, unsigned Depth);
 
-  CheckedVariable traceCheckedValueImpl(
-      llvm::Value *V, llvm::SmallPtrSetImpl<llvm::Value *> &Visited,
-      unsigned Depth);
+  CheckedVariable traceASanCheckedAddressImpl(llvm::Value *V, unsigned Depth);
 
-  llvm::Value *
-  normalizeVariableImpl(llvm::Value *V,
-                        llvm::SmallPtrSetImpl<llvm::Value *> &Visited,
-                        unsigned Depth);
+  CheckedVariable traceCheckedValueImpl(llvm::Value *V, unsigned Depth);
+
+  llvm::Value *normalizeValue(llvm::Value *V, unsigned Depth);
+
+  llvm::Value *normalizeVariableImpl(llvm::Value *V, unsigned Depth);
 
   AccessType inferAccessTypeFromUses(llvm::Value *CheckedValue,
                                      llvm::CallBase *CheckInst);
 
+  AccessType inferAccessTypeFromUsesImpl(llvm::Value *CheckedValue,
+                                         llvm::CallBase *CheckInst);
+
   SanitizerCheckCollector Collector;
+  const SanitizerCheckCollector *Classifier = nullptr;
   const llvm::DataLayout *CurrentDL = nullptr;
+  const llvm::Function *CacheFunction = nullptr;
+  TraceMemo<std::pair<const llvm::Value *, unsigned>, CheckedVariable>
+      TraceCache;
+  TraceMemo<const llvm::Value *, llvm::Value *> NormalizeCache;
+  TraceMemo<const llvm::Value *, uint64_t> DefSizeCache;
+  llvm::DenseMap<const llvm::Value *, uint64_t> UseSizeCache;
+  llvm::DenseMap<const llvm::Value *, AccessType> UseTypeCache;
 };
 
 void printCheckedVariable(llvm::raw_ostream &OS,
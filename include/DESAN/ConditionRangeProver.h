@@ -0,0 +1,43 @@
+#ifndef DESAN_CONDITION_RANGE_PROVER_H
+#define DESAN_CONDITION_RANGE_PROVER_H
+
+#include "DESAN/CheckGraphBuilder.h"
+
+#include <optional>
+
+namespace llvm {
+class BasicBlock;
+class ICmpInst;
+class Instruction;
+class LazyValueInfo;
+class Value;
+} // namespace llvm
+
+namespace desan {
+
+class ConditionRangeProver {
+public:
+  explicit ConditionRangeProver(CheckGraphBuilder &Builder);
+
+  void setUseScalarEvolution(bool Use) { UseScalarEvolution = Use; }
+
+  bool isNeverReached(const CheckedVariable &Var);
+
+private:
+  bool isDeadEdge(llvm::BasicBlock &From, llvm::BasicBlock &To,
+                  llvm::LazyValueInfo *LVI);
+
+  std::optional<bool> evaluate(llvm::Value *Cond, llvm::Instruction *CxtI,
+                               llvm::LazyValueInfo *LVI, unsigned Depth);
+
+  std::optional<bool> evaluateCompare(llvm::ICmpInst &Cmp,
+                                      llvm::Instruction *CxtI,
+                                      llvm::LazyValueInfo *LVI);
+
+  CheckGraphBuilder &Builder;
+  bool UseScalarEvolution = false;
+};
+
+} // namespace desan
+
+#endif // DESAN_CONDITION_RANGE_PROVER_H
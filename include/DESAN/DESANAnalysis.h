@@ -0,0 +1,130 @@
+#ifndef DESAN_DESAN_ANALYSIS_H
+#define DESAN_DESAN_ANALYSIS_H
+
+#include "DESAN/CheckedVariableAnalyzer.h"
+#include "DESAN/SanitizerCheckCollector.h"
+
+#include "llvm/ADT/ArrayRef.h"
+#include "llvm/ADT/DenseMap.h"
+#include "llvm/ADT/SmallVector.h"
+#include "llvm/IR/InstrTypes.h"
+#include "llvm/IR/PassManager.h"
+
+#include <memory>
+#include <string>
+#include <vector>
+
+namespace llvm {
+class Function;
+class Module;
+} // namespace llvm
+
+namespace desan {
+
+class CheckGraphBuilder;
+
+class SanitizerCheckInfo {
+public:
+  struct CheckEntry {
+    llvm::CallBase *Call = nullptr;
+    SanitizerCheckCollector::ClassifiedCheck Check;
+  };
+
+  void addCheck(llvm::CallBase *CB,
+                SanitizerCheckCollector::ClassifiedCheck Check);
+
+  llvm::ArrayRef<CheckEntry> checks() const { return Checks; }
+
+  const SanitizerCheckCollector::ClassifiedCheck *
+  lookup(const llvm::CallBase *CB) const;
+
+private:
+  llvm::SmallVector<CheckEntry, 16> Checks;
+  llvm::DenseMap<const llvm::CallBase *, unsigned> CheckIndices;
+};
+
+class SanitizerCheckAnalysis
+    : public llvm::AnalysisInfoMixin<SanitizerCheckAnalysis> {
+public:
+  using Result = SanitizerCheckInfo;
+
+  Result run(llvm::Function &F, llvm::FunctionAnalysisManager &FAM);
+
+private:
+  friend llvm::AnalysisInfoMixin<SanitizerCheckAnalysis>;
+  static llvm::AnalysisKey Key;
+
+  SanitizerCheckCollector Collector;
+};
+
+class CheckedVariableInfo {
+public:
+  void addVariable(CheckedVariable Var);
+
+  const std::vector<CheckedVariable> &variables() const { return Variables; }
+
+  const CheckedVariable *lookup(const llvm::CallBase *CB) const;
+
+private:
+  std::vector<CheckedVariable> Variables;
+  llvm::DenseMap<const llvm::CallBase *, unsigned> VariableIndices;
+};
+
+class CheckedVariableAnalysis
+    : public llvm::AnalysisInfoMixin<CheckedVariableAnalysis> {
+public:
+  using Result = CheckedVariableInfo;
+
+  Result run(llvm::Function &F, llvm::FunctionAnalysisManager &FAM);
+
+private:
+  friend llvm::AnalysisInfoMixin<CheckedVariableAnalysis>;
+  static llvm::AnalysisKey Key;
+};
+
+struct CheckGraphOptions {
+  unsigned CoreTopN = 4;
+  double CoreMinRatio = 5.0;
+  std::string ProfileFile;
+  unsigned Threads = 1;
+};
+
+class CheckGraphInfo {
+public:
+  using CheckStat = SanitizerCheckCollector::CheckStat;
+
+  CheckGraphInfo(llvm::Module &M, const CheckGraphOptions &Options,
+                 llvm::FunctionAnalysisManager &FAM);
+  CheckGraphInfo(CheckGraphInfo &&);
+  ~CheckGraphInfo();
+
+  const SanitizerCheckCollector &getCollector() const { return Collector; }
+
+  llvm::ArrayRef<CheckStat> getCoreChecks() const { return CoreChecks; }
+
+  CheckGraphBuilder &getGraphBuilder() { return *GraphBuilder; }
+
+private:
+  SanitizerCheckCollector Collector;
+  llvm::SmallVector<CheckStat, 16> CoreChecks;
+  std::unique_ptr<CheckGraphBuilder> GraphBuilder;
+};
+
+class CheckGraphAnalysis : public llvm::AnalysisInfoMixin<CheckGraphAnalysis> {
+public:
+  using Result = CheckGraphInfo;
+
+  explicit CheckGraphAnalysis(CheckGraphOptions Options = {});
+
+  Result run(llvm::Module &M, llvm::ModuleAnalysisManager &MAM);
+
+private:
+  friend llvm::AnalysisInfoMixin<CheckGraphAnalysis>;
+  static llvm::AnalysisKey Key;
+
+  CheckGraphOptions Options;
+};
+
+} // namespace desan
+
+#endif // DESAN_DESAN_ANALYSIS_H
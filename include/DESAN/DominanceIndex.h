@@ -0,0 +1,47 @@
+#ifndef DESAN_DOMINANCE_INDEX_H
+#define DESAN_DOMINANCE_INDEX_H
+
+#include "llvm/ADT/ArrayRef.h"
+#include "llvm/ADT/DenseMap.h"
+#include "llvm/ADT/SmallVector.h"
+
+#include <utility>
+
+namespace llvm {
+class BasicBlock;
+class DominatorTree;
+class Instruction;
+} // namespace llvm
+
+namespace desan {
+
+class DominanceIndex {
+public:
+  using DominancePair = std::pair<unsigned, unsigned>;
+
+  explicit DominanceIndex(llvm::DominatorTree &DT);
+
+  bool dominates(const llvm::Instruction *Def,
+                 const llvm::Instruction *User) const;
+
+  void computeDominancePairs(
+      llvm::ArrayRef<const llvm::Instruction *> Anchors,
+      llvm::SmallVectorImpl<DominancePair> &Pairs) const;
+
+private:
+  struct BlockNumbers {
+    unsigned DFSIn = 0;
+    unsigned DFSOut = 0;
+  };
+
+  const BlockNumbers *getBlockNumbers(const llvm::BasicBlock *BB) const;
+
+  bool isSweepDominator(const llvm::Instruction *I) const;
+
+  llvm::DominatorTree &DT;
+  llvm::DenseMap<const llvm::BasicBlock *, BlockNumbers> Numbers;
+};
+
+} // namespace desan
+
+#endif // DESAN_DOMINANCE_INDEX_H
@@ -0,0 +1,70 @@
+#ifndef DESAN_LOOP_BOUNDS_GUARD_H
+#define DESAN_LOOP_BOUNDS_GUARD_H
+
+#include "DESAN/CheckGraphBuilder.h"
+#include "DESAN/ConditionRangeProver.h"
+
+#include "llvm/ADT/ArrayRef.h"
+#include "llvm/ADT/SetVector.h"
+#include "llvm/ADT/SmallVector.h"
+#include "llvm/IR/InstrTypes.h"
+
+namespace llvm {
+class BasicBlock;
+class DominatorTree;
+class Function;
+class Loop;
+class LoopInfo;
+class SCEV;
+class SCEVExpander;
+class ScalarEvolution;
+class Value;
+} // namespace llvm
+
+namespace desan {
+
+class LoopBoundsGuard {
+public:
+  explicit LoopBoundsGuard(CheckGraphBuilder &Builder);
+
+  static bool isLoopBoundsCheck(const CheckedVariable &Var);
+
+  bool isProvenInBounds(const CheckedVariable &Var);
+
+  unsigned guardChecks(const CheckGraphBuilder::VariableCheckGroups &Groups,
+                       llvm::SmallVectorImpl<unsigned> &Replaced);
+
+  llvm::ArrayRef<llvm::Function *> changedFunctions() const {
+    return ChangedFunctions.getArrayRef();
+  }
+
+private:
+  struct EntryGuard {
+    unsigned Index = 0;
+    llvm::Loop *L = nullptr;
+    llvm::Value *Induction = nullptr;
+    llvm::CmpInst::Predicate PassPred = llvm::CmpInst::BAD_ICMP_PREDICATE;
+    const llvm::SCEV *Start = nullptr;
+    const llvm::SCEV *Last = nullptr;
+    const llvm::SCEV *Bound = nullptr;
+  };
+
+  unsigned guardFunctionChecks(llvm::Function &F,
+                               llvm::ArrayRef<unsigned> FunctionChecks,
+                               llvm::SmallVectorImpl<unsigned> &Replaced);
+
+  bool findEntryGuard(const CheckedVariable &Var, llvm::LoopInfo &LI,
+                      llvm::DominatorTree &DT, llvm::ScalarEvolution &SE,
+                      llvm::SCEVExpander &Expander, EntryGuard &Guard) const;
+
+  void emitEntryGuard(const EntryGuard &Guard, const CheckedVariable &Var,
+                      llvm::BasicBlock *&Entry, llvm::SCEVExpander &Expander);
+
+  CheckGraphBuilder &Builder;
+  ConditionRangeProver Prover;
+  llvm::SetVector<llvm::Function *> ChangedFunctions;
+};
+
+} // namespace desan
+
+#endif // DESAN_LOOP_BOUNDS_GUARD_H
@@ -0,0 +1,81 @@
+#ifndef DESAN_LOOP_CHECK_HOISTER_H
+#define DESAN_LOOP_CHECK_HOISTER_H
+
+#include "DESAN/CheckGraphBuilder.h"
+
+#include "llvm/ADT/ArrayRef.h"
+#include "llvm/ADT/DenseMap.h"
+#include "llvm/ADT/DenseSet.h"
+#include "llvm/ADT/SetVector.h"
+#include "llvm/ADT/SmallVector.h"
+
+#include <tuple>
+
+namespace llvm {
+class BasicBlock;
+class DominatorTree;
+class Function;
+class Instruction;
+class Loop;
+class LoopInfo;
+class SCEV;
+class SCEVExpander;
+class ScalarEvolution;
+} // namespace llvm
+
+namespace desan {
+
+class LoopCheckHoister {
+public:
+  explicit LoopCheckHoister(CheckGraphBuilder &Builder);
+
+  unsigned hoistChecks(const CheckGraphBuilder::VariableCheckGroups &Groups,
+                       llvm::SmallVectorImpl<unsigned> &Replaced);
+
+  llvm::ArrayRef<llvm::Function *> changedFunctions() const {
+    return ChangedFunctions.getArrayRef();
+  }
+
+  unsigned getNumRangeChecks() const { return NumRangeChecks; }
+
+private:
+  struct CheckRegion {
+    const llvm::SCEV *Start = nullptr;
+    const llvm::SCEV *Size = nullptr;
+    bool Invariant = false;
+  };
+
+  using RegionKey = std::tuple<const llvm::BasicBlock *, const llvm::SCEV *,
+                               const llvm::SCEV *>;
+
+  unsigned hoistFunctionChecks(llvm::Function &F,
+                               llvm::ArrayRef<unsigned> FunctionChecks,
+                               llvm::SmallVectorImpl<unsigned> &Replaced);
+
+  bool findRegion(const CheckedVariable &Var, llvm::Loop &L,
+                  llvm::ScalarEvolution &SE, CheckRegion &Region) const;
+
+  bool isShadowStable(const llvm::Loop &L);
+
+  void emitRegionCheck(const CheckRegion &Region, const CheckedVariable &Var,
+                       llvm::Instruction *InsertPt,
+                       llvm::SCEVExpander &Expander);
+
+  CheckGraphBuilder &Builder;
+  llvm::DenseMap<const llvm::Loop *, bool> ShadowStableLoops;
+  llvm::DenseSet<RegionKey> EmittedRegions;
+  llvm::SetVector<llvm::Function *> ChangedFunctions;
+  unsigned NumRangeChecks = 0;
+};
+
+void getLoopExitingBlocks(const llvm::Loop &L,
+                          llvm::SmallVectorImpl<llvm::BasicBlock *> &Exiting);
+
+bool isGuaranteedToExecuteInLoop(const llvm::Instruction &Anchor,
+                                 const llvm::Loop &L,
+                                 const llvm::DominatorTree &DT,
+                                 const llvm::LoopInfo &LI);
+
+} // namespace desan
+
+#endif // DESAN_LOOP_CHECK_HOISTER_H
@@ -0,0 +1,86 @@
+#ifndef DESAN_PARAM_SHADOW_PRUNER_H
+#define DESAN_PARAM_SHADOW_PRUNER_H
+
+#include "DESAN/CheckGraphBuilder.h"
+
+#include "llvm/ADT/ArrayRef.h"
+#include "llvm/ADT/DenseMap.h"
+#include "llvm/ADT/MapVector.h"
+#include "llvm/ADT/SetVector.h"
+#include "llvm/ADT/SmallPtrSet.h"
+#include "llvm/ADT/SmallSet.h"
+#include "llvm/ADT/SmallVector.h"
+
+#include <cstdint>
+
+namespace llvm {
+class CallBase;
+class DataLayout;
+class Function;
+class GlobalVariable;
+class LoadInst;
+class StoreInst;
+class Value;
+} // namespace llvm
+
+namespace desan {
+
+class ParamShadowPruner {
+public:
+  explicit ParamShadowPruner(CheckGraphBuilder &Builder);
+
+  void analyzeModule();
+
+  void findCleanChecks(const CheckGraphBuilder::VariableCheckGroups &Groups,
+                       llvm::SmallVectorImpl<unsigned> &Clean);
+
+  unsigned pruneShadowTraffic();
+
+  llvm::ArrayRef<llvm::Function *> changedFunctions() const {
+    return ChangedFunctions.getArrayRef();
+  }
+
+private:
+  struct FunctionShadow {
+    llvm::SmallVector<llvm::LoadInst *, 8> ParamLoads;
+    llvm::SmallVector<llvm::StoreInst *, 4> ReturnStores;
+    bool ParamsReadOnEntry = true;
+    bool StoresReturnShadow = false;
+  };
+
+  FunctionShadow scanFunction(llvm::Function &F) const;
+
+  bool isCandidate(const llvm::Function &F) const;
+
+  bool isCleanShadow(llvm::Value *V,
+                     llvm::SmallPtrSetImpl<llvm::Value *> &InProgress,
+                     unsigned Depth) const;
+
+  bool isCleanParamLoad(llvm::LoadInst &Load) const;
+
+  bool isCleanReturnLoad(llvm::LoadInst &Load) const;
+
+  bool isCleanArgument(llvm::CallBase &CB, int64_t Offset,
+                       uint64_t Size) const;
+
+  bool isCleanValue(llvm::Value *V) const;
+
+  unsigned pruneCallSite(llvm::CallBase &CB, const FunctionShadow &Callee,
+                         bool PruneParams, bool PruneReturn);
+
+  CheckGraphBuilder &Builder;
+  const llvm::DataLayout &DL;
+  llvm::GlobalVariable *ParamTLS = nullptr;
+  llvm::GlobalVariable *ParamOriginTLS = nullptr;
+  llvm::GlobalVariable *RetvalTLS = nullptr;
+  llvm::GlobalVariable *RetvalOriginTLS = nullptr;
+  llvm::MapVector<llvm::Function *, FunctionShadow> Functions;
+  llvm::DenseMap<const llvm::Function *, llvm::SmallSet<int64_t, 8>>
+      CleanParams;
+  llvm::SmallPtrSet<const llvm::Function *, 16> CleanReturns;
+  llvm::SetVector<llvm::Function *> ChangedFunctions;
+};
+
+} // namespace desan
+
+#endif // DESAN_PARAM_SHADOW_PRUNER_H
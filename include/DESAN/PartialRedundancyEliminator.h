@@ -0,0 +1,64 @@
+#ifndef DESAN_PARTIAL_REDUNDANCY_ELIMINATOR_H
+#define DESAN_PARTIAL_REDUNDANCY_ELIMINATOR_H
+
+#include "DESAN/CheckGraphBuilder.h"
+
+#include "llvm/ADT/ArrayRef.h"
+#include "llvm/ADT/DenseMap.h"
+#include "llvm/ADT/SetVector.h"
+#include "llvm/ADT/SmallPtrSet.h"
+#include "llvm/ADT/SmallVector.h"
+
+namespace llvm {
+class BasicBlock;
+class BranchInst;
+class CallBase;
+class Function;
+class Instruction;
+} // namespace llvm
+
+namespace desan {
+
+class PartialRedundancyEliminator {
+public:
+  explicit PartialRedundancyEliminator(CheckGraphBuilder &Builder);
+
+  unsigned hoistChecks(const CheckGraphBuilder::VariableCheckGroups &Groups,
+                       llvm::SmallVectorImpl<unsigned> &HoistedCopies);
+
+  llvm::ArrayRef<llvm::Function *> changedFunctions() const {
+    return ChangedFunctions.getArrayRef();
+  }
+
+  bool changedCFG(const llvm::Function &F) const {
+    return CFGChangedFunctions.contains(&F);
+  }
+
+private:
+  struct HoistCopy {
+    unsigned Check = 0;
+    llvm::CallBase *CheckInst = nullptr;
+    llvm::BranchInst *Guard = nullptr;
+    llvm::BasicBlock *ReportBB = nullptr;
+    llvm::SmallVector<llvm::Instruction *, 8> Closure;
+  };
+
+  using BlockChecks =
+      llvm::DenseMap<const llvm::BasicBlock *, llvm::SmallVector<unsigned, 4>>;
+
+  bool collectCopy(llvm::BasicBlock *BB, const BlockChecks &Checks,
+                   HoistCopy &Copy) const;
+
+  bool isEquivalentCopy(const HoistCopy &LHS, const HoistCopy &RHS) const;
+
+  void hoistCopies(llvm::BasicBlock *Pred, llvm::ArrayRef<HoistCopy> Copies);
+
+  CheckGraphBuilder &Builder;
+  llvm::SmallPtrSet<const llvm::BasicBlock *, 16> TouchedBlocks;
+  llvm::SetVector<llvm::Function *> ChangedFunctions;
+  llvm::SmallPtrSet<const llvm::Function *, 8> CFGChangedFunctions;
+};
+
+} // namespace desan
+
+#endif // DESAN_PARTIAL_REDUNDANCY_ELIMINATOR_H
@@ -0,0 +1,50 @@
+#ifndef DESAN_REACHABILITY_INDEX_H
+#define DESAN_REACHABILITY_INDEX_H
+
+#include "llvm/ADT/BitVector.h"
+#include "llvm/ADT/DenseMap.h"
+#include "llvm/ADT/SmallVector.h"
+
+#include <vector>
+
+namespace llvm {
+class BasicBlock;
+class Function;
+class Instruction;
+} // namespace llvm
+
+namespace desan {
+
+class ReachabilityIndex {
+public:
+  explicit ReachabilityIndex(llvm::Function &F);
+
+  bool isBlockReachable(const llvm::BasicBlock *From,
+                        const llvm::BasicBlock *To) const;
+
+  bool comesBefore(const llvm::Instruction *From,
+                   const llvm::Instruction *To) const;
+
+  bool isReachable(const llvm::Instruction *From,
+                   const llvm::Instruction *To) const;
+
+private:
+  void computeSCCs();
+
+  void computeClosure();
+
+  void numberInstructions(llvm::Function &F);
+
+  const llvm::Function *F = nullptr;
+  llvm::SmallVector<const llvm::BasicBlock *, 32> Blocks;
+  llvm::DenseMap<const llvm::BasicBlock *, unsigned> BlockIds;
+  llvm::SmallVector<unsigned, 32> BlockSCC;
+  llvm::BitVector CyclicSCCs;
+  std::vector<llvm::SmallVector<unsigned, 4>> SCCSuccessors;
+  std::vector<llvm::BitVector> SCCReach;
+  llvm::DenseMap<const llvm::Instruction *, unsigned> InstructionOrder;
+};
+
+} // namespace desan
+
+#endif // DESAN_REACHABILITY_INDEX_H
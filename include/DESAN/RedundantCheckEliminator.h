@@ -7,13 +7,16 @@
 #include "llvm/ADT/ArrayRef.h"
 #include "llvm/ADT/SmallPtrSet.h"
 #include "llvm/ADT/SmallVector.h"
+#include "llvm/IR/PassManager.h"
 #include "llvm/Support/raw_ostream.h"
 
 #include <cstddef>
+#include <memory>
 #include <string>
 
 namespace llvm {
 class CallBase;
+class Function;
 class Module;
 } // namespace llvm
 
@@ -26,12 +29,56 @@ public:
   RedundantCheckEliminator(llvm::Module &M,
                            llvm::ArrayRef<CheckStat> CoreChecks);
 
+  RedundantCheckEliminator(llvm::Module &M, CheckGraphBuilder &GraphBuilder);
+
   std::size_t eliminateRedundantChecks();
 
+  std::size_t eliminateRedundantChecks(llvm::Function &F);
+
   std::size_t eraseMarkedChecks();
 
+  void setRecordRemovalCandidates(bool Record) { RecordCandidates = Record; }
+
+  unsigned getNumHoistedChecks() const { return NumHoistedChecks; }
+
+  unsigned getNumHoistedCopies() const { return NumHoistedCopies; }
+
+  unsigned getNumLoopHoistedChecks() const { return NumLoopHoistedChecks; }
+
+  unsigned getNumLoopRangeChecks() const { return NumLoopRangeChecks; }
+
+  unsigned getNumLoopReplacedChecks() const { return NumLoopReplacedChecks; }
+
+  unsigned getNumCoalescedChecks() const { return NumCoalescedChecks; }
+
+  unsigned getNumCoalescedReplaced() const { return NumCoalescedReplaced; }
+
+  unsigned getNumRemovedWriteChecks() const { return NumRemovedWriteChecks; }
+
+  unsigned getNumSafeChecks() const { return NumSafeChecks; }
+
+  unsigned getNumRangeSafeChecks() const { return NumRangeSafeChecks; }
+
+  unsigned getNumLoopBoundsProven() const { return NumLoopBoundsProven; }
+
+  unsigned getNumLoopBoundsGuards() const { return NumLoopBoundsGuards; }
+
+  unsigned getNumLoopBoundsReplaced() const { return NumLoopBoundsReplaced; }
+
+  unsigned getNumCleanShadowChecks() const { return NumCleanShadowChecks; }
+
+  unsigned getNumPrunedShadowAccesses() const {
+    return NumPrunedShadowAccesses;
+  }
+
+  bool changedModule() const {
+    return SliceRemover.changedModule() || !ChangedFunctions.empty();
+  }
+
   void dumpRemovalCandidates(llvm::raw_ostream &OS) const;
 
+  llvm::PreservedAnalyses getPreservedAnalyses(const llvm::Function &F) const;
+
 private:
   struct RemovalCandidate {
     std::string CheckText;
@@ -41,12 +88,54 @@ private:
     std::string BasicBlockName;
   };
 
-  void markForRemoval(const CheckedVariable &Var, AccessType Type);
+  bool markForRemoval(const CheckedVariable &Var, AccessType Type);
+
+  void markRedundantChecks(const CheckGraphBuilder::VariableCheckGroups &Groups);
+
+  void removeSafeChecks(const CheckGraphBuilder::VariableCheckGroups &Groups);
+
+  std::size_t removeDuplicateShadowChecks(
+      const CheckGraphBuilder::VariableCheckGroups &Groups);
+
+  void pruneParamShadows(const CheckGraphBuilder::VariableCheckGroups &Groups);
+
+  void
+  guardLoopBoundsChecks(const CheckGraphBuilder::VariableCheckGroups &Groups);
+
+  void
+  hoistRedundantChecks(const CheckGraphBuilder::VariableCheckGroups &Groups);
+
+  void hoistLoopChecks(const CheckGraphBuilder::VariableCheckGroups &Groups);
+
+  void coalesceChecks(const CheckGraphBuilder::VariableCheckGroups &Groups);
+
+  std::size_t replaceChecks(llvm::ArrayRef<unsigned> Replaced,
+                            llvm::ArrayRef<llvm::Function *> Changed);
 
-  CheckGraphBuilder GraphBuilder;
+  std::unique_ptr<CheckGraphBuilder> OwnedGraphBuilder;
+  CheckGraphBuilder &GraphBuilder;
   CheckSliceRemover SliceRemover;
   llvm::SmallPtrSet<llvm::CallBase *, 32> MarkedCalls;
+  llvm::SmallVector<llvm::CallBase *, 32> MarkedCallOrder;
   llvm::SmallVector<RemovalCandidate, 32> RemovalCandidates;
+  llvm::SmallPtrSet<const llvm::Function *, 8> ChangedFunctions;
+  llvm::SmallPtrSet<const llvm::Function *, 8> ChangedCFGFunctions;
+  unsigned NumHoistedChecks = 0;
+  unsigned NumHoistedCopies = 0;
+  unsigned NumLoopHoistedChecks = 0;
+  unsigned NumLoopRangeChecks = 0;
+  unsigned NumLoopReplacedChecks = 0;
+  unsigned NumCoalescedChecks = 0;
+  unsigned NumCoalescedReplaced = 0;
+  unsigned NumRemovedWriteChecks = 0;
+  unsigned NumSafeChecks = 0;
+  unsigned NumRangeSafeChecks = 0;
+  unsigned NumLoopBoundsProven = 0;
+  unsigned NumLoopBoundsGuards = 0;
+  unsigned NumLoopBoundsReplaced = 0;
+  unsigned NumCleanShadowChecks = 0;
+  unsigned NumPrunedShadowAccesses = 0;
+  bool RecordCandidates = true;
 };
 
 } // namespace desan
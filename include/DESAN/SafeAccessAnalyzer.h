@@ -0,0 +1,32 @@
+#ifndef DESAN_SAFE_ACCESS_ANALYZER_H
+#define DESAN_SAFE_ACCESS_ANALYZER_H
+
+#include "DESAN/CheckedVariableAnalyzer.h"
+
+#include "llvm/ADT/DenseMap.h"
+
+#include <cstdint>
+
+namespace llvm {
+class DataLayout;
+class Value;
+} // namespace llvm
+
+namespace desan {
+
+class SafeAccessAnalyzer {
+public:
+  bool isSafeAccess(const CheckedVariable &Var);
+
+private:
+  uint64_t getSafeObjectSize(const llvm::Value &Object,
+                             const llvm::DataLayout &DL);
+
+  bool mayBeRepoisoned(const llvm::Value &Object) const;
+
+  llvm::DenseMap<const llvm::Value *, uint64_t> SafeObjectSizes;
+};
+
+} // namespace desan
+
+#endif // DESAN_SAFE_ACCESS_ANALYZER_H
@@ -1,18 +1,22 @@
 #ifndef DESAN_SANITIZER_CHECK_COLLECTOR_H
 #define DESAN_SANITIZER_CHECK_COLLECTOR_H
 
+#include "llvm/ADT/DenseMap.h"
 #include "llvm/ADT/SmallVector.h"
 #include "llvm/ADT/StringRef.h"
 #include "llvm/IR/InstrTypes.h"
+#include "llvm/IR/ValueMap.h"
 #include "llvm/Support/raw_ostream.h"
 
 #include <cstdint>
 #include <map>
+#include <memory>
 #include <optional>
-#include <string>
+#include <utility>
 
 namespace llvm {
 class Function;
+class Module;
 } // namespace llvm
 
 namespace desan {
@@ -26,26 +30,41 @@ enum class SanitizerKind {
 
 llvm::StringRef sanitizerKindName(SanitizerKind Kind);
 
+using CheckTypeId = unsigned;
+
+CheckTypeId internCheckType(llvm::StringRef CheckType);
+
+llvm::StringRef checkTypeName(CheckTypeId Id);
+
 class SanitizerCheckCollector {
 public:
   struct ClassifiedCheck {
     SanitizerKind Sanitizer = SanitizerKind::Unknown;
-    std::string CheckType;
+    CheckTypeId TypeId = 0;
+    llvm::StringRef CheckType;
   };
 
   struct CheckStat {
     SanitizerKind Sanitizer = SanitizerKind::Unknown;
-    std::string CheckType;
+    CheckTypeId TypeId = 0;
+    llvm::StringRef CheckType;
     uint64_t Count = 0;
     double RatioWithinSanitizer = 0.0;
     double RatioOverall = 0.0;
     double RuntimeRatio = -1.0;
   };
 
+  SanitizerCheckCollector();
+  SanitizerCheckCollector(SanitizerCheckCollector &&);
+  SanitizerCheckCollector &operator=(SanitizerCheckCollector &&);
+  ~SanitizerCheckCollector();
+
   void collectChecks(llvm::Function &F);
 
   std::optional<ClassifiedCheck> classifyCheck(llvm::CallBase *CB) const;
 
+  void classifyCallees(const llvm::Module &M);
+
   void dumpCheckStatistics(llvm::raw_ostream &OS = llvm::errs()) const;
 
   llvm::SmallVector<CheckStat, 16>
@@ -55,19 +74,25 @@ public:
   bool loadProfile(llvm::StringRef ProfilePath,
                    llvm::raw_ostream *ErrorOS = nullptr);
 
+  void recordCheck(const ClassifiedCheck &Check);
+
   uint64_t getTotalChecks() const { return TotalChecks; }
 
 private:
-  using CheckCountMap = std::map<std::string, uint64_t>;
+  using CheckCountMap = llvm::DenseMap<CheckTypeId, uint64_t>;
+  using CalleeCheckMap =
+      llvm::ValueMap<const llvm::Function *, std::optional<ClassifiedCheck>>;
 
-  void recordCheck(const ClassifiedCheck &Check);
+  std::optional<ClassifiedCheck>
+  classifyCallee(const llvm::Function &Callee) const;
 
   llvm::SmallVector<CheckStat, 16>
   getStatsForSanitizer(SanitizerKind Sanitizer) const;
 
+  mutable std::unique_ptr<CalleeCheckMap> CalleeChecks;
   std::map<SanitizerKind, CheckCountMap> CheckCounts;
   std::map<SanitizerKind, uint64_t> SanitizerTotals;
-  std::map<std::string, double> RuntimeCosts;
+  std::map<std::pair<SanitizerKind, CheckTypeId>, double> RuntimeCosts;
   double TotalRuntimeCost = 0.0;
   uint64_t TotalChecks = 0;
 };
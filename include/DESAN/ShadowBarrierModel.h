@@ -0,0 +1,53 @@
+#ifndef DESAN_SHADOW_BARRIER_MODEL_H
+#define DESAN_SHADOW_BARRIER_MODEL_H
+
+#include "llvm/ADT/ArrayRef.h"
+#include "llvm/ADT/DenseMap.h"
+#include "llvm/ADT/SmallPtrSet.h"
+#include "llvm/ADT/SmallVector.h"
+
+#include <utility>
+
+namespace llvm {
+class AAResults;
+class Function;
+class Instruction;
+class TargetLibraryInfo;
+class Value;
+} // namespace llvm
+
+namespace desan {
+
+class ShadowBarrierModel {
+public:
+  ShadowBarrierModel(llvm::Function &F, llvm::AAResults &AA,
+                     const llvm::TargetLibraryInfo &TLI);
+
+  bool isBarrier(const llvm::Instruction &I) const {
+    return BarrierSet.contains(&I);
+  }
+
+  bool mayInvalidate(const llvm::Instruction &Barrier,
+                     const llvm::Value *Object);
+
+  bool mayInvalidateAny(llvm::ArrayRef<const llvm::Instruction *> Barriers,
+                        const llvm::Value *Object);
+
+  bool hasBarriersFor(const llvm::Value *Object);
+
+private:
+  bool mayFreeOrPoison(const llvm::Instruction &I) const;
+
+  llvm::AAResults &AA;
+  const llvm::TargetLibraryInfo &TLI;
+  llvm::SmallVector<const llvm::Instruction *, 16> Barriers;
+  llvm::SmallPtrSet<const llvm::Instruction *, 16> BarrierSet;
+  llvm::DenseMap<std::pair<const llvm::Instruction *, const llvm::Value *>,
+                 bool>
+      Invalidates;
+  llvm::DenseMap<const llvm::Value *, bool> ObjectsWithBarriers;
+};
+
+} // namespace desan
+
+#endif // DESAN_SHADOW_BARRIER_MODEL_H
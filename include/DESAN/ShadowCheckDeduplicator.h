@@ -0,0 +1,42 @@
+#ifndef DESAN_SHADOW_CHECK_DEDUPLICATOR_H
+#define DESAN_SHADOW_CHECK_DEDUPLICATOR_H
+
+#include "DESAN/CheckGraphBuilder.h"
+
+#include "llvm/ADT/ArrayRef.h"
+#include "llvm/ADT/SmallVector.h"
+
+namespace llvm {
+class Function;
+class Instruction;
+class Value;
+} // namespace llvm
+
+namespace desan {
+
+class ShadowCheckDeduplicator {
+public:
+  explicit ShadowCheckDeduplicator(CheckGraphBuilder &Builder);
+
+  void findDuplicateChecks(const CheckGraphBuilder::VariableCheckGroups &Groups,
+                           llvm::SmallVectorImpl<unsigned> &Duplicates);
+
+private:
+  struct ShadowCheck {
+    unsigned Index = 0;
+    llvm::Instruction *Anchor = nullptr;
+    llvm::SmallVector<llvm::Value *, 4> Leaves;
+  };
+
+  void findFunctionDuplicates(llvm::Function &F,
+                              llvm::ArrayRef<ShadowCheck> Checks,
+                              llvm::SmallVectorImpl<unsigned> &Duplicates);
+
+  CheckGraphBuilder &Builder;
+};
+
+llvm::Value *getMemSanWarningShadow(const CheckedVariable &Var);
+
+} // namespace desan
+
+#endif // DESAN_SHADOW_CHECK_DEDUPLICATOR_H
@@ -0,0 +1,58 @@
+#ifndef DESAN_VARIABLE_UNIFIER_H
+#define DESAN_VARIABLE_UNIFIER_H
+
+#include "llvm/ADT/DenseMap.h"
+
+#include <map>
+#include <tuple>
+#include <vector>
+
+namespace llvm {
+class AAResults;
+class Instruction;
+class LoadInst;
+class MemoryAccess;
+class MemorySSA;
+class SCEV;
+class ScalarEvolution;
+class Type;
+class Value;
+} // namespace llvm
+
+namespace desan {
+
+class VariableUnifier {
+public:
+  VariableUnifier(llvm::AAResults &AA, llvm::MemorySSA &MSSA,
+                  llvm::ScalarEvolution &SE);
+
+  llvm::Value *getCanonicalValue(llvm::Value *V);
+
+  llvm::Value *getCanonicalRoot(llvm::Value *Address);
+
+  bool mustAlias(llvm::Value *LHS, llvm::Value *RHS);
+
+private:
+  using LoadKey =
+      std::tuple<llvm::Value *, llvm::MemoryAccess *, llvm::Type *>;
+  using ExprKey =
+      std::tuple<unsigned, llvm::Type *, std::vector<llvm::Value *>>;
+
+  llvm::Value *canonicalize(llvm::Value *V, unsigned Depth);
+
+  llvm::Value *canonicalizeLoad(llvm::LoadInst &Load, unsigned Depth);
+
+  llvm::Value *canonicalizeExpr(llvm::Instruction &I, unsigned Depth);
+
+  llvm::AAResults &AA;
+  llvm::MemorySSA &MSSA;
+  llvm::ScalarEvolution &SE;
+  llvm::DenseMap<llvm::Value *, llvm::Value *> Canonical;
+  llvm::DenseMap<LoadKey, llvm::Value *> Loads;
+  std::map<ExprKey, llvm::Value *> Exprs;
+  llvm::DenseMap<const llvm::SCEV *, llvm::Value *> SCEVs;
+};
+
+} // namespace desan
+
+#endif // DESAN_VARIABLE_UNIFIER_H
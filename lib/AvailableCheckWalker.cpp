@@ -0,0 +1,408 @@
+#include "DESAN/AvailableCheckWalker.h"
+
+#include "DESAN/ShadowBarrierModel.h"
+
+#include "llvm/ADT/MapVector.h"
+#include "llvm/ADT/STLExtras.h"
+#include "llvm/Analysis/ValueTracking.h"
+#include "llvm/IR/BasicBlock.h"
+#include "llvm/IR/CFG.h"
+#include "llvm/IR/Dominators.h"
+#include "llvm/IR/Function.h"
+#include "llvm/IR/Instruction.h"
+#include "llvm/Support/CommandLine.h"
+
+#include <algorithm>
+#include <memory>
+#include <optional>
+
+using namespace llvm;
+
+namespace desan {
+
+namespace {
+
+cl::opt<bool> FreeAwareBarriers(
+    "desan-free-aware-barriers", cl::init(false), cl::Hidden,
+    cl::desc("With the dominator engine, keep an ASan check available until "
+             "an instruction that may free, reallocate or repoison its "
+             "object runs, instead of until the next WRITE or UNKNOWN "
+             "check on the variable."));
+
+// Bounds the interval list walked per query; older intervals on a base
+// are rarely the ones that still cover a new access.
+constexpr unsigned MaxIntervalScan = 32;
+
+bool isBarrier(AccessType Type) { return Type != AccessType::READ; }
+
+// Barriers are asked about the object the checked address points into. The
+// base is only where tracing stopped, e.g. the stack slot a pointer was
+// reloaded from.
+const Value *getBarrierObject(const CheckedVariable &Var) {
+  if (Var.Address && Var.Address->getType()->isPointerTy())
+    return getUnderlyingObject(Var.Address);
+  return Var.Base ? Var.Base : Var.Address;
+}
+
+// Only ASan checks test a byte range; the offset must be static and the
+// size known for the range to mean anything.
+bool hasCheckedInterval(const CheckedVariable &Var) {
+  if (Var.Sanitizer != SanitizerKind::ASan || !Var.HasStaticByteOffset ||
+      Var.AccessSize == 0 || Var.AccessSize > INT64_MAX)
+    return false;
+  return Var.StaticByteOffset <=
+         INT64_MAX - static_cast<int64_t>(Var.AccessSize);
+}
+
+// An access size of zero means unknown; it only covers another unknown one.
+bool coversAccess(uint64_t AvailableSize, uint64_t AccessSize) {
+  if (AvailableSize == AccessSize)
+    return true;
+  return AvailableSize != 0 && AccessSize != 0 && AvailableSize >= AccessSize;
+}
+
+uint64_t mergeAccessSize(uint64_t AvailableSize, uint64_t AccessSize) {
+  if (AvailableSize != 0 && AccessSize != 0)
+    return std::max(AvailableSize, AccessSize);
+  return AccessSize;
+}
+
+// Unreachable predecessors contribute no paths, so a block whose only
+// reachable predecessor is its immediate dominator continues its generation.
+bool hasSingleReachablePredecessor(const BasicBlock *BB,
+                                   const DominatorTree &DT) {
+  const BasicBlock *Reachable = nullptr;
+  for (const BasicBlock *Pred : predecessors(BB)) {
+    if (!DT.isReachableFromEntry(Pred) || Pred == Reachable)
+      continue;
+    if (Reachable)
+      return false;
+    Reachable = Pred;
+  }
+  return Reachable != nullptr;
+}
+
+} // namespace
+
+AvailableCheckWalker::AvailableCheckWalker(CheckGraphBuilder &Builder)
+    : Builder(Builder) {}
+
+void AvailableCheckWalker::findRedundantChecks(
+    const CheckGraphBuilder::VariableCheckGroups &Groups,
+    SmallVectorImpl<unsigned> &Redundant) {
+  GroupsWithBarriers.clear();
+  GroupsWithBarriers.resize(Groups.size());
+  BasesWithBarriers.clear();
+  IntervalAllocator.Reset();
+  Locations.clear();
+  Bases.clear();
+
+  MapVector<Function *, BlockChecks> ChecksByFunction;
+  for (unsigned GroupIdx = 0, E = Groups.size(); GroupIdx != E; ++GroupIdx) {
+    for (unsigned Index : Groups[GroupIdx].Checks) {
+      const CheckedVariable &Var = Builder.getCheck(Index);
+      unsigned Base = getBase(Var);
+      if (isBarrier(Var.Type)) {
+        GroupsWithBarriers.set(GroupIdx);
+        if (Base)
+          BasesWithBarriers.set(Base);
+      }
+
+      Instruction *Anchor = findCheckAnchor(Var.CheckInst);
+      if (!Anchor || !Anchor->getParent())
+        continue;
+
+      ChecksByFunction[Anchor->getFunction()][Anchor->getParent()].push_back(
+          AnchoredCheck{Anchor, Index, GroupIdx, getLocation(GroupIdx, Var),
+                        Base});
+    }
+  }
+
+  std::size_t FirstRedundant = Redundant.size();
+  for (auto &[F, Checks] : ChecksByFunction)
+    walkFunction(*F, Checks, Redundant);
+
+  std::sort(Redundant.begin() + FirstRedundant, Redundant.end());
+}
+
+// Groups may merge every offset from one base, so availability is tracked per
+// exact location inside the group: a static byte offset, or else the checked
+// address itself. Location 0 is never available.
+unsigned AvailableCheckWalker::getLocation(unsigned Group,
+                                           const CheckedVariable &Var) {
+  LocationKey Key;
+  if (Var.HasStaticByteOffset)
+    Key = LocationKey(Group, 1, Var.StaticByteOffset, nullptr);
+  else if (Var.Address)
+    Key = LocationKey(Group, 0, 0, Builder.getUnifiedValue(Var.Address));
+  else if (Var.Offsets.empty())
+    Key = LocationKey(Group, 0, 0, nullptr);
+  else
+    return 0;
+
+  return Locations.try_emplace(Key, Locations.size() + 1).first->second;
+}
+
+// Checks on one base can sit in different groups, e.g. with static offsets
+// distinguished, so intervals and the barriers that end them are tracked
+// per base. Base 0 means the check has no traced base.
+unsigned AvailableCheckWalker::getBase(const CheckedVariable &Var) {
+  if (!Var.Base)
+    return 0;
+
+  auto [It, Inserted] = Bases.try_emplace(
+      std::make_pair(static_cast<unsigned>(Var.Sanitizer),
+                     Builder.getUnifiedBase(Var.Base)),
+      Bases.size() + 1);
+  if (Inserted)
+    BasesWithBarriers.resize(Bases.size() + 1);
+  return It->second;
+}
+
+void AvailableCheckWalker::walkFunction(Function &F, BlockChecks &Checks,
+                                        SmallVectorImpl<unsigned> &Redundant) {
+  for (auto &Entry : Checks)
+    llvm::stable_sort(Entry.second,
+                      [](const AnchoredCheck &LHS, const AnchoredCheck &RHS) {
+                        if (LHS.Anchor == RHS.Anchor)
+                          return LHS.Check < RHS.Check;
+                        return LHS.Anchor->comesBefore(RHS.Anchor);
+                      });
+
+  struct WalkNode {
+    WalkNode(AvailableCheckWalker &Walker, DomTreeNode *Node)
+        : CheckScope(Walker.AvailableChecks),
+          BarrierScope(Walker.BarrierEpochs),
+          IntervalScope(Walker.AvailableIntervals),
+          BaseBarrierScope(Walker.BaseBarrierEpochs),
+          BarrierPath(Walker.BarrierPath), PathDepth(BarrierPath.size()),
+          Node(Node), ChildIt(Node->begin()) {}
+    ~WalkNode() { BarrierPath.resize(PathDepth); }
+
+    AvailableCheckTable::ScopeTy CheckScope;
+    BarrierTable::ScopeTy BarrierScope;
+    IntervalTable::ScopeTy IntervalScope;
+    BarrierTable::ScopeTy BaseBarrierScope;
+    SmallVectorImpl<const Instruction *> &BarrierPath;
+    std::size_t PathDepth;
+    DomTreeNode *Node;
+    DomTreeNode::iterator ChildIt;
+    unsigned Generation = 0;
+  };
+
+  DominatorTree &DT = Builder.getDominatorTree(F);
+  DomTreeNode *Root = DT.getRootNode();
+  if (!Root)
+    return;
+
+  // Redundant WRITEs are found against the same barriers: a WRITE check is
+  // never a barrier itself once WRITEs can be removed.
+  std::optional<ShadowBarrierModel> Model;
+  if (FreeAwareBarriers || EliminateWrites)
+    Model.emplace(F, Builder.getAliasAnalysis(F),
+                  Builder.getTargetLibraryInfo(F));
+  Barriers = Model ? &*Model : nullptr;
+
+  // Walk the dominator tree in preorder, like EarlyCSE. Each node opens a
+  // scope, so a check is available exactly in the blocks it dominates. A
+  // block with several predecessors starts a new generation: checks made
+  // available before it are only trusted for groups that have no barrier
+  // anywhere, since another path may have passed one. Barriers on the
+  // current path bump the group's epoch in a scoped table of their own.
+  // With free-aware barriers, ASan checks instead record how many barrier
+  // instructions the path had passed; only later ones that may free or
+  // repoison the checked object end their availability.
+  SmallVector<std::unique_ptr<WalkNode>, 16> Stack;
+  CurrentGeneration = ++LastGeneration;
+  Stack.push_back(std::make_unique<WalkNode>(*this, Root));
+  processBlock(Root->getBlock(), Checks, Redundant);
+  Stack.back()->Generation = CurrentGeneration;
+
+  while (!Stack.empty()) {
+    WalkNode &Top = *Stack.back();
+    if (Top.ChildIt == Top.Node->end()) {
+      Stack.pop_back();
+      continue;
+    }
+
+    DomTreeNode *Child = *Top.ChildIt++;
+    CurrentGeneration = Top.Generation;
+    if (!hasSingleReachablePredecessor(Child->getBlock(), DT))
+      CurrentGeneration = ++LastGeneration;
+
+    Stack.push_back(std::make_unique<WalkNode>(*this, Child));
+    processBlock(Child->getBlock(), Checks, Redundant);
+    Stack.back()->Generation = CurrentGeneration;
+  }
+  Barriers = nullptr;
+}
+
+void AvailableCheckWalker::processBlock(BasicBlock *BB,
+                                        const BlockChecks &Checks,
+                                        SmallVectorImpl<unsigned> &Redundant) {
+  ArrayRef<AnchoredCheck> BlockChecks;
+  auto It = Checks.find(BB);
+  if (It != Checks.end())
+    BlockChecks = It->second;
+
+  if (!Barriers) {
+    for (const AnchoredCheck &Check : BlockChecks)
+      processCheck(Check, Redundant);
+    return;
+  }
+
+  for (Instruction &I : *BB) {
+    while (!BlockChecks.empty() && BlockChecks.front().Anchor == &I) {
+      processCheck(BlockChecks.front(), Redundant);
+      BlockChecks = BlockChecks.drop_front();
+    }
+    if (Barriers->isBarrier(I))
+      BarrierPath.push_back(&I);
+  }
+}
+
+void AvailableCheckWalker::processCheck(const AnchoredCheck &Check,
+                                        SmallVectorImpl<unsigned> &Redundant) {
+  const CheckedVariable &Var = Builder.getCheck(Check.Check);
+  if (!Var.CheckInst)
+    return;
+
+  // Under free-aware barriers an ASan WRITE tests the same shadow bytes as
+  // a READ, so it makes them available to READs. It is only removed itself
+  // when WRITE elimination is on and a dominating WRITE covers it.
+  bool FreeAware = usesFreeBarriers(Var);
+  if (isBarrier(Var.Type) && !FreeAware) {
+    BarrierEpochs.insert(Check.Group, ++LastEpoch);
+    if (Check.Base)
+      BaseBarrierEpochs.insert(Check.Base, ++LastEpoch);
+    return;
+  }
+  if (Var.Type == AccessType::UNKNOWN)
+    return;
+
+  bool IsWrite = Var.Type == AccessType::WRITE;
+  bool Removable = !IsWrite || EliminateWrites;
+  if (Removable && isCoveredByInterval(Check, Var)) {
+    Redundant.push_back(Check.Check);
+    return;
+  }
+  if (!Check.Location) {
+    makeIntervalAvailable(Check, Var);
+    return;
+  }
+
+  AvailableCheck Prior = AvailableChecks.lookup(Check.Location);
+  bool PriorValid =
+      Prior.Available &&
+      !passedBarrier(Prior.Epoch, Check, Var, /*ByBase=*/false) &&
+      (Prior.Generation == CurrentGeneration ||
+       !mayHaveBarrier(Check, Var, /*ByBase=*/false));
+  bool Covered = IsWrite ? Prior.WriteAvailable &&
+                              coversAccess(Prior.WriteSize, Var.AccessSize)
+                        : coversAccess(Prior.AccessSize, Var.AccessSize);
+  if (Removable && PriorValid && Covered) {
+    Redundant.push_back(Check.Check);
+    return;
+  }
+
+  AvailableCheck Entry;
+  Entry.Available = true;
+  Entry.AccessSize = Var.AccessSize;
+  if (PriorValid) {
+    Entry.AccessSize = mergeAccessSize(Prior.AccessSize, Var.AccessSize);
+    Entry.WriteAvailable = Prior.WriteAvailable;
+    Entry.WriteSize = Prior.WriteSize;
+  }
+  if (IsWrite) {
+    Entry.WriteSize = Entry.WriteAvailable
+                          ? mergeAccessSize(Entry.WriteSize, Var.AccessSize)
+                          : Var.AccessSize;
+    Entry.WriteAvailable = true;
+  }
+  Entry.Generation = CurrentGeneration;
+  Entry.Epoch = getBarrierEpoch(Check, Var, /*ByBase=*/false);
+  AvailableChecks.insert(Check.Location, Entry);
+  makeIntervalAvailable(Check, Var);
+}
+
+// A check is covered when a dominating check on the same base tested a byte
+// range containing [offset, offset + size) and no barrier on that base can
+// have run in between. WRITEs are only covered by WRITEs.
+bool AvailableCheckWalker::isCoveredByInterval(const AnchoredCheck &Check,
+                                               const CheckedVariable &Var) {
+  if (!Check.Base || !hasCheckedInterval(Var))
+    return false;
+
+  int64_t Begin = Var.StaticByteOffset;
+  int64_t End = Begin + static_cast<int64_t>(Var.AccessSize);
+
+  unsigned Scanned = 0;
+  for (const AvailableInterval *Interval =
+           AvailableIntervals.lookup(Check.Base);
+       Interval && Scanned != MaxIntervalScan;
+       Interval = Interval->Next, ++Scanned) {
+    if (passedBarrier(Interval->Epoch, Check, Var, /*ByBase=*/true))
+      break;
+    if ((Var.Type == AccessType::WRITE && !Interval->Write) ||
+        (Interval->Generation != CurrentGeneration &&
+         mayHaveBarrier(Check, Var, /*ByBase=*/true)))
+      continue;
+    if (Interval->Begin <= Begin && End <= Interval->End)
+      return true;
+  }
+  return false;
+}
+
+void AvailableCheckWalker::makeIntervalAvailable(const AnchoredCheck &Check,
+                                                 const CheckedVariable &Var) {
+  if (!Check.Base || !hasCheckedInterval(Var))
+    return;
+
+  auto *Interval = new (IntervalAllocator) AvailableInterval();
+  Interval->Begin = Var.StaticByteOffset;
+  Interval->End = Interval->Begin + static_cast<int64_t>(Var.AccessSize);
+  Interval->Generation = CurrentGeneration;
+  Interval->Epoch = getBarrierEpoch(Check, Var, /*ByBase=*/true);
+  Interval->Write = Var.Type == AccessType::WRITE;
+  Interval->Next = AvailableIntervals.lookup(Check.Base);
+  AvailableIntervals.insert(Check.Base, Interval);
+}
+
+bool AvailableCheckWalker::usesFreeBarriers(const CheckedVariable &Var) const {
+  return Barriers && Var.Sanitizer == SanitizerKind::ASan;
+}
+
+// Epochs count barrier checks on the group, or on the base for intervals.
+// Under free-aware barriers they are positions on the barrier path instead.
+unsigned AvailableCheckWalker::getBarrierEpoch(const AnchoredCheck &Check,
+                                               const CheckedVariable &Var,
+                                               bool ByBase) const {
+  if (usesFreeBarriers(Var))
+    return BarrierPath.size();
+  return ByBase ? BaseBarrierEpochs.lookup(Check.Base)
+                : BarrierEpochs.lookup(Check.Group);
+}
+
+bool AvailableCheckWalker::passedBarrier(unsigned Epoch,
+                                         const AnchoredCheck &Check,
+                                         const CheckedVariable &Var,
+                                         bool ByBase) {
+  if (!usesFreeBarriers(Var))
+    return Epoch != getBarrierEpoch(Check, Var, ByBase);
+  ArrayRef<const Instruction *> Since(BarrierPath);
+  return Barriers->mayInvalidateAny(Since.drop_front(Epoch),
+                                    getBarrierObject(Var));
+}
+
+// Availability from another generation crossed a join, where a barrier
+// off the dominator path may have run.
+bool AvailableCheckWalker::mayHaveBarrier(const AnchoredCheck &Check,
+                                          const CheckedVariable &Var,
+                                          bool ByBase) {
+  if (usesFreeBarriers(Var))
+    return Barriers->hasBarriersFor(getBarrierObject(Var));
+  return ByBase ? BasesWithBarriers.test(Check.Base)
+                : GroupsWithBarriers.test(Check.Group);
+}
+
+} // namespace desan
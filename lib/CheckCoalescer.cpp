@@ -0,0 +1,271 @@
+#include "DESAN/CheckCoalescer.h"
+
+#include "llvm/ADT/MapVector.h"
+#include "llvm/ADT/STLExtras.h"
+#include "llvm/ADT/Twine.h"
+#include "llvm/Analysis/ValueTracking.h"
+#include "llvm/IR/BasicBlock.h"
+#include "llvm/IR/CFG.h"
+#include "llvm/IR/DebugInfoMetadata.h"
+#include "llvm/IR/Function.h"
+#include "llvm/IR/IRBuilder.h"
+#include "llvm/IR/Instructions.h"
+#include "llvm/IR/Module.h"
+#include "llvm/Support/MathExtras.h"
+
+#include <algorithm>
+#include <string>
+#include <tuple>
+
+using namespace llvm;
+
+namespace desan {
+
+namespace {
+
+bool isCoalesceCandidate(const CheckedVariable &Var) {
+  return Var.Sanitizer == SanitizerKind::ASan &&
+         (Var.Type == AccessType::READ || Var.Type == AccessType::WRITE) &&
+         Var.CheckInst && Var.HasStaticByteOffset && Var.Address &&
+         Var.Address->getType()->isPointerTy() && Var.AccessSize != 0 &&
+         Var.AccessSize <= static_cast<uint64_t>(INT64_MAX);
+}
+
+// The block an inline check continues into when its shadow test passes, if
+// that block is entered from nowhere else.
+BasicBlock *getCheckContinuation(BasicBlock &BB) {
+  auto *Guard = dyn_cast<BranchInst>(BB.getTerminator());
+  if (!Guard || !Guard->isConditional())
+    return nullptr;
+
+  BasicBlock *Cont = nullptr;
+  bool HasReport = false;
+  for (BasicBlock *Succ : Guard->successors()) {
+    if (isSanitizerReportBlock(*Succ))
+      HasReport = true;
+    else
+      Cont = Succ;
+  }
+  if (!HasReport || !Cont || Cont->getSinglePredecessor() != &BB)
+    return nullptr;
+  return Cont;
+}
+
+} // namespace
+
+CheckCoalescer::CheckCoalescer(CheckGraphBuilder &Builder)
+    : Builder(Builder) {}
+
+unsigned CheckCoalescer::coalesceChecks(
+    const CheckGraphBuilder::VariableCheckGroups &Groups,
+    SmallVectorImpl<unsigned> &Replaced) {
+  // With static offsets distinguished, fields of one object land in
+  // separate groups, so clusters are formed across all of them. Checks
+  // that abort and checks that recover never share a cluster.
+  using ClusterKey =
+      std::tuple<const BasicBlock *, Value *, unsigned, unsigned>;
+  MapVector<Function *, MapVector<ClusterKey, SmallVector<ClusterMember, 4>>>
+      Clusters;
+
+  for (const VariableCheckGroup &Group : Groups) {
+    for (unsigned Index : Group.Checks) {
+      const CheckedVariable &Var = Builder.getCheck(Index);
+      if (!isCoalesceCandidate(Var))
+        continue;
+
+      Instruction *Anchor = findCheckAnchor(Var.CheckInst);
+      if (!Anchor || !Anchor->getParent())
+        continue;
+
+      Function *F = Anchor->getFunction();
+      if (!Traces.count(Anchor->getParent()))
+        computeTraces(*F);
+
+      const DataLayout &DL = F->getParent()->getDataLayout();
+      APInt Offset(DL.getIndexTypeSizeInBits(Var.Address->getType()), 0);
+      Value *Root = Var.Address->stripAndAccumulateConstantOffsets(
+          DL, Offset, /*AllowNonInbounds=*/true);
+      if (!Offset.isSignedIntN(63))
+        continue;
+
+      ClusterMember Member;
+      Member.Check = Index;
+      Member.Anchor = Anchor;
+      Member.Begin = Offset.getSExtValue();
+      Member.End = Member.Begin + static_cast<int64_t>(Var.AccessSize);
+      if (Member.End < Member.Begin)
+        continue;
+
+      ClusterKey Key(Traces.lookup(Anchor->getParent()).Head, Root,
+                     static_cast<unsigned>(Var.Type),
+                     static_cast<unsigned>(isRecoverableCheck(*Var.CheckInst)));
+      Clusters[F][Key].push_back(Member);
+    }
+  }
+
+  unsigned Inserted = 0;
+  for (auto &[F, FunctionClusters] : Clusters) {
+    std::size_t FirstReplaced = Replaced.size();
+    for (auto &[Key, Members] : FunctionClusters) {
+      if (Members.size() < 2)
+        continue;
+
+      // Sweep the byte ranges in offset order; every maximal run of
+      // contiguous or overlapping ranges becomes one check.
+      llvm::stable_sort(Members,
+                        [](const ClusterMember &LHS, const ClusterMember &RHS) {
+                          return std::tie(LHS.Begin, LHS.Check) <
+                                 std::tie(RHS.Begin, RHS.Check);
+                        });
+
+      Value *Root = std::get<1>(Key);
+      auto Access = static_cast<AccessType>(std::get<2>(Key));
+      bool Recover = std::get<3>(Key) != 0;
+      std::size_t RunBegin = 0;
+      int64_t RunEnd = Members.front().End;
+      for (std::size_t Idx = 1, E = Members.size(); Idx <= E; ++Idx) {
+        if (Idx != E && Members[Idx].Begin <= RunEnd) {
+          RunEnd = std::max(RunEnd, Members[Idx].End);
+          continue;
+        }
+
+        ArrayRef<ClusterMember> Run(Members.data() + RunBegin,
+                                    Idx - RunBegin);
+        if (Run.size() > 1 &&
+            coalesceRun(Run, Root, Access, Recover, Replaced))
+          ++Inserted;
+        if (Idx != E) {
+          RunBegin = Idx;
+          RunEnd = Members[Idx].End;
+        }
+      }
+    }
+    if (Replaced.size() != FirstReplaced)
+      ChangedFunctions.insert(F);
+  }
+  return Inserted;
+}
+
+// A trace is a chain of blocks joined by inline checks whose only other way
+// out is a report: once its head runs, every block runs or execution stops
+// with a report. Callback checks keep their block, so a plain block is a
+// trace of its own.
+void CheckCoalescer::computeTraces(Function &F) {
+  for (BasicBlock &BB : F) {
+    if (Traces.count(&BB))
+      continue;
+
+    BasicBlock *Pred = BB.getSinglePredecessor();
+    if (Pred && getCheckContinuation(*Pred) == &BB)
+      continue;
+
+    unsigned Index = 0;
+    for (BasicBlock *Cur = &BB; Cur; Cur = getCheckContinuation(*Cur)) {
+      if (!Traces.try_emplace(Cur, TracePosition{&BB, Index++}).second)
+        break;
+      if (BasicBlock *Next = getCheckContinuation(*Cur))
+        TraceSuccessors[Cur] = Next;
+    }
+  }
+}
+
+bool CheckCoalescer::comesBefore(const Instruction *LHS,
+                                 const Instruction *RHS) const {
+  if (LHS->getParent() == RHS->getParent())
+    return LHS->comesBefore(RHS);
+  return Traces.lookup(LHS->getParent()).Index <
+         Traces.lookup(RHS->getParent()).Index;
+}
+
+// Moving a check up to From is only sound when execution from From reaches
+// To, and shadow memory cannot change on the way.
+bool CheckCoalescer::isCleanPath(Instruction *From, Instruction *To) const {
+  BasicBlock::iterator It = From->getIterator();
+  while (&*It != To) {
+    Instruction &I = *It;
+    const auto *CB = dyn_cast<CallBase>(&I);
+    bool IsCheck = CB && isSanitizerRuntimeCall(*CB);
+    if (!IsCheck &&
+        (mayChangeShadow(I) || !isGuaranteedToTransferExecutionToSuccessor(&I)))
+      return false;
+
+    if (!I.isTerminator()) {
+      ++It;
+      continue;
+    }
+    BasicBlock *Next = TraceSuccessors.lookup(I.getParent());
+    if (!Next)
+      return false;
+    It = Next->begin();
+  }
+  return true;
+}
+
+bool CheckCoalescer::coalesceRun(ArrayRef<ClusterMember> Run, Value *Root,
+                                 AccessType Access, bool Recover,
+                                 SmallVectorImpl<unsigned> &Replaced) {
+  const ClusterMember *First = &Run.front();
+  Instruction *Last = First->Anchor;
+  int64_t Begin = Run.front().Begin;
+  int64_t End = Run.front().End;
+  for (const ClusterMember &Member : Run) {
+    if (comesBefore(Member.Anchor, First->Anchor))
+      First = &Member;
+    if (comesBefore(Last, Member.Anchor))
+      Last = Member.Anchor;
+    End = std::max(End, Member.End);
+  }
+  if (!isCleanPath(First->Anchor, Last))
+    return false;
+
+  // When the first check already covers the union, the others just go and
+  // nothing is inserted.
+  if (First->Begin == Begin && First->End == End) {
+    for (const ClusterMember &Member : Run)
+      if (&Member != First)
+        Replaced.push_back(Member.Check);
+    return false;
+  }
+
+  Module &M = *First->Anchor->getModule();
+  LLVMContext &Ctx = M.getContext();
+  Type *IntPtrTy = M.getDataLayout().getIntPtrType(Ctx);
+  IRBuilder<> IRB(First->Anchor);
+  Value *Start = Root;
+  if (Begin != 0)
+    Start = IRB.CreateGEP(Type::getInt8Ty(Ctx), Root,
+                          ConstantInt::get(IntPtrTy, Begin));
+  SmallVector<Value *, 2> Args = {IRB.CreatePtrToInt(Start, IntPtrTy)};
+
+  // The fixed-size callbacks test a single shadow load, which only covers
+  // a naturally aligned access. Any other union goes through the N form,
+  // which tests every byte.
+  uint64_t Size = static_cast<uint64_t>(End - Begin);
+  Align RootAlign = Root->getPointerAlignment(M.getDataLayout());
+  StringRef Op = Access == AccessType::READ ? "load" : "store";
+  std::string Name = ("__asan_" + Op + "N").str();
+  if (isPowerOf2_64(Size) && Size <= 16 && RootAlign.value() >= Size &&
+      Begin % static_cast<int64_t>(Size) == 0)
+    Name = ("__asan_" + Op + Twine(Size)).str();
+  else
+    Args.push_back(ConstantInt::get(IntPtrTy, Size));
+  if (Recover)
+    Name += "_noabort";
+
+  SmallVector<Type *, 2> Params(Args.size(), IntPtrTy);
+  FunctionCallee Callee = M.getOrInsertFunction(
+      Name, FunctionType::get(Type::getVoidTy(Ctx), Params, false));
+  CallInst *Check = IRB.CreateCall(Callee, Args);
+
+  const DILocation *Loc = nullptr;
+  for (const ClusterMember &Member : Run) {
+    const DILocation *MemberLoc =
+        Builder.getCheck(Member.Check).CheckInst->getDebugLoc().get();
+    Loc = Loc ? DILocation::getMergedLocation(Loc, MemberLoc) : MemberLoc;
+    Replaced.push_back(Member.Check);
+  }
+  Check->setDebugLoc(Loc);
+  return true;
+}
+
+} // namespace desan
@@ -1,18 +1,35 @@
 #include "DESAN/CheckGraphBuilder.h"
 
+#include "DESAN/DESANAnalysis.h"
+#include "DESAN/VariableUnifier.h"
+
+#include "llvm/ADT/Hashing.h"
+#include "llvm/ADT/MapVector.h"
 #include "llvm/ADT/STLExtras.h"
-#include "llvm/ADT/SmallPtrSet.h"
+#include "llvm/Analysis/AliasAnalysis.h"
+#include "llvm/Analysis/AssumptionCache.h"
+#include "llvm/Analysis/BasicAliasAnalysis.h"
+#include "llvm/Analysis/LazyValueInfo.h"
+#include "llvm/Analysis/LoopInfo.h"
+#include "llvm/Analysis/MemorySSA.h"
+#include "llvm/Analysis/ScalarEvolution.h"
+#include "llvm/Analysis/TargetLibraryInfo.h"
 #include "llvm/IR/CFG.h"
 #include "llvm/IR/Dominators.h"
 #include "llvm/IR/Function.h"
 #include "llvm/IR/InstIterator.h"
 #include "llvm/IR/Instructions.h"
+#include "llvm/IR/IntrinsicInst.h"
 #include "llvm/IR/Module.h"
+#include "llvm/IR/Operator.h"
+#include "llvm/IR/TypeFinder.h"
 #include "llvm/Support/CommandLine.h"
+#include "llvm/Support/ThreadPool.h"
+#include "llvm/Support/Threading.h"
+#include "llvm/TargetParser/Triple.h"
 
 #include <cstdint>
-#include <iterator>
-#include <queue>
+#include <memory>
 
 using namespace llvm;
 
@@ -32,28 +49,15 @@ cl::opt<bool> DistinguishStaticOffsets(
              "Disabled by default to preserve the current aggressive "
              "base-level elimination policy."));
 
-uintptr_t valueAddress(Value *V) {
-  return reinterpret_cast<uintptr_t>(V);
-}
-
-void appendUniqueNode(SmallVectorImpl<CheckNode *> &Nodes, CheckNode *Node) {
-  if (!Node || is_contained(Nodes, Node))
-    return;
-  Nodes.push_back(Node);
-}
+cl::opt<bool> UnifyCheckedVariables(
+    "desan-unify-checked-variables", cl::init(false), cl::Hidden,
+    cl::desc("Merge checked-variable keys whose bases and offsets are "
+             "provably the same value (MemorySSA reloads, must-alias "
+             "pointers, SCEV-equal offsets). Mostly useful on -O0 IR."));
 
-bool instructionComesBefore(const Instruction *From, const Instruction *To) {
-  if (!From || !To || From->getParent() != To->getParent())
-    return false;
-
-  const BasicBlock *BB = From->getParent();
-  for (auto It = std::next(From->getIterator()), End = BB->end(); It != End;
-       ++It) {
-    if (&*It == To)
-      return true;
-  }
-  return false;
-}
+// Pairwise must-alias queries between the roots of one function stop after
+// this many earlier roots.
+constexpr unsigned MaxMustAliasQueries = 8;
 
 bool isASanReportCall(const CallBase *CB) {
   if (!CB || !CB->getCalledFunction())
@@ -78,6 +82,30 @@ bool isMemSanReportCall(const CallBase *CB) {
   return Name.starts_with("__msan_warning");
 }
 
+// DataLayout computes struct layouts on first use. Fill the cache up front so
+// concurrent checked-variable tracing only reads it.
+void computeStructLayouts(Module &M) {
+  const DataLayout &DL = M.getDataLayout();
+  TypeFinder StructTypes;
+  StructTypes.run(M, /*onlyNamed=*/false);
+  for (StructType *STy : StructTypes)
+    if (!STy->isOpaque() && STy->isSized())
+      DL.getStructLayout(STy);
+}
+
+bool isShadowPointer(const Value *Ptr) {
+  return Operator::getOpcode(Ptr->stripPointerCasts()) ==
+         Instruction::IntToPtr;
+}
+
+Instruction *nodeAnchor(const CheckNode &Node) {
+  if (Node.AnchorInst)
+    return Node.AnchorInst;
+  return Node.CheckInst;
+}
+
+} // namespace
+
 Instruction *findCheckAnchor(CallBase *CB) {
   if (!CB)
     return nullptr;
@@ -109,60 +137,207 @@ Instruction *findCheckAnchor(CallBase *CB) {
   return Anchor ? Anchor : CB;
 }
 
-Instruction *nodeAnchor(const CheckNode &Node) {
-  if (Node.AnchorInst)
-    return Node.AnchorInst;
-  return Node.CheckInst;
-}
+// Analyses owned by the builder when no analysis manager is available.
+// Members refer to the ones declared before them.
+struct CheckGraphBuilder::FunctionAnalyses {
+  FunctionAnalyses(Function &F, DominatorTree &DT)
+      : TLII(Triple(F.getParent()->getTargetTriple())), TLI(TLII, &F), AC(F),
+        LI(DT), SE(F, TLI, AC, DT, LI),
+        BasicAA(F.getParent()->getDataLayout(), F, TLI, AC, &DT), AA(TLI) {
+    AA.addAAResult(BasicAA);
+  }
 
-} // namespace
+  TargetLibraryInfoImpl TLII;
+  TargetLibraryInfo TLI;
+  AssumptionCache AC;
+  LoopInfo LI;
+  ScalarEvolution SE;
+  BasicAAResult BasicAA;
+  AAResults AA;
+  std::unique_ptr<MemorySSA> MSSA;
+};
+
+bool isSanitizerRuntimeCall(const CallBase &CB) {
+  const Function *Callee = CB.getCalledFunction();
+  if (!Callee)
+    return false;
 
-bool VariableKeyLess::operator()(const VariableKey &LHS,
-                                 const VariableKey &RHS) const {
-  if (LHS.Sanitizer != RHS.Sanitizer)
-    return static_cast<unsigned>(LHS.Sanitizer) <
-           static_cast<unsigned>(RHS.Sanitizer);
+  StringRef Name = Callee->getName();
+  Name.consume_front("\01");
+  return Name.starts_with("__asan_load") || Name.starts_with("__asan_store") ||
+         Name.starts_with("__asan_exp_") ||
+         Name.starts_with("__asan_report_") ||
+         Name.starts_with("__ubsan_handle_") || Name.starts_with("__msan_");
+}
 
-  if (valueAddress(LHS.Base) != valueAddress(RHS.Base))
-    return valueAddress(LHS.Base) < valueAddress(RHS.Base);
+// Checks built with -fsanitize-recover report through the _noabort entry
+// points and continue; checks that replace them must do the same.
+bool isRecoverableCheck(const CallBase &CB) {
+  const Function *Callee = CB.getCalledFunction();
+  return Callee && Callee->getName().ends_with("_noabort");
+}
 
-  if (LHS.Offsets.size() != RHS.Offsets.size())
-    return LHS.Offsets.size() < RHS.Offsets.size();
+bool isSanitizerReportBlock(const BasicBlock &BB) {
+  if (!isa<UnreachableInst>(BB.getTerminator()))
+    return false;
+  return any_of(BB, [](const Instruction &I) {
+    const auto *CB = dyn_cast<CallBase>(&I);
+    return CB && isSanitizerRuntimeCall(*CB);
+  });
+}
 
-  for (auto [LHSOffset, RHSOffset] : zip(LHS.Offsets, RHS.Offsets)) {
-    if (valueAddress(LHSOffset) != valueAddress(RHSOffset))
-      return valueAddress(LHSOffset) < valueAddress(RHSOffset);
-  }
+// ASan only changes its verdict for an address when shadow memory is
+// written: directly through an inttoptr pointer, or by a call that may free
+// or (un)poison memory.
+bool mayChangeShadow(const Instruction &I) {
+  if (const auto *Store = dyn_cast<StoreInst>(&I))
+    return isShadowPointer(Store->getPointerOperand());
+  if (const auto *MI = dyn_cast<MemIntrinsic>(&I))
+    return isShadowPointer(MI->getRawDest());
+  if (const auto *CB = dyn_cast<CallBase>(&I))
+    return !isSanitizerRuntimeCall(*CB) && !CB->onlyReadsMemory() &&
+           !CB->hasFnAttr(Attribute::NoFree);
+  return false;
+}
 
-  if (LHS.HasStaticByteOffset != RHS.HasStaticByteOffset)
-    return LHS.HasStaticByteOffset < RHS.HasStaticByteOffset;
+VariableKey VariableKeyInfo::getEmptyKey() {
+  VariableKey Key;
+  Key.Base = DenseMapInfo<Value *>::getEmptyKey();
+  return Key;
+}
 
-  if (LHS.HasStaticByteOffset &&
-      LHS.StaticByteOffset != RHS.StaticByteOffset)
-    return LHS.StaticByteOffset < RHS.StaticByteOffset;
+VariableKey VariableKeyInfo::getTombstoneKey() {
+  VariableKey Key;
+  Key.Base = DenseMapInfo<Value *>::getTombstoneKey();
+  return Key;
+}
 
-  return false;
+unsigned VariableKeyInfo::getHashValue(const VariableKey &Key) {
+  return Key.Hash;
+}
+
+bool VariableKeyInfo::isEqual(const VariableKey &LHS, const VariableKey &RHS) {
+  // Offsets are interned by CheckGraphBuilder, so equal offset lists share
+  // storage and compare by pointer.
+  return LHS.Hash == RHS.Hash && LHS.Sanitizer == RHS.Sanitizer &&
+         LHS.Base == RHS.Base && LHS.Offsets.data() == RHS.Offsets.data() &&
+         LHS.Offsets.size() == RHS.Offsets.size() &&
+         LHS.HasStaticByteOffset == RHS.HasStaticByteOffset &&
+         LHS.StaticByteOffset == RHS.StaticByteOffset;
 }
 
-CheckGraphBuilder::CheckGraphBuilder(Module &M, ArrayRef<CheckStat> CoreChecks)
-    : M(M) {
+CheckGraphBuilder::CheckGraphBuilder(Module &M, ArrayRef<CheckStat> CoreChecks,
+                                     FunctionAnalysisManager *FAM)
+    : M(M), FAM(FAM) {
   for (const CheckStat &Stat : CoreChecks)
-    CoreCheckSet.insert({Stat.Sanitizer, Stat.CheckType});
+    CoreCheckSet.insert({Stat.Sanitizer, Stat.TypeId});
 }
 
 CheckGraphBuilder::~CheckGraphBuilder() = default;
 
+void CheckGraphBuilder::analyzeFunctions(unsigned Threads) {
+  if (!FAM || Threads == 1 || GroupsComputed)
+    return;
+
+  SmallVector<Function *, 32> Functions;
+  SmallVector<const SanitizerCheckInfo *, 32> FunctionChecks;
+  for (Function &F : M) {
+    if (F.isDeclaration())
+      continue;
+
+    const SanitizerCheckInfo &Info = FAM->getResult<SanitizerCheckAnalysis>(F);
+    if (Info.checks().empty())
+      continue;
+    Functions.push_back(&F);
+    FunctionChecks.push_back(&Info);
+  }
+  if (Functions.empty())
+    return;
+
+  Collector.classifyCallees(M);
+  computeStructLayouts(M);
+
+  // Each task only reads the IR and writes its own slot; results are merged
+  // in module order so grouping and removal match the serial run.
+  std::vector<std::unique_ptr<CheckedVariableInfo>> Results(Functions.size());
+  ThreadPool Pool(hardware_concurrency(Threads));
+  for (unsigned Idx = 0, E = Functions.size(); Idx != E; ++Idx) {
+    Pool.async([this, &FunctionChecks, &Results, Idx] {
+      CheckedVariableAnalyzer Worker(Collector);
+      auto Info = std::make_unique<CheckedVariableInfo>();
+      for (const SanitizerCheckInfo::CheckEntry &Entry :
+           FunctionChecks[Idx]->checks())
+        if (isCoreCheck(Entry.Check))
+          if (std::optional<CheckedVariable> Var =
+                  Worker.analyzeCheck(Entry.Call))
+            Info->addVariable(std::move(*Var));
+      Results[Idx] = std::move(Info);
+    });
+  }
+  Pool.wait();
+
+  for (unsigned Idx = 0, E = Functions.size(); Idx != E; ++Idx)
+    AnalyzedVariables[Functions[Idx]] = std::move(Results[Idx]);
+}
+
 const CheckGraphBuilder::VariableCheckGroups &
 CheckGraphBuilder::groupChecksByVariable() {
   if (GroupsComputed)
     return Groups;
 
-  Groups.clear();
+  releaseChecks();
+  for (Function &F : M)
+    if (!F.isDeclaration())
+      addFunctionChecks(F);
 
-  for (Function &F : M) {
-    if (F.isDeclaration())
-      continue;
+  GroupsComputed = true;
+  return Groups;
+}
+
+const CheckGraphBuilder::VariableCheckGroups &
+CheckGraphBuilder::groupChecksInFunction(Function &F) {
+  // Function-scoped groups replace whatever was grouped before, so memory
+  // stays bounded by the current function.
+  releaseChecks();
+  if (!F.isDeclaration())
+    addFunctionChecks(F);
+  AnalyzedVariables.erase(&F);
+  return Groups;
+}
+
+void CheckGraphBuilder::invalidateFunction(Function &F) {
+  releaseChecks();
+  AnalyzedVariables.erase(&F);
+  if (FAM)
+    FAM->invalidate(F, PreservedAnalyses::none());
+}
+
+void CheckGraphBuilder::releaseChecks() {
+  Checks.clear();
+  Groups.clear();
+  GroupIndices.clear();
+  OffsetPool.clear();
+  OffsetAllocator.Reset();
+  UnifiedBases.clear();
+  UnifiedValues.clear();
+  FunctionAnalysisCache.clear();
+  DominatorTrees.clear();
+  DominanceIndices.clear();
+  ReachabilityIndices.clear();
+  GroupsComputed = false;
+}
 
+void CheckGraphBuilder::addFunctionChecks(Function &F) {
+  std::vector<CheckedVariable> FunctionChecks;
+  if (FAM) {
+    const SanitizerCheckInfo &CheckInfo =
+        FAM->getResult<SanitizerCheckAnalysis>(F);
+    const CheckedVariableInfo &Variables = getCheckedVariables(F);
+    for (const SanitizerCheckInfo::CheckEntry &Entry : CheckInfo.checks())
+      if (isCoreCheck(Entry.Check))
+        if (const CheckedVariable *Var = Variables.lookup(Entry.Call))
+          FunctionChecks.push_back(*Var);
+  } else {
     for (Instruction &I : instructions(F)) {
       auto *CB = dyn_cast<CallBase>(&I);
       if (!CB)
@@ -173,31 +348,153 @@ CheckGraphBuilder::groupChecksByVariable() {
       if (!Check || !isCoreCheck(*Check))
         continue;
 
-      std::optional<CheckedVariable> Var = Analyzer.analyzeCheck(CB);
-      if (!Var)
-        continue;
+      if (std::optional<CheckedVariable> Var = Analyzer.analyzeCheck(CB))
+        FunctionChecks.push_back(std::move(*Var));
+    }
+  }
+
+  if (UnifyCheckedVariables && !FunctionChecks.empty())
+    unifyFunctionChecks(F, FunctionChecks);
+  for (CheckedVariable &Var : FunctionChecks)
+    addCheck(std::move(Var));
+}
 
-      Groups[makeVariableKey(*Var)].push_back(*Var);
+// The analyzer keys a check by the slot its pointer was loaded from, so at
+// -O0 a reload and the pointer it reloads land in different groups. A base
+// joins the object its addresses point into when every check on it agrees
+// on that object; objects then merge when alias analysis says they must
+// alias. Offsets and addresses map to their value-numbered representative.
+// A slot reassigned between reloads holds different objects, so each of
+// its checks is keyed by the object it reaches instead. Only keys change:
+// the checked IR values stay as the analyzer found them.
+void CheckGraphBuilder::unifyFunctionChecks(
+    Function &F, MutableArrayRef<CheckedVariable> FunctionChecks) {
+  VariableUnifier Unifier(getAliasAnalysis(F), getMemorySSA(F),
+                          getScalarEvolution(F));
+
+  MapVector<Value *, Value *> BaseRoots;
+  SmallVector<Value *, 16> VarRoots;
+  for (const CheckedVariable &Var : FunctionChecks) {
+    for (Value *Offset : Var.Offsets)
+      if (Value *Canon = Unifier.getCanonicalValue(Offset); Canon != Offset)
+        UnifiedValues[Offset] = Canon;
+    if (Value *Canon = Unifier.getCanonicalValue(Var.Address);
+        Canon != Var.Address)
+      UnifiedValues[Var.Address] = Canon;
+
+    Value *Root = nullptr;
+    if (Var.Base && Var.Address && Var.Address->getType()->isPointerTy())
+      Root = Unifier.getCanonicalRoot(Var.Address);
+    VarRoots.push_back(Root);
+    if (!Var.Base)
+      continue;
+    auto [It, Inserted] = BaseRoots.insert({Var.Base, Root});
+    if (!Inserted && It->second != Root)
+      It->second = nullptr;
+  }
+
+  for (auto [Var, Root] : zip(FunctionChecks, VarRoots)) {
+    if (!Root || BaseRoots.lookup(Var.Base))
+      continue;
+    Var.Base = Root;
+    BaseRoots.insert({Root, Root});
+  }
+
+  SmallVector<Value *, 8> Roots;
+  for (auto &[Base, Root] : BaseRoots) {
+    if (!Root)
+      continue;
+    if (Root != Base)
+      uniteBases(Base, Root);
+    if (is_contained(Roots, Root))
+      continue;
+
+    unsigned Queries = 0;
+    for (Value *Other : reverse(Roots)) {
+      if (++Queries > MaxMustAliasQueries)
+        break;
+      if (Unifier.mustAlias(Root, Other))
+        uniteBases(Root, Other);
     }
+    Roots.push_back(Root);
   }
+}
 
-  GroupsComputed = true;
-  return Groups;
+// Leaders are kept stable across functions: a global always leads its
+// class, and two globals are never merged.
+void CheckGraphBuilder::uniteBases(Value *Base, Value *Root) {
+  Value *BaseLeader = getUnifiedBase(Base);
+  Value *RootLeader = getUnifiedBase(Root);
+  if (BaseLeader == RootLeader)
+    return;
+
+  bool BaseIsGlobal = isa<GlobalValue>(BaseLeader);
+  bool RootIsGlobal = isa<GlobalValue>(RootLeader);
+  if (BaseIsGlobal && RootIsGlobal)
+    return;
+  if (BaseIsGlobal)
+    UnifiedBases[RootLeader] = BaseLeader;
+  else
+    UnifiedBases[BaseLeader] = RootLeader;
+}
+
+Value *CheckGraphBuilder::getUnifiedBase(Value *Base) const {
+  for (auto It = UnifiedBases.find(Base); It != UnifiedBases.end();
+       It = UnifiedBases.find(Base))
+    Base = It->second;
+  return Base;
+}
+
+Value *CheckGraphBuilder::getUnifiedValue(Value *V) const {
+  auto It = UnifiedValues.find(V);
+  return It == UnifiedValues.end() ? V : It->second;
+}
+
+void CheckGraphBuilder::addCheck(CheckedVariable Var) {
+  VariableKey Key = makeVariableKey(Var);
+  auto [It, Inserted] = GroupIndices.try_emplace(Key, Groups.size());
+  if (Inserted)
+    Groups.push_back(VariableCheckGroup{Key, {}});
+
+  Groups[It->second].Checks.push_back(Checks.size());
+  Checks.push_back(std::move(Var));
+}
+
+const CheckedVariableInfo &CheckGraphBuilder::getCheckedVariables(Function &F) {
+  auto It = AnalyzedVariables.find(&F);
+  if (It != AnalyzedVariables.end())
+    return *It->second;
+  return FAM->getResult<CheckedVariableAnalysis>(F);
 }
 
 std::unique_ptr<CheckGraph>
 CheckGraphBuilder::buildGraphForVariable(CheckedVariable Var) {
   groupChecksByVariable();
 
-  auto Graph = std::make_unique<CheckGraph>();
+  VariableKey Key = makeVariableKey(Var);
+  auto GroupIt = GroupIndices.find(Key);
+  if (GroupIt == GroupIndices.end()) {
+    auto Graph = std::make_unique<CheckGraph>();
+    Graph->Var = Var;
+    Graph->Key = Key;
+    return Graph;
+  }
+
+  std::unique_ptr<CheckGraph> Graph =
+      buildGraphForGroup(Groups[GroupIt->second]);
   Graph->Var = Var;
-  Graph->Key = makeVariableKey(Var);
+  return Graph;
+}
 
-  auto GroupIt = Groups.find(Graph->Key);
-  if (GroupIt == Groups.end())
-    return Graph;
+std::unique_ptr<CheckGraph>
+CheckGraphBuilder::buildGraphForGroup(const VariableCheckGroup &Group) {
+  auto Graph = std::make_unique<CheckGraph>();
+  Graph->Key = Group.Key;
+  if (!Group.Checks.empty())
+    Graph->Var = Checks[Group.Checks.front()];
 
-  for (const CheckedVariable &GroupedVar : GroupIt->second) {
+  for (unsigned Index : Group.Checks) {
+    const CheckedVariable &GroupedVar = Checks[Index];
     auto Node = std::make_unique<CheckNode>();
     Node->Id = Graph->Nodes.size();
     Node->CheckInst = GroupedVar.CheckInst;
@@ -231,66 +528,95 @@ void CheckGraphBuilder::computeReachability(CheckGraph &Graph) {
       if (!isReachable(*From, *To))
         continue;
 
-      appendUniqueNode(From->Successors, To);
-      appendUniqueNode(To->Predecessors, From);
+      From->Successors.push_back(To);
+      To->Predecessors.push_back(From);
     }
   }
 }
 
 void CheckGraphBuilder::computeDominance(CheckGraph &Graph) {
+  MapVector<Function *, SmallVector<CheckNode *, 8>> NodesByFunction;
   for (CheckNode *Node : Graph.Nodes) {
     Node->Dominators.clear();
     Node->DominatedNodes.clear();
+    if (Instruction *Anchor = nodeAnchor(*Node))
+      NodesByFunction[Anchor->getFunction()].push_back(Node);
   }
 
-  for (CheckNode *CandidateDom : Graph.Nodes) {
-    Instruction *CandidateAnchor = nodeAnchor(*CandidateDom);
-    if (!CandidateAnchor)
-      continue;
-
-    Function *DomFunction = CandidateAnchor->getFunction();
-    DominatorTree &DT = getDominatorTree(*DomFunction);
-
-    for (CheckNode *Node : Graph.Nodes) {
-      Instruction *NodeAnchor = nodeAnchor(*Node);
-      if (CandidateDom == Node || !NodeAnchor)
-        continue;
-      if (NodeAnchor->getFunction() != DomFunction)
-        continue;
-
-      if (!DT.dominates(CandidateAnchor, NodeAnchor))
-        continue;
-
-      appendUniqueNode(Node->Dominators, CandidateDom);
-      appendUniqueNode(CandidateDom->DominatedNodes, Node);
+  SmallVector<const Instruction *, 8> Anchors;
+  SmallVector<DominanceIndex::DominancePair, 16> Pairs;
+  for (auto &Entry : NodesByFunction) {
+    Anchors.clear();
+    Pairs.clear();
+    for (CheckNode *Node : Entry.second)
+      Anchors.push_back(nodeAnchor(*Node));
+
+    getDominanceIndex(*Entry.first).computeDominancePairs(Anchors, Pairs);
+    for (auto [DomIdx, NodeIdx] : Pairs) {
+      CheckNode *Dom = Entry.second[DomIdx];
+      CheckNode *Node = Entry.second[NodeIdx];
+      Node->Dominators.push_back(Dom);
+      Dom->DominatedNodes.push_back(Node);
     }
   }
+
+  auto ById = [](const CheckNode *LHS, const CheckNode *RHS) {
+    return LHS->Id < RHS->Id;
+  };
+  for (CheckNode *Node : Graph.Nodes) {
+    llvm::sort(Node->Dominators, ById);
+    llvm::sort(Node->DominatedNodes, ById);
+  }
 }
 
-VariableKey CheckGraphBuilder::makeVariableKey(const CheckedVariable &Var) const {
+VariableKey CheckGraphBuilder::makeVariableKey(const CheckedVariable &Var) {
   VariableKey Key;
   Key.Sanitizer = Var.Sanitizer;
-  Key.Base = Var.Base;
+  Key.Base = getUnifiedBase(Var.Base);
 
   if (DistinguishStaticOffsets && Var.HasStaticByteOffset) {
     Key.HasStaticByteOffset = true;
     Key.StaticByteOffset = Var.StaticByteOffset;
   }
 
-  if (!Var.HasStaticByteOffset && !GroupDynamicOffsetsByBase)
-    Key.Offsets.append(Var.Offsets.begin(), Var.Offsets.end());
+  if (!Var.HasStaticByteOffset && !GroupDynamicOffsetsByBase) {
+    SmallVector<Value *, 4> Offsets;
+    for (Value *Offset : Var.Offsets)
+      Offsets.push_back(getUnifiedValue(Offset));
+    Key.Offsets = internOffsets(Offsets);
+  }
+
+  Key.Hash = static_cast<unsigned>(
+      hash_combine(static_cast<unsigned>(Key.Sanitizer), Key.Base,
+                   Key.Offsets.data(), Key.Offsets.size(),
+                   Key.HasStaticByteOffset, Key.StaticByteOffset));
   return Key;
 }
 
+ArrayRef<Value *> CheckGraphBuilder::internOffsets(ArrayRef<Value *> Offsets) {
+  if (Offsets.empty())
+    return {};
+
+  auto It = OffsetPool.find(Offsets);
+  if (It != OffsetPool.end())
+    return *It;
+
+  Value **Storage = OffsetAllocator.Allocate<Value *>(Offsets.size());
+  std::uninitialized_copy(Offsets.begin(), Offsets.end(), Storage);
+  ArrayRef<Value *> Interned(Storage, Offsets.size());
+  OffsetPool.insert(Interned);
+  return Interned;
+}
+
 bool CheckGraphBuilder::isCoreCheck(
     const SanitizerCheckCollector::ClassifiedCheck &Check) const {
   if (CoreCheckSet.empty())
     return true;
-  return CoreCheckSet.count({Check.Sanitizer, Check.CheckType}) != 0;
+  return CoreCheckSet.count({Check.Sanitizer, Check.TypeId}) != 0;
 }
 
 bool CheckGraphBuilder::isReachable(const CheckNode &From,
-                                    const CheckNode &To) const {
+                                    const CheckNode &To) {
   Instruction *FromAnchor = nodeAnchor(From);
   Instruction *ToAnchor = nodeAnchor(To);
 
@@ -299,32 +625,14 @@ bool CheckGraphBuilder::isReachable(const CheckNode &From,
   if (FromAnchor->getFunction() != ToAnchor->getFunction())
     return false;
 
-  if (From.BB == To.BB)
-    return instructionComesBefore(FromAnchor, ToAnchor);
-
-  SmallPtrSet<const BasicBlock *, 32> Visited;
-  std::queue<const BasicBlock *> Worklist;
-
-  for (const BasicBlock *Succ : successors(From.BB))
-    Worklist.push(Succ);
-
-  while (!Worklist.empty()) {
-    const BasicBlock *Current = Worklist.front();
-    Worklist.pop();
-    if (!Visited.insert(Current).second)
-      continue;
-
-    if (Current == To.BB)
-      return true;
-
-    for (const BasicBlock *Succ : successors(Current))
-      Worklist.push(Succ);
-  }
-
-  return false;
+  return getReachabilityIndex(*FromAnchor->getFunction())
+      .isReachable(FromAnchor, ToAnchor);
 }
 
 DominatorTree &CheckGraphBuilder::getDominatorTree(Function &F) {
+  if (FAM)
+    return FAM->getResult<DominatorTreeAnalysis>(F);
+
   auto It = DominatorTrees.find(&F);
   if (It != DominatorTrees.end())
     return *It->second;
@@ -335,6 +643,83 @@ DominatorTree &CheckGraphBuilder::getDominatorTree(Function &F) {
   return Result;
 }
 
+LoopInfo &CheckGraphBuilder::getLoopInfo(Function &F) {
+  if (FAM)
+    return FAM->getResult<LoopAnalysis>(F);
+  return getFunctionAnalyses(F).LI;
+}
+
+ScalarEvolution &CheckGraphBuilder::getScalarEvolution(Function &F) {
+  if (FAM)
+    return FAM->getResult<ScalarEvolutionAnalysis>(F);
+  return getFunctionAnalyses(F).SE;
+}
+
+AAResults &CheckGraphBuilder::getAliasAnalysis(Function &F) {
+  if (FAM)
+    return FAM->getResult<AAManager>(F);
+  return getFunctionAnalyses(F).AA;
+}
+
+const TargetLibraryInfo &CheckGraphBuilder::getTargetLibraryInfo(Function &F) {
+  if (FAM)
+    return FAM->getResult<TargetLibraryAnalysis>(F);
+  return getFunctionAnalyses(F).TLI;
+}
+
+MemorySSA &CheckGraphBuilder::getMemorySSA(Function &F) {
+  if (FAM)
+    return FAM->getResult<MemorySSAAnalysis>(F).getMSSA();
+
+  FunctionAnalyses &Analyses = getFunctionAnalyses(F);
+  if (!Analyses.MSSA)
+    Analyses.MSSA = std::make_unique<MemorySSA>(F, &Analyses.AA,
+                                                &getDominatorTree(F));
+  return *Analyses.MSSA;
+}
+
+// LazyValueInfo is only taken from the analysis manager: its constructor
+// differs across the supported LLVM releases.
+LazyValueInfo *CheckGraphBuilder::getLazyValueInfo(Function &F) {
+  if (FAM)
+    return &FAM->getResult<LazyValueAnalysis>(F);
+  return nullptr;
+}
+
+CheckGraphBuilder::FunctionAnalyses &
+CheckGraphBuilder::getFunctionAnalyses(Function &F) {
+  auto It = FunctionAnalysisCache.find(&F);
+  if (It != FunctionAnalysisCache.end())
+    return *It->second;
+
+  auto Analyses = std::make_unique<FunctionAnalyses>(F, getDominatorTree(F));
+  FunctionAnalyses &Result = *Analyses;
+  FunctionAnalysisCache[&F] = std::move(Analyses);
+  return Result;
+}
+
+DominanceIndex &CheckGraphBuilder::getDominanceIndex(Function &F) {
+  auto It = DominanceIndices.find(&F);
+  if (It != DominanceIndices.end())
+    return *It->second;
+
+  auto Index = std::make_unique<DominanceIndex>(getDominatorTree(F));
+  DominanceIndex &Result = *Index;
+  DominanceIndices[&F] = std::move(Index);
+  return Result;
+}
+
+ReachabilityIndex &CheckGraphBuilder::getReachabilityIndex(Function &F) {
+  auto It = ReachabilityIndices.find(&F);
+  if (It != ReachabilityIndices.end())
+    return *It->second;
+
+  auto Index = std::make_unique<ReachabilityIndex>(F);
+  ReachabilityIndex &Result = *Index;
+  ReachabilityIndices[&F] = std::move(Index);
+  return Result;
+}
+
 void printVariableKey(raw_ostream &OS, const VariableKey &Key) {
   OS << "Sanitizer: " << sanitizerKindName(Key.Sanitizer) << "\n";
   OS << "Base: ";
@@ -88,15 +88,35 @@ bool hasNonSanitizerPredecessor(BasicBlock *BB,
   return false;
 }
 
+void compactSlice(CheckSlice &Slice) {
+  erase_if(Slice.OrderedInstructions, [&Slice](Instruction *I) {
+    return !Slice.Instructions.contains(I);
+  });
+  erase_if(Slice.OrderedBlocks,
+           [&Slice](BasicBlock *BB) { return !Slice.Blocks.contains(BB); });
+}
+
 } // namespace
 
 CheckSliceRemover::CheckSliceRemover(Module &M) : M(M) {}
 
 CheckSlice CheckSliceRemover::collectCheckSlice(CallBase *CB) {
   CheckSlice Slice;
-  if (!CB)
+  if (!CB || !CB->getFunction())
     return Slice;
 
+  FunctionOwnership &Ownership = getOwnership(*CB->getFunction());
+  auto It = Ownership.Slices.find(CB);
+  if (It != Ownership.Slices.end()) {
+    compactSlice(It->second);
+    return It->second;
+  }
+
+  buildCheckSlice(Slice, CB);
+  return Slice;
+}
+
+void CheckSliceRemover::buildCheckSlice(CheckSlice &Slice, CallBase *CB) {
   addInstruction(Slice, CB);
   collectBackwardFromInstruction(Slice, CB);
 
@@ -104,13 +124,193 @@ CheckSlice CheckSliceRemover::collectCheckSlice(CallBase *CB) {
     addBlock(Slice, CB->getParent());
 
   collectControlFlowSlice(Slice, CB);
+}
+
+CheckSliceRemover::FunctionOwnership &
+CheckSliceRemover::getOwnership(Function &F) {
+  std::unique_ptr<FunctionOwnership> &Ownership = Ownerships[&F];
+  if (!Ownership) {
+    Ownership = std::make_unique<FunctionOwnership>();
+    computeOwnership(F, *Ownership);
+  }
+  return *Ownership;
+}
+
+void CheckSliceRemover::computeOwnership(Function &F,
+                                         FunctionOwnership &Ownership) {
+  SmallVector<CallBase *, 16> FunctionChecks;
+  for (BasicBlock &BB : F) {
+    BlockOwnership &BlockInfo = Ownership.Blocks[&BB];
+    for (Instruction &I : BB) {
+      bool IsCheck = false;
+      if (auto *CB = dyn_cast<CallBase>(&I)) {
+        if (Collector.classifyCheck(CB)) {
+          IsCheck = true;
+          BlockInfo.Checks.push_back(CB);
+          FunctionChecks.push_back(CB);
+        }
+      }
+
+      bool SanitizerOnly = IsCheck || classifySanitizerOnlyInstruction(&I);
+      Ownership.Instructions[&I].SanitizerOnly = SanitizerOnly;
+      if (!SanitizerOnly)
+        ++BlockInfo.NonSanitizerInstructions;
+    }
+  }
+
+  // Every slice is labelled onto the instructions and blocks it covers, so an
+  // instruction shared by several checks carries one owner per check.
+  for (CallBase *CB : FunctionChecks) {
+    CheckSlice &Slice = Ownership.Slices[CB];
+    buildCheckSlice(Slice, CB);
+    for (Instruction *I : Slice.OrderedInstructions)
+      Ownership.Instructions[I].Owners.push_back(CB);
+    for (BasicBlock *BB : Slice.OrderedBlocks)
+      Ownership.Blocks[BB].Owners.push_back(CB);
+  }
+}
+
+const CheckSliceRemover::FunctionOwnership *
+CheckSliceRemover::lookupOwnership(const Function *F) const {
+  auto It = Ownerships.find(F);
+  if (It == Ownerships.end())
+    return nullptr;
+  return It->second.get();
+}
+
+CheckSlice CheckSliceRemover::takeCheckSlice(CallBase *CB) {
+  CheckSlice Slice;
+  FunctionOwnership &Ownership = getOwnership(*CB->getFunction());
+  auto It = Ownership.Slices.find(CB);
+  if (It == Ownership.Slices.end()) {
+    buildCheckSlice(Slice, CB);
+    return Slice;
+  }
+
+  Slice = std::move(It->second);
+  Ownership.Slices.erase(It);
+  compactSlice(Slice);
+  releaseOwnership(Ownership, CB, Slice);
   return Slice;
 }
 
+void CheckSliceRemover::releaseOwnership(FunctionOwnership &Ownership,
+                                         CallBase *CB,
+                                         const CheckSlice &Slice) {
+  auto IsOwner = [CB](CallBase *Owner) { return Owner == CB; };
+  for (Instruction *I : Slice.OrderedInstructions) {
+    auto It = Ownership.Instructions.find(I);
+    if (It != Ownership.Instructions.end())
+      erase_if(It->second.Owners, IsOwner);
+  }
+  for (BasicBlock *BB : Slice.OrderedBlocks) {
+    auto It = Ownership.Blocks.find(BB);
+    if (It != Ownership.Blocks.end())
+      erase_if(It->second.Owners, IsOwner);
+  }
+}
+
+bool CheckSliceRemover::hasLiveOwners(const Instruction *I) const {
+  const FunctionOwnership *Ownership = lookupOwnership(I->getFunction());
+  if (!Ownership)
+    return false;
+
+  auto It = Ownership->Instructions.find(I);
+  return It != Ownership->Instructions.end() && !It->second.Owners.empty();
+}
+
+void CheckSliceRemover::forgetInstruction(Instruction *I) {
+  auto OwnershipIt = Ownerships.find(I->getFunction());
+  if (OwnershipIt == Ownerships.end())
+    return;
+  FunctionOwnership &Ownership = *OwnershipIt->second;
+
+  if (auto *CB = dyn_cast<CallBase>(I)) {
+    auto SliceIt = Ownership.Slices.find(CB);
+    if (SliceIt != Ownership.Slices.end()) {
+      CheckSlice Slice = std::move(SliceIt->second);
+      Ownership.Slices.erase(SliceIt);
+      releaseOwnership(Ownership, CB, Slice);
+    }
+
+    auto BlockIt = Ownership.Blocks.find(I->getParent());
+    if (BlockIt != Ownership.Blocks.end())
+      erase_if(BlockIt->second.Checks,
+               [CB](CallBase *Check) { return Check == CB; });
+  }
+
+  auto It = Ownership.Instructions.find(I);
+  if (It == Ownership.Instructions.end())
+    return;
+
+  // Owners keep their ordered lists; entries missing from the set are
+  // skipped, which avoids rewriting every shared slice on each erase.
+  for (CallBase *Owner : It->second.Owners) {
+    auto SliceIt = Ownership.Slices.find(Owner);
+    if (SliceIt != Ownership.Slices.end())
+      SliceIt->second.Instructions.erase(I);
+  }
+
+  if (!It->second.SanitizerOnly) {
+    auto BlockIt = Ownership.Blocks.find(I->getParent());
+    if (BlockIt != Ownership.Blocks.end() &&
+        BlockIt->second.NonSanitizerInstructions)
+      --BlockIt->second.NonSanitizerInstructions;
+  }
+  Ownership.Instructions.erase(It);
+}
+
+void CheckSliceRemover::forgetBlock(BasicBlock *BB) {
+  for (Instruction &I : *BB)
+    forgetInstruction(&I);
+
+  auto OwnershipIt = Ownerships.find(BB->getParent());
+  if (OwnershipIt == Ownerships.end())
+    return;
+  FunctionOwnership &Ownership = *OwnershipIt->second;
+
+  auto It = Ownership.Blocks.find(BB);
+  if (It == Ownership.Blocks.end())
+    return;
+
+  for (CallBase *Owner : It->second.Owners) {
+    auto SliceIt = Ownership.Slices.find(Owner);
+    if (SliceIt != Ownership.Slices.end())
+      SliceIt->second.Blocks.erase(BB);
+  }
+  Ownership.Blocks.erase(It);
+}
+
+void CheckSliceRemover::noteChanged(const Function *F, bool CFGChanged) {
+  ChangedFunctions.insert(F);
+  if (CFGChanged)
+    CFGChangedFunctions.insert(F);
+}
+
+void CheckSliceRemover::eraseInstruction(Instruction *I) {
+  noteChanged(I->getFunction(), I->isTerminator());
+  addDeadCandidates(I);
+  forgetInstruction(I);
+  I->eraseFromParent();
+}
+
 bool CheckSliceRemover::isSanitizerOnlyInstruction(Instruction *I) const {
   if (!I)
     return false;
 
+  if (const FunctionOwnership *Ownership =
+          lookupOwnership(I->getFunction())) {
+    auto It = Ownership->Instructions.find(I);
+    if (It != Ownership->Instructions.end())
+      return It->second.SanitizerOnly;
+  }
+  return classifySanitizerOnlyInstruction(I);
+}
+
+bool CheckSliceRemover::classifySanitizerOnlyInstruction(Instruction *I) const {
+  if (!I)
+    return false;
+
   if (auto *CB = dyn_cast<CallBase>(I)) {
     if (Collector.classifyCheck(CB))
       return true;
@@ -147,84 +347,127 @@ bool CheckSliceRemover::removeCheckSlice(CheckNode *N) {
   if (!N || !N->CheckInst)
     return false;
 
-  CallBase *CB = N->CheckInst;
-  Function *F = CB->getFunction();
-  if (F)
-    TouchedFunctions.insert(F);
-
-  CheckSlice Slice = collectCheckSlice(CB);
-  bool RemovedCheck = bypassReportBlock(Slice, CB);
+  if (!eraseCheckSlice(N->CheckInst))
+    return false;
 
-  if (RemovedCheck) {
-    cleanupDeadInstructions();
-    simplifyCFG();
-    return true;
-  }
+  cleanupDeadInstructions();
+  simplifyCFG();
+  return true;
+}
 
-  if (!RemovedCheck)
-    RemovedCheck = eraseDirectCheckCall(CB);
+std::size_t CheckSliceRemover::removeCheckSlices(ArrayRef<CallBase *> Calls) {
+  // Removing a slice never deletes blocks other than its own report block,
+  // but slice cleanup can erase instructions; track the remaining calls.
+  SmallVector<WeakTrackingVH, 32> PendingCalls(Calls.begin(), Calls.end());
 
-  if (!RemovedCheck)
-    return false;
+  std::size_t Removed = 0;
+  for (WeakTrackingVH &Pending : PendingCalls) {
+    auto *CB = dyn_cast_or_null<CallBase>(Pending);
+    if (CB && eraseCheckSlice(CB))
+      ++Removed;
+  }
 
-  eraseDeadSliceInstructions(Slice);
   cleanupDeadInstructions();
   simplifyCFG();
-  return true;
+  return Removed;
 }
 
-std::size_t CheckSliceRemover::cleanupDeadInstructions() {
-  std::size_t DeadCount = 0;
+bool CheckSliceRemover::eraseCheckSlice(CallBase *CB) {
+  if (!CB->getFunction())
+    return false;
 
-  while (true) {
-    SmallVector<WeakTrackingVH, 64> DeadInsts;
+  CheckSlice Slice = takeCheckSlice(CB);
+  if (bypassReportBlock(Slice, CB))
+    return true;
 
-    for (Function *F : TouchedFunctions) {
-      if (!F || F->isDeclaration())
-        continue;
-      for (BasicBlock &BB : *F)
-        for (Instruction &I : BB)
-          if (isInstructionTriviallyDead(&I))
-            DeadInsts.push_back(&I);
-    }
+  // The call is erased below; keep the slice free of dangling entries.
+  if (Slice.Instructions.erase(CB))
+    erase_if(Slice.OrderedInstructions,
+             [CB](Instruction *I) { return I == CB; });
 
-    if (DeadInsts.empty())
-      break;
+  if (!eraseDirectCheckCall(CB))
+    return false;
 
-    DeadCount += DeadInsts.size();
-    RecursivelyDeleteTriviallyDeadInstructions(DeadInsts);
-  }
+  eraseDeadSliceInstructions(Slice);
+  return true;
+}
+
+std::size_t CheckSliceRemover::cleanupDeadInstructions() {
+  SmallVector<WeakTrackingVH, 64> DeadInsts;
+  for (WeakTrackingVH &Candidate : DeadCandidates)
+    if (auto *I = dyn_cast_or_null<Instruction>(Candidate))
+      if (isInstructionTriviallyDead(I))
+        DeadInsts.push_back(I);
+  DeadCandidates.clear();
+
+  // Ownership labels are only maintained across slice erasure; general
+  // cleanup rebuilds them on the next request.
+  if (!DeadInsts.empty())
+    Ownerships.clear();
 
+  std::size_t DeadCount = 0;
+  RecursivelyDeleteTriviallyDeadInstructionsPermissive(
+      DeadInsts, nullptr, nullptr, [this, &DeadCount](Value *V) {
+        noteChanged(cast<Instruction>(V)->getFunction(), false);
+        ++DeadCount;
+      });
   return DeadCount;
 }
 
+void CheckSliceRemover::releaseFunction(const Function &F) {
+  Ownerships.erase(&F);
+}
+
 bool CheckSliceRemover::simplifyCFG() {
   bool Changed = false;
+  if (!BlockCandidates.empty())
+    Ownerships.clear();
 
-  for (Function *F : TouchedFunctions) {
-    if (!F || F->isDeclaration())
+  while (!BlockCandidates.empty()) {
+    auto *BB = dyn_cast_or_null<BasicBlock>(BlockCandidates.pop_back_val());
+    if (!BB || !BB->getParent() || BB->isEntryBlock())
       continue;
 
-    Changed |= EliminateUnreachableBlocks(*F);
-
-    bool LocalChanged = true;
-    while (LocalChanged) {
-      LocalChanged = false;
-      for (BasicBlock &BB : make_early_inc_range(*F)) {
-        if (&BB == &F->getEntryBlock())
-          continue;
-        if (MergeBlockIntoPredecessor(&BB)) {
-          Changed = true;
-          LocalChanged = true;
-          break;
-        }
-      }
+    if (pred_empty(BB)) {
+      for (BasicBlock *Succ : successors(BB))
+        addBlockCandidate(Succ);
+      for (Instruction &I : *BB)
+        addDeadCandidates(&I);
+      noteChanged(BB->getParent(), true);
+      DeleteDeadBlock(BB);
+      Changed = true;
+      continue;
     }
+
+    BasicBlock *Pred = BB->getSinglePredecessor();
+    Function *F = BB->getParent();
+    if (!Pred || !MergeBlockIntoPredecessor(BB))
+      continue;
+
+    noteChanged(F, true);
+    // The predecessor now ends with the merged block's terminator, so its
+    // new successors may have become mergeable as well.
+    for (BasicBlock *Succ : successors(Pred))
+      addBlockCandidate(Succ);
+    Changed = true;
   }
 
+  if (!DeadCandidates.empty())
+    cleanupDeadInstructions();
   return Changed;
 }
 
+void CheckSliceRemover::addDeadCandidates(Instruction *I) {
+  for (Value *Op : I->operands())
+    if (auto *OpI = dyn_cast<Instruction>(Op))
+      DeadCandidates.push_back(OpI);
+}
+
+void CheckSliceRemover::addBlockCandidate(BasicBlock *BB) {
+  if (BB)
+    BlockCandidates.push_back(BB);
+}
+
 bool CheckSliceRemover::addInstruction(CheckSlice &Slice, Instruction *I) {
   if (!I || !isSanitizerOnlyInstruction(I))
     return false;
@@ -233,8 +476,6 @@ bool CheckSliceRemover::addInstruction(CheckSlice &Slice, Instruction *I) {
     return false;
 
   Slice.OrderedInstructions.push_back(I);
-  if (Function *F = I->getFunction())
-    TouchedFunctions.insert(F);
   return true;
 }
 
@@ -246,8 +487,6 @@ bool CheckSliceRemover::addBlock(CheckSlice &Slice, BasicBlock *BB) {
     return false;
 
   Slice.OrderedBlocks.push_back(BB);
-  if (Function *F = BB->getParent())
-    TouchedFunctions.insert(F);
 
   for (Instruction &I : *BB)
     addInstruction(Slice, &I);
@@ -311,6 +550,15 @@ bool CheckSliceRemover::isSanitizerOnlyBlock(BasicBlock *BB,
   if (!BB)
     return false;
 
+  if (const FunctionOwnership *Ownership =
+          lookupOwnership(BB->getParent())) {
+    auto It = Ownership->Blocks.find(BB);
+    if (It != Ownership->Blocks.end())
+      return !It->second.NonSanitizerInstructions &&
+             all_of(It->second.Checks,
+                    [TargetCB](CallBase *CB) { return CB == TargetCB; });
+  }
+
   for (Instruction &I : *BB) {
     if (auto *CB = dyn_cast<CallBase>(&I))
       if (Collector.classifyCheck(CB) && CB != TargetCB)
@@ -323,9 +571,9 @@ bool CheckSliceRemover::isSanitizerOnlyBlock(BasicBlock *BB,
 
 bool CheckSliceRemover::canEraseInstruction(Instruction *I,
                                             const CheckSlice &Slice) const {
-  if (!I || !I->getParent())
+  if (!I || !Slice.Instructions.contains(I) || !I->getParent())
     return false;
-  if (!Slice.Instructions.contains(I))
+  if (hasLiveOwners(I))
     return false;
   if (I->isTerminator())
     return false;
@@ -413,15 +661,23 @@ bool CheckSliceRemover::bypassReportBlock(CheckSlice &Slice, CallBase *CB) {
     collectBackwardFromInstruction(Slice, BI);
     ReportBB->removePredecessor(Pred, false);
     BranchInst::Create(SafeSucc, BI);
-    BI->eraseFromParent();
+    addBlockCandidate(SafeSucc);
+    eraseInstruction(BI);
   }
 
+  addBlockCandidate(ReportBB);
   if (hasNonSanitizerPredecessor(ReportBB, Slice.Blocks))
     return false;
 
   if (!pred_empty(ReportBB))
     return false;
 
+  for (BasicBlock *Succ : successors(ReportBB))
+    addBlockCandidate(Succ);
+  for (Instruction &I : *ReportBB)
+    addDeadCandidates(&I);
+  forgetBlock(ReportBB);
+  noteChanged(ReportBB->getParent(), true);
   DeleteDeadBlock(ReportBB);
   return true;
 }
@@ -431,8 +687,7 @@ bool CheckSliceRemover::eraseDirectCheckCall(CallBase *CB) {
   if (!CI || !CI->use_empty())
     return false;
 
-  TouchedFunctions.insert(CI->getFunction());
-  CI->eraseFromParent();
+  eraseInstruction(CI);
   return true;
 }
 
@@ -446,7 +701,8 @@ std::size_t CheckSliceRemover::eraseDeadSliceInstructions(CheckSlice &Slice) {
       if (!canEraseInstruction(I, Slice))
         continue;
 
-      I->eraseFromParent();
+      Slice.Instructions.erase(I);
+      eraseInstruction(I);
       ++Removed;
       Changed = true;
     }
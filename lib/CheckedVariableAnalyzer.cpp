@@ -11,6 +11,7 @@
 #include "llvm/IR/DataLayout.h"
 #include "llvm/IR/Function.h"
 #include "llvm/IR/GlobalValue.h"
+#include "llvm/IR/GlobalVariable.h"
 #include "llvm/IR/InstrTypes.h"
 #include "llvm/IR/Instructions.h"
 #include "llvm/IR/IntrinsicInst.h"
@@ -19,6 +20,7 @@
 #include "llvm/IR/Value.h"
 #include "llvm/Support/raw_ostream.h"
 
+#include <algorithm>
 #include <cctype>
 #include <cstddef>
 #include <cstdint>
@@ -72,6 +74,68 @@ bool isShiftOutOfBoundsCheck(StringRef Name) {
   return Name.starts_with("__ubsan_handle_shift_out_of_bounds");
 }
 
+// Clang's CodeGenFunction::TypeCheckKind.
+enum class TypeCheckKind : uint64_t {
+  Load,
+  Store,
+  ReferenceBinding,
+  MemberAccess,
+  MemberCall,
+  ConstructorCall,
+  DowncastPointer,
+  DowncastReference,
+  Upcast,
+  UpcastToVirtualBase,
+  NonnullAssign,
+  DynamicOperation,
+};
+
+// The handler data of a type_mismatch check is a private global whose last
+// field is the i8 TypeCheckKind, in both the original and the _v1 layout.
+std::optional<TypeCheckKind> getTypeCheckKind(const CallBase &CB) {
+  if (CB.arg_size() == 0)
+    return std::nullopt;
+  const auto *Data =
+      dyn_cast<GlobalVariable>(CB.getArgOperand(0)->stripPointerCasts());
+  if (!Data || !Data->hasInitializer())
+    return std::nullopt;
+  const auto *Fields = dyn_cast<ConstantStruct>(Data->getInitializer());
+  if (!Fields || Fields->getNumOperands() == 0)
+    return std::nullopt;
+  const auto *Kind =
+      dyn_cast<ConstantInt>(Fields->getOperand(Fields->getNumOperands() - 1));
+  if (!Kind || !Kind->getType()->isIntegerTy(8) ||
+      Kind->getZExtValue() > uint64_t(TypeCheckKind::DynamicOperation))
+    return std::nullopt;
+  return TypeCheckKind(Kind->getZExtValue());
+}
+
+// Only a store or a constructor writes the checked object. Binding,
+// member access and casts just form a pointer or reference to it, which
+// reads like a load for retention. A member call may do anything to the
+// object, and a nonnull assignment checks the stored value rather than an
+// address.
+AccessType getTypeCheckAccessType(TypeCheckKind Kind) {
+  switch (Kind) {
+  case TypeCheckKind::Load:
+  case TypeCheckKind::ReferenceBinding:
+  case TypeCheckKind::MemberAccess:
+  case TypeCheckKind::DowncastPointer:
+  case TypeCheckKind::DowncastReference:
+  case TypeCheckKind::Upcast:
+  case TypeCheckKind::UpcastToVirtualBase:
+    return AccessType::READ;
+  case TypeCheckKind::Store:
+  case TypeCheckKind::ConstructorCall:
+    return AccessType::WRITE;
+  case TypeCheckKind::MemberCall:
+  case TypeCheckKind::NonnullAssign:
+  case TypeCheckKind::DynamicOperation:
+    return AccessType::UNKNOWN;
+  }
+  return AccessType::UNKNOWN;
+}
+
 bool isMemSanExplicitValueCheck(StringRef Name) {
   return Name.starts_with("__msan_param_") ||
          Name.starts_with("__msan_retval_") ||
@@ -128,14 +192,6 @@ bool sameRegionStart(const CheckedVariable &LHS,
   return LHS.StaticByteOffset == RHS.StaticByteOffset;
 }
 
-SmallPtrSet<Value *, 16>
-cloneVisited(const SmallPtrSetImpl<Value *> &Visited) {
-  SmallPtrSet<Value *, 16> Copy;
-  for (Value *V : Visited)
-    Copy.insert(V);
-  return Copy;
-}
-
 Value *firstNonConstant(Value *LHS, Value *RHS) {
   if (LHS && !isa<Constant>(LHS))
     return LHS;
@@ -339,58 +395,6 @@ uint64_t typeStoreSizeOrZero(const DataLayout *DL, Type *Ty) {
   return DL->getTypeStoreSize(Ty);
 }
 
-uint64_t inferSizeFromValueDef(Value *V, const DataLayout *DL,
-                               unsigned Depth = 0) {
-  if (!V || !DL || Depth > MaxTraceDepth)
-    return 0;
-
-  V = stripScalarCasts(V);
-
-  if (auto *Load = dyn_cast<LoadInst>(V))
-    return typeStoreSizeOrZero(DL, Load->getType());
-
-  if (auto *Store = dyn_cast<StoreInst>(V))
-    return typeStoreSizeOrZero(DL, Store->getValueOperand()->getType());
-
-  if (auto *Cmp = dyn_cast<CmpInst>(V)) {
-    Value *Operand = firstNonConstant(Cmp->getOperand(0), Cmp->getOperand(1));
-    if (uint64_t Size = inferSizeFromValueDef(Operand, DL, Depth + 1))
-      return Size;
-  }
-
-  if (auto *BinOp = dyn_cast<BinaryOperator>(V)) {
-    Value *Operand =
-        firstNonConstant(BinOp->getOperand(0), BinOp->getOperand(1));
-    if (uint64_t Size = inferSizeFromValueDef(Operand, DL, Depth + 1))
-      return Size;
-  }
-
-  if (auto *Phi = dyn_cast<PHINode>(V)) {
-    uint64_t CommonSize = 0;
-    for (Value *Incoming : Phi->incoming_values()) {
-      uint64_t IncomingSize = inferSizeFromValueDef(Incoming, DL, Depth + 1);
-      if (IncomingSize == 0)
-        continue;
-      if (CommonSize != 0 && CommonSize != IncomingSize)
-        return 0;
-      CommonSize = IncomingSize;
-    }
-    if (CommonSize != 0)
-      return CommonSize;
-  }
-
-  if (auto *Select = dyn_cast<SelectInst>(V)) {
-    uint64_t TrueSize =
-        inferSizeFromValueDef(Select->getTrueValue(), DL, Depth + 1);
-    uint64_t FalseSize =
-        inferSizeFromValueDef(Select->getFalseValue(), DL, Depth + 1);
-    if (TrueSize != 0 && TrueSize == FalseSize)
-      return TrueSize;
-  }
-
-  return typeStoreSizeOrZero(DL, V->getType());
-}
-
 } // namespace
 
 StringRef accessTypeName(AccessType Type) {
@@ -405,12 +409,77 @@ StringRef accessTypeName(AccessType Type) {
   return "UNKNOWN";
 }
 
+template <typename KeyT, typename ResultT>
+template <typename ComputeFn, typename CutFn>
+ResultT CheckedVariableAnalyzer::TraceMemo<KeyT, ResultT>::get(
+    KeyT Key, unsigned Depth, ComputeFn Compute, CutFn Cut) {
+  auto It = Results.find(Key);
+  if (It != Results.end())
+    return It->second;
+
+  // Levels are depth + 1 so that a depth cut, recorded as level 0, keeps
+  // even the outermost value of a truncated trace out of the table.
+  if (Depth > MaxTraceDepth) {
+    CutLevel = 0;
+    return Cut();
+  }
+
+  auto [ActiveIt, Inserted] = Active.try_emplace(Key, Depth + 1);
+  if (!Inserted) {
+    CutLevel = std::min(CutLevel, ActiveIt->second);
+    return Cut();
+  }
+
+  unsigned OuterCutLevel = CutLevel;
+  CutLevel = ~0U;
+  ResultT Result = Compute();
+  Active.erase(Key);
+
+  // A result that was cut at an enclosing value depends on the path that
+  // reached it; only results whose cycles close at or below this value are
+  // the same from every caller.
+  if (CutLevel > Depth)
+    Results.try_emplace(Key, Result);
+  CutLevel = std::min(OuterCutLevel, CutLevel);
+  return Result;
+}
+
+template <typename KeyT, typename ResultT>
+void CheckedVariableAnalyzer::TraceMemo<KeyT, ResultT>::clear() {
+  Results.clear();
+  Active.clear();
+  CutLevel = ~0U;
+}
+
+void CheckedVariableAnalyzer::enterFunction(const Value *V) {
+  const Function *F = nullptr;
+  if (const auto *I = dyn_cast_or_null<Instruction>(V))
+    F = I->getFunction();
+  else if (const auto *A = dyn_cast_or_null<Argument>(V))
+    F = A->getParent();
+  if (!F || F == CacheFunction)
+    return;
+
+  CacheFunction = F;
+  TraceCache.clear();
+  NormalizeCache.clear();
+  DefSizeCache.clear();
+  UseSizeCache.clear();
+  UseTypeCache.clear();
+}
+
+CheckedVariableAnalyzer::CheckedVariableAnalyzer(
+    const SanitizerCheckCollector &Classifier)
+    : Classifier(&Classifier) {}
+
 std::optional<CheckedVariable>
 CheckedVariableAnalyzer::analyzeCheck(CallBase *CB) {
   std::optional<ClassifiedCheck> Check = classifyCheck(CB);
   if (!Check)
     return std::nullopt;
 
+  enterFunction(CB);
+
   CurrentDL = CB && CB->getModule() ? &CB->getModule()->getDataLayout()
                                     : nullptr;
 
@@ -451,13 +520,13 @@ CheckedVariableAnalyzer::analyzeCheck(CallBase *CB) {
 CheckedVariable CheckedVariableAnalyzer::traceCheckedValue(Value *V) {
   if (const DataLayout *DL = dataLayoutForValue(V))
     CurrentDL = DL;
-  SmallPtrSet<Value *, 16> Visited;
-  return traceCheckedValueImpl(V, Visited, 0);
+  enterFunction(V);
+  return traceValue(V, TraceMode::CheckedValue, 0);
 }
 
 Value *CheckedVariableAnalyzer::normalizeVariable(Value *V) {
-  SmallPtrSet<Value *, 16> Visited;
-  return normalizeVariableImpl(V, Visited, 0);
+  enterFunction(V);
+  return normalizeValue(V, 0);
 }
 
 AccessType CheckedVariableAnalyzer::inferAccessType(CallBase *CB) {
@@ -465,6 +534,8 @@ AccessType CheckedVariableAnalyzer::inferAccessType(CallBase *CB) {
   if (!Check)
     return AccessType::UNKNOWN;
 
+  enterFunction(CB);
+
   StringRef CheckType = getCheckType(*Check);
   switch (Check->Sanitizer) {
   case SanitizerKind::ASan:
@@ -477,6 +548,9 @@ AccessType CheckedVariableAnalyzer::inferAccessType(CallBase *CB) {
   case SanitizerKind::UBSan:
     if (isShiftOutOfBoundsCheck(CheckType))
       return AccessType::UNKNOWN;
+    if (isTypeMismatchCheck(CheckType))
+      if (std::optional<TypeCheckKind> Kind = getTypeCheckKind(*CB))
+        return getTypeCheckAccessType(*Kind);
     if (Value *CheckedValue = getCheckedOperand(CB, *Check)) {
       AccessType Type = inferAccessTypeFromUses(CheckedValue, CB);
       if (Type != AccessType::UNKNOWN)
@@ -509,6 +583,8 @@ AccessType CheckedVariableAnalyzer::inferAccessType(CallBase *CB) {
 
 std::optional<CheckedVariableAnalyzer::ClassifiedCheck>
 CheckedVariableAnalyzer::classifyCheck(CallBase *CB) const {
+  if (Classifier)
+    return Classifier->classifyCheck(CB);
   return Collector.classifyCheck(CB);
 }
 
@@ -648,7 +724,7 @@ Value *CheckedVariableAnalyzer::getImplicitMemSanOperand(
       continue;
 
     if (auto *PrevCB = dyn_cast<CallBase>(&Candidate)) {
-      if (Collector.classifyCheck(PrevCB) ||
+      if (classifyCheck(PrevCB) ||
           isDirectMemSanRuntimeCall(PrevCB))
         continue;
       return nullptr;
@@ -686,7 +762,7 @@ uint64_t CheckedVariableAnalyzer::inferMemSanAccessSize(
     return 0;
 
   if (CheckedValue) {
-    if (uint64_t Size = inferSizeFromValueDef(CheckedValue, DL))
+    if (uint64_t Size = inferSizeFromValueDef(CheckedValue, DL, 0))
       return Size;
 
     if (uint64_t Size = inferAccessSizeFromUses(CheckedValue))
@@ -712,10 +788,81 @@ uint64_t CheckedVariableAnalyzer::inferASanAccessSize(
   return 0;
 }
 
+uint64_t CheckedVariableAnalyzer::inferSizeFromValueDef(Value *V,
+                                                        const DataLayout *DL,
+                                                        unsigned Depth) {
+  if (!V || !DL)
+    return 0;
+
+  return DefSizeCache.get(
+      V, Depth, [&] { return inferSizeFromValueDefImpl(V, DL, Depth); },
+      [] { return uint64_t(0); });
+}
+
+uint64_t CheckedVariableAnalyzer::inferSizeFromValueDefImpl(
+    Value *V, const DataLayout *DL, unsigned Depth) {
+  V = stripScalarCasts(V);
+
+  if (auto *Load = dyn_cast<LoadInst>(V))
+    return typeStoreSizeOrZero(DL, Load->getType());
+
+  if (auto *Store = dyn_cast<StoreInst>(V))
+    return typeStoreSizeOrZero(DL, Store->getValueOperand()->getType());
+
+  if (auto *Cmp = dyn_cast<CmpInst>(V)) {
+    Value *Operand = firstNonConstant(Cmp->getOperand(0), Cmp->getOperand(1));
+    if (uint64_t Size = inferSizeFromValueDef(Operand, DL, Depth + 1))
+      return Size;
+  }
+
+  if (auto *BinOp = dyn_cast<BinaryOperator>(V)) {
+    Value *Operand =
+        firstNonConstant(BinOp->getOperand(0), BinOp->getOperand(1));
+    if (uint64_t Size = inferSizeFromValueDef(Operand, DL, Depth + 1))
+      return Size;
+  }
+
+  if (auto *Phi = dyn_cast<PHINode>(V)) {
+    uint64_t CommonSize = 0;
+    for (Value *Incoming : Phi->incoming_values()) {
+      uint64_t IncomingSize = inferSizeFromValueDef(Incoming, DL, Depth + 1);
+      if (IncomingSize == 0)
+        continue;
+      if (CommonSize != 0 && CommonSize != IncomingSize)
+        return 0;
+      CommonSize = IncomingSize;
+    }
+    if (CommonSize != 0)
+      return CommonSize;
+  }
+
+  if (auto *Select = dyn_cast<SelectInst>(V)) {
+    uint64_t TrueSize =
+        inferSizeFromValueDef(Select->getTrueValue(), DL, Depth + 1);
+    uint64_t FalseSize =
+        inferSizeFromValueDef(Select->getFalseValue(), DL, Depth + 1);
+    if (TrueSize != 0 && TrueSize == FalseSize)
+      return TrueSize;
+  }
+
+  return typeStoreSizeOrZero(DL, V->getType());
+}
+
 uint64_t CheckedVariableAnalyzer::inferAccessSizeFromUses(Value *CheckedValue) {
   if (!CheckedValue)
     return 0;
 
+  auto Cached = UseSizeCache.find(CheckedValue);
+  if (Cached != UseSizeCache.end())
+    return Cached->second;
+
+  uint64_t Size = inferAccessSizeFromUsesImpl(CheckedValue);
+  UseSizeCache[CheckedValue] = Size;
+  return Size;
+}
+
+uint64_t
+CheckedVariableAnalyzer::inferAccessSizeFromUsesImpl(Value *CheckedValue) {
   const DataLayout *DL = CurrentDL ? CurrentDL : dataLayoutForValue(CheckedValue);
   if (!DL)
     return 0;
@@ -761,48 +908,55 @@ uint64_t CheckedVariableAnalyzer::inferAccessSizeFromUses(Value *CheckedValue) {
 }
 
 CheckedVariable CheckedVariableAnalyzer::traceASanCheckedAddress(Value *V) {
-  SmallPtrSet<Value *, 16> Visited;
-  return traceASanCheckedAddressImpl(V, Visited, 0);
+  return traceValue(V, TraceMode::ASanAddress, 0);
 }
 
-CheckedVariable CheckedVariableAnalyzer::traceASanCheckedAddressImpl(
-    Value *V, SmallPtrSetImpl<Value *> &Visited, unsigned Depth) {
-  CheckedVariable Result;
+CheckedVariable CheckedVariableAnalyzer::traceValue(Value *V, TraceMode Mode,
+                                                    unsigned Depth) {
   if (!V)
-    return Result;
-
-  if (Depth > MaxTraceDepth || !Visited.insert(V).second) {
-    return makeBaseVariable(V);
-  }
+    return CheckedVariable();
+
+  return TraceCache.get(
+      {V, static_cast<unsigned>(Mode)}, Depth,
+      [&] {
+        return Mode == TraceMode::ASanAddress
+                   ? traceASanCheckedAddressImpl(V, Depth)
+                   : traceCheckedValueImpl(V, Depth);
+      },
+      [V] { return makeBaseVariable(V); });
+}
 
+CheckedVariable
+CheckedVariableAnalyzer::traceASanCheckedAddressImpl(Value *V,
+                                                     unsigned Depth) {
+  CheckedVariable Result;
   V = V->stripPointerCasts();
 
   if (auto *GEP = dyn_cast<GetElementPtrInst>(V)) {
-    Result = traceASanCheckedAddressImpl(GEP->getPointerOperand(), Visited,
-                                         Depth + 1);
+    Result = traceValue(GEP->getPointerOperand(), TraceMode::ASanAddress,
+                        Depth + 1);
     appendGEPRegion(Result, GEP, CurrentDL);
     Result.Address = GEP;
     return Result;
   }
 
   if (auto *GEP = dyn_cast<GEPOperator>(V)) {
-    Result = traceASanCheckedAddressImpl(GEP->getPointerOperand(), Visited,
-                                         Depth + 1);
+    Result = traceValue(GEP->getPointerOperand(), TraceMode::ASanAddress,
+                        Depth + 1);
     appendGEPRegion(Result, GEP, CurrentDL);
     Result.Address = GEP;
     return Result;
   }
 
   if (auto *Load = dyn_cast<LoadInst>(V)) {
-    Result = traceASanCheckedAddressImpl(Load->getPointerOperand(), Visited,
-                                         Depth + 1);
+    Result = traceValue(Load->getPointerOperand(), TraceMode::ASanAddress,
+                        Depth + 1);
     markUnknownStaticOffset(Result);
     return Result;
   }
 
   if (auto *Cast = dyn_cast<CastInst>(V))
-    return traceASanCheckedAddressImpl(Cast->getOperand(0), Visited,
-                                       Depth + 1);
+    return traceValue(Cast->getOperand(0), TraceMode::ASanAddress, Depth + 1);
 
   if (auto *Phi = dyn_cast<PHINode>(V)) {
     CheckedVariable Merged;
@@ -810,9 +964,8 @@ CheckedVariable CheckedVariableAnalyzer::traceASanCheckedAddressImpl(
     bool SameBase = true;
 
     for (Value *Incoming : Phi->incoming_values()) {
-      SmallPtrSet<Value *, 16> IncomingVisited = cloneVisited(Visited);
       CheckedVariable IncomingVar =
-          traceASanCheckedAddressImpl(Incoming, IncomingVisited, Depth + 1);
+          traceValue(Incoming, TraceMode::ASanAddress, Depth + 1);
       if (!IncomingVar.Base)
         continue;
 
@@ -838,12 +991,10 @@ CheckedVariable CheckedVariableAnalyzer::traceASanCheckedAddressImpl(
   }
 
   if (auto *Select = dyn_cast<SelectInst>(V)) {
-    SmallPtrSet<Value *, 16> TrueVisited = cloneVisited(Visited);
-    SmallPtrSet<Value *, 16> FalseVisited = cloneVisited(Visited);
-    CheckedVariable TrueVar = traceASanCheckedAddressImpl(
-        Select->getTrueValue(), TrueVisited, Depth + 1);
-    CheckedVariable FalseVar = traceASanCheckedAddressImpl(
-        Select->getFalseValue(), FalseVisited, Depth + 1);
+    CheckedVariable TrueVar = traceValue(Select->getTrueValue(),
+                                         TraceMode::ASanAddress, Depth + 1);
+    CheckedVariable FalseVar = traceValue(Select->getFalseValue(),
+                                          TraceMode::ASanAddress, Depth + 1);
 
     Value *TrueBase = normalizeVariable(TrueVar.Base);
     Value *FalseBase = normalizeVariable(FalseVar.Base);
@@ -868,7 +1019,7 @@ CheckedVariable CheckedVariableAnalyzer::traceASanCheckedAddressImpl(
     Value *LHS = BinOp->getOperand(0);
     Value *RHS = BinOp->getOperand(1);
     Value *AddressOperand = firstNonConstant(LHS, RHS);
-    Result = traceASanCheckedAddressImpl(AddressOperand, Visited, Depth + 1);
+    Result = traceValue(AddressOperand, TraceMode::ASanAddress, Depth + 1);
 
     if (BinOp->getOpcode() == Instruction::Add ||
         BinOp->getOpcode() == Instruction::Sub) {
@@ -890,7 +1041,11 @@ CheckedVariable CheckedVariableAnalyzer::traceASanCheckedAddressImpl(
                                       : CI->getSExtValue());
         else
           markUnknownStaticOffset(Result);
+      } else {
+        markUnknownStaticOffset(Result);
       }
+    } else {
+      markUnknownStaticOffset(Result);
     }
 
     return Result;
@@ -899,50 +1054,44 @@ CheckedVariable CheckedVariableAnalyzer::traceASanCheckedAddressImpl(
   return makeBaseVariable(normalizeVariable(V));
 }
 
-CheckedVariable CheckedVariableAnalyzer::traceCheckedValueImpl(
-    Value *V, SmallPtrSetImpl<Value *> &Visited, unsigned Depth) {
+CheckedVariable CheckedVariableAnalyzer::traceCheckedValueImpl(Value *V,
+                                                               unsigned Depth) {
   CheckedVariable Result;
-  if (!V)
-    return Result;
-
-  if (Depth > MaxTraceDepth || !Visited.insert(V).second) {
-    return makeBaseVariable(V);
-  }
-
   V = V->stripPointerCasts();
 
   if (auto *GEP = dyn_cast<GetElementPtrInst>(V)) {
-    Result = traceCheckedValueImpl(GEP->getPointerOperand(), Visited,
-                                   Depth + 1);
+    Result = traceValue(GEP->getPointerOperand(), TraceMode::CheckedValue,
+                        Depth + 1);
     appendGEPRegion(Result, GEP, CurrentDL);
     Result.Address = GEP;
     return Result;
   }
 
   if (auto *Load = dyn_cast<LoadInst>(V)) {
-    Result = traceCheckedValueImpl(Load->getPointerOperand(), Visited,
-                                   Depth + 1);
+    Result = traceValue(Load->getPointerOperand(), TraceMode::CheckedValue,
+                        Depth + 1);
     markUnknownStaticOffset(Result);
     return Result;
   }
 
   if (auto *Store = dyn_cast<StoreInst>(V)) {
-    Result = traceCheckedValueImpl(Store->getPointerOperand(), Visited,
-                                   Depth + 1);
+    Result = traceValue(Store->getPointerOperand(), TraceMode::CheckedValue,
+                        Depth + 1);
     markUnknownStaticOffset(Result);
     return Result;
   }
 
   if (auto *Cast = dyn_cast<CastInst>(V))
-    return traceCheckedValueImpl(Cast->getOperand(0), Visited, Depth + 1);
+    return traceValue(Cast->getOperand(0), TraceMode::CheckedValue, Depth + 1);
 
   if (auto *Cast = dyn_cast<ConstantExpr>(V))
     if (Cast->isCast())
-      return traceCheckedValueImpl(Cast->getOperand(0), Visited, Depth + 1);
+      return traceValue(Cast->getOperand(0), TraceMode::CheckedValue,
+                        Depth + 1);
 
   if (auto *GEP = dyn_cast<GEPOperator>(V)) {
-    Result = traceCheckedValueImpl(GEP->getPointerOperand(), Visited,
-                                   Depth + 1);
+    Result = traceValue(GEP->getPointerOperand(), TraceMode::CheckedValue,
+                        Depth + 1);
     appendGEPRegion(Result, GEP, CurrentDL);
     Result.Address = GEP;
     return Result;
@@ -954,9 +1103,8 @@ CheckedVariable CheckedVariableAnalyzer::traceCheckedValueImpl(
     bool SameBase = true;
 
     for (Value *Incoming : Phi->incoming_values()) {
-      SmallPtrSet<Value *, 16> IncomingVisited = cloneVisited(Visited);
       CheckedVariable IncomingVar =
-          traceCheckedValueImpl(Incoming, IncomingVisited, Depth + 1);
+          traceValue(Incoming, TraceMode::CheckedValue, Depth + 1);
       if (!IncomingVar.Base)
         continue;
 
@@ -982,13 +1130,10 @@ CheckedVariable CheckedVariableAnalyzer::traceCheckedValueImpl(
   }
 
   if (auto *Select = dyn_cast<SelectInst>(V)) {
-    SmallPtrSet<Value *, 16> TrueVisited = cloneVisited(Visited);
-    SmallPtrSet<Value *, 16> FalseVisited = cloneVisited(Visited);
-    CheckedVariable TrueVar =
-        traceCheckedValueImpl(Select->getTrueValue(), TrueVisited, Depth + 1);
-    CheckedVariable FalseVar =
-        traceCheckedValueImpl(Select->getFalseValue(), FalseVisited,
-                              Depth + 1);
+    CheckedVariable TrueVar = traceValue(Select->getTrueValue(),
+                                         TraceMode::CheckedValue, Depth + 1);
+    CheckedVariable FalseVar = traceValue(Select->getFalseValue(),
+                                          TraceMode::CheckedValue, Depth + 1);
 
     Value *TrueBase = normalizeVariable(TrueVar.Base);
     Value *FalseBase = normalizeVariable(FalseVar.Base);
@@ -1011,7 +1156,7 @@ CheckedVariable CheckedVariableAnalyzer::traceCheckedValueImpl(
 
   if (auto *Cmp = dyn_cast<CmpInst>(V)) {
     Value *Operand = firstNonConstant(Cmp->getOperand(0), Cmp->getOperand(1));
-    return traceCheckedValueImpl(Operand, Visited, Depth + 1);
+    return traceValue(Operand, TraceMode::CheckedValue, Depth + 1);
   }
 
   if (auto *BinOp = dyn_cast<BinaryOperator>(V)) {
@@ -1022,7 +1167,7 @@ CheckedVariable CheckedVariableAnalyzer::traceCheckedValueImpl(
       OffsetOperand = BinOp->getOperand(0);
     }
     if (PointerOperand) {
-      Result = traceCheckedValueImpl(PointerOperand, Visited, Depth + 1);
+      Result = traceValue(PointerOperand, TraceMode::CheckedValue, Depth + 1);
       appendOffset(Result.Offsets, OffsetOperand);
       markUnknownStaticOffset(Result);
       return Result;
@@ -1030,7 +1175,7 @@ CheckedVariable CheckedVariableAnalyzer::traceCheckedValueImpl(
 
     Value *Operand =
         firstNonConstant(BinOp->getOperand(0), BinOp->getOperand(1));
-    Result = traceCheckedValueImpl(Operand, Visited, Depth + 1);
+    Result = traceValue(Operand, TraceMode::CheckedValue, Depth + 1);
     if (BinOp->getOpcode() == Instruction::Add ||
         BinOp->getOpcode() == Instruction::Sub) {
       Value *LHS = BinOp->getOperand(0);
@@ -1055,41 +1200,42 @@ CheckedVariable CheckedVariableAnalyzer::traceCheckedValueImpl(
   return makeBaseVariable(normalizeVariable(V));
 }
 
-Value *CheckedVariableAnalyzer::normalizeVariableImpl(
-    Value *V, SmallPtrSetImpl<Value *> &Visited, unsigned Depth) {
+Value *CheckedVariableAnalyzer::normalizeValue(Value *V, unsigned Depth) {
   if (!V)
     return nullptr;
 
-  if (Depth > MaxTraceDepth || !Visited.insert(V).second)
-    return V;
+  return NormalizeCache.get(
+      V, Depth, [&] { return normalizeVariableImpl(V, Depth); },
+      [V] { return V; });
+}
 
+Value *CheckedVariableAnalyzer::normalizeVariableImpl(Value *V,
+                                                      unsigned Depth) {
   V = V->stripPointerCasts();
 
   if (auto *GEP = dyn_cast<GetElementPtrInst>(V))
-    return normalizeVariableImpl(GEP->getPointerOperand(), Visited, Depth + 1);
+    return normalizeValue(GEP->getPointerOperand(), Depth + 1);
 
   if (auto *GEP = dyn_cast<GEPOperator>(V))
-    return normalizeVariableImpl(GEP->getPointerOperand(), Visited, Depth + 1);
+    return normalizeValue(GEP->getPointerOperand(), Depth + 1);
 
   if (auto *Cast = dyn_cast<CastInst>(V))
-    return normalizeVariableImpl(Cast->getOperand(0), Visited, Depth + 1);
+    return normalizeValue(Cast->getOperand(0), Depth + 1);
 
   if (auto *Cast = dyn_cast<ConstantExpr>(V))
     if (Cast->isCast())
-      return normalizeVariableImpl(Cast->getOperand(0), Visited, Depth + 1);
+      return normalizeValue(Cast->getOperand(0), Depth + 1);
 
   if (auto *Load = dyn_cast<LoadInst>(V))
-    return normalizeVariableImpl(Load->getPointerOperand(), Visited,
-                                 Depth + 1);
+    return normalizeValue(Load->getPointerOperand(), Depth + 1);
 
   if (auto *Store = dyn_cast<StoreInst>(V))
-    return normalizeVariableImpl(Store->getPointerOperand(), Visited,
-                                 Depth + 1);
+    return normalizeValue(Store->getPointerOperand(), Depth + 1);
 
   if (auto *Phi = dyn_cast<PHINode>(V)) {
     Value *CommonBase = nullptr;
     for (Value *Incoming : Phi->incoming_values()) {
-      Value *IncomingBase = normalizeVariableImpl(Incoming, Visited, Depth + 1);
+      Value *IncomingBase = normalizeValue(Incoming, Depth + 1);
       if (!IncomingBase)
         continue;
       if (!CommonBase)
@@ -1102,9 +1248,9 @@ Value *CheckedVariableAnalyzer::normalizeVariableImpl(
 
   if (auto *Select = dyn_cast<SelectInst>(V)) {
     Value *TrueBase =
-        normalizeVariableImpl(Select->getTrueValue(), Visited, Depth + 1);
+        normalizeValue(Select->getTrueValue(), Depth + 1);
     Value *FalseBase =
-        normalizeVariableImpl(Select->getFalseValue(), Visited, Depth + 1);
+        normalizeValue(Select->getFalseValue(), Depth + 1);
     if (TrueBase && TrueBase == FalseBase)
       return TrueBase;
     return Select;
@@ -1113,7 +1259,7 @@ Value *CheckedVariableAnalyzer::normalizeVariableImpl(
   if (auto *BinOp = dyn_cast<BinaryOperator>(V)) {
     Value *Operand =
         firstNonConstant(BinOp->getOperand(0), BinOp->getOperand(1));
-    return normalizeVariableImpl(Operand, Visited, Depth + 1);
+    return normalizeValue(Operand, Depth + 1);
   }
 
   return V;
@@ -1124,6 +1270,20 @@ AccessType CheckedVariableAnalyzer::inferAccessTypeFromUses(
   if (!CheckedValue)
     return AccessType::UNKNOWN;
 
+  // Only the check call itself is skipped among the users, and a check call
+  // never counts as a read or write, so the result is per value.
+  auto Cached = UseTypeCache.find(CheckedValue);
+  if (Cached != UseTypeCache.end())
+    return Cached->second;
+
+  AccessType Type = inferAccessTypeFromUsesImpl(CheckedValue, CheckInst);
+  UseTypeCache[CheckedValue] = Type;
+  return Type;
+}
+
+AccessType CheckedVariableAnalyzer::inferAccessTypeFromUsesImpl(
+    Value *CheckedValue, CallBase *CheckInst) {
+
   bool SawRead = false;
   bool SawWrite = false;
   SmallVector<Value *, 16> Worklist;
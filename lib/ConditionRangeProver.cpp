@@ -0,0 +1,183 @@
+#include "DESAN/ConditionRangeProver.h"
+
+#include "llvm/ADT/STLExtras.h"
+#include "llvm/Analysis/LazyValueInfo.h"
+#include "llvm/Analysis/ScalarEvolution.h"
+#include "llvm/IR/BasicBlock.h"
+#include "llvm/IR/CFG.h"
+#include "llvm/IR/ConstantRange.h"
+#include "llvm/IR/Constants.h"
+#include "llvm/IR/Instructions.h"
+#include "llvm/IR/IntrinsicInst.h"
+
+using namespace llvm;
+
+namespace desan {
+
+namespace {
+
+// Clang combines at most a handful of conditions per handler; deeper
+// expressions are not worth the range queries.
+constexpr unsigned MaxConditionDepth = 8;
+
+} // namespace
+
+ConditionRangeProver::ConditionRangeProver(CheckGraphBuilder &Builder)
+    : Builder(Builder) {}
+
+// A UBSan handler only runs when a branch into its block selects it. If
+// value ranges prove that no incoming branch ever does, the guarded
+// condition cannot fire and the whole check is dead.
+bool ConditionRangeProver::isNeverReached(const CheckedVariable &Var) {
+  if (Var.Sanitizer != SanitizerKind::UBSan || !Var.CheckInst)
+    return false;
+
+  BasicBlock *Handler = Var.CheckInst->getParent();
+  if (!Handler || Handler->isEntryBlock() || pred_empty(Handler))
+    return false;
+
+  LazyValueInfo *LVI = Builder.getLazyValueInfo(*Handler->getParent());
+  if (!LVI && !UseScalarEvolution)
+    return false;
+
+  return all_of(predecessors(Handler), [&](BasicBlock *Pred) {
+    return isDeadEdge(*Pred, *Handler, LVI);
+  });
+}
+
+bool ConditionRangeProver::isDeadEdge(BasicBlock &From, BasicBlock &To,
+                                      LazyValueInfo *LVI) {
+  auto *Br = dyn_cast<BranchInst>(From.getTerminator());
+  if (!Br || !Br->isConditional() ||
+      Br->getSuccessor(0) == Br->getSuccessor(1))
+    return false;
+
+  bool TakenWhen = Br->getSuccessor(0) == &To;
+  std::optional<bool> Cond = evaluate(Br->getCondition(), Br, LVI, 0);
+  return Cond && *Cond != TakenWhen;
+}
+
+// Folds an i1 condition at CxtI. Comparisons are decided on the operands'
+// ranges, an overflow bit on whether the operand ranges lie in the no-wrap
+// region of the operation, and logic over those by the usual tables.
+std::optional<bool> ConditionRangeProver::evaluate(Value *Cond,
+                                                   Instruction *CxtI,
+                                                   LazyValueInfo *LVI,
+                                                   unsigned Depth) {
+  if (Depth > MaxConditionDepth)
+    return std::nullopt;
+
+  if (auto *C = dyn_cast<ConstantInt>(Cond))
+    return C->isOne();
+
+  if (auto *Cmp = dyn_cast<ICmpInst>(Cond))
+    return evaluateCompare(*Cmp, CxtI, LVI);
+
+  if (auto *Extract = dyn_cast<ExtractValueInst>(Cond)) {
+    auto *WO = dyn_cast<WithOverflowInst>(Extract->getAggregateOperand());
+    if (!LVI || !WO || Extract->getNumIndices() != 1 ||
+        Extract->getIndices()[0] != 1)
+      return std::nullopt;
+    ConstantRange LHS =
+        LVI->getConstantRange(WO->getLHS(), WO, /*UndefAllowed=*/false);
+    ConstantRange RHS =
+        LVI->getConstantRange(WO->getRHS(), WO, /*UndefAllowed=*/false);
+    if (ConstantRange::makeGuaranteedNoWrapRegion(WO->getBinaryOp(), RHS,
+                                                  WO->getNoWrapKind())
+            .contains(LHS))
+      return false;
+    return std::nullopt;
+  }
+
+  if (auto *BO = dyn_cast<BinaryOperator>(Cond)) {
+    if (!BO->getType()->isIntegerTy(1))
+      return std::nullopt;
+    std::optional<bool> LHS = evaluate(BO->getOperand(0), CxtI, LVI, Depth + 1);
+    std::optional<bool> RHS = evaluate(BO->getOperand(1), CxtI, LVI, Depth + 1);
+    switch (BO->getOpcode()) {
+    case Instruction::And:
+      if ((LHS && !*LHS) || (RHS && !*RHS))
+        return false;
+      break;
+    case Instruction::Or:
+      if ((LHS && *LHS) || (RHS && *RHS))
+        return true;
+      break;
+    case Instruction::Xor:
+      if (LHS && RHS)
+        return *LHS != *RHS;
+      return std::nullopt;
+    default:
+      return std::nullopt;
+    }
+    if (LHS && RHS)
+      return *LHS;
+    return std::nullopt;
+  }
+
+  if (auto *Select = dyn_cast<SelectInst>(Cond)) {
+    if (std::optional<bool> Pick =
+            evaluate(Select->getCondition(), CxtI, LVI, Depth + 1))
+      return evaluate(*Pick ? Select->getTrueValue() : Select->getFalseValue(),
+                      CxtI, LVI, Depth + 1);
+    std::optional<bool> TrueValue =
+        evaluate(Select->getTrueValue(), CxtI, LVI, Depth + 1);
+    if (TrueValue &&
+        TrueValue == evaluate(Select->getFalseValue(), CxtI, LVI, Depth + 1))
+      return TrueValue;
+    return std::nullopt;
+  }
+
+  if (auto *Phi = dyn_cast<PHINode>(Cond)) {
+    std::optional<bool> Common;
+    for (unsigned Idx = 0, E = Phi->getNumIncomingValues(); Idx != E; ++Idx) {
+      std::optional<bool> Incoming =
+          evaluate(Phi->getIncomingValue(Idx),
+                   Phi->getIncomingBlock(Idx)->getTerminator(), LVI,
+                   Depth + 1);
+      if (!Incoming || (Common && *Common != *Incoming))
+        return std::nullopt;
+      Common = Incoming;
+    }
+    return Common;
+  }
+
+  return std::nullopt;
+}
+
+// Ranges settle most comparisons. ScalarEvolution also knows how far an
+// induction variable gets within its loop's trip count, and which
+// dominating conditions hold at CxtI.
+std::optional<bool> ConditionRangeProver::evaluateCompare(ICmpInst &Cmp,
+                                                          Instruction *CxtI,
+                                                          LazyValueInfo *LVI) {
+  Value *LHS = Cmp.getOperand(0);
+  Value *RHS = Cmp.getOperand(1);
+  if (LVI && LHS->getType()->isIntegerTy()) {
+    ConstantRange LHSRange =
+        LVI->getConstantRange(LHS, CxtI, /*UndefAllowed=*/false);
+    ConstantRange RHSRange =
+        LVI->getConstantRange(RHS, CxtI, /*UndefAllowed=*/false);
+    if (LHSRange.icmp(Cmp.getPredicate(), RHSRange))
+      return true;
+    if (LHSRange.icmp(Cmp.getInversePredicate(), RHSRange))
+      return false;
+  }
+
+  if (!UseScalarEvolution)
+    return std::nullopt;
+
+  ScalarEvolution &SE = Builder.getScalarEvolution(*CxtI->getFunction());
+  if (!SE.isSCEVable(LHS->getType()))
+    return std::nullopt;
+  const SCEV *LHSExpr = SE.getSCEV(LHS);
+  const SCEV *RHSExpr = SE.getSCEV(RHS);
+  if (SE.isKnownPredicateAt(Cmp.getPredicate(), LHSExpr, RHSExpr, CxtI))
+    return true;
+  if (SE.isKnownPredicateAt(Cmp.getInversePredicate(), LHSExpr, RHSExpr,
+                            CxtI))
+    return false;
+  return std::nullopt;
+}
+
+} // namespace desan
@@ -0,0 +1,111 @@
+#include "DESAN/DESANAnalysis.h"
+
+#include "DESAN/CheckGraphBuilder.h"
+
+#include "llvm/IR/Function.h"
+#include "llvm/IR/InstIterator.h"
+#include "llvm/IR/Instructions.h"
+#include "llvm/IR/Module.h"
+#include "llvm/Support/raw_ostream.h"
+
+#include <optional>
+#include <utility>
+
+using namespace llvm;
+
+namespace desan {
+
+AnalysisKey SanitizerCheckAnalysis::Key;
+AnalysisKey CheckedVariableAnalysis::Key;
+AnalysisKey CheckGraphAnalysis::Key;
+
+void SanitizerCheckInfo::addCheck(
+    CallBase *CB, SanitizerCheckCollector::ClassifiedCheck Check) {
+  CheckIndices[CB] = Checks.size();
+  Checks.push_back(CheckEntry{CB, std::move(Check)});
+}
+
+const SanitizerCheckCollector::ClassifiedCheck *
+SanitizerCheckInfo::lookup(const CallBase *CB) const {
+  auto It = CheckIndices.find(CB);
+  if (It == CheckIndices.end())
+    return nullptr;
+  return &Checks[It->second].Check;
+}
+
+SanitizerCheckInfo SanitizerCheckAnalysis::run(Function &F,
+                                               FunctionAnalysisManager &) {
+  // The collector outlives individual runs so callee classifications are
+  // computed once per module rather than once per function.
+  SanitizerCheckInfo Info;
+  for (Instruction &I : instructions(F)) {
+    auto *CB = dyn_cast<CallBase>(&I);
+    if (!CB)
+      continue;
+
+    if (std::optional<SanitizerCheckCollector::ClassifiedCheck> Check =
+            Collector.classifyCheck(CB))
+      Info.addCheck(CB, std::move(*Check));
+  }
+  return Info;
+}
+
+void CheckedVariableInfo::addVariable(CheckedVariable Var) {
+  VariableIndices[Var.CheckInst] = Variables.size();
+  Variables.push_back(std::move(Var));
+}
+
+const CheckedVariable *
+CheckedVariableInfo::lookup(const CallBase *CB) const {
+  auto It = VariableIndices.find(CB);
+  if (It == VariableIndices.end())
+    return nullptr;
+  return &Variables[It->second];
+}
+
+CheckedVariableInfo
+CheckedVariableAnalysis::run(Function &F, FunctionAnalysisManager &FAM) {
+  const SanitizerCheckInfo &Checks = FAM.getResult<SanitizerCheckAnalysis>(F);
+
+  CheckedVariableAnalyzer Analyzer;
+  CheckedVariableInfo Info;
+  for (const SanitizerCheckInfo::CheckEntry &Entry : Checks.checks())
+    if (std::optional<CheckedVariable> Var = Analyzer.analyzeCheck(Entry.Call))
+      Info.addVariable(std::move(*Var));
+  return Info;
+}
+
+CheckGraphInfo::CheckGraphInfo(Module &M, const CheckGraphOptions &Options,
+                               FunctionAnalysisManager &FAM) {
+  if (!Options.ProfileFile.empty())
+    Collector.loadProfile(Options.ProfileFile, &errs());
+
+  for (Function &F : M) {
+    if (F.isDeclaration())
+      continue;
+    for (const SanitizerCheckInfo::CheckEntry &Entry :
+         FAM.getResult<SanitizerCheckAnalysis>(F).checks())
+      Collector.recordCheck(Entry.Check);
+  }
+
+  CoreChecks =
+      Collector.identifyCoreChecks(Options.CoreTopN, Options.CoreMinRatio);
+  GraphBuilder = std::make_unique<CheckGraphBuilder>(M, CoreChecks, &FAM);
+  GraphBuilder->analyzeFunctions(Options.Threads);
+}
+
+CheckGraphInfo::CheckGraphInfo(CheckGraphInfo &&) = default;
+
+CheckGraphInfo::~CheckGraphInfo() = default;
+
+CheckGraphAnalysis::CheckGraphAnalysis(CheckGraphOptions Options)
+    : Options(std::move(Options)) {}
+
+CheckGraphInfo CheckGraphAnalysis::run(Module &M,
+                                       ModuleAnalysisManager &MAM) {
+  FunctionAnalysisManager &FAM =
+      MAM.getResult<FunctionAnalysisManagerModuleProxy>(M).getManager();
+  return CheckGraphInfo(M, Options, FAM);
+}
+
+} // namespace desan
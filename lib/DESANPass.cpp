@@ -1,11 +1,11 @@
 #include "DESAN/CheckGraphBuilder.h"
 #include "DESAN/CheckedVariableAnalyzer.h"
+#include "DESAN/DESANAnalysis.h"
 #include "DESAN/LLMAssistedAnalyzer.h"
 #include "DESAN/RedundantCheckEliminator.h"
 #include "DESAN/SanitizerCheckCollector.h"
 
 #include "llvm/ADT/SmallVector.h"
-#include "llvm/IR/InstIterator.h"
 #include "llvm/IR/Instructions.h"
 #include "llvm/IR/Module.h"
 #include "llvm/IR/PassManager.h"
@@ -16,7 +16,6 @@
 #include "llvm/Support/raw_ostream.h"
 
 #include <memory>
-#include <optional>
 #include <set>
 #include <string>
 #include <utility>
@@ -25,7 +24,7 @@ using namespace llvm;
 
 namespace {
 
-using CoreCheckKey = std::pair<desan::SanitizerKind, std::string>;
+using CoreCheckKey = std::pair<desan::SanitizerKind, desan::CheckTypeId>;
 
 cl::opt<unsigned>
     CoreTopN("desan-core-top-n", cl::init(4), cl::Hidden,
@@ -42,6 +41,12 @@ cl::opt<std::string>
                 cl::desc("Optional CSV/TSV profile file. Supported rows: "
                          "'check_type,cost' or 'sanitizer,check_type,cost'."));
 
+cl::opt<unsigned> Threads(
+    "desan-threads", cl::init(1), cl::Hidden,
+    cl::desc("Number of threads used to trace checked variables before "
+             "grouping. 0 uses all hardware threads; 1 analyzes serially. "
+             "Ignored with -desan-stream-functions."));
+
 cl::opt<bool> DumpCheckedVariables(
     "desan-dump-checked-vars", cl::init(false), cl::Hidden,
     cl::desc("Dump checked variable tracing results for identified core "
@@ -56,6 +61,12 @@ cl::opt<bool> EliminateRedundantReads(
     cl::desc("Remove redundant sanitizer READ checks using the current "
              "per-variable retention policy."));
 
+cl::opt<bool> StreamFunctions(
+    "desan-stream-functions", cl::init(false), cl::Hidden,
+    cl::desc("Group, decide and remove redundant checks one function at a "
+             "time, scoping the retention policy to each function and "
+             "releasing its analysis state before moving on."));
+
 cl::opt<bool> DumpRemovals(
     "desan-dump-removals", cl::init(false), cl::Hidden,
     cl::desc("Dump redundant READ checks selected for removal."));
@@ -113,12 +124,10 @@ bool canIssueLLMQuery(unsigned QueryCount) {
   return LLMMaxQueries == 0 || QueryCount < LLMMaxQueries;
 }
 
-void runLLMAssistedAnalysis(
-    Module &M, ArrayRef<desan::SanitizerCheckCollector::CheckStat> CoreChecks,
-    const std::set<CoreCheckKey> &CoreCheckSet,
-    const desan::SanitizerCheckCollector &Collector) {
+void runLLMAssistedAnalysis(Module &M, FunctionAnalysisManager &FAM,
+                            desan::CheckGraphInfo &GraphInfo,
+                            const std::set<CoreCheckKey> &CoreCheckSet) {
   desan::LLMAssistedAnalyzer LLM(LLMCommand, LLMMaxSliceInstructions);
-  desan::CheckedVariableAnalyzer Analyzer;
 
   errs() << "DESAN LLM-Assisted Analysis\n";
   errs() << "Mode: "
@@ -136,25 +145,22 @@ void runLLMAssistedAnalysis(
     if (F.isDeclaration())
       continue;
 
-    for (Instruction &I : instructions(F)) {
+    const desan::SanitizerCheckInfo &Checks =
+        FAM.getResult<desan::SanitizerCheckAnalysis>(F);
+    const desan::CheckedVariableInfo &Variables =
+        FAM.getResult<desan::CheckedVariableAnalysis>(F);
+    for (const desan::SanitizerCheckInfo::CheckEntry &Entry : Checks.checks()) {
       if (!canIssueLLMQuery(Queries))
         break;
 
-      auto *CB = dyn_cast<CallBase>(&I);
-      if (!CB)
-        continue;
-
-      std::optional<desan::SanitizerCheckCollector::ClassifiedCheck> Check =
-          Collector.classifyCheck(CB);
-      if (!Check)
-        continue;
-
+      CallBase *CB = Entry.Call;
+      const desan::SanitizerCheckCollector::ClassifiedCheck &Check =
+          Entry.Check;
       if (!CoreCheckSet.empty() &&
-          !CoreCheckSet.count({Check->Sanitizer, Check->CheckType}))
+          !CoreCheckSet.count({Check.Sanitizer, Check.TypeId}))
         continue;
 
-      std::optional<desan::CheckedVariable> Variable =
-          Analyzer.analyzeCheck(CB);
+      const desan::CheckedVariable *Variable = Variables.lookup(CB);
       if (!Variable)
         continue;
 
@@ -182,18 +188,18 @@ void runLLMAssistedAnalysis(
   }
 
   if (canIssueLLMQuery(Queries)) {
-    desan::CheckGraphBuilder GraphBuilder(M, CoreChecks);
+    desan::CheckGraphBuilder &GraphBuilder = GraphInfo.getGraphBuilder();
     const desan::CheckGraphBuilder::VariableCheckGroups &Groups =
         GraphBuilder.groupChecksByVariable();
 
-    for (const auto &Group : Groups) {
+    for (const desan::VariableCheckGroup &Group : Groups) {
       if (!canIssueLLMQuery(Queries))
         break;
-      if (Group.second.empty())
+      if (Group.Checks.empty())
         continue;
 
       std::unique_ptr<desan::CheckGraph> Graph =
-          GraphBuilder.buildGraphForVariable(Group.second.front());
+          GraphBuilder.buildGraphForGroup(Group);
       for (desan::CheckNode *Node : Graph->Nodes) {
         if (!canIssueLLMQuery(Queries))
           break;
@@ -220,28 +226,35 @@ void runLLMAssistedAnalysis(
   errs() << "DESAN LLM Assist Queries: " << Queries << "\n";
 }
 
+desan::CheckGraphOptions getCheckGraphOptions() {
+  desan::CheckGraphOptions Options;
+  Options.CoreTopN = CoreTopN;
+  Options.CoreMinRatio = CoreMinRatio;
+  Options.ProfileFile = ProfileFile;
+  // Tracing every function up front would hold the whole module's checked
+  // variables; streaming traces each function when it gets to it instead.
+  Options.Threads = StreamFunctions ? 1 : Threads;
+  return Options;
+}
+
 class SanitizerCheckCollectorPass
     : public PassInfoMixin<SanitizerCheckCollectorPass> {
 public:
-  PreservedAnalyses run(Module &M, ModuleAnalysisManager &) {
-    desan::SanitizerCheckCollector Collector;
-    if (!ProfileFile.empty())
-      Collector.loadProfile(ProfileFile, &errs());
-
-    for (Function &F : M) {
-      if (!F.isDeclaration())
-        Collector.collectChecks(F);
-    }
+  PreservedAnalyses run(Module &M, ModuleAnalysisManager &MAM) {
+    FunctionAnalysisManager &FAM =
+        MAM.getResult<FunctionAnalysisManagerModuleProxy>(M).getManager();
+    desan::CheckGraphInfo &GraphInfo =
+        MAM.getResult<desan::CheckGraphAnalysis>(M);
 
-    Collector.dumpCheckStatistics(errs());
+    GraphInfo.getCollector().dumpCheckStatistics(errs());
 
-    SmallVector<desan::SanitizerCheckCollector::CheckStat, 16> CoreChecks =
-        Collector.identifyCoreChecks(CoreTopN, CoreMinRatio);
+    ArrayRef<desan::SanitizerCheckCollector::CheckStat> CoreChecks =
+        GraphInfo.getCoreChecks();
     std::set<CoreCheckKey> CoreCheckSet;
 
     errs() << "DESAN Core Check Summary\n";
     for (const auto &Stat : CoreChecks) {
-      CoreCheckSet.insert({Stat.Sanitizer, Stat.CheckType});
+      CoreCheckSet.insert({Stat.Sanitizer, Stat.TypeId});
       errs() << desan::sanitizerKindName(Stat.Sanitizer) << " "
              << Stat.CheckType << " count=" << Stat.Count
              << " ratio=" << format("%.1f%%", Stat.RatioWithinSanitizer);
@@ -251,34 +264,31 @@ public:
     }
 
     if (DumpCheckedVariables) {
-      desan::CheckedVariableAnalyzer Analyzer;
       errs() << "DESAN Checked Variables\n";
 
       for (Function &F : M) {
         if (F.isDeclaration())
           continue;
 
-        for (Instruction &I : instructions(F)) {
-          auto *CB = dyn_cast<CallBase>(&I);
-          if (!CB)
-            continue;
-
-          std::optional<desan::SanitizerCheckCollector::ClassifiedCheck>
-              Check = Collector.classifyCheck(CB);
-          if (!Check)
-            continue;
-
+        const desan::SanitizerCheckInfo &Checks =
+            FAM.getResult<desan::SanitizerCheckAnalysis>(F);
+        const desan::CheckedVariableInfo &Variables =
+            FAM.getResult<desan::CheckedVariableAnalysis>(F);
+        for (const desan::SanitizerCheckInfo::CheckEntry &Entry :
+             Checks.checks()) {
+          const desan::SanitizerCheckCollector::ClassifiedCheck &Check =
+              Entry.Check;
           if (!CoreCheckSet.empty() &&
-              !CoreCheckSet.count({Check->Sanitizer, Check->CheckType}))
+              !CoreCheckSet.count({Check.Sanitizer, Check.TypeId}))
             continue;
 
-          std::optional<desan::CheckedVariable> Variable =
-              Analyzer.analyzeCheck(CB);
+          const desan::CheckedVariable *Variable =
+              Variables.lookup(Entry.Call);
           if (!Variable)
             continue;
 
           errs() << "Function: " << F.getName() << "\n";
-          errs() << "Check Type: " << Check->CheckType << "\n";
+          errs() << "Check Type: " << Check.CheckType << "\n";
           desan::printCheckedVariable(errs(), *Variable);
           errs() << "\n";
         }
@@ -286,37 +296,93 @@ public:
     }
 
     if (EnableLLMAssist)
-      runLLMAssistedAnalysis(M, CoreChecks, CoreCheckSet, Collector);
+      runLLMAssistedAnalysis(M, FAM, GraphInfo, CoreCheckSet);
 
     if (DumpCheckGraphs) {
-      desan::CheckGraphBuilder GraphBuilder(M, CoreChecks);
+      desan::CheckGraphBuilder &GraphBuilder = GraphInfo.getGraphBuilder();
       const desan::CheckGraphBuilder::VariableCheckGroups &Groups =
           GraphBuilder.groupChecksByVariable();
 
       errs() << "DESAN Per-Variable Check Graphs\n";
-      for (const auto &Group : Groups) {
-        if (Group.second.empty())
+      for (const desan::VariableCheckGroup &Group : Groups) {
+        if (Group.Checks.empty())
           continue;
 
         std::unique_ptr<desan::CheckGraph> Graph =
-            GraphBuilder.buildGraphForVariable(Group.second.front());
+            GraphBuilder.buildGraphForGroup(Group);
         desan::printCheckGraph(errs(), *Graph);
         errs() << "\n";
       }
     }
 
+    if (!EliminateRedundantReads)
+      return PreservedAnalyses::all();
+
+    desan::RedundantCheckEliminator Eliminator(M,
+                                               GraphInfo.getGraphBuilder());
+    Eliminator.setRecordRemovalCandidates(DumpRemovals);
+
     std::size_t RemovedCount = 0;
-    if (EliminateRedundantReads) {
-      desan::RedundantCheckEliminator Eliminator(M, CoreChecks);
+    if (StreamFunctions) {
+      for (Function &F : M) {
+        if (F.isDeclaration())
+          continue;
+
+        RemovedCount += Eliminator.eliminateRedundantChecks(F);
+        PreservedAnalyses PA = Eliminator.getPreservedAnalyses(F);
+        PA.abandon<desan::CheckedVariableAnalysis>();
+        FAM.invalidate(F, PA);
+      }
+    } else {
       RemovedCount = Eliminator.eliminateRedundantChecks();
-      if (DumpRemovals)
-        Eliminator.dumpRemovalCandidates(errs());
-      errs() << "DESAN Removed Redundant Checks: " << RemovedCount
-             << "\n";
     }
+    if (DumpRemovals)
+      Eliminator.dumpRemovalCandidates(errs());
+    errs() << "DESAN Removed Redundant Checks: " << RemovedCount << "\n";
+    if (unsigned Writes = Eliminator.getNumRemovedWriteChecks())
+      errs() << "DESAN Removed Redundant WRITE Checks: " << Writes << "\n";
+    if (unsigned Safe = Eliminator.getNumSafeChecks())
+      errs() << "DESAN Removed Statically Safe Checks: " << Safe << "\n";
+    if (unsigned RangeSafe = Eliminator.getNumRangeSafeChecks())
+      errs() << "DESAN Removed Range-Proven UBSan Checks: " << RangeSafe
+             << "\n";
+    if (unsigned Proven = Eliminator.getNumLoopBoundsProven())
+      errs() << "DESAN Removed Loop-Bounds UBSan Checks: " << Proven << "\n";
+    if (unsigned Guards = Eliminator.getNumLoopBoundsGuards())
+      errs() << "DESAN Loop-Entry Bounds Guards: " << Guards
+             << " (replaced: " << Eliminator.getNumLoopBoundsReplaced()
+             << ")\n";
+    if (unsigned Clean = Eliminator.getNumCleanShadowChecks())
+      errs() << "DESAN Removed Clean-Shadow MSan Checks: " << Clean << "\n";
+    if (unsigned Pruned = Eliminator.getNumPrunedShadowAccesses())
+      errs() << "DESAN Removed Param/Retval Shadow Accesses: " << Pruned
+             << "\n";
+    if (unsigned Hoisted = Eliminator.getNumHoistedChecks())
+      errs() << "DESAN Hoisted Redundant Checks: " << Hoisted
+             << " (copies removed: " << Eliminator.getNumHoistedCopies()
+             << ")\n";
+    if (unsigned LoopHoisted = Eliminator.getNumLoopHoistedChecks())
+      errs() << "DESAN Loop-Hoisted Checks: " << LoopHoisted
+             << " (range: " << Eliminator.getNumLoopRangeChecks()
+             << ", replaced: " << Eliminator.getNumLoopReplacedChecks()
+             << ")\n";
+    if (unsigned Replaced = Eliminator.getNumCoalescedReplaced())
+      errs() << "DESAN Coalesced Checks: " << Eliminator.getNumCoalescedChecks()
+             << " (replaced: " << Replaced << ")\n";
+
+    if (!Eliminator.changedModule())
+      return PreservedAnalyses::all();
+
+    // Changed functions are invalidated here with what the removal kept
+    // intact, so untouched functions keep their cached analyses.
+    for (Function &F : M)
+      if (!F.isDeclaration())
+        FAM.invalidate(F, Eliminator.getPreservedAnalyses(F));
 
-    return RemovedCount == 0 ? PreservedAnalyses::all()
-                             : PreservedAnalyses::none();
+    PreservedAnalyses PA;
+    PA.preserve<FunctionAnalysisManagerModuleProxy>();
+    PA.preserveSet<AllAnalysesOn<Function>>();
+    return PA;
   }
 };
 
@@ -325,6 +391,19 @@ public:
 extern "C" LLVM_ATTRIBUTE_WEAK PassPluginLibraryInfo llvmGetPassPluginInfo() {
   return {LLVM_PLUGIN_API_VERSION, "DESANPass", LLVM_VERSION_STRING,
           [](PassBuilder &PB) {
+            PB.registerAnalysisRegistrationCallback(
+                [](FunctionAnalysisManager &FAM) {
+                  FAM.registerPass(
+                      [] { return desan::SanitizerCheckAnalysis(); });
+                  FAM.registerPass(
+                      [] { return desan::CheckedVariableAnalysis(); });
+                });
+            PB.registerAnalysisRegistrationCallback(
+                [](ModuleAnalysisManager &MAM) {
+                  MAM.registerPass([] {
+                    return desan::CheckGraphAnalysis(getCheckGraphOptions());
+                  });
+                });
             PB.registerPipelineParsingCallback(
                 [](StringRef Name, ModulePassManager &MPM,
                    ArrayRef<PassBuilder::PipelineElement>) {
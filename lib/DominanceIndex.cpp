@@ -0,0 +1,132 @@
+#include "DESAN/DominanceIndex.h"
+
+#include "llvm/ADT/STLExtras.h"
+#include "llvm/IR/BasicBlock.h"
+#include "llvm/IR/Dominators.h"
+#include "llvm/IR/Function.h"
+#include "llvm/IR/Instructions.h"
+
+using namespace llvm;
+
+namespace desan {
+
+DominanceIndex::DominanceIndex(DominatorTree &DT) : DT(DT) {
+  DT.updateDFSNumbers();
+
+  BasicBlock *Entry = DT.getRoot();
+  if (!Entry || !Entry->getParent())
+    return;
+
+  for (BasicBlock &BB : *Entry->getParent()) {
+    DomTreeNode *Node = DT.getNode(&BB);
+    if (!Node)
+      continue;
+    Numbers[&BB] = {Node->getDFSNumIn(), Node->getDFSNumOut()};
+  }
+}
+
+const DominanceIndex::BlockNumbers *
+DominanceIndex::getBlockNumbers(const BasicBlock *BB) const {
+  auto It = Numbers.find(BB);
+  if (It == Numbers.end())
+    return nullptr;
+  return &It->second;
+}
+
+bool DominanceIndex::isSweepDominator(const Instruction *I) const {
+  // Invoke and callbr results only dominate through their normal edges, which
+  // the block intervals do not model.
+  return !isa<InvokeInst>(I) && !isa<CallBrInst>(I);
+}
+
+bool DominanceIndex::dominates(const Instruction *Def,
+                               const Instruction *User) const {
+  if (!Def || !User)
+    return false;
+
+  const BlockNumbers *UserNumbers = getBlockNumbers(User->getParent());
+  if (!UserNumbers)
+    return true;
+
+  const BlockNumbers *DefNumbers = getBlockNumbers(Def->getParent());
+  if (!DefNumbers || Def == User)
+    return false;
+
+  if (!isSweepDominator(Def))
+    return DT.dominates(Def, User);
+
+  if (Def->getParent() != User->getParent())
+    return DefNumbers->DFSIn <= UserNumbers->DFSIn &&
+           UserNumbers->DFSOut <= DefNumbers->DFSOut;
+
+  if (isa<PHINode>(User))
+    return true;
+  return Def->comesBefore(User);
+}
+
+void DominanceIndex::computeDominancePairs(
+    ArrayRef<const Instruction *> Anchors,
+    SmallVectorImpl<DominancePair> &Pairs) const {
+  SmallVector<unsigned, 32> Sweep;
+
+  for (unsigned Idx = 0, E = Anchors.size(); Idx != E; ++Idx) {
+    const Instruction *Anchor = Anchors[Idx];
+    if (!getBlockNumbers(Anchor->getParent())) {
+      // DominatorTree treats a use in an unreachable block as dominated by
+      // everything; keep that answer for anchors outside the tree.
+      for (unsigned DomIdx = 0; DomIdx != E; ++DomIdx)
+        if (DomIdx != Idx)
+          Pairs.push_back({DomIdx, Idx});
+      continue;
+    }
+
+    if (!isSweepDominator(Anchor)) {
+      for (unsigned UserIdx = 0; UserIdx != E; ++UserIdx) {
+        const Instruction *User = Anchors[UserIdx];
+        if (UserIdx == Idx || !getBlockNumbers(User->getParent()))
+          continue;
+        if (DT.dominates(Anchor, User))
+          Pairs.push_back({Idx, UserIdx});
+      }
+    }
+
+    Sweep.push_back(Idx);
+  }
+
+  llvm::sort(Sweep, [&](unsigned LHS, unsigned RHS) {
+    const Instruction *LHSAnchor = Anchors[LHS];
+    const Instruction *RHSAnchor = Anchors[RHS];
+    if (LHSAnchor->getParent() != RHSAnchor->getParent())
+      return getBlockNumbers(LHSAnchor->getParent())->DFSIn <
+             getBlockNumbers(RHSAnchor->getParent())->DFSIn;
+    if (LHSAnchor == RHSAnchor)
+      return LHS < RHS;
+    return LHSAnchor->comesBefore(RHSAnchor);
+  });
+
+  // Walking anchors in dominator-tree preorder keeps a stack whose block
+  // intervals are nested; every open anchor dominates the current one.
+  SmallVector<unsigned, 16> Open;
+  for (unsigned Idx : Sweep) {
+    const Instruction *Anchor = Anchors[Idx];
+    const BlockNumbers *AnchorNumbers = getBlockNumbers(Anchor->getParent());
+
+    while (!Open.empty()) {
+      const BlockNumbers *OpenNumbers =
+          getBlockNumbers(Anchors[Open.back()]->getParent());
+      if (OpenNumbers->DFSIn <= AnchorNumbers->DFSIn &&
+          AnchorNumbers->DFSOut <= OpenNumbers->DFSOut)
+        break;
+      Open.pop_back();
+    }
+
+    for (unsigned DomIdx : Open)
+      if (Anchors[DomIdx] != Anchor)
+        Pairs.push_back({DomIdx, Idx});
+
+    if (isSweepDominator(Anchor))
+      Open.push_back(Idx);
+  }
+}
+
+} // namespace desan
@@ -0,0 +1,281 @@
+#include "DESAN/LoopBoundsGuard.h"
+
+#include "DESAN/LoopCheckHoister.h"
+
+#include "llvm/ADT/DenseMap.h"
+#include "llvm/ADT/MapVector.h"
+#include "llvm/ADT/STLExtras.h"
+#include "llvm/Analysis/LoopInfo.h"
+#include "llvm/Analysis/ScalarEvolution.h"
+#include "llvm/Analysis/ScalarEvolutionExpressions.h"
+#include "llvm/IR/BasicBlock.h"
+#include "llvm/IR/CFG.h"
+#include "llvm/IR/Dominators.h"
+#include "llvm/IR/Function.h"
+#include "llvm/IR/IRBuilder.h"
+#include "llvm/IR/Instructions.h"
+#include "llvm/IR/IntrinsicInst.h"
+#include "llvm/IR/Module.h"
+#include "llvm/Transforms/Utils/BasicBlockUtils.h"
+#include "llvm/Transforms/Utils/Cloning.h"
+#include "llvm/Transforms/Utils/ScalarEvolutionExpander.h"
+#include "llvm/Transforms/Utils/ValueMapper.h"
+
+#include <utility>
+
+using namespace llvm;
+
+namespace desan {
+
+namespace {
+
+StringRef getHandlerName(const CheckedVariable &Var) {
+  const Function *Callee = Var.CheckInst->getCalledFunction();
+  return Callee ? Callee->getName() : StringRef();
+}
+
+bool isOutOfBoundsHandler(const CheckedVariable &Var) {
+  return getHandlerName(Var).starts_with("__ubsan_handle_out_of_bounds");
+}
+
+} // namespace
+
+LoopBoundsGuard::LoopBoundsGuard(CheckGraphBuilder &Builder)
+    : Builder(Builder), Prover(Builder) {
+  Prover.setUseScalarEvolution(true);
+}
+
+bool LoopBoundsGuard::isLoopBoundsCheck(const CheckedVariable &Var) {
+  if (Var.Sanitizer != SanitizerKind::UBSan || !Var.CheckInst ||
+      !Var.CheckInst->getParent())
+    return false;
+  StringRef Name = getHandlerName(Var);
+  return Name.starts_with("__ubsan_handle_out_of_bounds") ||
+         Name.starts_with("__ubsan_handle_pointer_overflow");
+}
+
+// ScalarEvolution bounds an induction variable by the loop's trip count, so
+// an index or pointer offset that stays in range on every iteration makes
+// the handler unreachable. Checks outside loops are left to the range
+// stage.
+bool LoopBoundsGuard::isProvenInBounds(const CheckedVariable &Var) {
+  if (!isLoopBoundsCheck(Var))
+    return false;
+
+  BasicBlock *Handler = Var.CheckInst->getParent();
+  LoopInfo &LI = Builder.getLoopInfo(*Handler->getParent());
+  if (none_of(predecessors(Handler),
+              [&](BasicBlock *Pred) { return LI.getLoopFor(Pred); }))
+    return false;
+  return Prover.isNeverReached(Var);
+}
+
+unsigned LoopBoundsGuard::guardChecks(
+    const CheckGraphBuilder::VariableCheckGroups &Groups,
+    SmallVectorImpl<unsigned> &Replaced) {
+  MapVector<Function *, SmallVector<unsigned, 8>> ChecksByFunction;
+  for (const VariableCheckGroup &Group : Groups) {
+    for (unsigned Index : Group.Checks) {
+      const CheckedVariable &Var = Builder.getCheck(Index);
+      if (isLoopBoundsCheck(Var) && isOutOfBoundsHandler(Var))
+        ChecksByFunction[Var.CheckInst->getFunction()].push_back(Index);
+    }
+  }
+
+  unsigned Inserted = 0;
+  for (auto &[F, FunctionChecks] : ChecksByFunction) {
+    llvm::sort(FunctionChecks);
+    Inserted += guardFunctionChecks(*F, FunctionChecks, Replaced);
+  }
+  return Inserted;
+}
+
+// All guards of a function are found before any is emitted: emission
+// splits preheaders, and the analyses describe the function as it was.
+unsigned LoopBoundsGuard::guardFunctionChecks(
+    Function &F, ArrayRef<unsigned> FunctionChecks,
+    SmallVectorImpl<unsigned> &Replaced) {
+  LoopInfo &LI = Builder.getLoopInfo(F);
+  if (LI.empty())
+    return 0;
+
+  DominatorTree &DT = Builder.getDominatorTree(F);
+  ScalarEvolution &SE = Builder.getScalarEvolution(F);
+  SCEVExpander Expander(SE, F.getParent()->getDataLayout(), "desan.bounds");
+
+  SmallVector<EntryGuard, 8> Guards;
+  for (unsigned Index : FunctionChecks) {
+    EntryGuard Guard;
+    Guard.Index = Index;
+    if (findEntryGuard(Builder.getCheck(Index), LI, DT, SE, Expander, Guard))
+      Guards.push_back(Guard);
+  }
+  if (Guards.empty())
+    return 0;
+
+  // Each guard splits the block that enters its loop; later guards of the
+  // same loop go into the lower half, so they still run right before it.
+  DenseMap<const Loop *, BasicBlock *> Entries;
+  for (const EntryGuard &Guard : Guards) {
+    BasicBlock *&Entry = Entries[Guard.L];
+    if (!Entry)
+      Entry = Guard.L->getLoopPreheader();
+    emitEntryGuard(Guard, Builder.getCheck(Guard.Index), Entry, Expander);
+    Replaced.push_back(Guard.Index);
+  }
+
+  ChangedFunctions.insert(&F);
+  return Guards.size();
+}
+
+// An out_of_bounds check can move to the loop entry when it compares an
+// affine induction variable against a loop-invariant bound and runs on
+// every iteration. A monotonic induction passes the comparison on every
+// iteration exactly when it passes at the first and the last one, so two
+// comparisons in the preheader decide all of them.
+bool LoopBoundsGuard::findEntryGuard(const CheckedVariable &Var,
+                                     LoopInfo &LI, DominatorTree &DT,
+                                     ScalarEvolution &SE,
+                                     SCEVExpander &Expander,
+                                     EntryGuard &Guard) const {
+  BasicBlock *Handler = Var.CheckInst->getParent();
+  BasicBlock *Pred = Handler->getSinglePredecessor();
+  if (!Pred || isa<PHINode>(Handler->front()))
+    return false;
+
+  auto *Br = dyn_cast<BranchInst>(Pred->getTerminator());
+  if (!Br || !Br->isConditional() ||
+      Br->getSuccessor(0) == Br->getSuccessor(1))
+    return false;
+  auto *Cmp = dyn_cast<ICmpInst>(Br->getCondition());
+  if (!Cmp || !Cmp->getOperand(0)->getType()->isIntegerTy())
+    return false;
+
+  Loop *L = LI.getLoopFor(Pred);
+  if (!L || !L->getLoopPreheader() ||
+      !isGuaranteedToExecuteInLoop(*Br, *L, DT, LI))
+    return false;
+
+  // The handler block is cloned into the preheader, so it must not depend
+  // on anything computed in the loop other than the index it reports.
+  auto *HandlerBr = dyn_cast<BranchInst>(Handler->getTerminator());
+  if (!isa<UnreachableInst>(Handler->getTerminator()) &&
+      !(HandlerBr && HandlerBr->isUnconditional()))
+    return false;
+
+  SmallVector<BasicBlock *, 4> Exiting;
+  getLoopExitingBlocks(*L, Exiting);
+  if (Exiting.size() != 1)
+    return false;
+  const SCEV *BackedgeTakenCount = SE.getExitCount(L, Exiting.front());
+  if (isa<SCEVCouldNotCompute>(BackedgeTakenCount) ||
+      !SE.isLoopInvariant(BackedgeTakenCount, L))
+    return false;
+
+  CmpInst::Predicate PassPred = Br->getSuccessor(0) == Handler
+                                    ? Cmp->getInversePredicate()
+                                    : Cmp->getPredicate();
+  Value *Induction = Cmp->getOperand(0);
+  Value *Bound = Cmp->getOperand(1);
+  const auto *AR = dyn_cast<SCEVAddRecExpr>(SE.getSCEV(Induction));
+  if (!AR || AR->getLoop() != L) {
+    std::swap(Induction, Bound);
+    PassPred = CmpInst::getSwappedPredicate(PassPred);
+    AR = dyn_cast<SCEVAddRecExpr>(SE.getSCEV(Induction));
+  }
+  if (!AR || AR->getLoop() != L || !AR->isAffine() ||
+      ICmpInst::isEquality(PassPred))
+    return false;
+
+  const SCEV *BoundExpr = SE.getSCEV(Bound);
+  const auto *Step = dyn_cast<SCEVConstant>(AR->getStepRecurrence(SE));
+  if (!SE.isLoopInvariant(BoundExpr, L) || !Step || Step->isZero() ||
+      SE.getTypeSizeInBits(BackedgeTakenCount->getType()) >
+          SE.getTypeSizeInBits(AR->getType()))
+    return false;
+
+  const SCEV *Last = AR->evaluateAtIteration(
+      SE.getNoopOrZeroExtend(BackedgeTakenCount, AR->getType()), SE);
+
+  // The comparison must be monotonic in the induction: signed ones need a
+  // recurrence without signed wrap, unsigned ones one without unsigned wrap
+  // or a non-negative one without signed wrap.
+  if (ICmpInst::isSigned(PassPred)) {
+    if (!AR->hasNoSignedWrap())
+      return false;
+  } else if (!AR->hasNoUnsignedWrap()) {
+    const SCEV *Lowest =
+        Step->getAPInt().isNegative() ? Last : AR->getStart();
+    if (!AR->hasNoSignedWrap() || !SE.isKnownNonNegative(Lowest))
+      return false;
+  }
+
+  Instruction *InsertPt = L->getLoopPreheader()->getTerminator();
+  if (!Expander.isSafeToExpandAt(AR->getStart(), InsertPt) ||
+      !Expander.isSafeToExpandAt(Last, InsertPt) ||
+      !Expander.isSafeToExpandAt(BoundExpr, InsertPt))
+    return false;
+
+  for (Instruction &I : *Handler) {
+    const auto *CB = dyn_cast<CallBase>(&I);
+    if (CB && CB != Var.CheckInst && !isa<DbgInfoIntrinsic>(CB))
+      return false;
+    for (Value *Op : I.operands()) {
+      if (Op == Induction || isa<Constant, Argument, BasicBlock,
+                                 MetadataAsValue, InlineAsm>(Op))
+        continue;
+      auto *OpInst = dyn_cast<Instruction>(Op);
+      if (!OpInst ||
+          (OpInst->getParent() != Handler && !DT.dominates(OpInst, InsertPt)))
+        return false;
+    }
+  }
+
+  Guard.L = L;
+  Guard.Induction = Induction;
+  Guard.PassPred = PassPred;
+  Guard.Start = AR->getStart();
+  Guard.Last = Last;
+  Guard.Bound = BoundExpr;
+  return true;
+}
+
+// Entry: br (start ok && last ok), Tail, Report. The report block is a copy
+// of the handler that reports the endpoint that failed; a recoverable
+// handler then runs the loop, which no longer checks the index.
+void LoopBoundsGuard::emitEntryGuard(const EntryGuard &Guard,
+                                     const CheckedVariable &Var,
+                                     BasicBlock *&Entry,
+                                     SCEVExpander &Expander) {
+  Instruction *InsertPt = Entry->getTerminator();
+  Type *Ty = Guard.Induction->getType();
+  Value *Start = Expander.expandCodeFor(Guard.Start, Ty, InsertPt);
+  Value *Last = Expander.expandCodeFor(Guard.Last, Ty, InsertPt);
+  Value *Bound = Expander.expandCodeFor(Guard.Bound, Ty, InsertPt);
+
+  IRBuilder<> IRB(InsertPt);
+  IRB.SetCurrentDebugLocation(Var.CheckInst->getDebugLoc());
+  Value *StartOk = IRB.CreateICmp(Guard.PassPred, Start, Bound);
+  Value *LastOk = IRB.CreateICmp(Guard.PassPred, Last, Bound);
+  Value *InBounds = IRB.CreateAnd(StartOk, LastOk, "desan.bounds.ok");
+  Value *Failing =
+      IRB.CreateSelect(StartOk, Last, Start, "desan.bounds.index");
+
+  Function *F = Entry->getParent();
+  BasicBlock *Tail = SplitBlock(Entry, InsertPt);
+  BasicBlock *Handler = Var.CheckInst->getParent();
+  ValueToValueMapTy VMap;
+  VMap[Guard.Induction] = Failing;
+  BasicBlock *Report = CloneBasicBlock(Handler, VMap, ".guard", F);
+  for (Instruction &I : *Report)
+    RemapInstruction(&I, VMap,
+                     RF_NoModuleLevelChanges | RF_IgnoreMissingLocals);
+  if (auto *Br = dyn_cast<BranchInst>(Report->getTerminator()))
+    Br->setSuccessor(0, Tail);
+
+  ReplaceInstWithInst(Entry->getTerminator(),
+                      BranchInst::Create(Tail, Report, InBounds));
+  Entry = Tail;
+}
+
+} // namespace desan
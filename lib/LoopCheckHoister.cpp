@@ -0,0 +1,268 @@
+#include "DESAN/LoopCheckHoister.h"
+
+#include "llvm/ADT/MapVector.h"
+#include "llvm/ADT/STLExtras.h"
+#include "llvm/ADT/Twine.h"
+#include "llvm/Analysis/LoopInfo.h"
+#include "llvm/Analysis/ScalarEvolution.h"
+#include "llvm/Analysis/ScalarEvolutionExpressions.h"
+#include "llvm/Analysis/ValueTracking.h"
+#include "llvm/IR/BasicBlock.h"
+#include "llvm/IR/CFG.h"
+#include "llvm/IR/Dominators.h"
+#include "llvm/IR/Function.h"
+#include "llvm/IR/IRBuilder.h"
+#include "llvm/IR/Instructions.h"
+#include "llvm/IR/Module.h"
+#include "llvm/Support/MathExtras.h"
+#include "llvm/Transforms/Utils/ScalarEvolutionExpander.h"
+
+#include <string>
+
+using namespace llvm;
+
+namespace desan {
+
+namespace {
+
+bool isLoopCheckCandidate(const CheckedVariable &Var) {
+  return Var.Sanitizer == SanitizerKind::ASan &&
+         Var.Type == AccessType::READ && Var.CheckInst && Var.Address &&
+         Var.Address->getType()->isPointerTy() && Var.AccessSize != 0;
+}
+
+// __asan_loadN and its report call take the size as an argument; the
+// original access may then be unaligned.
+bool isVariableSizeCheck(const CallBase &CB) {
+  const Function *Callee = CB.getCalledFunction();
+  if (!Callee)
+    return true;
+  StringRef Name = Callee->getName();
+  Name.consume_back("_noabort");
+  return Name.ends_with("N");
+}
+
+} // namespace
+
+LoopCheckHoister::LoopCheckHoister(CheckGraphBuilder &Builder)
+    : Builder(Builder) {}
+
+unsigned LoopCheckHoister::hoistChecks(
+    const CheckGraphBuilder::VariableCheckGroups &Groups,
+    SmallVectorImpl<unsigned> &Replaced) {
+  MapVector<Function *, SmallVector<unsigned, 8>> ChecksByFunction;
+  for (const VariableCheckGroup &Group : Groups) {
+    for (unsigned Index : Group.Checks) {
+      const CheckedVariable &Var = Builder.getCheck(Index);
+      if (!isLoopCheckCandidate(Var))
+        continue;
+
+      Instruction *Anchor = findCheckAnchor(Var.CheckInst);
+      if (Anchor && Anchor->getParent())
+        ChecksByFunction[Anchor->getFunction()].push_back(Index);
+    }
+  }
+
+  unsigned Inserted = 0;
+  for (auto &[F, FunctionChecks] : ChecksByFunction) {
+    llvm::sort(FunctionChecks);
+    Inserted += hoistFunctionChecks(*F, FunctionChecks, Replaced);
+  }
+  return Inserted;
+}
+
+unsigned LoopCheckHoister::hoistFunctionChecks(
+    Function &F, ArrayRef<unsigned> FunctionChecks,
+    SmallVectorImpl<unsigned> &Replaced) {
+  LoopInfo &LI = Builder.getLoopInfo(F);
+  if (LI.empty())
+    return 0;
+
+  DominatorTree &DT = Builder.getDominatorTree(F);
+  ScalarEvolution &SE = Builder.getScalarEvolution(F);
+  SCEVExpander Expander(SE, F.getParent()->getDataLayout(), "desan.loop");
+
+  unsigned Inserted = 0;
+  std::size_t FirstReplaced = Replaced.size();
+  for (unsigned Index : FunctionChecks) {
+    const CheckedVariable &Var = Builder.getCheck(Index);
+    Instruction *Anchor = findCheckAnchor(Var.CheckInst);
+    Loop *L = LI.getLoopFor(Anchor->getParent());
+    if (!L)
+      continue;
+
+    BasicBlock *Preheader = L->getLoopPreheader();
+    if (!Preheader || !isShadowStable(*L) ||
+        !isGuaranteedToExecuteInLoop(*Anchor, *L, DT, LI))
+      continue;
+
+    CheckRegion Region;
+    if (!findRegion(Var, *L, SE, Region))
+      continue;
+
+    Instruction *InsertPt = Preheader->getTerminator();
+    if (!Expander.isSafeToExpandAt(Region.Start, InsertPt) ||
+        !Expander.isSafeToExpandAt(Region.Size, InsertPt))
+      continue;
+
+    if (EmittedRegions.insert({Preheader, Region.Start, Region.Size}).second) {
+      emitRegionCheck(Region, Var, InsertPt, Expander);
+      ++Inserted;
+    }
+    Replaced.push_back(Index);
+  }
+
+  if (Replaced.size() != FirstReplaced)
+    ChangedFunctions.insert(&F);
+  return Inserted;
+}
+
+// The bytes a check covers over the whole loop: its own access for an
+// invariant address, or [first, last + size) for an affine one. Strides wider
+// than the access leave gaps the original checks never looked at, and a
+// region check over them could report valid code.
+bool LoopCheckHoister::findRegion(const CheckedVariable &Var, Loop &L,
+                                  ScalarEvolution &SE,
+                                  CheckRegion &Region) const {
+  if (!SE.isSCEVable(Var.Address->getType()))
+    return false;
+
+  const SCEV *Address = SE.getSCEV(Var.Address);
+  Type *IntPtrTy = SE.getEffectiveSCEVType(Address->getType());
+  const SCEV *AccessSize = SE.getConstant(IntPtrTy, Var.AccessSize);
+  if (SE.isLoopInvariant(Address, &L)) {
+    Region.Start = Address;
+    Region.Size = AccessSize;
+    Region.Invariant = true;
+    return true;
+  }
+
+  // An inbounds GEP stays inside one object whenever the access is valid,
+  // so it cannot wrap even where SCEV could not prove it.
+  const auto *AR = dyn_cast<SCEVAddRecExpr>(Address);
+  const auto *GEP = dyn_cast<GEPOperator>(Var.Address);
+  if (!AR || AR->getLoop() != &L || !AR->isAffine() ||
+      (!AR->hasNoSelfWrap() && !AR->hasNoUnsignedWrap() &&
+       !AR->hasNoSignedWrap() && !(GEP && GEP->isInBounds())))
+    return false;
+
+  const auto *Step = dyn_cast<SCEVConstant>(AR->getStepRecurrence(SE));
+  if (!Step || Step->getAPInt().isZero() ||
+      Step->getAPInt().abs().ugt(Var.AccessSize))
+    return false;
+
+  SmallVector<BasicBlock *, 4> Exiting;
+  getLoopExitingBlocks(L, Exiting);
+  if (Exiting.size() != 1)
+    return false;
+
+  const SCEV *BackedgeTakenCount = SE.getExitCount(&L, Exiting.front());
+  if (isa<SCEVCouldNotCompute>(BackedgeTakenCount) ||
+      !SE.isLoopInvariant(BackedgeTakenCount, &L) ||
+      SE.getTypeSizeInBits(BackedgeTakenCount->getType()) >
+          SE.getTypeSizeInBits(IntPtrTy))
+    return false;
+
+  BackedgeTakenCount = SE.getNoopOrZeroExtend(BackedgeTakenCount, IntPtrTy);
+  const SCEV *Span = SE.getMulExpr(
+      BackedgeTakenCount,
+      SE.getConstant(IntPtrTy, Step->getAPInt().abs().getZExtValue()));
+  Region.Start = AR->getStart();
+  if (Step->getAPInt().isNegative())
+    Region.Start = SE.getAddExpr(Region.Start, SE.getNegativeSCEV(Span));
+  Region.Size = SE.getAddExpr(Span, AccessSize);
+  return true;
+}
+
+bool LoopCheckHoister::isShadowStable(const Loop &L) {
+  auto [It, Inserted] = ShadowStableLoops.try_emplace(&L, true);
+  if (!Inserted)
+    return It->second;
+
+  for (const BasicBlock *BB : L.blocks())
+    if (any_of(*BB, mayChangeShadow))
+      return It->second = false;
+  return true;
+}
+
+void LoopCheckHoister::emitRegionCheck(const CheckRegion &Region,
+                                       const CheckedVariable &Var,
+                                       Instruction *InsertPt,
+                                       SCEVExpander &Expander) {
+  Module &M = *InsertPt->getModule();
+  LLVMContext &Ctx = M.getContext();
+  Type *IntPtrTy = M.getDataLayout().getIntPtrType(Ctx);
+
+  Value *Start = Expander.expandCodeFor(Region.Start, Region.Start->getType(),
+                                        InsertPt);
+  IRBuilder<> IRB(InsertPt);
+  SmallVector<Value *, 2> Args = {IRB.CreatePtrToInt(Start, IntPtrTy)};
+
+  // Fixed-size callbacks assume a naturally aligned access and test only
+  // the granule it starts in. That holds for an invariant region, which is
+  // the original access; a range over several iterations goes through
+  // __asan_loadN, which tests every byte.
+  std::string Name = "__asan_loadN";
+  if (Region.Invariant && isPowerOf2_64(Var.AccessSize) &&
+      Var.AccessSize <= 16 && !isVariableSizeCheck(*Var.CheckInst))
+    Name = ("__asan_load" + Twine(Var.AccessSize)).str();
+  else
+    Args.push_back(Expander.expandCodeFor(Region.Size, IntPtrTy, InsertPt));
+  if (isRecoverableCheck(*Var.CheckInst))
+    Name += "_noabort";
+
+  SmallVector<Type *, 2> Params(Args.size(), IntPtrTy);
+  FunctionCallee Callee = M.getOrInsertFunction(
+      Name, FunctionType::get(Type::getVoidTy(Ctx), Params, false));
+  CallInst *Check = IRB.CreateCall(Callee, Args);
+  Check->setDebugLoc(Var.CheckInst->getDebugLoc());
+
+  if (!Region.Invariant)
+    ++NumRangeChecks;
+}
+
+// Report blocks end execution, so only the other exits bound how many
+// iterations run.
+void getLoopExitingBlocks(const Loop &L,
+                          SmallVectorImpl<BasicBlock *> &Exiting) {
+  for (BasicBlock *BB : L.blocks())
+    if (any_of(successors(BB), [&](const BasicBlock *Succ) {
+          return !L.contains(Succ) && !isSanitizerReportBlock(*Succ);
+        }))
+      Exiting.push_back(BB);
+}
+
+// A check may run in the preheader only if every trip through the loop
+// reaches it: it dominates all latches and exits. The preheader check also
+// covers the last iteration, so nothing anywhere in the loop, before or
+// after the check, may leave the function or loop forever. Other sanitizer
+// checks and their report blocks only end execution with a report.
+bool isGuaranteedToExecuteInLoop(const Instruction &Anchor, const Loop &L,
+                                 const DominatorTree &DT, const LoopInfo &LI) {
+  const BasicBlock *AnchorBB = Anchor.getParent();
+  SmallVector<BasicBlock *, 4> Exits;
+  getLoopExitingBlocks(L, Exits);
+  L.getLoopLatches(Exits);
+  if (!all_of(Exits, [&](const BasicBlock *BB) {
+        return DT.dominates(AnchorBB, BB);
+      }))
+    return false;
+
+  for (const BasicBlock *BB : L.blocks()) {
+    if (isSanitizerReportBlock(*BB))
+      continue;
+    if (LI.getLoopFor(BB) != &L)
+      return false;
+
+    for (const Instruction &I : *BB) {
+      const auto *CB = dyn_cast<CallBase>(&I);
+      if (CB && isSanitizerRuntimeCall(*CB))
+        continue;
+      if (!isGuaranteedToTransferExecutionToSuccessor(&I))
+        return false;
+    }
+  }
+  return true;
+}
+
+} // namespace desan
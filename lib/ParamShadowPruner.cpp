@@ -0,0 +1,498 @@
+#include "DESAN/ParamShadowPruner.h"
+
+#include "DESAN/ShadowCheckDeduplicator.h"
+
+#include "llvm/ADT/APInt.h"
+#include "llvm/ADT/STLExtras.h"
+#include "llvm/IR/Constants.h"
+#include "llvm/IR/DataLayout.h"
+#include "llvm/IR/Function.h"
+#include "llvm/IR/GlobalVariable.h"
+#include "llvm/IR/InstrTypes.h"
+#include "llvm/IR/Instructions.h"
+#include "llvm/IR/IntrinsicInst.h"
+#include "llvm/IR/Module.h"
+#include "llvm/IR/PatternMatch.h"
+
+#include <optional>
+
+using namespace llvm;
+using namespace llvm::PatternMatch;
+
+namespace desan {
+
+namespace {
+
+// Shadow expressions deeper than this are assumed to carry poison.
+constexpr unsigned MaxShadowDepth = 16;
+
+struct TLSSlot {
+  const GlobalVariable *TLS = nullptr;
+  int64_t Offset = 0;
+};
+
+// MSan addresses its TLS arrays with a constant GEP, or in older releases
+// as inttoptr (add (ptrtoint @tls, C)).
+std::optional<TLSSlot> getTLSSlot(Value *Ptr, const DataLayout &DL) {
+  if (!Ptr->getType()->isPointerTy())
+    return std::nullopt;
+
+  APInt Offset(DL.getIndexTypeSizeInBits(Ptr->getType()), 0);
+  Value *Base = Ptr->stripAndAccumulateConstantOffsets(
+      DL, Offset, /*AllowNonInbounds=*/true);
+  int64_t Extra = 0;
+  Value *Int = nullptr;
+  Value *Object = nullptr;
+  ConstantInt *Add = nullptr;
+  if (match(Base, m_IntToPtr(m_Value(Int)))) {
+    if (match(Int, m_Add(m_PtrToInt(m_Value(Object)), m_ConstantInt(Add)))) {
+      Base = Object;
+      Extra = Add->getSExtValue();
+    } else if (match(Int, m_PtrToInt(m_Value(Object)))) {
+      Base = Object;
+    }
+  }
+
+  const auto *GV = dyn_cast<GlobalVariable>(Base);
+  if (!GV)
+    return std::nullopt;
+  return TLSSlot{GV, Offset.getSExtValue() + Extra};
+}
+
+std::optional<TLSSlot> getTLSSlot(Value *Ptr, const GlobalVariable *TLS,
+                                  const DataLayout &DL) {
+  if (!TLS)
+    return std::nullopt;
+  std::optional<TLSSlot> Slot = getTLSSlot(Ptr, DL);
+  if (!Slot || Slot->TLS != TLS)
+    return std::nullopt;
+  return Slot;
+}
+
+bool refersTo(Instruction &I, const GlobalVariable *TLS,
+              const DataLayout &DL) {
+  return TLS && any_of(I.operands(), [&](const Use &Op) {
+           return getTLSSlot(Op.get(), TLS, DL).has_value();
+         });
+}
+
+// MSan writes the shadow TLS right before a call and reads it right after
+// one; any call other than an intrinsic may overwrite it.
+bool isWindowBoundary(const Instruction &I) {
+  const auto *CB = dyn_cast<CallBase>(&I);
+  return CB && !isa<IntrinsicInst>(CB);
+}
+
+uint64_t getStoreSize(const StoreInst &Store, const DataLayout &DL) {
+  return DL.getTypeStoreSize(Store.getValueOperand()->getType());
+}
+
+bool overlaps(int64_t Begin, uint64_t Size, int64_t OtherBegin,
+              uint64_t OtherSize) {
+  return Begin < OtherBegin + int64_t(OtherSize) &&
+         OtherBegin < Begin + int64_t(Size);
+}
+
+} // namespace
+
+ParamShadowPruner::ParamShadowPruner(CheckGraphBuilder &Builder)
+    : Builder(Builder), DL(Builder.getModule().getDataLayout()) {
+  Module &M = Builder.getModule();
+  ParamTLS = M.getNamedGlobal("__msan_param_tls");
+  ParamOriginTLS = M.getNamedGlobal("__msan_param_origin_tls");
+  RetvalTLS = M.getNamedGlobal("__msan_retval_tls");
+  RetvalOriginTLS = M.getNamedGlobal("__msan_retval_origin_tls");
+}
+
+// Only functions whose every caller is visible can have their argument and
+// return shadow decided here: internal, instrumented ones that are never
+// called indirectly or through an invoke, whose return shadow MSan reads in
+// another block.
+bool ParamShadowPruner::isCandidate(const Function &F) const {
+  if (F.isDeclaration() || !F.hasLocalLinkage() || F.isVarArg() ||
+      !F.hasFnAttribute(Attribute::SanitizeMemory))
+    return false;
+  return all_of(F.uses(), [&](const Use &U) {
+    const auto *Call = dyn_cast<CallInst>(U.getUser());
+    return Call && Call->isCallee(&U) &&
+           Call->getFunctionType() == F.getFunctionType();
+  });
+}
+
+// MSan reads argument shadow and origins once, at the top of the entry
+// block, and writes the return shadow right before each return. Any other
+// read of the argument TLS makes the function's argument slots opaque.
+ParamShadowPruner::FunctionShadow
+ParamShadowPruner::scanFunction(Function &F) const {
+  FunctionShadow Info;
+  bool InPrologue = true;
+  for (BasicBlock &BB : F) {
+    for (Instruction &I : BB) {
+      if (isWindowBoundary(I))
+        InPrologue = false;
+
+      if (auto *Load = dyn_cast<LoadInst>(&I)) {
+        Value *Ptr = Load->getPointerOperand();
+        if (!getTLSSlot(Ptr, ParamTLS, DL) &&
+            !getTLSSlot(Ptr, ParamOriginTLS, DL))
+          continue;
+        if (InPrologue && Load->isSimple())
+          Info.ParamLoads.push_back(Load);
+        else
+          Info.ParamsReadOnEntry = false;
+        continue;
+      }
+
+      if (auto *Store = dyn_cast<StoreInst>(&I)) {
+        Value *Ptr = Store->getPointerOperand();
+        if (getTLSSlot(Ptr, ParamTLS, DL) ||
+            getTLSSlot(Ptr, ParamOriginTLS, DL))
+          InPrologue = false;
+        continue;
+      }
+
+      if (refersTo(I, ParamTLS, DL) || refersTo(I, ParamOriginTLS, DL))
+        Info.ParamsReadOnEntry = false;
+    }
+    InPrologue = false;
+  }
+
+  if (F.getReturnType()->isVoidTy() || !RetvalTLS)
+    return Info;
+
+  Info.StoresReturnShadow = true;
+  for (BasicBlock &BB : F) {
+    auto *Ret = dyn_cast<ReturnInst>(BB.getTerminator());
+    if (!Ret)
+      continue;
+
+    StoreInst *ReturnStore = nullptr;
+    for (Instruction *I = Ret->getPrevNode(); I && !isWindowBoundary(*I);
+         I = I->getPrevNode()) {
+      auto *Store = dyn_cast<StoreInst>(I);
+      std::optional<TLSSlot> Slot =
+          Store ? getTLSSlot(Store->getPointerOperand(), RetvalTLS, DL)
+                : std::nullopt;
+      if (Slot && Slot->Offset == 0 && Store->isSimple()) {
+        ReturnStore = Store;
+        break;
+      }
+    }
+    if (!ReturnStore) {
+      Info.StoresReturnShadow = false;
+      Info.ReturnStores.clear();
+      break;
+    }
+    Info.ReturnStores.push_back(ReturnStore);
+  }
+  return Info;
+}
+
+// Starts with nothing clean and grows to a fixed point: an argument slot is
+// clean once every call site stores a clean shadow into it, and a return
+// once every return stores one. Either may depend on slots and returns
+// proven in an earlier round, which is how facts cross call chains.
+void ParamShadowPruner::analyzeModule() {
+  if (!ParamTLS && !RetvalTLS)
+    return;
+
+  for (Function &F : Builder.getModule())
+    if (isCandidate(F))
+      Functions.insert({&F, scanFunction(F)});
+
+  bool Changed = true;
+  while (Changed) {
+    Changed = false;
+    for (auto &[F, Info] : Functions) {
+      if (Info.ParamsReadOnEntry) {
+        SmallMapVector<int64_t, uint64_t, 8> Slots;
+        for (LoadInst *Load : Info.ParamLoads)
+          if (std::optional<TLSSlot> Slot =
+                  getTLSSlot(Load->getPointerOperand(), ParamTLS, DL)) {
+            uint64_t &Size = Slots[Slot->Offset];
+            Size = std::max<uint64_t>(Size,
+                                      DL.getTypeStoreSize(Load->getType()));
+          }
+
+        for (auto [Offset, Size] : Slots) {
+          if (CleanParams[F].count(Offset))
+            continue;
+          if (all_of(F->users(), [&](User *U) {
+                return isCleanArgument(*cast<CallBase>(U), Offset, Size);
+              })) {
+            CleanParams[F].insert(Offset);
+            Changed = true;
+          }
+        }
+      }
+
+      if (Info.StoresReturnShadow && !CleanReturns.contains(F) &&
+          all_of(Info.ReturnStores, [&](StoreInst *Store) {
+            return isCleanValue(Store->getValueOperand());
+          })) {
+        CleanReturns.insert(F);
+        Changed = true;
+      }
+    }
+  }
+}
+
+void ParamShadowPruner::findCleanChecks(
+    const CheckGraphBuilder::VariableCheckGroups &Groups,
+    SmallVectorImpl<unsigned> &Clean) {
+  if (Functions.empty())
+    return;
+
+  for (const VariableCheckGroup &Group : Groups)
+    for (unsigned Index : Group.Checks)
+      if (Value *Shadow = getMemSanWarningShadow(Builder.getCheck(Index));
+          Shadow && isCleanValue(Shadow))
+        Clean.push_back(Index);
+}
+
+bool ParamShadowPruner::isCleanArgument(CallBase &CB, int64_t Offset,
+                                        uint64_t Size) const {
+  for (Instruction *I = CB.getPrevNode(); I && !isWindowBoundary(*I);
+       I = I->getPrevNode()) {
+    if (auto *Store = dyn_cast<StoreInst>(I)) {
+      std::optional<TLSSlot> Slot =
+          getTLSSlot(Store->getPointerOperand(), ParamTLS, DL);
+      uint64_t StoreSize = getStoreSize(*Store, DL);
+      if (!Slot || !overlaps(Slot->Offset, StoreSize, Offset, Size))
+        continue;
+      return Slot->Offset <= Offset &&
+             Offset + int64_t(Size) <= Slot->Offset + int64_t(StoreSize) &&
+             isCleanValue(Store->getValueOperand());
+    }
+    if (refersTo(*I, ParamTLS, DL))
+      return false;
+  }
+  return false;
+}
+
+bool ParamShadowPruner::isCleanValue(Value *V) const {
+  SmallPtrSet<Value *, 16> InProgress;
+  return isCleanShadow(V, InProgress, 0);
+}
+
+// Whether a shadow value is provably all zeros. Every operation followed
+// here maps zero operands to zero, so a cycle through phis is clean when
+// everything entering it is; values on the current path are assumed clean.
+bool ParamShadowPruner::isCleanShadow(Value *V,
+                                      SmallPtrSetImpl<Value *> &InProgress,
+                                      unsigned Depth) const {
+  if (auto *C = dyn_cast<Constant>(V))
+    return C->isNullValue();
+  auto *I = dyn_cast<Instruction>(V);
+  if (!I || Depth > MaxShadowDepth)
+    return false;
+  if (!InProgress.insert(I).second)
+    return true;
+
+  auto IsClean = [&](Value *Op) {
+    return isCleanShadow(Op, InProgress, Depth + 1);
+  };
+
+  bool Clean = false;
+  switch (I->getOpcode()) {
+  case Instruction::Trunc:
+  case Instruction::ZExt:
+  case Instruction::SExt:
+  case Instruction::BitCast:
+  case Instruction::PtrToInt:
+  case Instruction::IntToPtr:
+  case Instruction::Shl:
+  case Instruction::LShr:
+  case Instruction::AShr:
+  case Instruction::ExtractValue:
+  case Instruction::ExtractElement:
+    Clean = IsClean(I->getOperand(0));
+    break;
+  case Instruction::Or:
+  case Instruction::Xor:
+  case Instruction::Add:
+  case Instruction::Sub:
+  case Instruction::InsertValue:
+  case Instruction::InsertElement:
+  case Instruction::ShuffleVector:
+    Clean = IsClean(I->getOperand(0)) && IsClean(I->getOperand(1));
+    break;
+  case Instruction::And:
+  case Instruction::Mul:
+    Clean = IsClean(I->getOperand(0)) || IsClean(I->getOperand(1));
+    break;
+  case Instruction::ICmp: {
+    // Strict comparisons of zeros are false; the others are true.
+    CmpInst::Predicate Pred = cast<ICmpInst>(I)->getPredicate();
+    Clean = (Pred == CmpInst::ICMP_NE || CmpInst::isStrictPredicate(Pred)) &&
+            IsClean(I->getOperand(0)) && IsClean(I->getOperand(1));
+    break;
+  }
+  case Instruction::Select:
+    Clean = IsClean(I->getOperand(1)) && IsClean(I->getOperand(2));
+    break;
+  case Instruction::PHI:
+    Clean = all_of(cast<PHINode>(I)->incoming_values(),
+                   [&](Value *Incoming) { return IsClean(Incoming); });
+    break;
+  case Instruction::Load:
+    Clean = isCleanParamLoad(*cast<LoadInst>(I)) ||
+            isCleanReturnLoad(*cast<LoadInst>(I));
+    break;
+  default:
+    break;
+  }
+
+  InProgress.erase(I);
+  return Clean;
+}
+
+bool ParamShadowPruner::isCleanParamLoad(LoadInst &Load) const {
+  std::optional<TLSSlot> Slot =
+      getTLSSlot(Load.getPointerOperand(), ParamTLS, DL);
+  if (!Slot)
+    return false;
+
+  Function *F = Load.getFunction();
+  auto It = Functions.find(F);
+  if (It == Functions.end() || !It->second.ParamsReadOnEntry ||
+      !is_contained(It->second.ParamLoads, &Load))
+    return false;
+
+  auto Clean = CleanParams.find(F);
+  return Clean != CleanParams.end() && Clean->second.count(Slot->Offset);
+}
+
+bool ParamShadowPruner::isCleanReturnLoad(LoadInst &Load) const {
+  std::optional<TLSSlot> Slot =
+      getTLSSlot(Load.getPointerOperand(), RetvalTLS, DL);
+  if (!Slot || Slot->Offset != 0)
+    return false;
+
+  for (Instruction *I = Load.getPrevNode(); I; I = I->getPrevNode()) {
+    if (isWindowBoundary(*I)) {
+      Function *Callee = cast<CallBase>(I)->getCalledFunction();
+      auto It = Callee ? Functions.find(Callee) : Functions.end();
+      if (It == Functions.end() || !CleanReturns.contains(Callee))
+        return false;
+      uint64_t Size = DL.getTypeStoreSize(Load.getType());
+      return all_of(It->second.ReturnStores, [&](StoreInst *Store) {
+        return getStoreSize(*Store, DL) >= Size;
+      });
+    }
+    if (refersTo(*I, RetvalTLS, DL))
+      return false;
+  }
+  return false;
+}
+
+// Rescans the module: check removal may have deleted shadow loads that the
+// analysis saw. Argument slots that the callee reads nowhere any more, and
+// return shadows that are clean, are neither written nor read.
+unsigned ParamShadowPruner::pruneShadowTraffic() {
+  unsigned Removed = 0;
+  for (auto &Entry : Functions) {
+    Function *F = Entry.first;
+    FunctionShadow Info = scanFunction(*F);
+
+    if (Info.ParamsReadOnEntry) {
+      auto Clean = CleanParams.find(F);
+      SmallVector<LoadInst *, 8> Remaining;
+      for (LoadInst *Load : Info.ParamLoads) {
+        std::optional<TLSSlot> Slot = getTLSSlot(Load->getPointerOperand(), DL);
+        if (Clean == CleanParams.end() || !Clean->second.count(Slot->Offset)) {
+          Remaining.push_back(Load);
+          continue;
+        }
+        Load->replaceAllUsesWith(Constant::getNullValue(Load->getType()));
+        Load->eraseFromParent();
+        ChangedFunctions.insert(F);
+        ++Removed;
+      }
+      Info.ParamLoads = std::move(Remaining);
+    }
+
+    bool PruneReturn = Info.StoresReturnShadow && CleanReturns.contains(F);
+    for (User *U : F->users())
+      Removed += pruneCallSite(*cast<CallBase>(U), Info,
+                               Info.ParamsReadOnEntry, PruneReturn);
+
+    if (!PruneReturn)
+      continue;
+    for (StoreInst *ReturnStore : Info.ReturnStores) {
+      BasicBlock *BB = ReturnStore->getParent();
+      for (Instruction *I = BB->getTerminator()->getPrevNode();
+           I && !isWindowBoundary(*I);) {
+        Instruction *Prev = I->getPrevNode();
+        auto *Store = dyn_cast<StoreInst>(I);
+        if (Store && (getTLSSlot(Store->getPointerOperand(), RetvalTLS, DL) ||
+                      getTLSSlot(Store->getPointerOperand(), RetvalOriginTLS,
+                                 DL))) {
+          Store->eraseFromParent();
+          ChangedFunctions.insert(F);
+          ++Removed;
+        }
+        I = Prev;
+      }
+    }
+  }
+  return Removed;
+}
+
+unsigned ParamShadowPruner::pruneCallSite(CallBase &CB,
+                                          const FunctionShadow &Callee,
+                                          bool PruneParams,
+                                          bool PruneReturn) {
+  auto IsReadByCallee = [&](const TLSSlot &Slot, uint64_t Size) {
+    return any_of(Callee.ParamLoads, [&](LoadInst *Load) {
+      std::optional<TLSSlot> Read = getTLSSlot(Load->getPointerOperand(), DL);
+      return Read->TLS == Slot.TLS &&
+             overlaps(Read->Offset, DL.getTypeStoreSize(Load->getType()),
+                      Slot.Offset, Size);
+    });
+  };
+
+  unsigned Removed = 0;
+  for (Instruction *I = CB.getPrevNode(); I && !isWindowBoundary(*I);) {
+    Instruction *Prev = I->getPrevNode();
+    auto *Store = dyn_cast<StoreInst>(I);
+    std::optional<TLSSlot> Slot =
+        Store && Store->isSimple() ? getTLSSlot(Store->getPointerOperand(), DL)
+                                   : std::nullopt;
+    bool Dead = false;
+    if (Slot && PruneParams &&
+        (Slot->TLS == ParamTLS || Slot->TLS == ParamOriginTLS))
+      Dead = !IsReadByCallee(*Slot, getStoreSize(*Store, DL));
+    else if (Slot && PruneReturn && Slot->TLS == RetvalTLS)
+      Dead = true;
+    if (Dead) {
+      Store->eraseFromParent();
+      ++Removed;
+    }
+    I = Prev;
+  }
+
+  if (PruneReturn) {
+    for (Instruction *I = CB.getNextNode(); I && !isWindowBoundary(*I);) {
+      Instruction *Next = I->getNextNode();
+      if (isa<StoreInst>(I) &&
+          (refersTo(*I, RetvalTLS, DL) || refersTo(*I, RetvalOriginTLS, DL)))
+        break;
+      auto *Load = dyn_cast<LoadInst>(I);
+      if (Load && (getTLSSlot(Load->getPointerOperand(), RetvalTLS, DL) ||
+                   getTLSSlot(Load->getPointerOperand(), RetvalOriginTLS,
+                              DL))) {
+        Load->replaceAllUsesWith(Constant::getNullValue(Load->getType()));
+        Load->eraseFromParent();
+        ++Removed;
+      }
+      I = Next;
+    }
+  }
+
+  if (Removed)
+    ChangedFunctions.insert(CB.getFunction());
+  return Removed;
+}
+
+} // namespace desan
@@ -0,0 +1,271 @@
+#include "DESAN/PartialRedundancyEliminator.h"
+
+#include "llvm/ADT/STLExtras.h"
+#include "llvm/IR/BasicBlock.h"
+#include "llvm/IR/CFG.h"
+#include "llvm/IR/DebugInfoMetadata.h"
+#include "llvm/IR/Function.h"
+#include "llvm/IR/Instructions.h"
+#include "llvm/Transforms/Utils/BasicBlockUtils.h"
+#include "llvm/Transforms/Utils/Cloning.h"
+#include "llvm/Transforms/Utils/ValueMapper.h"
+
+#include <utility>
+
+using namespace llvm;
+
+namespace desan {
+
+namespace {
+
+bool sameCheckedLocation(const CheckedVariable &LHS,
+                         const CheckedVariable &RHS) {
+  if (LHS.HasStaticByteOffset || RHS.HasStaticByteOffset)
+    return LHS.HasStaticByteOffset && RHS.HasStaticByteOffset &&
+           LHS.StaticByteOffset == RHS.StaticByteOffset;
+  if (LHS.Address || RHS.Address)
+    return LHS.Address == RHS.Address;
+  return LHS.Offsets.empty() && RHS.Offsets.empty();
+}
+
+} // namespace
+
+PartialRedundancyEliminator::PartialRedundancyEliminator(
+    CheckGraphBuilder &Builder)
+    : Builder(Builder) {}
+
+unsigned PartialRedundancyEliminator::hoistChecks(
+    const CheckGraphBuilder::VariableCheckGroups &Groups,
+    SmallVectorImpl<unsigned> &HoistedCopies) {
+  unsigned Inserted = 0;
+
+  for (const VariableCheckGroup &Group : Groups) {
+    if (Group.Checks.size() < 2)
+      continue;
+
+    BlockChecks Checks;
+    SetVector<BasicBlock *> Preds;
+    for (unsigned Index : Group.Checks) {
+      Instruction *Anchor = findCheckAnchor(Builder.getCheck(Index).CheckInst);
+      if (!Anchor || !Anchor->getParent())
+        continue;
+
+      BasicBlock *BB = Anchor->getParent();
+      Checks[BB].push_back(Index);
+      if (BasicBlock *Pred = BB->getSinglePredecessor())
+        Preds.insert(Pred);
+    }
+
+    for (auto &Entry : Checks)
+      llvm::stable_sort(Entry.second, [this](unsigned LHS, unsigned RHS) {
+        Instruction *LHSAnchor =
+            findCheckAnchor(Builder.getCheck(LHS).CheckInst);
+        Instruction *RHSAnchor =
+            findCheckAnchor(Builder.getCheck(RHS).CheckInst);
+        if (LHSAnchor == RHSAnchor)
+          return LHS < RHS;
+        return LHSAnchor->comesBefore(RHSAnchor);
+      });
+
+    // A check is anticipated at the end of Pred when every successor starts
+    // with an equivalent READ and can only be entered from Pred.
+    for (BasicBlock *Pred : Preds) {
+      if (TouchedBlocks.contains(Pred))
+        continue;
+
+      Instruction *Term = Pred->getTerminator();
+      if (!Term || (!isa<BranchInst>(Term) && !isa<SwitchInst>(Term)) ||
+          Term->getNumSuccessors() < 2)
+        continue;
+
+      SmallVector<HoistCopy, 4> Copies;
+      SmallPtrSet<BasicBlock *, 4> Seen;
+      bool Anticipated = true;
+      for (BasicBlock *Succ : successors(Pred)) {
+        HoistCopy Copy;
+        if (!Seen.insert(Succ).second || Succ->getSinglePredecessor() != Pred ||
+            TouchedBlocks.contains(Succ) || !collectCopy(Succ, Checks, Copy) ||
+            (!Copies.empty() && !isEquivalentCopy(Copies.front(), Copy))) {
+          Anticipated = false;
+          break;
+        }
+        Copies.push_back(std::move(Copy));
+      }
+      if (!Anticipated)
+        continue;
+
+      hoistCopies(Pred, Copies);
+      ++Inserted;
+
+      TouchedBlocks.insert(Pred);
+      for (const HoistCopy &Copy : Copies) {
+        TouchedBlocks.insert(Copy.CheckInst->getParent());
+        TouchedBlocks.insert(findCheckAnchor(Copy.CheckInst)->getParent());
+        HoistedCopies.push_back(Copy.Check);
+      }
+    }
+  }
+
+  return Inserted;
+}
+
+bool PartialRedundancyEliminator::collectCopy(BasicBlock *BB,
+                                              const BlockChecks &Checks,
+                                              HoistCopy &Copy) const {
+  auto It = Checks.find(BB);
+  if (It == Checks.end() || It->second.empty())
+    return false;
+
+  const CheckedVariable &Var = Builder.getCheck(It->second.front());
+  if (Var.Type != AccessType::READ || !Var.CheckInst)
+    return false;
+
+  Instruction *Anchor = findCheckAnchor(Var.CheckInst);
+  if (!Anchor || Anchor->getParent() != BB)
+    return false;
+
+  Copy.Check = It->second.front();
+  Copy.CheckInst = Var.CheckInst;
+
+  SmallVector<Value *, 8> Roots;
+  if (Anchor == Var.CheckInst) {
+    if (!isa<CallInst>(Var.CheckInst))
+      return false;
+    Roots.append(Var.CheckInst->arg_begin(), Var.CheckInst->arg_end());
+  } else {
+    // Inline shadow checks branch to a private report block; the hoisted
+    // copy keeps that shape, so the block has to be clonable as is.
+    auto *Guard = dyn_cast<BranchInst>(Anchor);
+    if (!Guard || !Guard->isConditional())
+      return false;
+
+    BasicBlock *ReportBB = Var.CheckInst->getParent();
+    BasicBlock *Cont = Guard->getSuccessor(0) == ReportBB
+                           ? Guard->getSuccessor(1)
+                           : Guard->getSuccessor(0);
+    if (Cont == ReportBB || ReportBB->getSinglePredecessor() != BB)
+      return false;
+
+    Instruction *ReportTerm = ReportBB->getTerminator();
+    if (!isa<UnreachableInst>(ReportTerm)) {
+      auto *Br = dyn_cast<BranchInst>(ReportTerm);
+      if (!Br || Br->isConditional() || Br->getSuccessor(0) != Cont ||
+          isa<PHINode>(Cont->begin()))
+        return false;
+    }
+
+    Copy.Guard = Guard;
+    Copy.ReportBB = ReportBB;
+    Roots.push_back(Guard->getCondition());
+    for (Instruction &I : *ReportBB)
+      Roots.append(I.op_begin(), I.op_end());
+  }
+
+  SmallPtrSet<Instruction *, 16> InClosure;
+  while (!Roots.empty()) {
+    auto *I = dyn_cast<Instruction>(Roots.pop_back_val());
+    if (!I || I->getParent() != BB || !InClosure.insert(I).second)
+      continue;
+    if (isa<PHINode>(I) || I->mayHaveSideEffects())
+      return false;
+    Roots.append(I->op_begin(), I->op_end());
+  }
+
+  // The hoisted check runs before everything that preceded it in BB, which
+  // is only unobservable when none of that code has side effects.
+  for (Instruction &I : *BB) {
+    if (&I == Anchor)
+      break;
+    if (InClosure.contains(&I))
+      Copy.Closure.push_back(&I);
+    else if (I.mayHaveSideEffects())
+      return false;
+  }
+  return true;
+}
+
+bool PartialRedundancyEliminator::isEquivalentCopy(const HoistCopy &LHS,
+                                                   const HoistCopy &RHS) const {
+  const CheckedVariable &LHSVar = Builder.getCheck(LHS.Check);
+  const CheckedVariable &RHSVar = Builder.getCheck(RHS.Check);
+  if (LHS.CheckInst->getCalledOperand()->stripPointerCasts() !=
+          RHS.CheckInst->getCalledOperand()->stripPointerCasts() ||
+      !LHS.Guard != !RHS.Guard || LHSVar.AccessSize != RHSVar.AccessSize ||
+      !sameCheckedLocation(LHSVar, RHSVar))
+    return false;
+
+  // Arguments computed next to each copy are compared through the checked
+  // location; anything else has to be the very same value.
+  for (auto [LHSArg, RHSArg] :
+       zip(LHS.CheckInst->args(), RHS.CheckInst->args())) {
+    auto *LHSInst = dyn_cast<Instruction>(LHSArg.get());
+    auto *RHSInst = dyn_cast<Instruction>(RHSArg.get());
+    if (LHSInst && RHSInst && is_contained(LHS.Closure, LHSInst) &&
+        is_contained(RHS.Closure, RHSInst))
+      continue;
+    if (LHSArg.get() != RHSArg.get())
+      return false;
+  }
+  return true;
+}
+
+void PartialRedundancyEliminator::hoistCopies(BasicBlock *Pred,
+                                              ArrayRef<HoistCopy> Copies) {
+  const HoistCopy &Leader = Copies.front();
+  Function *F = Pred->getParent();
+
+  Instruction *InsertPt = Pred->getTerminator();
+  BasicBlock *Tail = nullptr;
+  if (Leader.Guard) {
+    Tail = SplitBlock(Pred, InsertPt);
+    InsertPt = Pred->getTerminator();
+  }
+
+  ValueToValueMapTy VMap;
+  auto CloneBefore = [&](Instruction *I) {
+    Instruction *Clone = I->clone();
+    Clone->insertBefore(InsertPt);
+    if (I->hasName())
+      Clone->setName(I->getName() + ".pre");
+    VMap[I] = Clone;
+    RemapInstruction(Clone, VMap,
+                     RF_NoModuleLevelChanges | RF_IgnoreMissingLocals);
+    return Clone;
+  };
+
+  for (Instruction *I : Leader.Closure)
+    CloneBefore(I);
+
+  const DILocation *Loc = Leader.CheckInst->getDebugLoc().get();
+  for (const HoistCopy &Copy : drop_begin(Copies))
+    Loc = DILocation::getMergedLocation(Loc,
+                                        Copy.CheckInst->getDebugLoc().get());
+
+  if (!Leader.Guard) {
+    CloneBefore(Leader.CheckInst)->setDebugLoc(Loc);
+    ChangedFunctions.insert(F);
+    return;
+  }
+
+  BasicBlock *Report = CloneBasicBlock(Leader.ReportBB, VMap, ".pre", F);
+  for (Instruction &I : *Report)
+    RemapInstruction(&I, VMap,
+                     RF_NoModuleLevelChanges | RF_IgnoreMissingLocals);
+  cast<Instruction>(VMap[Leader.CheckInst])->setDebugLoc(Loc);
+  if (auto *Br = dyn_cast<BranchInst>(Report->getTerminator()))
+    Br->setSuccessor(0, Tail);
+
+  auto *Guard = cast<BranchInst>(Leader.Guard->clone());
+  RemapInstruction(Guard, VMap,
+                   RF_NoModuleLevelChanges | RF_IgnoreMissingLocals);
+  for (unsigned Idx = 0, E = Guard->getNumSuccessors(); Idx != E; ++Idx)
+    Guard->setSuccessor(Idx, Leader.Guard->getSuccessor(Idx) == Leader.ReportBB
+                                 ? Report
+                                 : Tail);
+  ReplaceInstWithInst(Pred->getTerminator(), Guard);
+
+  ChangedFunctions.insert(F);
+  CFGChangedFunctions.insert(F);
+}
+
+} // namespace desan
@@ -0,0 +1,178 @@
+#include "DESAN/ReachabilityIndex.h"
+
+#include "llvm/ADT/STLExtras.h"
+#include "llvm/IR/BasicBlock.h"
+#include "llvm/IR/CFG.h"
+#include "llvm/IR/Function.h"
+#include "llvm/IR/Instruction.h"
+
+#include <algorithm>
+#include <limits>
+#include <utility>
+
+using namespace llvm;
+
+namespace desan {
+
+namespace {
+
+constexpr unsigned UnvisitedBlock = std::numeric_limits<unsigned>::max();
+
+} // namespace
+
+ReachabilityIndex::ReachabilityIndex(Function &F) : F(&F) {
+  for (BasicBlock &BB : F) {
+    BlockIds[&BB] = Blocks.size();
+    Blocks.push_back(&BB);
+  }
+
+  computeSCCs();
+  computeClosure();
+  numberInstructions(F);
+}
+
+void ReachabilityIndex::computeSCCs() {
+  unsigned NumBlocks = Blocks.size();
+  std::vector<SmallVector<unsigned, 2>> BlockSuccessors(NumBlocks);
+  for (unsigned Id = 0; Id < NumBlocks; ++Id)
+    for (const BasicBlock *Succ : successors(Blocks[Id]))
+      BlockSuccessors[Id].push_back(BlockIds.lookup(Succ));
+
+  // Iterative Tarjan over every block, including blocks that are not
+  // reachable from the entry. SCCs are numbered in completion order, which
+  // is a reverse topological order of the condensation.
+  SmallVector<unsigned, 32> Index(NumBlocks, UnvisitedBlock);
+  SmallVector<unsigned, 32> LowLink(NumBlocks, 0);
+  BitVector OnStack(NumBlocks);
+  SmallVector<unsigned, 32> Stack;
+  SmallVector<std::pair<unsigned, unsigned>, 32> CallStack;
+  unsigned NextIndex = 0;
+  unsigned NumSCCs = 0;
+  BlockSCC.assign(NumBlocks, 0);
+
+  auto Visit = [&](unsigned Id) {
+    Index[Id] = LowLink[Id] = NextIndex++;
+    Stack.push_back(Id);
+    OnStack.set(Id);
+    CallStack.push_back({Id, 0});
+  };
+
+  for (unsigned Root = 0; Root < NumBlocks; ++Root) {
+    if (Index[Root] != UnvisitedBlock)
+      continue;
+
+    Visit(Root);
+    while (!CallStack.empty()) {
+      unsigned Id = CallStack.back().first;
+      unsigned &SuccPos = CallStack.back().second;
+      if (SuccPos < BlockSuccessors[Id].size()) {
+        unsigned Succ = BlockSuccessors[Id][SuccPos++];
+        if (Index[Succ] == UnvisitedBlock)
+          Visit(Succ);
+        else if (OnStack.test(Succ))
+          LowLink[Id] = std::min(LowLink[Id], Index[Succ]);
+        continue;
+      }
+
+      CallStack.pop_back();
+      if (!CallStack.empty()) {
+        unsigned Parent = CallStack.back().first;
+        LowLink[Parent] = std::min(LowLink[Parent], LowLink[Id]);
+      }
+
+      if (LowLink[Id] != Index[Id])
+        continue;
+
+      unsigned Member = 0;
+      do {
+        Member = Stack.pop_back_val();
+        OnStack.reset(Member);
+        BlockSCC[Member] = NumSCCs;
+      } while (Member != Id);
+      ++NumSCCs;
+    }
+  }
+
+  CyclicSCCs.resize(NumSCCs);
+  SCCSuccessors.assign(NumSCCs, {});
+  for (unsigned Id = 0; Id < NumBlocks; ++Id) {
+    unsigned SCC = BlockSCC[Id];
+    for (unsigned Succ : BlockSuccessors[Id]) {
+      unsigned SuccSCC = BlockSCC[Succ];
+      if (SuccSCC == SCC) {
+        CyclicSCCs.set(SCC);
+        continue;
+      }
+      SCCSuccessors[SCC].push_back(SuccSCC);
+    }
+  }
+
+  // Several member blocks can contribute the same condensation edge.
+  for (SmallVector<unsigned, 4> &Succs : SCCSuccessors) {
+    llvm::sort(Succs);
+    Succs.erase(std::unique(Succs.begin(), Succs.end()), Succs.end());
+  }
+}
+
+void ReachabilityIndex::computeClosure() {
+  unsigned NumSCCs = SCCSuccessors.size();
+  SCCReach.assign(NumSCCs, BitVector(NumSCCs));
+
+  // Successor SCCs always complete before their predecessors, so a single
+  // pass in numbering order sees every successor closure already built.
+  for (unsigned SCC = 0; SCC < NumSCCs; ++SCC) {
+    BitVector &Reach = SCCReach[SCC];
+    for (unsigned Succ : SCCSuccessors[SCC]) {
+      Reach.set(Succ);
+      Reach |= SCCReach[Succ];
+    }
+    if (CyclicSCCs.test(SCC))
+      Reach.set(SCC);
+  }
+}
+
+void ReachabilityIndex::numberInstructions(Function &F) {
+  for (BasicBlock &BB : F) {
+    unsigned Order = 0;
+    for (Instruction &I : BB)
+      InstructionOrder[&I] = Order++;
+  }
+}
+
+bool ReachabilityIndex::isBlockReachable(const BasicBlock *From,
+                                         const BasicBlock *To) const {
+  if (!From || !To)
+    return false;
+
+  auto FromIt = BlockIds.find(From);
+  auto ToIt = BlockIds.find(To);
+  if (FromIt == BlockIds.end() || ToIt == BlockIds.end())
+    return false;
+
+  return SCCReach[BlockSCC[FromIt->second]].test(BlockSCC[ToIt->second]);
+}
+
+bool ReachabilityIndex::comesBefore(const Instruction *From,
+                                    const Instruction *To) const {
+  if (!From || !To || From == To || From->getParent() != To->getParent())
+    return false;
+
+  auto FromIt = InstructionOrder.find(From);
+  auto ToIt = InstructionOrder.find(To);
+  if (FromIt == InstructionOrder.end() || ToIt == InstructionOrder.end())
+    return From->comesBefore(To);
+  return FromIt->second < ToIt->second;
+}
+
+bool ReachabilityIndex::isReachable(const Instruction *From,
+                                    const Instruction *To) const {
+  if (!From || !To || From->getFunction() != F || To->getFunction() != F)
+    return false;
+
+  if (From->getParent() == To->getParent())
+    return comesBefore(From, To);
+
+  return isBlockReachable(From->getParent(), To->getParent());
+}
+
+} // namespace desan
@@ -1,10 +1,24 @@
 #include "DESAN/RedundantCheckEliminator.h"
 
+#include "DESAN/AvailableCheckWalker.h"
+#include "DESAN/CheckCoalescer.h"
+#include "DESAN/ConditionRangeProver.h"
+#include "DESAN/LoopBoundsGuard.h"
+#include "DESAN/LoopCheckHoister.h"
+#include "DESAN/ParamShadowPruner.h"
+#include "DESAN/PartialRedundancyEliminator.h"
+#include "DESAN/SafeAccessAnalyzer.h"
+#include "DESAN/ShadowCheckDeduplicator.h"
+
 #include "llvm/IR/BasicBlock.h"
+#include "llvm/IR/Function.h"
 #include "llvm/IR/InstrTypes.h"
 #include "llvm/IR/Module.h"
+#include "llvm/IR/ValueHandle.h"
+#include "llvm/Support/CommandLine.h"
 #include "llvm/Support/raw_ostream.h"
 
+#include <memory>
 #include <string>
 #include <utility>
 
@@ -14,6 +28,85 @@ namespace desan {
 
 namespace {
 
+enum class EliminationEngine {
+  Order,
+  Dominator,
+};
+
+cl::opt<EliminationEngine> Engine(
+    "desan-elimination-engine", cl::init(EliminationEngine::Order),
+    cl::Hidden, cl::desc("Policy used to select redundant READ checks."),
+    cl::values(clEnumValN(EliminationEngine::Order, "order",
+                          "Per-variable retention in module layout order"),
+               clEnumValN(EliminationEngine::Dominator, "dominator",
+                          "Remove READs covered by a dominating available "
+                          "check with no barrier on any path")));
+
+cl::opt<bool> EliminateRedundantWrites(
+    "desan-eliminate-redundant-writes", cl::init(false), cl::Hidden,
+    cl::desc("Also remove an ASan WRITE check covered by a dominating WRITE "
+             "check with no possible free, reallocation or poisoning change "
+             "of its object in between. WRITE and READ checks stay "
+             "available across each other under this mode."));
+
+cl::opt<bool> EliminateSafeAccesses(
+    "desan-eliminate-safe-accesses", cl::init(false), cl::Hidden,
+    cl::desc("Remove ASan checks whose access lies at a constant offset "
+             "inside a static alloca or a defined global that nothing can "
+             "poison, before any redundancy elimination runs."));
+
+cl::opt<bool> EliminateRangeSafeUBSan(
+    "desan-eliminate-range-safe-ubsan", cl::init(false), cl::Hidden,
+    cl::desc("Remove UBSan checks whose guarding condition LazyValueInfo "
+             "ranges prove can never select the handler, e.g. a masked "
+             "shift amount or an add of operands that cannot overflow."));
+
+cl::opt<bool> UBSanLoopBounds(
+    "desan-ubsan-loop-bounds", cl::init(false), cl::Hidden,
+    cl::desc("Remove UBSan out_of_bounds and pointer_overflow checks in "
+             "loops that ScalarEvolution proves pass for the whole trip "
+             "count. An out_of_bounds check on an affine index with a "
+             "loop-invariant bound is otherwise replaced by one check of "
+             "the first and last index at loop entry."));
+
+cl::opt<bool> DedupMemSanWarnings(
+    "desan-dedup-msan-warnings", cl::init(false), cl::Hidden,
+    cl::desc("Remove MSan warnings whose shadow, looked through casts and "
+             "ORs of operand shadows, was already tested by dominating "
+             "warnings."));
+
+cl::opt<bool> PruneMemSanParamShadows(
+    "desan-prune-msan-param-shadows", cl::init(false), cl::Hidden,
+    cl::desc("Remove MSan warnings on argument and return shadow that every "
+             "caller of an internal function passes clean, and the "
+             "__msan_param_tls and __msan_retval_tls stores and loads left "
+             "with no reader. Module mode only."));
+
+cl::opt<bool> EnableCheckPRE(
+    "desan-check-pre", cl::init(false), cl::Hidden,
+    cl::desc("Hoist a READ check that starts every successor of a branch "
+             "into the branch block and remove the copies before running "
+             "the elimination engine."));
+
+cl::opt<bool> EnableLoopCheckHoisting(
+    "desan-loop-check-hoisting", cl::init(false), cl::Hidden,
+    cl::desc("Replace ASan READ checks that run on every loop iteration "
+             "with one preheader check: of the address itself when it is "
+             "loop-invariant, or of the whole accessed range when it is an "
+             "affine induction with a computable trip count."));
+
+cl::opt<bool> EnableCheckCoalescing(
+    "desan-coalesce-checks", cl::init(false), cl::Hidden,
+    cl::desc("Replace ASan checks of one base whose static byte ranges are "
+             "contiguous or overlapping, and which run in sequence, with a "
+             "single check over the union range."));
+
+cl::opt<bool> BatchSliceRemoval(
+    "desan-batch-slice-removal", cl::init(true), cl::Hidden,
+    cl::desc("Remove all marked check slices first and run dead-code and "
+             "CFG cleanup once per touched function. When disabled, cleanup "
+             "runs after every removed check."));
+
 // Per-variable retention policy: keep the first check, keep every WRITE,
 // keep the first READ after a WRITE/UNKNOWN barrier, and remove other READs.
 class ReadRetentionState {
@@ -56,14 +149,23 @@ private:
 
 RedundantCheckEliminator::RedundantCheckEliminator(
     Module &M, ArrayRef<CheckStat> CoreChecks)
-    : GraphBuilder(M, CoreChecks), SliceRemover(M) {}
+    : OwnedGraphBuilder(std::make_unique<CheckGraphBuilder>(M, CoreChecks)),
+      GraphBuilder(*OwnedGraphBuilder), SliceRemover(M) {}
+
+RedundantCheckEliminator::RedundantCheckEliminator(
+    Module &M, CheckGraphBuilder &GraphBuilder)
+    : GraphBuilder(GraphBuilder), SliceRemover(M) {}
 
-void RedundantCheckEliminator::markForRemoval(const CheckedVariable &Var,
+bool RedundantCheckEliminator::markForRemoval(const CheckedVariable &Var,
                                               AccessType Type) {
   if (!Var.CheckInst)
-    return;
+    return false;
   if (!MarkedCalls.insert(Var.CheckInst).second)
-    return;
+    return false;
+  MarkedCallOrder.push_back(Var.CheckInst);
+
+  if (!RecordCandidates)
+    return true;
 
   RemovalCandidate Candidate;
   std::string CheckText;
@@ -85,18 +187,241 @@ void RedundantCheckEliminator::markForRemoval(const CheckedVariable &Var,
     Candidate.BasicBlockName = "<unknown>";
 
   RemovalCandidates.push_back(std::move(Candidate));
+  return true;
 }
 
+// Checks that need no other check go first, then clean-shadow and
+// duplicate MSan checks, so no later stage keeps, folds or removes a check
+// on the strength of one that is gone. Loop guards, loop hoisting,
+// coalescing and PRE then replace checks with new ones, which the
+// elimination engine sees last. Only the engine's removals and shadow
+// duplicates are removed redundant checks; the other stages are reported
+// on their own, as safe removals or as inserted and replaced checks.
 std::size_t RedundantCheckEliminator::eliminateRedundantChecks() {
-  const CheckGraphBuilder::VariableCheckGroups &Groups =
-      GraphBuilder.groupChecksByVariable();
+  std::size_t Removed = 0;
+  if (EliminateSafeAccesses || EliminateRangeSafeUBSan || UBSanLoopBounds)
+    removeSafeChecks(GraphBuilder.groupChecksByVariable());
+  if (PruneMemSanParamShadows)
+    pruneParamShadows(GraphBuilder.groupChecksByVariable());
+  if (UBSanLoopBounds)
+    guardLoopBoundsChecks(GraphBuilder.groupChecksByVariable());
+  if (DedupMemSanWarnings)
+    Removed +=
+        removeDuplicateShadowChecks(GraphBuilder.groupChecksByVariable());
+  if (EnableLoopCheckHoisting)
+    hoistLoopChecks(GraphBuilder.groupChecksByVariable());
+  if (EnableCheckCoalescing)
+    coalesceChecks(GraphBuilder.groupChecksByVariable());
+  if (EnableCheckPRE)
+    hoistRedundantChecks(GraphBuilder.groupChecksByVariable());
+
+  markRedundantChecks(GraphBuilder.groupChecksByVariable());
+  return Removed + eraseMarkedChecks();
+}
+
+std::size_t RedundantCheckEliminator::eliminateRedundantChecks(Function &F) {
+  std::size_t Removed = 0;
+  if (EliminateSafeAccesses || EliminateRangeSafeUBSan || UBSanLoopBounds)
+    removeSafeChecks(GraphBuilder.groupChecksInFunction(F));
+  if (UBSanLoopBounds)
+    guardLoopBoundsChecks(GraphBuilder.groupChecksInFunction(F));
+  if (DedupMemSanWarnings)
+    Removed +=
+        removeDuplicateShadowChecks(GraphBuilder.groupChecksInFunction(F));
+  if (EnableLoopCheckHoisting)
+    hoistLoopChecks(GraphBuilder.groupChecksInFunction(F));
+  if (EnableCheckCoalescing)
+    coalesceChecks(GraphBuilder.groupChecksInFunction(F));
+  if (EnableCheckPRE)
+    hoistRedundantChecks(GraphBuilder.groupChecksInFunction(F));
+
+  markRedundantChecks(GraphBuilder.groupChecksInFunction(F));
+  Removed += eraseMarkedChecks();
+  SliceRemover.releaseFunction(F);
+  return Removed;
+}
+
+void RedundantCheckEliminator::removeSafeChecks(
+    const CheckGraphBuilder::VariableCheckGroups &Groups) {
+  SafeAccessAnalyzer Analyzer;
+  ConditionRangeProver Prover(GraphBuilder);
+  LoopBoundsGuard BoundsGuard(GraphBuilder);
+  SmallPtrSet<Function *, 8> Changed;
+  for (const VariableCheckGroup &Group : Groups) {
+    for (unsigned Index : Group.Checks) {
+      const CheckedVariable &Var = GraphBuilder.getCheck(Index);
+      if (EliminateSafeAccesses && Analyzer.isSafeAccess(Var)) {
+        if (!markForRemoval(Var, Var.Type))
+          continue;
+        ++NumSafeChecks;
+      } else if (EliminateRangeSafeUBSan && Prover.isNeverReached(Var)) {
+        if (!markForRemoval(Var, Var.Type))
+          continue;
+        ++NumRangeSafeChecks;
+      } else if (UBSanLoopBounds && BoundsGuard.isProvenInBounds(Var)) {
+        if (!markForRemoval(Var, Var.Type))
+          continue;
+        ++NumLoopBoundsProven;
+      } else {
+        continue;
+      }
+      Changed.insert(Var.CheckInst->getFunction());
+    }
+  }
+  if (Changed.empty())
+    return;
+
+  eraseMarkedChecks();
+  for (Function *F : Changed)
+    GraphBuilder.invalidateFunction(*F);
+}
+
+std::size_t RedundantCheckEliminator::removeDuplicateShadowChecks(
+    const CheckGraphBuilder::VariableCheckGroups &Groups) {
+  ShadowCheckDeduplicator Deduplicator(GraphBuilder);
+  SmallVector<unsigned, 16> Duplicates;
+  Deduplicator.findDuplicateChecks(Groups, Duplicates);
+
+  SmallPtrSet<Function *, 8> Changed;
+  for (unsigned Index : Duplicates) {
+    const CheckedVariable &Var = GraphBuilder.getCheck(Index);
+    if (markForRemoval(Var, Var.Type))
+      Changed.insert(Var.CheckInst->getFunction());
+  }
+  if (Changed.empty())
+    return 0;
+
+  std::size_t Removed = eraseMarkedChecks();
+  for (Function *F : Changed)
+    GraphBuilder.invalidateFunction(*F);
+  return Removed;
+}
+
+// Needs every call site of a function, so it only runs over the whole
+// module. The TLS traffic goes after the checks, whose shadow loads are the
+// readers that keep most of it alive.
+void RedundantCheckEliminator::pruneParamShadows(
+    const CheckGraphBuilder::VariableCheckGroups &Groups) {
+  ParamShadowPruner Pruner(GraphBuilder);
+  Pruner.analyzeModule();
+  SmallVector<unsigned, 16> Clean;
+  Pruner.findCleanChecks(Groups, Clean);
+
+  SmallPtrSet<Function *, 8> Changed;
+  for (unsigned Index : Clean) {
+    const CheckedVariable &Var = GraphBuilder.getCheck(Index);
+    if (!markForRemoval(Var, Var.Type))
+      continue;
+    ++NumCleanShadowChecks;
+    Changed.insert(Var.CheckInst->getFunction());
+  }
+  if (!Changed.empty())
+    eraseMarkedChecks();
+
+  NumPrunedShadowAccesses += Pruner.pruneShadowTraffic();
+  for (Function *F : Pruner.changedFunctions()) {
+    ChangedFunctions.insert(F);
+    Changed.insert(F);
+  }
+  for (Function *F : Changed)
+    GraphBuilder.invalidateFunction(*F);
+}
+
+void RedundantCheckEliminator::guardLoopBoundsChecks(
+    const CheckGraphBuilder::VariableCheckGroups &Groups) {
+  LoopBoundsGuard Guard(GraphBuilder);
+  SmallVector<unsigned, 16> Replaced;
+  NumLoopBoundsGuards += Guard.guardChecks(Groups, Replaced);
+  if (Replaced.empty())
+    return;
+
+  for (Function *F : Guard.changedFunctions())
+    ChangedCFGFunctions.insert(F);
+  NumLoopBoundsReplaced += replaceChecks(Replaced, Guard.changedFunctions());
+}
+
+void RedundantCheckEliminator::hoistRedundantChecks(
+    const CheckGraphBuilder::VariableCheckGroups &Groups) {
+  PartialRedundancyEliminator PRE(GraphBuilder);
+  SmallVector<unsigned, 16> HoistedCopies;
+  unsigned Hoisted = PRE.hoistChecks(Groups, HoistedCopies);
+  if (Hoisted == 0)
+    return;
+
+  NumHoistedChecks += Hoisted;
+  for (Function *F : PRE.changedFunctions())
+    if (PRE.changedCFG(*F))
+      ChangedCFGFunctions.insert(F);
+  NumHoistedCopies += replaceChecks(HoistedCopies, PRE.changedFunctions());
+}
+
+void RedundantCheckEliminator::hoistLoopChecks(
+    const CheckGraphBuilder::VariableCheckGroups &Groups) {
+  LoopCheckHoister Hoister(GraphBuilder);
+  SmallVector<unsigned, 16> Replaced;
+  NumLoopHoistedChecks += Hoister.hoistChecks(Groups, Replaced);
+  NumLoopRangeChecks += Hoister.getNumRangeChecks();
+  if (Replaced.empty())
+    return;
+  NumLoopReplacedChecks += replaceChecks(Replaced, Hoister.changedFunctions());
+}
 
-  for (const auto &Group : Groups) {
-    if (Group.second.empty())
+void RedundantCheckEliminator::coalesceChecks(
+    const CheckGraphBuilder::VariableCheckGroups &Groups) {
+  CheckCoalescer Coalescer(GraphBuilder);
+  SmallVector<unsigned, 16> Replaced;
+  NumCoalescedChecks += Coalescer.coalesceChecks(Groups, Replaced);
+  if (Replaced.empty())
+    return;
+  NumCoalescedReplaced += replaceChecks(Replaced, Coalescer.changedFunctions());
+}
+
+std::size_t
+RedundantCheckEliminator::replaceChecks(ArrayRef<unsigned> Replaced,
+                                        ArrayRef<Function *> Changed) {
+  for (unsigned Index : Replaced) {
+    const CheckedVariable &Var = GraphBuilder.getCheck(Index);
+    markForRemoval(Var, Var.Type);
+  }
+  std::size_t Removed = eraseMarkedChecks();
+
+  // The replacement checks are new instructions; regroup the changed
+  // functions so the elimination engine sees them instead of the removed
+  // checks.
+  for (Function *F : Changed) {
+    ChangedFunctions.insert(F);
+    GraphBuilder.invalidateFunction(*F);
+  }
+  return Removed;
+}
+
+void RedundantCheckEliminator::markRedundantChecks(
+    const CheckGraphBuilder::VariableCheckGroups &Groups) {
+  bool UseWalker = Engine == EliminationEngine::Dominator;
+  if (UseWalker || EliminateRedundantWrites) {
+    SmallVector<unsigned, 32> Redundant;
+    AvailableCheckWalker Walker(GraphBuilder);
+    Walker.setEliminateWrites(EliminateRedundantWrites);
+    Walker.findRedundantChecks(Groups, Redundant);
+    for (unsigned Index : Redundant) {
+      // Under the order engine the walker only contributes WRITEs.
+      const CheckedVariable &Var = GraphBuilder.getCheck(Index);
+      if (Var.Type != AccessType::WRITE && !UseWalker)
+        continue;
+      if (markForRemoval(Var, Var.Type) && Var.Type == AccessType::WRITE)
+        ++NumRemovedWriteChecks;
+    }
+    if (UseWalker)
+      return;
+  }
+
+  for (const VariableCheckGroup &Group : Groups) {
+    if (Group.Checks.empty())
       continue;
 
     ReadRetentionState Retention;
-    for (const CheckedVariable &Var : Group.second) {
+    for (unsigned Index : Group.Checks) {
+      const CheckedVariable &Var = GraphBuilder.getCheck(Index);
       if (!Var.CheckInst)
         continue;
       if (Retention.shouldKeep(Var.Type))
@@ -105,19 +430,27 @@ std::size_t RedundantCheckEliminator::eliminateRedundantChecks() {
         markForRemoval(Var, Var.Type);
     }
   }
-
-  return eraseMarkedChecks();
 }
 
 std::size_t RedundantCheckEliminator::eraseMarkedChecks() {
-  SmallVector<CallBase *, 32> CallsToErase;
-  for (CallBase *CB : MarkedCalls) {
-    if (CB)
-      CallsToErase.push_back(CB);
+  if (BatchSliceRemoval) {
+    std::size_t Removed = SliceRemover.removeCheckSlices(MarkedCallOrder);
+    MarkedCalls.clear();
+    MarkedCallOrder.clear();
+    return Removed;
   }
 
+  // Per-check cleanup can delete blocks that hold other marked calls, e.g.
+  // unreachable ones, so track the calls that are still pending.
+  SmallVector<WeakTrackingVH, 32> CallsToErase(MarkedCallOrder.begin(),
+                                               MarkedCallOrder.end());
+
   std::size_t Removed = 0;
-  for (CallBase *CB : CallsToErase) {
+  for (WeakTrackingVH &Pending : CallsToErase) {
+    auto *CB = dyn_cast_or_null<CallBase>(Pending);
+    if (!CB)
+      continue;
+
     CheckNode Node;
     Node.CheckInst = CB;
     Node.BB = CB->getParent();
@@ -127,6 +460,8 @@ std::size_t RedundantCheckEliminator::eraseMarkedChecks() {
 
   SliceRemover.cleanupDeadInstructions();
   SliceRemover.simplifyCFG();
+  MarkedCalls.clear();
+  MarkedCallOrder.clear();
   return Removed;
 }
 
@@ -147,4 +482,15 @@ void RedundantCheckEliminator::dumpRemovalCandidates(raw_ostream &OS) const {
   }
 }
 
+PreservedAnalyses
+RedundantCheckEliminator::getPreservedAnalyses(const Function &F) const {
+  if (!SliceRemover.changedFunction(F) && !ChangedFunctions.contains(&F))
+    return PreservedAnalyses::all();
+
+  PreservedAnalyses PA;
+  if (!SliceRemover.changedCFG(F) && !ChangedCFGFunctions.contains(&F))
+    PA.preserveSet<CFGAnalyses>();
+  return PA;
+}
+
 } // namespace desan
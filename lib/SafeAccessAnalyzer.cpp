@@ -0,0 +1,161 @@
+#include "DESAN/SafeAccessAnalyzer.h"
+
+#include "DESAN/CheckGraphBuilder.h"
+
+#include "llvm/ADT/APInt.h"
+#include "llvm/ADT/SmallPtrSet.h"
+#include "llvm/ADT/SmallVector.h"
+#include "llvm/IR/Constants.h"
+#include "llvm/IR/DataLayout.h"
+#include "llvm/IR/DerivedTypes.h"
+#include "llvm/IR/GlobalVariable.h"
+#include "llvm/IR/InstrTypes.h"
+#include "llvm/IR/Instructions.h"
+#include "llvm/IR/Module.h"
+#include "llvm/IR/Operator.h"
+
+#include <utility>
+
+using namespace llvm;
+
+namespace desan {
+
+namespace {
+
+// Objects with more derived values than this are assumed to be repoisoned.
+constexpr unsigned MaxObjectUsers = 1024;
+
+// ASan appends a right redzone to each instrumented global by wrapping it
+// in { original, [N x i8] }; only the original part is addressable.
+Type *getAddressableGlobalType(const GlobalVariable &GV) {
+  Type *Ty = GV.getValueType();
+  auto *STy = dyn_cast<StructType>(Ty);
+  if (!STy || !STy->isLiteral() || STy->getNumElements() != 2)
+    return Ty;
+
+  auto *RedZone = dyn_cast<ArrayType>(STy->getElementType(1));
+  if (!RedZone || !RedZone->getElementType()->isIntegerTy(8))
+    return Ty;
+  return STy->getElementType(0);
+}
+
+// The address recovered from a checked integer drops any integer addends,
+// so it only locates the checked bytes when the integer is the address.
+bool checksAddressItself(const CheckedVariable &Var) {
+  if (Var.CheckInst->arg_size() == 0)
+    return false;
+  const auto *PtrToInt =
+      dyn_cast<PtrToIntOperator>(Var.CheckInst->getArgOperand(0));
+  return PtrToInt &&
+         PtrToInt->getPointerOperand()->stripPointerCasts() == Var.Address;
+}
+
+} // namespace
+
+// An ASan check is statically safe when its address is a constant offset
+// into a stack or global object whose whole extent stays addressable for
+// as long as the check can run: the accessed bytes lie inside the object,
+// and nothing can poison it in the meantime.
+bool SafeAccessAnalyzer::isSafeAccess(const CheckedVariable &Var) {
+  if (Var.Sanitizer != SanitizerKind::ASan ||
+      (Var.Type != AccessType::READ && Var.Type != AccessType::WRITE) ||
+      !Var.CheckInst || !Var.Address ||
+      !Var.Address->getType()->isPointerTy() || Var.AccessSize == 0)
+    return false;
+
+  const DataLayout &DL = Var.CheckInst->getModule()->getDataLayout();
+  const Value *Object = nullptr;
+  int64_t Offset = 0;
+  if (checksAddressItself(Var)) {
+    APInt AddressOffset(DL.getIndexTypeSizeInBits(Var.Address->getType()), 0);
+    Object = Var.Address->stripAndAccumulateConstantOffsets(
+        DL, AddressOffset, /*AllowNonInbounds=*/true);
+    if (!AddressOffset.isSignedIntN(64))
+      return false;
+    Offset = AddressOffset.getSExtValue();
+  } else if (Var.HasStaticByteOffset && Var.Base) {
+    Object = Var.Base->stripPointerCasts();
+    Offset = Var.StaticByteOffset;
+  } else {
+    return false;
+  }
+  if (Offset < 0)
+    return false;
+
+  uint64_t Size = getSafeObjectSize(*Object, DL);
+  uint64_t Begin = static_cast<uint64_t>(Offset);
+  return Begin <= Size && Var.AccessSize <= Size - Begin;
+}
+
+// Size of an object that is addressable in full for its whole lifetime, or
+// 0. Stack objects must be static allocas without lifetime markers, which
+// would poison them outside their scope; globals must have a definitive
+// initializer, so the definition seen here is the one that links.
+uint64_t SafeAccessAnalyzer::getSafeObjectSize(const Value &Object,
+                                               const DataLayout &DL) {
+  auto It = SafeObjectSizes.find(&Object);
+  if (It != SafeObjectSizes.end())
+    return It->second;
+
+  uint64_t Size = 0;
+  if (const auto *AI = dyn_cast<AllocaInst>(&Object)) {
+    if (AI->isStaticAlloca())
+      if (auto AllocSize = AI->getAllocationSize(DL))
+        if (!AllocSize->isScalable())
+          Size = *AllocSize;
+  } else if (const auto *GV = dyn_cast<GlobalVariable>(&Object)) {
+    Type *Ty = getAddressableGlobalType(*GV);
+    if (GV->hasDefinitiveInitializer() && Ty->isSized())
+      Size = DL.getTypeAllocSize(Ty);
+  }
+
+  if (Size != 0 && mayBeRepoisoned(Object))
+    Size = 0;
+  SafeObjectSizes[&Object] = Size;
+  return Size;
+}
+
+// Follows the object through address arithmetic, including the integer
+// form ASan uses to compute shadow addresses. Lifetime markers, ASan
+// runtime calls other than checks, and writes through an address rebuilt
+// from the object's integer value all may change its shadow.
+bool SafeAccessAnalyzer::mayBeRepoisoned(const Value &Object) const {
+  SmallVector<std::pair<const Value *, bool>, 16> Worklist;
+  SmallPtrSet<const Value *, 16> Visited;
+  Worklist.push_back({&Object, false});
+  Visited.insert(&Object);
+
+  while (!Worklist.empty()) {
+    auto [V, FromInteger] = Worklist.pop_back_val();
+    for (const User *U : V->users()) {
+      if (const auto *CB = dyn_cast<CallBase>(U)) {
+        if (CB->isLifetimeStartOrEnd())
+          return true;
+        if (isSanitizerRuntimeCall(*CB))
+          continue;
+        const Function *Callee = CB->getCalledFunction();
+        if (FromInteger ||
+            (Callee && Callee->getName().starts_with("__asan_")))
+          return true;
+        continue;
+      }
+
+      if (const auto *Store = dyn_cast<StoreInst>(U)) {
+        if (FromInteger && Store->getPointerOperand() == V)
+          return true;
+        continue;
+      }
+
+      if (!isa<GetElementPtrInst, CastInst, BinaryOperator, PHINode,
+               SelectInst, ConstantExpr>(U))
+        continue;
+      if (Visited.size() >= MaxObjectUsers)
+        return true;
+      if (Visited.insert(U).second)
+        Worklist.push_back({U, FromInteger || isa<PtrToIntOperator>(U)});
+    }
+  }
+  return false;
+}
+
+} // namespace desan
@@ -4,18 +4,21 @@
 #include "llvm/ADT/StringExtras.h"
 #include "llvm/ADT/StringRef.h"
 #include "llvm/ADT/STLExtras.h"
-#include "llvm/ADT/Twine.h"
+#include "llvm/ADT/StringMap.h"
 #include "llvm/IR/Function.h"
 #include "llvm/IR/GlobalAlias.h"
 #include "llvm/IR/InstIterator.h"
 #include "llvm/IR/Instructions.h"
+#include "llvm/IR/Module.h"
 #include "llvm/Support/Format.h"
 #include "llvm/Support/MemoryBuffer.h"
 
 #include <algorithm>
 #include <cstdlib>
 #include <memory>
+#include <mutex>
 #include <utility>
+#include <vector>
 
 using namespace llvm;
 
@@ -35,11 +38,44 @@ StringRef sanitizerKindName(SanitizerKind Kind) {
   return "Unknown";
 }
 
-static std::string runtimeCostKey(SanitizerKind Sanitizer, StringRef CheckType) {
-  return (Twine(sanitizerKindName(Sanitizer)) + "\t" + CheckType).str();
+namespace {
+
+// Check type names are shared by every collector so that IDs stay comparable
+// across functions, analyses and the core-check sets built from them.
+struct CheckTypeTable {
+  std::mutex Lock;
+  StringMap<CheckTypeId> Ids;
+  std::vector<StringRef> Names{StringRef()};
+};
+
+CheckTypeTable &getCheckTypeTable() {
+  static CheckTypeTable Table;
+  return Table;
+}
+
+} // namespace
+
+CheckTypeId internCheckType(StringRef CheckType) {
+  if (CheckType.empty())
+    return 0;
+
+  CheckTypeTable &Table = getCheckTypeTable();
+  std::lock_guard<std::mutex> Guard(Table.Lock);
+  auto Inserted = Table.Ids.try_emplace(CheckType, Table.Names.size());
+  if (Inserted.second)
+    Table.Names.push_back(Inserted.first->getKey());
+  return Inserted.first->second;
 }
 
-static std::string canonicalCalleeName(StringRef Name) {
+StringRef checkTypeName(CheckTypeId Id) {
+  CheckTypeTable &Table = getCheckTypeTable();
+  std::lock_guard<std::mutex> Guard(Table.Lock);
+  if (Id >= Table.Names.size())
+    return StringRef();
+  return Table.Names[Id];
+}
+
+static StringRef canonicalCalleeName(StringRef Name) {
   Name = Name.trim();
   Name.consume_front("\01");
 
@@ -49,7 +85,7 @@ static std::string canonicalCalleeName(StringRef Name) {
       Name.starts_with("___msan_"))
     Name = Name.drop_front();
 
-  return Name.str();
+  return Name;
 }
 
 static const Function *resolveCalledFunction(const CallBase *CB) {
@@ -134,6 +170,17 @@ static SanitizerKind parseSanitizerKind(StringRef Text) {
   return SanitizerKind::Unknown;
 }
 
+SanitizerCheckCollector::SanitizerCheckCollector()
+    : CalleeChecks(std::make_unique<CalleeCheckMap>()) {}
+
+SanitizerCheckCollector::SanitizerCheckCollector(
+    SanitizerCheckCollector &&) = default;
+
+SanitizerCheckCollector &
+SanitizerCheckCollector::operator=(SanitizerCheckCollector &&) = default;
+
+SanitizerCheckCollector::~SanitizerCheckCollector() = default;
+
 void SanitizerCheckCollector::collectChecks(Function &F) {
   for (Instruction &I : instructions(F)) {
     auto *CB = dyn_cast<CallBase>(&I);
@@ -151,23 +198,51 @@ SanitizerCheckCollector::classifyCheck(CallBase *CB) const {
     return std::nullopt;
 
   const Function *Callee = resolveCalledFunction(CB);
-  if (!Callee || Callee->getName().empty())
+  if (!Callee)
+    return std::nullopt;
+
+  if (!CalleeChecks)
+    CalleeChecks = std::make_unique<CalleeCheckMap>();
+
+  auto It = CalleeChecks->find(Callee);
+  if (It != CalleeChecks->end())
+    return It->second;
+
+  std::optional<ClassifiedCheck> Check = classifyCallee(*Callee);
+  CalleeChecks->insert({Callee, Check});
+  return Check;
+}
+
+void SanitizerCheckCollector::classifyCallees(const Module &M) {
+  if (!CalleeChecks)
+    CalleeChecks = std::make_unique<CalleeCheckMap>();
+
+  // Once every function has an entry, classifyCheck only reads the table and
+  // can be shared by concurrent analyses.
+  for (const Function &Callee : M)
+    if (!CalleeChecks->count(&Callee))
+      CalleeChecks->insert({&Callee, classifyCallee(Callee)});
+}
+
+std::optional<SanitizerCheckCollector::ClassifiedCheck>
+SanitizerCheckCollector::classifyCallee(const Function &Callee) const {
+  if (Callee.getName().empty())
     return std::nullopt;
 
-  std::string NameStorage = canonicalCalleeName(Callee->getName());
-  StringRef Name(NameStorage);
+  StringRef Name = canonicalCalleeName(Callee.getName());
   SanitizerKind Sanitizer = classifySanitizerName(Name);
   if (Sanitizer == SanitizerKind::Unknown)
     return std::nullopt;
 
-  return ClassifiedCheck{Sanitizer, Name.str()};
+  CheckTypeId TypeId = internCheckType(Name);
+  return ClassifiedCheck{Sanitizer, TypeId, checkTypeName(TypeId)};
 }
 
 void SanitizerCheckCollector::recordCheck(const ClassifiedCheck &Check) {
-  if (Check.Sanitizer == SanitizerKind::Unknown || Check.CheckType.empty())
+  if (Check.Sanitizer == SanitizerKind::Unknown || Check.TypeId == 0)
     return;
 
-  ++CheckCounts[Check.Sanitizer][Check.CheckType];
+  ++CheckCounts[Check.Sanitizer][Check.TypeId];
   ++SanitizerTotals[Check.Sanitizer];
   ++TotalChecks;
 }
@@ -187,7 +262,8 @@ SanitizerCheckCollector::getStatsForSanitizer(SanitizerKind Sanitizer) const {
   for (const auto &Check : CountsIt->second) {
     CheckStat Stat;
     Stat.Sanitizer = Sanitizer;
-    Stat.CheckType = Check.first;
+    Stat.TypeId = Check.first;
+    Stat.CheckType = checkTypeName(Check.first);
     Stat.Count = Check.second;
     Stat.RatioWithinSanitizer =
         SanitizerTotal == 0 ? 0.0
@@ -198,8 +274,7 @@ SanitizerCheckCollector::getStatsForSanitizer(SanitizerKind Sanitizer) const {
                          : (100.0 * static_cast<double>(Check.second) /
                             static_cast<double>(TotalChecks));
 
-    auto RuntimeIt =
-        RuntimeCosts.find(runtimeCostKey(Sanitizer, Stat.CheckType));
+    auto RuntimeIt = RuntimeCosts.find({Sanitizer, Stat.TypeId});
     if (RuntimeIt != RuntimeCosts.end() && TotalRuntimeCost > 0.0)
       Stat.RuntimeRatio = 100.0 * RuntimeIt->second / TotalRuntimeCost;
 
@@ -324,28 +399,28 @@ bool SanitizerCheckCollector::loadProfile(StringRef ProfilePath,
       Field = Field.trim();
 
     SanitizerKind Sanitizer = SanitizerKind::Unknown;
-    std::string CheckTypeStorage;
+    StringRef CheckType;
     double Cost = 0.0;
 
     if (Fields.size() == 2) {
-      CheckTypeStorage = canonicalCalleeName(Fields[0]);
-      Sanitizer = classifySanitizerName(CheckTypeStorage);
+      CheckType = canonicalCalleeName(Fields[0]);
+      Sanitizer = classifySanitizerName(CheckType);
       if (!parseDouble(Fields[1], Cost))
         continue;
     } else if (Fields.size() >= 3) {
       Sanitizer = parseSanitizerKind(Fields[0]);
-      CheckTypeStorage = canonicalCalleeName(Fields[1]);
+      CheckType = canonicalCalleeName(Fields[1]);
       if (!parseDouble(Fields[2], Cost))
         continue;
     } else {
       continue;
     }
 
-    if (Sanitizer == SanitizerKind::Unknown || CheckTypeStorage.empty() ||
+    if (Sanitizer == SanitizerKind::Unknown || CheckType.empty() ||
         Cost < 0.0)
       continue;
 
-    RuntimeCosts[runtimeCostKey(Sanitizer, CheckTypeStorage)] += Cost;
+    RuntimeCosts[{Sanitizer, internCheckType(CheckType)}] += Cost;
     TotalRuntimeCost += Cost;
   }
 
@@ -0,0 +1,157 @@
+#include "DESAN/ShadowBarrierModel.h"
+
+#include "DESAN/CheckGraphBuilder.h"
+
+#include "llvm/ADT/STLExtras.h"
+#include "llvm/Analysis/AliasAnalysis.h"
+#include "llvm/Analysis/MemoryLocation.h"
+#include "llvm/Analysis/TargetLibraryInfo.h"
+#include "llvm/IR/Function.h"
+#include "llvm/IR/InstIterator.h"
+#include "llvm/IR/InstrTypes.h"
+#include "llvm/IR/Instruction.h"
+
+using namespace llvm;
+
+namespace desan {
+
+namespace {
+
+// Past this many barriers between two checks the alias queries cost more
+// than the check they could save.
+constexpr unsigned MaxBarrierQueries = 64;
+
+// Library functions that never free, reallocate or poison memory they were
+// not given to allocate, even when declared without attributes.
+bool isNonFreeingLibFunc(LibFunc Func) {
+  switch (Func) {
+  case LibFunc_malloc:
+  case LibFunc_calloc:
+  case LibFunc_memcpy:
+  case LibFunc_memmove:
+  case LibFunc_memset:
+  case LibFunc_memcmp:
+  case LibFunc_bcmp:
+  case LibFunc_memchr:
+  case LibFunc_strlen:
+  case LibFunc_strnlen:
+  case LibFunc_strcmp:
+  case LibFunc_strncmp:
+  case LibFunc_strcpy:
+  case LibFunc_strncpy:
+  case LibFunc_strcat:
+  case LibFunc_strncat:
+  case LibFunc_strchr:
+  case LibFunc_strrchr:
+  case LibFunc_strstr:
+  case LibFunc_strspn:
+  case LibFunc_strcspn:
+  case LibFunc_strpbrk:
+  case LibFunc_strdup:
+  case LibFunc_strndup:
+  case LibFunc_atoi:
+  case LibFunc_atol:
+  case LibFunc_strtol:
+  case LibFunc_strtoul:
+  case LibFunc_strtod:
+  case LibFunc_printf:
+  case LibFunc_fprintf:
+  case LibFunc_sprintf:
+  case LibFunc_snprintf:
+  case LibFunc_puts:
+  case LibFunc_fputs:
+  case LibFunc_putchar:
+  case LibFunc_fputc:
+  case LibFunc_fwrite:
+  case LibFunc_fread:
+    return true;
+  default:
+    return false;
+  }
+}
+
+// Runtime calls that rewrite shadow for an address range. They take plain
+// integers, so no alias query can tell which object they touch.
+bool isPoisoningCall(const CallBase &CB) {
+  const Function *Callee = CB.getCalledFunction();
+  if (!Callee)
+    return false;
+
+  StringRef Name = Callee->getName();
+  return Name.starts_with("__asan_poison_") ||
+         Name.starts_with("__asan_unpoison_") ||
+         Name.starts_with("__asan_set_shadow_") ||
+         Name.starts_with("__asan_stack_free_") ||
+         Name == "__asan_alloca_poison" || Name == "__asan_allocas_unpoison";
+}
+
+} // namespace
+
+ShadowBarrierModel::ShadowBarrierModel(Function &F, AAResults &AA,
+                                       const TargetLibraryInfo &TLI)
+    : AA(AA), TLI(TLI) {
+  for (Instruction &I : instructions(F)) {
+    if (!mayFreeOrPoison(I))
+      continue;
+    Barriers.push_back(&I);
+    BarrierSet.insert(&I);
+  }
+}
+
+// A check stays valid until its object may be freed, reallocated or
+// repoisoned. Writes to shadow memory can hit any object; a call can only
+// free memory it may modify, which is the question alias analysis answers.
+// Lifetime markers end or restart a stack object's scope and are asked the
+// same way.
+bool ShadowBarrierModel::mayFreeOrPoison(const Instruction &I) const {
+  if (I.isLifetimeStartOrEnd())
+    return true;
+
+  const auto *CB = dyn_cast<CallBase>(&I);
+  if (CB && isPoisoningCall(*CB))
+    return true;
+  if (!mayChangeShadow(I))
+    return false;
+  if (!CB)
+    return true;
+
+  LibFunc Func;
+  const Function *Callee = CB->getCalledFunction();
+  return !Callee || !TLI.getLibFunc(*Callee, Func) || !TLI.has(Func) ||
+         !isNonFreeingLibFunc(Func);
+}
+
+bool ShadowBarrierModel::mayInvalidate(const Instruction &Barrier,
+                                       const Value *Object) {
+  const auto *CB = dyn_cast<CallBase>(&Barrier);
+  if (!CB || isPoisoningCall(*CB) || !Object ||
+      !Object->getType()->isPointerTy())
+    return true;
+
+  auto [It, Inserted] = Invalidates.try_emplace({&Barrier, Object}, true);
+  if (Inserted)
+    It->second = isModSet(
+        AA.getModRefInfo(CB, MemoryLocation::getBeforeOrAfter(Object)));
+  return It->second;
+}
+
+bool ShadowBarrierModel::mayInvalidateAny(
+    ArrayRef<const Instruction *> Candidates, const Value *Object) {
+  if (Candidates.size() > MaxBarrierQueries)
+    return true;
+  return any_of(Candidates, [&](const Instruction *Barrier) {
+    return mayInvalidate(*Barrier, Object);
+  });
+}
+
+bool ShadowBarrierModel::hasBarriersFor(const Value *Object) {
+  auto It = ObjectsWithBarriers.find(Object);
+  if (It != ObjectsWithBarriers.end())
+    return It->second;
+
+  bool HasBarriers = mayInvalidateAny(Barriers, Object);
+  ObjectsWithBarriers[Object] = HasBarriers;
+  return HasBarriers;
+}
+
+} // namespace desan
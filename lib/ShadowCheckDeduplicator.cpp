@@ -0,0 +1,170 @@
+#include "DESAN/ShadowCheckDeduplicator.h"
+
+#include "llvm/ADT/DenseMap.h"
+#include "llvm/ADT/MapVector.h"
+#include "llvm/ADT/STLExtras.h"
+#include "llvm/ADT/SmallPtrSet.h"
+#include "llvm/IR/Constants.h"
+#include "llvm/IR/Dominators.h"
+#include "llvm/IR/Function.h"
+#include "llvm/IR/InstrTypes.h"
+#include "llvm/IR/Instructions.h"
+#include "llvm/IR/PatternMatch.h"
+
+#include <utility>
+
+using namespace llvm;
+using namespace llvm::PatternMatch;
+
+namespace desan {
+
+namespace {
+
+// Shadow expressions that combine more values than this are keyed as a
+// whole instead.
+constexpr unsigned MaxShadowLeaves = 8;
+
+bool isWarningCheck(const CheckedVariable &Var) {
+  if (Var.Sanitizer != SanitizerKind::MemSan || !Var.CheckInst)
+    return false;
+  const Function *Callee = Var.CheckInst->getCalledFunction();
+  if (!Callee)
+    return false;
+  StringRef Name = Callee->getName();
+  return Name.starts_with("__msan_warning") ||
+         Name.starts_with("__msan_maybe_warning");
+}
+
+// MSan propagates shadow through casts and by ORing operand shadows, and
+// tests the result against zero. The tested shadow is non-zero exactly
+// when one of the leaves reached through those operations is.
+bool collectShadowLeaves(Value *Shadow, SmallVectorImpl<Value *> &Leaves) {
+  SmallVector<Value *, 8> Worklist = {Shadow};
+  SmallPtrSet<Value *, 8> Visited;
+  while (!Worklist.empty()) {
+    Value *V = Worklist.pop_back_val();
+    if (!Visited.insert(V).second)
+      continue;
+    if (auto *C = dyn_cast<Constant>(V); C && C->isNullValue())
+      continue;
+
+    Value *LHS = nullptr;
+    Value *RHS = nullptr;
+    ICmpInst::Predicate Pred;
+    if (match(V, m_ZExtOrSExt(m_Value(LHS))) ||
+        match(V, m_BitCast(m_Value(LHS))) ||
+        (match(V, m_ICmp(Pred, m_Value(LHS), m_Zero())) &&
+         Pred == ICmpInst::ICMP_NE)) {
+      Worklist.push_back(LHS);
+      continue;
+    }
+    if (match(V, m_Or(m_Value(LHS), m_Value(RHS))) ||
+        match(V, m_LogicalOr(m_Value(LHS), m_Value(RHS)))) {
+      Worklist.push_back(LHS);
+      Worklist.push_back(RHS);
+      continue;
+    }
+
+    Leaves.push_back(V);
+    if (Leaves.size() > MaxShadowLeaves)
+      return false;
+  }
+  return true;
+}
+
+bool getShadowLeaves(const CheckedVariable &Var,
+                     SmallVectorImpl<Value *> &Leaves) {
+  Value *Shadow = getMemSanWarningShadow(Var);
+  if (!Shadow)
+    return false;
+  if (!collectShadowLeaves(Shadow, Leaves)) {
+    Leaves.clear();
+    Leaves.push_back(Shadow);
+  }
+  return !Leaves.empty();
+}
+
+} // namespace
+
+ShadowCheckDeduplicator::ShadowCheckDeduplicator(CheckGraphBuilder &Builder)
+    : Builder(Builder) {}
+
+void ShadowCheckDeduplicator::findDuplicateChecks(
+    const CheckGraphBuilder::VariableCheckGroups &Groups,
+    SmallVectorImpl<unsigned> &Duplicates) {
+  MapVector<Function *, SmallVector<ShadowCheck, 8>> ChecksByFunction;
+  for (const VariableCheckGroup &Group : Groups) {
+    for (unsigned Index : Group.Checks) {
+      const CheckedVariable &Var = Builder.getCheck(Index);
+      if (!isWarningCheck(Var))
+        continue;
+
+      Instruction *Anchor = findCheckAnchor(Var.CheckInst);
+      if (!Anchor || !Anchor->getParent())
+        continue;
+
+      ShadowCheck Check;
+      Check.Index = Index;
+      Check.Anchor = Anchor;
+      if (getShadowLeaves(Var, Check.Leaves))
+        ChecksByFunction[Anchor->getFunction()].push_back(std::move(Check));
+    }
+  }
+
+  for (auto &[F, Checks] : ChecksByFunction)
+    findFunctionDuplicates(*F, Checks, Duplicates);
+}
+
+// A warning is a duplicate when every leaf of its shadow was already tested
+// by a dominating warning. With halt_on_error that warning would have
+// stopped the program; with keep_going it has already reported the same
+// uninitialized value.
+void ShadowCheckDeduplicator::findFunctionDuplicates(
+    Function &F, ArrayRef<ShadowCheck> Checks,
+    SmallVectorImpl<unsigned> &Duplicates) {
+  if (Checks.size() < 2)
+    return;
+
+  DominatorTree &DT = Builder.getDominatorTree(F);
+  DenseMap<const Value *, SmallVector<Instruction *, 4>> TestedAt;
+  for (const ShadowCheck &Check : Checks)
+    for (Value *Leaf : Check.Leaves)
+      TestedAt[Leaf].push_back(Check.Anchor);
+
+  for (const ShadowCheck &Check : Checks) {
+    bool Covered = all_of(Check.Leaves, [&](const Value *Leaf) {
+      return any_of(TestedAt[Leaf], [&](Instruction *Anchor) {
+        return Anchor != Check.Anchor && DT.dominates(Anchor, Check.Anchor);
+      });
+    });
+    if (Covered)
+      Duplicates.push_back(Check.Index);
+  }
+}
+
+// The shadow a warning fires on: the operand of __msan_maybe_warning_N, or
+// the value the branch into a __msan_warning block tests for non-zero.
+Value *getMemSanWarningShadow(const CheckedVariable &Var) {
+  if (!isWarningCheck(Var))
+    return nullptr;
+
+  if (Var.CheckInst->getCalledFunction()->getName().starts_with(
+          "__msan_maybe_warning"))
+    return Var.CheckInst->arg_size() ? Var.CheckInst->getArgOperand(0)
+                                     : nullptr;
+
+  auto *Br = dyn_cast_or_null<BranchInst>(findCheckAnchor(Var.CheckInst));
+  if (!Br || !Br->isConditional())
+    return nullptr;
+  if (Br->getSuccessor(0) == Var.CheckInst->getParent())
+    return Br->getCondition();
+
+  ICmpInst::Predicate Pred;
+  Value *Tested = nullptr;
+  if (match(Br->getCondition(), m_ICmp(Pred, m_Value(Tested), m_Zero())) &&
+      Pred == ICmpInst::ICMP_EQ)
+    return Tested;
+  return nullptr;
+}
+
+} // namespace desan
@@ -0,0 +1,135 @@
+#include "DESAN/VariableUnifier.h"
+
+#include "llvm/Analysis/AliasAnalysis.h"
+#include "llvm/Analysis/MemorySSA.h"
+#include "llvm/Analysis/ScalarEvolution.h"
+#include "llvm/Analysis/ScalarEvolutionExpressions.h"
+#include "llvm/IR/Instructions.h"
+#include "llvm/IR/Operator.h"
+
+using namespace llvm;
+
+namespace desan {
+
+namespace {
+
+// Deep chains are rare in checked addresses; stop before recursion gets
+// expensive and keep the value as its own representative.
+constexpr unsigned MaxUnifyDepth = 16;
+
+} // namespace
+
+VariableUnifier::VariableUnifier(AAResults &AA, MemorySSA &MSSA,
+                                 ScalarEvolution &SE)
+    : AA(AA), MSSA(MSSA), SE(SE) {}
+
+Value *VariableUnifier::getCanonicalValue(Value *V) {
+  return V ? canonicalize(V, 0) : nullptr;
+}
+
+// The object an address points into: its canonical form with GEPs and
+// no-op casts peeled off.
+Value *VariableUnifier::getCanonicalRoot(Value *Address) {
+  Value *Root = getCanonicalValue(Address);
+  for (unsigned Depth = 0; Root && Depth != MaxUnifyDepth; ++Depth) {
+    auto *GEP = dyn_cast<GEPOperator>(Root);
+    if (!GEP)
+      break;
+    Root = canonicalize(GEP->getPointerOperand(), 0);
+  }
+  return Root;
+}
+
+bool VariableUnifier::mustAlias(Value *LHS, Value *RHS) {
+  return LHS->getType()->isPointerTy() && RHS->getType()->isPointerTy() &&
+         AA.isMustAlias(LHS, RHS);
+}
+
+// Values get one representative per provably equal class: a load stands
+// for the value its must-alias store wrote, or shares a representative
+// with loads of the same pointer under the same MemorySSA clobber; phis
+// and selects whose inputs agree collapse to that input; pure expressions
+// over equal operands are hash-consed; and SCEV merges what is left with
+// an equal closed form.
+Value *VariableUnifier::canonicalize(Value *V, unsigned Depth) {
+  if (V->getType()->isPointerTy())
+    V = V->stripPointerCastsSameRepresentation();
+
+  auto It = Canonical.find(V);
+  if (It != Canonical.end())
+    return It->second;
+
+  auto *I = dyn_cast<Instruction>(V);
+  if (!I || Depth > MaxUnifyDepth)
+    return V;
+
+  // Cycles through phis see the phi itself until it is resolved.
+  Canonical[V] = V;
+  Value *Result = V;
+  if (auto *Load = dyn_cast<LoadInst>(I)) {
+    Result = canonicalizeLoad(*Load, Depth);
+  } else if (auto *Phi = dyn_cast<PHINode>(I)) {
+    Value *Common = nullptr;
+    for (Value *Incoming : Phi->incoming_values()) {
+      Value *Canon = canonicalize(Incoming, Depth + 1);
+      if (Canon == Phi || Canon == Common)
+        continue;
+      if (Common) {
+        Common = nullptr;
+        break;
+      }
+      Common = Canon;
+    }
+    if (Common)
+      Result = Common;
+  } else if (auto *GEP = dyn_cast<GetElementPtrInst>(I);
+             GEP && GEP->hasAllZeroIndices()) {
+    Result = canonicalize(GEP->getPointerOperand(), Depth + 1);
+  } else if (isa<GetElementPtrInst, CastInst, BinaryOperator, SelectInst>(I)) {
+    Result = canonicalizeExpr(*I, Depth);
+  }
+
+  if (SE.isSCEVable(Result->getType())) {
+    const SCEV *S = SE.getSCEV(Result);
+    if (!isa<SCEVUnknown>(S) && !isa<SCEVCouldNotCompute>(S))
+      Result = SCEVs.try_emplace(S, Result).first->second;
+  }
+
+  Canonical[V] = Result;
+  return Result;
+}
+
+Value *VariableUnifier::canonicalizeLoad(LoadInst &Load, unsigned Depth) {
+  if (!Load.isSimple())
+    return &Load;
+
+  MemoryAccess *Clobber = MSSA.getWalker()->getClobberingMemoryAccess(&Load);
+  if (auto *Def = dyn_cast_or_null<MemoryDef>(Clobber))
+    if (auto *Store = dyn_cast_or_null<StoreInst>(Def->getMemoryInst()))
+      if (Store->isSimple() &&
+          Store->getValueOperand()->getType() == Load.getType() &&
+          AA.isMustAlias(Store->getPointerOperand(), Load.getPointerOperand()))
+        return canonicalize(Store->getValueOperand(), Depth + 1);
+
+  Value *Ptr = canonicalize(Load.getPointerOperand(), Depth + 1);
+  return Loads.try_emplace(LoadKey(Ptr, Clobber, Load.getType()), &Load)
+      .first->second;
+}
+
+Value *VariableUnifier::canonicalizeExpr(Instruction &I, unsigned Depth) {
+  std::vector<Value *> Operands;
+  Operands.reserve(I.getNumOperands());
+  for (Value *Operand : I.operands())
+    Operands.push_back(canonicalize(Operand, Depth + 1));
+
+  if (isa<SelectInst>(I) && Operands[1] == Operands[2])
+    return Operands[1];
+
+  Type *Ty = I.getType();
+  if (auto *GEP = dyn_cast<GetElementPtrInst>(&I))
+    Ty = GEP->getSourceElementType();
+  return Exprs.try_emplace(ExprKey(I.getOpcode(), Ty, std::move(Operands)), &I)
+      .first->second;
+}
+
+} // namespace desan
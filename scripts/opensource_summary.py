@@ -41,12 +41,16 @@ def numeric(value):
 
 
 def parse_pass_log(path, core_prefixes):
-    total = 0
-    core = 0
-    removed = 0
+    counts = {
+        "total_checks": 0,
+        "core_checks": 0,
+        "removed_checks": 0,
+        "removed_write_checks": 0,
+        "removed_safe_checks": 0,
+    }
     p = Path(path)
     if not p.exists():
-        return total, core, removed
+        return counts
 
     current_type = None
     saw_total = False
@@ -54,7 +58,7 @@ def parse_pass_log(path, core_prefixes):
         for line in f:
             line = line.strip()
             if line.startswith("Total Checks:") and not saw_total:
-                total = int(line.rsplit(" ", 1)[1])
+                counts["total_checks"] = int(line.rsplit(" ", 1)[1])
                 saw_total = True
                 continue
             if line.startswith("Check Type:"):
@@ -63,15 +67,27 @@ def parse_pass_log(path, core_prefixes):
             if line.startswith("Count:") and current_type:
                 count = int(line.rsplit(" ", 1)[1])
                 if current_type.startswith(core_prefixes):
-                    core += count
+                    counts["core_checks"] += count
                 current_type = None
                 continue
             if (
                 line.startswith("DESAN Removed Redundant Checks:")
                 or line.startswith("DESAN Removed Redundant READ Checks:")
             ):
-                removed = int(line.rsplit(" ", 1)[1])
-    return total, core, removed
+                counts["removed_checks"] = int(line.rsplit(" ", 1)[1])
+                continue
+            # A breakdown of the line above, which already includes them.
+            if line.startswith("DESAN Removed Redundant WRITE Checks:"):
+                counts["removed_write_checks"] = int(line.rsplit(" ", 1)[1])
+                continue
+            if (
+                line.startswith("DESAN Removed Statically Safe Checks:")
+                or line.startswith("DESAN Removed Range-Proven UBSan Checks:")
+                or line.startswith("DESAN Removed Loop-Bounds UBSan Checks:")
+                or line.startswith("DESAN Removed Clean-Shadow MSan Checks:")
+            ):
+                counts["removed_safe_checks"] += int(line.rsplit(" ", 1)[1])
+    return counts
 
 
 def parse_records(path, benchmark, core_prefixes):
@@ -81,6 +97,8 @@ def parse_records(path, benchmark, core_prefixes):
         "total_checks": 0,
         "core_checks": 0,
         "removed_checks": 0,
+        "removed_write_checks": 0,
+        "removed_safe_checks": 0,
     }
     p = Path(path)
     if not p.exists():
@@ -93,16 +111,15 @@ def parse_records(path, benchmark, core_prefixes):
             result["compile_units"] += 1
             status = rec.get("status")
             if status == "pass":
-                total, core, removed = parse_pass_log(rec.get("pass_log", ""), core_prefixes)
-                result["total_checks"] += total
-                result["core_checks"] += core
-                result["removed_checks"] += removed
+                counts = parse_pass_log(rec.get("pass_log", ""), core_prefixes)
+                for key, value in counts.items():
+                    result[key] += value
                 continue
             if status == "pass-fallback":
                 result["fallback_units"] += 1
-                total, core, _ = parse_pass_log(rec.get("pass_log", ""), core_prefixes)
-                result["total_checks"] += total
-                result["core_checks"] += core
+                counts = parse_pass_log(rec.get("pass_log", ""), core_prefixes)
+                result["total_checks"] += counts["total_checks"]
+                result["core_checks"] += counts["core_checks"]
                 continue
             result["fallback_units"] += 1
     return result
@@ -183,6 +200,8 @@ def main():
     total = counts["total_checks"]
     core = counts["core_checks"]
     removed = counts["removed_checks"]
+    removed_writes = counts["removed_write_checks"]
+    removed_safe = counts["removed_safe_checks"]
     core_ratio = (core / total * 100.0) if total else None
     removed_ratio = (removed / total * 100.0) if total else None
     removed_core_ratio = (removed / core * 100.0) if core else None
@@ -200,6 +219,8 @@ def main():
         "Core Checks": core,
         "Core / All": core_ratio,
         "Removed Checks": removed,
+        "Removed WRITE Checks": removed_writes,
+        "Removed Safe Checks": removed_safe,
         "Removed / All": removed_ratio,
         "Removed / Core": removed_core_ratio,
         "Runtime Native": native_time,
@@ -219,8 +240,8 @@ def main():
             writer.writeheader()
             writer.writerow(row)
 
-    print("| Benchmark | Orig Checks | Core | Core/All | Removed | Removed/All | Removed/Core | Native(s) | Before(s) | After(s) | Sanitizer Overhead | DESAN Overhead | Overhead Reduction | Status |")
-    print("|---|---|---|---|---|---|---|---|---|---|---|---|---|---|")
+    print("| Benchmark | Orig Checks | Core | Core/All | Removed | Removed WRITE | Removed Safe | Removed/All | Removed/Core | Native(s) | Before(s) | After(s) | Sanitizer Overhead | DESAN Overhead | Overhead Reduction | Status |")
+    print("|---|---|---|---|---|---|---|---|---|---|---|---|---|---|---|---|")
     print(
         "| "
         + " | ".join(
@@ -230,6 +251,8 @@ def main():
                 fmt_int(core),
                 fmt_pct(core_ratio),
                 fmt_int(removed),
+                fmt_int(removed_writes),
+                fmt_int(removed_safe),
                 fmt_pct(removed_ratio),
                 fmt_pct(removed_core_ratio),
                 fmt_float(native_time),
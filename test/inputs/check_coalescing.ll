@@ -0,0 +1,152 @@
+; RUN: opt -load-pass-plugin=%plugin -passes=desan-collect-checks -desan-core-top-n=0 -desan-core-min-ratio=0 -desan-elimination-engine=dominator -desan-coalesce-checks -S %s -o - 2>&1 | FileCheck %s
+
+; Checks of one base whose byte ranges touch or overlap become one check of
+; the union. The run whose first check already covers the union needs no
+; new check. A fixed-size callback is only used when the union is known to
+; be naturally aligned, and recoverable checks stay recoverable.
+
+; CHECK:      DESAN Removed Redundant Checks: 0
+; CHECK-NEXT: DESAN Coalesced Checks: 5 (replaced: 11)
+
+declare void @__asan_load4(i64)
+declare void @__asan_load8(i64)
+declare void @__asan_load2(i64)
+declare void @__asan_load2_noabort(i64)
+declare void @free(ptr)
+
+; %p is only known to be 4-aligned, so the union may span two granules.
+; CHECK-LABEL: define i32 @contiguous(
+; CHECK-NEXT:  entry:
+; CHECK-NEXT:    [[ADDR:%.*]] = ptrtoint ptr %p to i64
+; CHECK-NEXT:    call void @__asan_loadN(i64 [[ADDR]], i64 8)
+; CHECK-NOT:     call void @__asan_load
+; CHECK:         ret i32 %s
+define i32 @contiguous(ptr align 4 %p) {
+entry:
+  %a.addr = ptrtoint ptr %p to i64
+  call void @__asan_load4(i64 %a.addr)
+  %a = load i32, ptr %p, align 4
+  %b.ptr = getelementptr inbounds i8, ptr %p, i64 4
+  %b.addr = ptrtoint ptr %b.ptr to i64
+  call void @__asan_load4(i64 %b.addr)
+  %b = load i32, ptr %b.ptr, align 4
+  %s = add i32 %a, %b
+  ret i32 %s
+}
+
+; CHECK-LABEL: define i32 @aligned(
+; CHECK-NEXT:  entry:
+; CHECK-NEXT:    [[ADDR:%.*]] = ptrtoint ptr %p to i64
+; CHECK-NEXT:    call void @__asan_load8(i64 [[ADDR]])
+; CHECK-NOT:     call void @__asan_load
+; CHECK:         ret i32 %s
+define i32 @aligned(ptr align 8 %p) {
+entry:
+  %a.addr = ptrtoint ptr %p to i64
+  call void @__asan_load4(i64 %a.addr)
+  %a = load i32, ptr %p, align 8
+  %b.ptr = getelementptr inbounds i8, ptr %p, i64 4
+  %b.addr = ptrtoint ptr %b.ptr to i64
+  call void @__asan_load4(i64 %b.addr)
+  %b = load i32, ptr %b.ptr, align 4
+  %s = add i32 %a, %b
+  ret i32 %s
+}
+
+; [6, 10) is a power of two in size but not aligned to it.
+; CHECK-LABEL: define i16 @misaligned(
+; CHECK:         [[START:%.*]] = getelementptr i8, ptr %p, i64 6
+; CHECK-NEXT:    [[ADDR:%.*]] = ptrtoint ptr [[START]] to i64
+; CHECK-NEXT:    call void @__asan_loadN(i64 [[ADDR]], i64 4)
+; CHECK-NOT:     call void @__asan_load
+; CHECK:         ret i16 %s
+define i16 @misaligned(ptr align 8 %p) {
+entry:
+  %a.ptr = getelementptr inbounds i8, ptr %p, i64 6
+  %a.addr = ptrtoint ptr %a.ptr to i64
+  call void @__asan_load2(i64 %a.addr)
+  %a = load i16, ptr %a.ptr, align 2
+  %b.ptr = getelementptr inbounds i8, ptr %p, i64 8
+  %b.addr = ptrtoint ptr %b.ptr to i64
+  call void @__asan_load2(i64 %b.addr)
+  %b = load i16, ptr %b.ptr, align 8
+  %s = add i16 %a, %b
+  ret i16 %s
+}
+
+; CHECK-LABEL: define i16 @recoverable(
+; CHECK-NEXT:  entry:
+; CHECK-NEXT:    [[ADDR:%.*]] = ptrtoint ptr %p to i64
+; CHECK-NEXT:    call void @__asan_load4_noabort(i64 [[ADDR]])
+; CHECK-NOT:     call void @__asan_load
+; CHECK:         ret i16 %s
+define i16 @recoverable(ptr align 4 %p) {
+entry:
+  %a.addr = ptrtoint ptr %p to i64
+  call void @__asan_load2_noabort(i64 %a.addr)
+  %a = load i16, ptr %p, align 4
+  %b.ptr = getelementptr inbounds i8, ptr %p, i64 2
+  %b.addr = ptrtoint ptr %b.ptr to i64
+  call void @__asan_load2_noabort(i64 %b.addr)
+  %b = load i16, ptr %b.ptr, align 2
+  %s = add i16 %a, %b
+  ret i16 %s
+}
+
+; CHECK-LABEL: define i32 @odd_union(
+; CHECK-NEXT:  entry:
+; CHECK-NEXT:    [[ADDR:%.*]] = ptrtoint ptr %p to i64
+; CHECK-NEXT:    call void @__asan_loadN(i64 [[ADDR]], i64 6)
+; CHECK-NOT:     call void @__asan_load
+; CHECK:         ret i32 %s
+define i32 @odd_union(ptr %p) {
+entry:
+  %a.addr = ptrtoint ptr %p to i64
+  call void @__asan_load4(i64 %a.addr)
+  %a = load i32, ptr %p, align 4
+  %b.ptr = getelementptr inbounds i8, ptr %p, i64 4
+  %b.addr = ptrtoint ptr %b.ptr to i64
+  call void @__asan_load2(i64 %b.addr)
+  %b = load i16, ptr %b.ptr, align 2
+  %b.ext = zext i16 %b to i32
+  %s = add i32 %a, %b.ext
+  ret i32 %s
+}
+
+; CHECK-LABEL: define i32 @first_covers(
+; CHECK-NEXT:  entry:
+; CHECK-NEXT:    %a.addr = ptrtoint ptr %p to i64
+; CHECK-NEXT:    call void @__asan_load8(i64 %a.addr)
+; CHECK-NOT:     call void @__asan_load
+; CHECK:         ret i32 %s
+define i32 @first_covers(ptr %p) {
+entry:
+  %a.addr = ptrtoint ptr %p to i64
+  call void @__asan_load8(i64 %a.addr)
+  %a = load i64, ptr %p, align 8
+  %b.ptr = getelementptr inbounds i8, ptr %p, i64 4
+  %b.addr = ptrtoint ptr %b.ptr to i64
+  call void @__asan_load4(i64 %b.addr)
+  %b = load i32, ptr %b.ptr, align 4
+  %a.trunc = trunc i64 %a to i32
+  %s = add i32 %a.trunc, %b
+  ret i32 %s
+}
+
+; CHECK-LABEL: define i32 @free_between(
+; CHECK:         call void @__asan_load4(i64 %a.addr)
+; CHECK:         call void @free(ptr %q)
+; CHECK:         call void @__asan_load4(i64 %b.addr)
+define i32 @free_between(ptr %p, ptr %q) {
+entry:
+  %a.addr = ptrtoint ptr %p to i64
+  call void @__asan_load4(i64 %a.addr)
+  %a = load i32, ptr %p, align 4
+  call void @free(ptr %q)
+  %b.ptr = getelementptr inbounds i8, ptr %p, i64 4
+  %b.addr = ptrtoint ptr %b.ptr to i64
+  call void @__asan_load4(i64 %b.addr)
+  %b = load i32, ptr %b.ptr, align 4
+  %s = add i32 %a, %b
+  ret i32 %s
+}
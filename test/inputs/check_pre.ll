@@ -0,0 +1,154 @@
+; RUN: opt -load-pass-plugin=%plugin -passes=desan-collect-checks -desan-core-top-n=0 -desan-core-min-ratio=0 -desan-elimination-engine=dominator -desan-check-pre -S %s -o - 2>&1 | FileCheck %s
+
+; A READ that starts every successor of a branch is hoisted into the branch
+; block. The header/latch pair is not a PRE case: the header check already
+; dominates the latch copy, and the elimination engine removes that one.
+
+; CHECK:      DESAN Removed Redundant Checks: 1
+; CHECK-NEXT: DESAN Hoisted Redundant Checks: 2 (copies removed: 4)
+
+declare void @__asan_load4(i64)
+declare void @__asan_report_load4(i64)
+declare void @ext()
+
+; CHECK-LABEL: define i32 @callback_diamond(
+; CHECK:       entry:
+; CHECK-NEXT:    %addr = ptrtoint ptr %p to i64
+; CHECK-NEXT:    call void @__asan_load4(i64 %addr)
+; CHECK-NEXT:    br i1 %c, label %left, label %right
+; CHECK-NOT:   call void @__asan_load4
+; CHECK:       ret i32 %v
+define i32 @callback_diamond(ptr %p, i1 %c) {
+entry:
+  %addr = ptrtoint ptr %p to i64
+  br i1 %c, label %left, label %right
+
+left:
+  call void @__asan_load4(i64 %addr)
+  %a = load i32, ptr %p, align 4
+  br label %join
+
+right:
+  call void @__asan_load4(i64 %addr)
+  %b = load i32, ptr %p, align 4
+  br label %join
+
+join:
+  %v = phi i32 [ %a, %left ], [ %b, %right ]
+  ret i32 %v
+}
+
+; CHECK-LABEL: define i32 @inline_diamond(
+; CHECK:       entry:
+; CHECK:         %l.shadow.pre = load i8, ptr %l.shadow.ptr.pre, align 1
+; CHECK-NEXT:    %l.bad.pre = icmp ne i8 %l.shadow.pre, 0
+; CHECK-NEXT:    br i1 %l.bad.pre, label %l.report.pre, label %entry.split
+; CHECK:       entry.split:
+; CHECK-NEXT:    br i1 %c, label %left, label %right
+; CHECK:       left:
+; CHECK-NEXT:    %a = load i32, ptr %p, align 4
+; CHECK:       right:
+; CHECK-NEXT:    %b = load i32, ptr %p, align 4
+; CHECK:       l.report.pre:
+; CHECK-NEXT:    call void @__asan_report_load4(i64 %addr)
+; CHECK-NEXT:    unreachable
+; CHECK-NOT:   call void @__asan_report_load4
+; CHECK:       }
+define i32 @inline_diamond(ptr %p, i1 %c) {
+entry:
+  %addr = ptrtoint ptr %p to i64
+  br i1 %c, label %left, label %right
+
+left:
+  %l.shift = lshr i64 %addr, 3
+  %l.shadow.addr = add i64 %l.shift, 2147450880
+  %l.shadow.ptr = inttoptr i64 %l.shadow.addr to ptr
+  %l.shadow = load i8, ptr %l.shadow.ptr, align 1
+  %l.bad = icmp ne i8 %l.shadow, 0
+  br i1 %l.bad, label %l.report, label %l.cont
+
+l.report:
+  call void @__asan_report_load4(i64 %addr)
+  unreachable
+
+l.cont:
+  %a = load i32, ptr %p, align 4
+  br label %join
+
+right:
+  %r.shift = lshr i64 %addr, 3
+  %r.shadow.addr = add i64 %r.shift, 2147450880
+  %r.shadow.ptr = inttoptr i64 %r.shadow.addr to ptr
+  %r.shadow = load i8, ptr %r.shadow.ptr, align 1
+  %r.bad = icmp ne i8 %r.shadow, 0
+  br i1 %r.bad, label %r.report, label %r.cont
+
+r.report:
+  call void @__asan_report_load4(i64 %addr)
+  unreachable
+
+r.cont:
+  %b = load i32, ptr %p, align 4
+  br label %join
+
+join:
+  %v = phi i32 [ %a, %l.cont ], [ %b, %r.cont ]
+  ret i32 %v
+}
+
+; CHECK-LABEL: define i32 @side_effect_first(
+; CHECK:       entry:
+; CHECK-NOT:     call void @__asan_load4
+; CHECK:       left:
+; CHECK-NEXT:    call void @ext()
+; CHECK-NEXT:    call void @__asan_load4(i64 %addr)
+; CHECK:       right:
+; CHECK-NEXT:    call void @__asan_load4(i64 %addr)
+define i32 @side_effect_first(ptr %p, i1 %c) {
+entry:
+  %addr = ptrtoint ptr %p to i64
+  br i1 %c, label %left, label %right
+
+left:
+  call void @ext()
+  call void @__asan_load4(i64 %addr)
+  %a = load i32, ptr %p, align 4
+  br label %join
+
+right:
+  call void @__asan_load4(i64 %addr)
+  %b = load i32, ptr %p, align 4
+  br label %join
+
+join:
+  %v = phi i32 [ %a, %left ], [ %b, %right ]
+  ret i32 %v
+}
+
+; CHECK-LABEL: define void @header_latch(
+; CHECK:       header:
+; CHECK:         call void @__asan_load4(i64 %addr)
+; CHECK:       latch:
+; CHECK-NOT:     call void @__asan_load4
+; CHECK:         br i1 %again
+define void @header_latch(ptr %p, i64 %n) {
+entry:
+  %addr = ptrtoint ptr %p to i64
+  br label %header
+
+header:
+  %i = phi i64 [ 0, %entry ], [ %next, %latch ]
+  call void @__asan_load4(i64 %addr)
+  %x = load volatile i32, ptr %p, align 4
+  br label %latch
+
+latch:
+  call void @__asan_load4(i64 %addr)
+  %y = load volatile i32, ptr %p, align 4
+  %next = add i64 %i, 1
+  %again = icmp ult i64 %next, %n
+  br i1 %again, label %header, label %exit
+
+exit:
+  ret void
+}
@@ -0,0 +1,78 @@
+; RUN: opt -load-pass-plugin=%plugin -passes=desan-collect-checks -desan-core-top-n=0 -desan-core-min-ratio=0 -desan-elimination-engine=dominator -S %s -o - 2>&1 | FileCheck %s
+
+; With the dominator engine, an ASan READ on a base is also redundant when a
+; dominating READ on the same base tested a byte range containing it. A
+; barrier on the base ends the range, and a check of unknown size is never
+; covered.
+
+; CHECK: DESAN Removed Redundant Checks: 1
+
+declare void @__asan_load4(i64)
+declare void @__asan_load8(i64)
+declare void @__asan_loadN(i64, i64)
+declare void @__asan_store4(i64)
+
+; CHECK-LABEL: define i32 @wider_covers(
+; CHECK:         call void @__asan_load8(i64 %a.addr)
+; CHECK-NOT:     call void @__asan_load
+; CHECK:         ret i32 %v
+define i32 @wider_covers(ptr %p) {
+entry:
+  %a.addr = ptrtoint ptr %p to i64
+  call void @__asan_load8(i64 %a.addr)
+  %a = load i64, ptr %p, align 8
+  %b.ptr = getelementptr inbounds i8, ptr %p, i64 4
+  %b.addr = ptrtoint ptr %b.ptr to i64
+  call void @__asan_load4(i64 %b.addr)
+  %v = load i32, ptr %b.ptr, align 4
+  ret i32 %v
+}
+
+; CHECK-LABEL: define i32 @barrier_between(
+; CHECK:         call void @__asan_load8(i64 %a.addr)
+; CHECK:         call void @__asan_store4(i64 %a.addr)
+; CHECK:         call void @__asan_load4(i64 %b.addr)
+define i32 @barrier_between(ptr %p) {
+entry:
+  %a.addr = ptrtoint ptr %p to i64
+  call void @__asan_load8(i64 %a.addr)
+  %a = load i64, ptr %p, align 8
+  call void @__asan_store4(i64 %a.addr)
+  store i32 0, ptr %p, align 4
+  %b.ptr = getelementptr inbounds i8, ptr %p, i64 4
+  %b.addr = ptrtoint ptr %b.ptr to i64
+  call void @__asan_load4(i64 %b.addr)
+  %v = load i32, ptr %b.ptr, align 4
+  ret i32 %v
+}
+
+; [6, 10) reaches past the tested [0, 8).
+; CHECK-LABEL: define i32 @not_covered(
+; CHECK:         call void @__asan_load8(i64 %a.addr)
+; CHECK:         call void @__asan_load4(i64 %b.addr)
+define i32 @not_covered(ptr %p) {
+entry:
+  %a.addr = ptrtoint ptr %p to i64
+  call void @__asan_load8(i64 %a.addr)
+  %a = load i64, ptr %p, align 8
+  %b.ptr = getelementptr inbounds i8, ptr %p, i64 6
+  %b.addr = ptrtoint ptr %b.ptr to i64
+  call void @__asan_load4(i64 %b.addr)
+  %v = load i32, ptr %b.ptr, align 2
+  ret i32 %v
+}
+
+; CHECK-LABEL: define i8 @unknown_size(
+; CHECK:         call void @__asan_load8(i64 %a.addr)
+; CHECK:         call void @__asan_loadN(i64 %b.addr, i64 %n)
+define i8 @unknown_size(ptr %p, i64 %n) {
+entry:
+  %a.addr = ptrtoint ptr %p to i64
+  call void @__asan_load8(i64 %a.addr)
+  %a = load i64, ptr %p, align 8
+  %b.ptr = getelementptr inbounds i8, ptr %p, i64 2
+  %b.addr = ptrtoint ptr %b.ptr to i64
+  call void @__asan_loadN(i64 %b.addr, i64 %n)
+  %v = load i8, ptr %b.ptr, align 1
+  ret i8 %v
+}
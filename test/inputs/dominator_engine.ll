@@ -0,0 +1,111 @@
+; RUN: opt -load-pass-plugin=%plugin -passes=desan-collect-checks -desan-core-top-n=0 -desan-core-min-ratio=0 -desan-elimination-engine=dominator -S %s -o - 2>&1 | FileCheck %s
+
+; The dominator engine removes a check only when a check on the same
+; location dominates it. Each dominator subtree is a scope, so a check in
+; one arm of a branch says nothing about its sibling arm.
+
+; CHECK: DESAN Removed Redundant Checks: 2
+
+declare void @__asan_load4(i64)
+declare void @__asan_store4(i64)
+declare void @__asan_report_load4(i64)
+declare void @__asan_report_store4(i64)
+
+; CHECK-LABEL: define i32 @dominated(
+; CHECK:       entry:
+; CHECK:         call void @__asan_load4(i64 %a)
+; CHECK-NOT:     call void @__asan_load4
+; CHECK:         ret i32
+define i32 @dominated(ptr %p, i1 %c) {
+entry:
+  %a = ptrtoint ptr %p to i64
+  call void @__asan_load4(i64 %a)
+  %v0 = load i32, ptr %p, align 4
+  br i1 %c, label %then, label %exit
+
+then:
+  call void @__asan_load4(i64 %a)
+  %v1 = load i32, ptr %p, align 4
+  br label %exit
+
+exit:
+  %v = phi i32 [ %v0, %entry ], [ %v1, %then ]
+  ret i32 %v
+}
+
+; The arms are siblings in the dominator tree: the left arm's check is
+; out of scope in the right arm, and neither dominates the join.
+; CHECK-LABEL: define i32 @siblings(
+; CHECK:       left:
+; CHECK-NEXT:    call void @__asan_load4(i64 %a)
+; CHECK:       right:
+; CHECK-NEXT:    call void @__asan_load4(i64 %a)
+; CHECK:       join:
+; CHECK:         call void @__asan_load4(i64 %a)
+define i32 @siblings(ptr %p, i1 %c) {
+entry:
+  %a = ptrtoint ptr %p to i64
+  br i1 %c, label %left, label %right
+
+left:
+  call void @__asan_load4(i64 %a)
+  %v0 = load i32, ptr %p, align 4
+  br label %join
+
+right:
+  call void @__asan_load4(i64 %a)
+  %v1 = load i32, ptr %p, align 4
+  br label %join
+
+join:
+  %v = phi i32 [ %v0, %left ], [ %v1, %right ]
+  call void @__asan_load4(i64 %a)
+  %v2 = load i32, ptr %p, align 4
+  %s = add i32 %v, %v2
+  ret i32 %s
+}
+
+; The join starts a new generation, but no path can pass a barrier.
+; CHECK-LABEL: define i32 @join_without_barrier(
+; CHECK:         call void @__asan_load4(i64 %a)
+; CHECK-NOT:     call void @__asan_load4
+; CHECK:         ret i32
+define i32 @join_without_barrier(ptr %p, i1 %c) {
+entry:
+  %a = ptrtoint ptr %p to i64
+  call void @__asan_load4(i64 %a)
+  %v0 = load i32, ptr %p, align 4
+  br i1 %c, label %then, label %join
+
+then:
+  br label %join
+
+join:
+  call void @__asan_load4(i64 %a)
+  %v1 = load i32, ptr %p, align 4
+  %s = add i32 %v0, %v1
+  ret i32 %s
+}
+
+; A WRITE check on one path into the join ends availability there.
+; CHECK-LABEL: define i32 @join_after_barrier(
+; CHECK:       join:
+; CHECK-NEXT:    call void @__asan_load4(i64 %a)
+define i32 @join_after_barrier(ptr %p, i1 %c) {
+entry:
+  %a = ptrtoint ptr %p to i64
+  call void @__asan_load4(i64 %a)
+  %v0 = load i32, ptr %p, align 4
+  br i1 %c, label %then, label %join
+
+then:
+  call void @__asan_store4(i64 %a)
+  store i32 0, ptr %p, align 4
+  br label %join
+
+join:
+  call void @__asan_load4(i64 %a)
+  %v1 = load i32, ptr %p, align 4
+  %s = add i32 %v0, %v1
+  ret i32 %s
+}
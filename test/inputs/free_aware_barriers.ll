@@ -0,0 +1,115 @@
+; RUN: opt -load-pass-plugin=%plugin -passes=desan-collect-checks -desan-core-top-n=0 -desan-core-min-ratio=0 -desan-elimination-engine=dominator -S %s -o - 2>&1 | FileCheck %s --check-prefixes=CHECK,EPOCH
+; RUN: opt -load-pass-plugin=%plugin -passes=desan-collect-checks -desan-core-top-n=0 -desan-core-min-ratio=0 -desan-elimination-engine=dominator -desan-free-aware-barriers -S %s -o - 2>&1 | FileCheck %s --check-prefixes=CHECK,FREE
+
+; Epoch barriers end a READ's availability at the next WRITE or UNKNOWN check
+; on the variable. Free-aware barriers end it where the object may be freed,
+; poisoned or leave its scope instead, and see through nofree calls.
+
+; EPOCH: DESAN Removed Redundant Checks: 4
+; FREE:  DESAN Removed Redundant Checks: 2
+
+declare void @__asan_load4(i64)
+declare void @__asan_store4(i64)
+declare void @__asan_poison_stack_memory(i64, i64)
+declare void @free(ptr)
+declare void @log_value(i32) nofree nounwind
+declare void @llvm.lifetime.start.p0(i64, ptr nocapture)
+declare void @llvm.lifetime.end.p0(i64, ptr nocapture)
+
+; CHECK-LABEL: define i32 @nofree_call(
+; CHECK:         call void @log_value(i32 %a)
+; EPOCH-NEXT:    call void @__asan_load4(i64 %addr)
+; FREE-NOT:      call void @__asan_load4
+; CHECK:         %b = load i32, ptr %p, align 4
+define i32 @nofree_call(ptr %p) {
+entry:
+  %addr = ptrtoint ptr %p to i64
+  call void @__asan_load4(i64 %addr)
+  %a = load i32, ptr %p, align 4
+  call void @__asan_store4(i64 %addr)
+  store i32 0, ptr %p, align 4
+  call void @log_value(i32 %a)
+  call void @__asan_load4(i64 %addr)
+  %b = load i32, ptr %p, align 4
+  ret i32 %b
+}
+
+; CHECK-LABEL: define i32 @freed(
+; CHECK:         call void @free(ptr %p)
+; EPOCH-NOT:     call void @__asan_load4
+; FREE-NEXT:     call void @__asan_load4(i64 %addr)
+; CHECK:         %b = load i32, ptr %p, align 4
+define i32 @freed(ptr %p) {
+entry:
+  %addr = ptrtoint ptr %p to i64
+  call void @__asan_load4(i64 %addr)
+  %a = load i32, ptr %p, align 4
+  call void @free(ptr %p)
+  call void @__asan_load4(i64 %addr)
+  %b = load i32, ptr %p, align 4
+  %s = add i32 %a, %b
+  ret i32 %s
+}
+
+; A reloaded pointer is traced back to its stack slot, but the free
+; releases the object the slot points to.
+; CHECK-LABEL: define i32 @freed_through_slot(
+; CHECK:         call void @free(ptr %r)
+; EPOCH-NOT:     call void @__asan_load4
+; FREE-NEXT:     call void @__asan_load4(i64 %addr)
+; CHECK:         %b = load i32, ptr %r, align 4
+define i32 @freed_through_slot(ptr %p) {
+entry:
+  %p.addr = alloca ptr, align 8
+  store ptr %p, ptr %p.addr, align 8
+  %r = load ptr, ptr %p.addr, align 8
+  %addr = ptrtoint ptr %r to i64
+  call void @__asan_load4(i64 %addr)
+  %a = load i32, ptr %r, align 4
+  call void @free(ptr %r)
+  call void @__asan_load4(i64 %addr)
+  %b = load i32, ptr %r, align 4
+  %s = add i32 %a, %b
+  ret i32 %s
+}
+
+; CHECK-LABEL: define i32 @poisoned(
+; CHECK:         call void @__asan_poison_stack_memory(i64 %addr, i64 4)
+; EPOCH-NOT:     call void @__asan_load4
+; FREE-NEXT:     call void @__asan_load4(i64 %addr)
+; CHECK:         %b = load i32, ptr %p, align 4
+define i32 @poisoned(ptr %p) {
+entry:
+  %addr = ptrtoint ptr %p to i64
+  call void @__asan_load4(i64 %addr)
+  %a = load i32, ptr %p, align 4
+  call void @__asan_poison_stack_memory(i64 %addr, i64 4)
+  call void @__asan_load4(i64 %addr)
+  %b = load i32, ptr %p, align 4
+  %s = add i32 %a, %b
+  ret i32 %s
+}
+
+; CHECK-LABEL: define i32 @out_of_scope(
+; CHECK:         call void @__asan_store4(i64 %addr)
+; EPOCH:         call void @__asan_load4(i64 %addr)
+; FREE-NOT:      call void @__asan_load4
+; CHECK:         call void @llvm.lifetime.end.p0(i64 4, ptr %slot)
+; EPOCH-NOT:     call void @__asan_load4
+; FREE-NEXT:     call void @__asan_load4(i64 %addr)
+; CHECK:         %b = load volatile i32, ptr %slot, align 4
+define i32 @out_of_scope() {
+entry:
+  %slot = alloca i32, align 4
+  %addr = ptrtoint ptr %slot to i64
+  call void @llvm.lifetime.start.p0(i64 4, ptr %slot)
+  call void @__asan_store4(i64 %addr)
+  store i32 1, ptr %slot, align 4
+  call void @__asan_load4(i64 %addr)
+  %a = load volatile i32, ptr %slot, align 4
+  call void @llvm.lifetime.end.p0(i64 4, ptr %slot)
+  call void @__asan_load4(i64 %addr)
+  %b = load volatile i32, ptr %slot, align 4
+  %s = add i32 %a, %b
+  ret i32 %s
+}
@@ -0,0 +1,238 @@
+; RUN: opt -load-pass-plugin=%plugin -passes=desan-collect-checks -desan-core-top-n=0 -desan-core-min-ratio=0 -desan-elimination-engine=dominator -desan-loop-check-hoisting -S %s -o - 2>&1 | FileCheck %s
+
+; Invariant and affine READs move to the preheader. A range over several
+; iterations is checked byte by byte with __asan_loadN even when its size
+; is a constant power of two, and recoverable checks stay recoverable.
+; Loops that may free, strides wider than the access, loops with a second
+; exit and loops with a call that may not return keep their per-iteration
+; checks.
+
+; CHECK:      DESAN Removed Redundant Checks: 0
+; CHECK-NEXT: DESAN Loop-Hoisted Checks: 5 (range: 4, replaced: 5)
+
+declare void @__asan_load4(i64)
+declare void @__asan_load4_noabort(i64)
+declare void @free(ptr)
+declare void @may_exit(i32) nofree nounwind
+
+; CHECK-LABEL: define void @invariant(
+; CHECK:       entry:
+; CHECK-NEXT:    [[ADDR:%.*]] = ptrtoint ptr %p to i64
+; CHECK-NEXT:    call void @__asan_load4(i64 [[ADDR]])
+; CHECK:       loop:
+; CHECK-NOT:     call void @__asan_load4
+; CHECK:         br i1 %again
+define void @invariant(ptr %p, i64 %n) {
+entry:
+  %addr = ptrtoint ptr %p to i64
+  br label %loop
+
+loop:
+  %i = phi i64 [ 0, %entry ], [ %next, %loop ]
+  call void @__asan_load4(i64 %addr)
+  %x = load volatile i32, ptr %p, align 4
+  %next = add i64 %i, 1
+  %again = icmp ult i64 %next, %n
+  br i1 %again, label %loop, label %exit
+
+exit:
+  ret void
+}
+
+; CHECK-LABEL: define void @forward(
+; CHECK:       entry:
+; CHECK-NEXT:    [[START:%.*]] = ptrtoint ptr %p to i64
+; CHECK:         call void @__asan_loadN(i64 [[START]], i64 %{{.*}})
+; CHECK:       loop:
+; CHECK-NOT:     call void @__asan_load
+; CHECK:         br i1 %again
+define void @forward(ptr %p, i64 %n) {
+entry:
+  br label %loop
+
+loop:
+  %i = phi i64 [ 0, %entry ], [ %next, %loop ]
+  %elt = getelementptr inbounds i32, ptr %p, i64 %i
+  %addr = ptrtoint ptr %elt to i64
+  call void @__asan_load4(i64 %addr)
+  %x = load volatile i32, ptr %elt, align 4
+  %next = add nuw i64 %i, 1
+  %again = icmp ult i64 %next, %n
+  br i1 %again, label %loop, label %exit
+
+exit:
+  ret void
+}
+
+; Two iterations of a 4-byte stride cover 8 bytes from a 4-aligned
+; address, which __asan_load8 would test as a single granule.
+; CHECK-LABEL: define void @constant_range(
+; CHECK:       entry:
+; CHECK-NEXT:    [[START:%.*]] = ptrtoint ptr %p to i64
+; CHECK-NEXT:    call void @__asan_loadN(i64 [[START]], i64 8)
+; CHECK:       loop:
+; CHECK-NOT:     call void @__asan_load
+; CHECK:         br i1 %again
+define void @constant_range(ptr %p) {
+entry:
+  br label %loop
+
+loop:
+  %i = phi i64 [ 0, %entry ], [ %next, %loop ]
+  %elt = getelementptr inbounds i32, ptr %p, i64 %i
+  %addr = ptrtoint ptr %elt to i64
+  call void @__asan_load4(i64 %addr)
+  %x = load volatile i32, ptr %elt, align 4
+  %next = add nuw i64 %i, 1
+  %again = icmp ult i64 %next, 2
+  br i1 %again, label %loop, label %exit
+
+exit:
+  ret void
+}
+
+; CHECK-LABEL: define void @recoverable(
+; CHECK:       entry:
+; CHECK:         call void @__asan_loadN_noabort(i64 %{{.*}}, i64 %{{.*}})
+; CHECK:       loop:
+; CHECK-NOT:     call void @__asan_load
+; CHECK:         br i1 %again
+define void @recoverable(ptr %p, i64 %n) {
+entry:
+  br label %loop
+
+loop:
+  %i = phi i64 [ 0, %entry ], [ %next, %loop ]
+  %elt = getelementptr inbounds i32, ptr %p, i64 %i
+  %addr = ptrtoint ptr %elt to i64
+  call void @__asan_load4_noabort(i64 %addr)
+  %x = load volatile i32, ptr %elt, align 4
+  %next = add nuw i64 %i, 1
+  %again = icmp ult i64 %next, %n
+  br i1 %again, label %loop, label %exit
+
+exit:
+  ret void
+}
+
+; CHECK-LABEL: define void @backward(
+; CHECK:       entry:
+; CHECK:         call void @__asan_loadN(i64 %{{.*}}, i64 %{{.*}})
+; CHECK:       loop:
+; CHECK-NOT:     call void @__asan_load
+; CHECK:         br i1 %again
+define void @backward(ptr %p, i64 %n) {
+entry:
+  br label %loop
+
+loop:
+  %i = phi i64 [ %n, %entry ], [ %next, %loop ]
+  %elt = getelementptr inbounds i32, ptr %p, i64 %i
+  %addr = ptrtoint ptr %elt to i64
+  call void @__asan_load4(i64 %addr)
+  %x = load volatile i32, ptr %elt, align 4
+  %next = add nsw i64 %i, -1
+  %again = icmp sgt i64 %next, 0
+  br i1 %again, label %loop, label %exit
+
+exit:
+  ret void
+}
+
+; CHECK-LABEL: define void @frees(
+; CHECK:       entry:
+; CHECK-NOT:     call void @__asan_load
+; CHECK:       loop:
+; CHECK:         call void @__asan_load4(i64 %addr)
+; CHECK:         call void @free(ptr %q)
+define void @frees(ptr %p, ptr %q, i64 %n) {
+entry:
+  %addr = ptrtoint ptr %p to i64
+  br label %loop
+
+loop:
+  %i = phi i64 [ 0, %entry ], [ %next, %loop ]
+  call void @__asan_load4(i64 %addr)
+  %x = load volatile i32, ptr %p, align 4
+  call void @free(ptr %q)
+  %next = add i64 %i, 1
+  %again = icmp ult i64 %next, %n
+  br i1 %again, label %loop, label %exit
+
+exit:
+  ret void
+}
+
+; CHECK-LABEL: define void @wide_stride(
+; CHECK:       entry:
+; CHECK-NOT:     call void @__asan_load
+; CHECK:       loop:
+; CHECK:         call void @__asan_load4(i64 %addr)
+define void @wide_stride(ptr %p, i64 %n) {
+entry:
+  br label %loop
+
+loop:
+  %i = phi i64 [ 0, %entry ], [ %next, %loop ]
+  %elt = getelementptr inbounds i64, ptr %p, i64 %i
+  %addr = ptrtoint ptr %elt to i64
+  call void @__asan_load4(i64 %addr)
+  %x = load volatile i32, ptr %elt, align 4
+  %next = add nuw i64 %i, 1
+  %again = icmp ult i64 %next, %n
+  br i1 %again, label %loop, label %exit
+
+exit:
+  ret void
+}
+
+; CHECK-LABEL: define void @two_exits(
+; CHECK:       entry:
+; CHECK-NOT:     call void @__asan_load
+; CHECK:       loop:
+; CHECK:         call void @__asan_load4(i64 %addr)
+define void @two_exits(ptr %p, i64 %n, i32 %stop) {
+entry:
+  br label %loop
+
+loop:
+  %i = phi i64 [ 0, %entry ], [ %next, %latch ]
+  %elt = getelementptr inbounds i32, ptr %p, i64 %i
+  %addr = ptrtoint ptr %elt to i64
+  call void @__asan_load4(i64 %addr)
+  %x = load volatile i32, ptr %elt, align 4
+  %found = icmp eq i32 %x, %stop
+  br i1 %found, label %exit, label %latch
+
+latch:
+  %next = add nuw i64 %i, 1
+  %again = icmp ult i64 %next, %n
+  br i1 %again, label %loop, label %exit
+
+exit:
+  ret void
+}
+
+; A later iteration may never run, so its bytes must not be checked early.
+; CHECK-LABEL: define void @may_not_return(
+; CHECK:       loop:
+; CHECK:         call void @__asan_load4(i64 %addr)
+; CHECK:         call void @may_exit(i32 %x)
+define void @may_not_return(ptr %p, i64 %n) {
+entry:
+  br label %loop
+
+loop:
+  %i = phi i64 [ 0, %entry ], [ %next, %loop ]
+  %elt = getelementptr inbounds i32, ptr %p, i64 %i
+  %addr = ptrtoint ptr %elt to i64
+  call void @__asan_load4(i64 %addr)
+  %x = load volatile i32, ptr %elt, align 4
+  call void @may_exit(i32 %x)
+  %next = add nuw i64 %i, 1
+  %again = icmp ult i64 %next, %n
+  br i1 %again, label %loop, label %exit
+
+exit:
+  ret void
+}
@@ -0,0 +1,132 @@
+; RUN: opt -load-pass-plugin=%plugin -passes=desan-collect-checks -desan-core-top-n=0 -desan-core-min-ratio=0 -desan-elimination-engine=dominator -desan-dedup-msan-warnings -S %s -o - 2>&1 | FileCheck %s --check-prefix=DEDUP
+; RUN: opt -load-pass-plugin=%plugin -passes=desan-collect-checks -desan-core-top-n=0 -desan-core-min-ratio=0 -desan-elimination-engine=dominator -S %s -o - 2>&1 | FileCheck %s --check-prefix=ENGINE
+
+; An MSan warning is removed when dominating warnings already tested every
+; shadow it ORs together. The engine alone keys an ORed shadow by its first
+; operand, so it keeps all of these. A warning whose shadow was only tested
+; on one path is kept.
+
+; DEDUP:  DESAN Removed Redundant Checks: 3
+; ENGINE: DESAN Removed Redundant Checks: 0
+
+declare void @__msan_warning_noreturn()
+declare void @__msan_maybe_warning_4(i32, i32)
+declare void @use(i32)
+
+; DEDUP-LABEL:  define void @same_shadow(
+; DEDUP:          call void @__msan_warning_noreturn()
+; DEDUP-NOT:      call void @__msan_
+; DEDUP:          ret void
+; ENGINE-LABEL: define void @same_shadow(
+; ENGINE:         call void @__msan_warning_noreturn()
+; ENGINE:         call void @__msan_warning_noreturn()
+define void @same_shadow(i32 %x, i32 %sx, i32 %sy) {
+entry:
+  %s1 = or i32 %sy, %sx
+  %t1 = icmp ne i32 %s1, 0
+  br i1 %t1, label %warn1, label %ok1
+
+warn1:
+  call void @__msan_warning_noreturn()
+  unreachable
+
+ok1:
+  call void @use(i32 %x)
+  %s2 = or i32 %sx, %sy
+  %t2 = icmp ne i32 %s2, 0
+  br i1 %t2, label %warn2, label %ok2
+
+warn2:
+  call void @__msan_warning_noreturn()
+  unreachable
+
+ok2:
+  call void @use(i32 %x)
+  ret void
+}
+
+; DEDUP-LABEL:  define void @or_covers_leaf(
+; DEDUP:          call void @__msan_warning_noreturn()
+; DEDUP-NOT:      call void @__msan_
+; DEDUP:          ret void
+; ENGINE-LABEL: define void @or_covers_leaf(
+; ENGINE:         call void @__msan_maybe_warning_4(i32 %sx, i32 0)
+define void @or_covers_leaf(i32 %x, i32 %sx, i32 %sy) {
+entry:
+  %s = or i32 %sy, %sx
+  %t = icmp ne i32 %s, 0
+  br i1 %t, label %warn, label %ok
+
+warn:
+  call void @__msan_warning_noreturn()
+  unreachable
+
+ok:
+  call void @use(i32 %x)
+  call void @__msan_maybe_warning_4(i32 %sx, i32 0)
+  call void @use(i32 %x)
+  ret void
+}
+
+; DEDUP-LABEL:  define void @or_of_tested(
+; DEDUP:          call void @__msan_warning_noreturn()
+; DEDUP:          call void @__msan_maybe_warning_4(i32 %sy, i32 0)
+; DEDUP-NOT:      call void @__msan_
+; DEDUP:          ret void
+; ENGINE-LABEL: define void @or_of_tested(
+; ENGINE:         call void @__msan_maybe_warning_4(i32 %sy, i32 0)
+; ENGINE:         call void @__msan_warning_noreturn()
+define void @or_of_tested(i32 %x, i32 %sx, i32 %sy, i32 %sz) {
+entry:
+  %s1 = or i32 %sz, %sx
+  %t1 = icmp ne i32 %s1, 0
+  br i1 %t1, label %warn1, label %ok1
+
+warn1:
+  call void @__msan_warning_noreturn()
+  unreachable
+
+ok1:
+  call void @use(i32 %x)
+  call void @__msan_maybe_warning_4(i32 %sy, i32 0)
+  call void @use(i32 %x)
+  %s2 = or i32 %sx, %sy
+  %t2 = icmp ne i32 %s2, 0
+  br i1 %t2, label %warn2, label %ok2
+
+warn2:
+  call void @__msan_warning_noreturn()
+  unreachable
+
+ok2:
+  call void @use(i32 %x)
+  ret void
+}
+
+; DEDUP-LABEL:  define void @not_dominated(
+; DEDUP:        then:
+; DEDUP-NEXT:     call void @__msan_maybe_warning_4(i32 %sx, i32 0)
+; DEDUP:        warn:
+; DEDUP-NEXT:     call void @__msan_warning_noreturn()
+define void @not_dominated(i32 %x, i32 %sx, i32 %sy, i1 %c) {
+entry:
+  br i1 %c, label %then, label %join
+
+then:
+  call void @__msan_maybe_warning_4(i32 %sx, i32 0)
+  call void @use(i32 %x)
+  br label %join
+
+join:
+  %s = or i32 %sy, %sx
+  %t = icmp ne i32 %s, 0
+  br i1 %t, label %warn, label %ok
+
+warn:
+  call void @__msan_warning_noreturn()
+  unreachable
+
+ok:
+  call void @use(i32 %x)
+  ret void
+}
@@ -0,0 +1,170 @@
+; RUN: opt -load-pass-plugin=%plugin -passes=desan-collect-checks -desan-core-top-n=0 -desan-core-min-ratio=0 -desan-elimination-engine=dominator -desan-prune-msan-param-shadows -S %s -o - 2>&1 | FileCheck %s
+
+; Every caller of @mid stores a zero argument shadow, and @mid forwards it
+; to @leaf, so the warnings on both the argument and @leaf's return shadow
+; go, followed by the TLS traffic nobody reads any more. An address-taken
+; or external function may have unseen callers and keeps its warning. One
+; caller passing a possibly poisoned shadow keeps @maybe_poisoned's warning
+; and the stores of every caller. The dominator engine keeps the order
+; engine from pairing warnings across functions through the shared TLS.
+
+; CHECK:      DESAN Removed Redundant Checks: 0
+; CHECK-NEXT: DESAN Removed Clean-Shadow MSan Checks: 2
+; CHECK-NEXT: DESAN Removed Param/Retval Shadow Accesses: 8
+
+@__msan_param_tls = external thread_local(initialexec) global [100 x i64]
+@__msan_retval_tls = external thread_local(initialexec) global [100 x i64]
+@fp = global ptr null
+
+declare void @__msan_warning_noreturn()
+declare void @use(i32)
+
+; CHECK-LABEL: define internal i32 @leaf(
+; CHECK-NEXT:  entry:
+; CHECK-NEXT:    call void @use(i32 %x)
+; CHECK-NEXT:    ret i32 %x
+define internal i32 @leaf(i32 %x) sanitize_memory {
+entry:
+  %sx = load i32, ptr @__msan_param_tls, align 8
+  %c = icmp ne i32 %sx, 0
+  br i1 %c, label %warn, label %ok
+
+warn:
+  call void @__msan_warning_noreturn()
+  unreachable
+
+ok:
+  call void @use(i32 %x)
+  store i32 0, ptr @__msan_retval_tls, align 8
+  ret i32 %x
+}
+
+; CHECK-LABEL: define internal i32 @mid(
+; CHECK-NEXT:  entry:
+; CHECK-NEXT:    %r = call i32 @leaf(i32 %x)
+; CHECK-NEXT:    call void @use(i32 %r)
+; CHECK-NEXT:    ret i32 %r
+define internal i32 @mid(i32 %x) sanitize_memory {
+entry:
+  %sx = load i32, ptr @__msan_param_tls, align 8
+  store i32 %sx, ptr @__msan_param_tls, align 8
+  store i32 0, ptr @__msan_retval_tls, align 8
+  %r = call i32 @leaf(i32 %x)
+  %rs = load i32, ptr @__msan_retval_tls, align 8
+  %c = icmp ne i32 %rs, 0
+  br i1 %c, label %warn, label %ok
+
+warn:
+  call void @__msan_warning_noreturn()
+  unreachable
+
+ok:
+  call void @use(i32 %r)
+  store i32 0, ptr @__msan_retval_tls, align 8
+  ret i32 %r
+}
+
+; CHECK-LABEL: define i32 @clean_chain(
+; CHECK-NEXT:  entry:
+; CHECK-NEXT:    %r = call i32 @mid(i32 %a)
+; CHECK-NEXT:    store i32 0, ptr @__msan_retval_tls
+; CHECK-NEXT:    ret i32 %r
+define i32 @clean_chain(i32 %a) sanitize_memory {
+entry:
+  store i32 0, ptr @__msan_param_tls, align 8
+  store i32 0, ptr @__msan_retval_tls, align 8
+  %r = call i32 @mid(i32 %a)
+  %rs = load i32, ptr @__msan_retval_tls, align 8
+  store i32 %rs, ptr @__msan_retval_tls, align 8
+  ret i32 %r
+}
+
+; CHECK-LABEL: define internal void @address_taken(
+; CHECK:         call void @__msan_warning_noreturn()
+define internal void @address_taken(i32 %x) sanitize_memory {
+entry:
+  %sx = load i32, ptr @__msan_param_tls, align 8
+  %c = icmp ne i32 %sx, 0
+  br i1 %c, label %warn, label %ok
+
+warn:
+  call void @__msan_warning_noreturn()
+  unreachable
+
+ok:
+  call void @use(i32 %x)
+  ret void
+}
+
+; CHECK-LABEL: define void @external(
+; CHECK:         call void @__msan_warning_noreturn()
+define void @external(i32 %x) sanitize_memory {
+entry:
+  %sx = load i32, ptr @__msan_param_tls, align 8
+  %c = icmp ne i32 %sx, 0
+  br i1 %c, label %warn, label %ok
+
+warn:
+  call void @__msan_warning_noreturn()
+  unreachable
+
+ok:
+  call void @use(i32 %x)
+  ret void
+}
+
+; CHECK-LABEL: define void @exposed_callers(
+; CHECK:         store i32 0, ptr @__msan_param_tls
+; CHECK-NEXT:    call void @address_taken(i32 %a)
+; CHECK-NEXT:    store i32 0, ptr @__msan_param_tls
+; CHECK-NEXT:    call void @external(i32 %a)
+define void @exposed_callers(i32 %a) sanitize_memory {
+entry:
+  store ptr @address_taken, ptr @fp, align 8
+  store i32 0, ptr @__msan_param_tls, align 8
+  call void @address_taken(i32 %a)
+  store i32 0, ptr @__msan_param_tls, align 8
+  call void @external(i32 %a)
+  ret void
+}
+
+; CHECK-LABEL: define internal void @maybe_poisoned(
+; CHECK:         call void @__msan_warning_noreturn()
+define internal void @maybe_poisoned(i32 %x) sanitize_memory {
+entry:
+  %sx = load i32, ptr @__msan_param_tls, align 8
+  %c = icmp ne i32 %sx, 0
+  br i1 %c, label %warn, label %ok
+
+warn:
+  call void @__msan_warning_noreturn()
+  unreachable
+
+ok:
+  call void @use(i32 %x)
+  ret void
+}
+
+; CHECK-LABEL: define void @clean_caller(
+; CHECK-NEXT:  entry:
+; CHECK-NEXT:    store i32 0, ptr @__msan_param_tls
+; CHECK-NEXT:    call void @maybe_poisoned(i32 %a)
+define void @clean_caller(i32 %a) sanitize_memory {
+entry:
+  store i32 0, ptr @__msan_param_tls, align 8
+  call void @maybe_poisoned(i32 %a)
+  ret void
+}
+
+; CHECK-LABEL: define void @poisoned_caller(
+; CHECK-NEXT:  entry:
+; CHECK-NEXT:    %sa = load i32, ptr @__msan_param_tls
+; CHECK-NEXT:    store i32 %sa, ptr @__msan_param_tls
+; CHECK-NEXT:    call void @maybe_poisoned(i32 %a)
+define void @poisoned_caller(i32 %a) sanitize_memory {
+entry:
+  %sa = load i32, ptr @__msan_param_tls, align 8
+  store i32 %sa, ptr @__msan_param_tls, align 8
+  call void @maybe_poisoned(i32 %a)
+  ret void
+}
@@ -0,0 +1,89 @@
+; RUN: opt -load-pass-plugin=%plugin -passes=desan-collect-checks -desan-core-top-n=0 -desan-core-min-ratio=0 -desan-eliminate-redundant-writes -S %s -o - 2>&1 | FileCheck %s
+
+; A WRITE check is removed when a dominating WRITE check covers its bytes.
+; Anything that may free, repoison or end the scope of the object in between
+; keeps it.
+
+; CHECK:      DESAN Removed Redundant Checks: 1
+; CHECK-NEXT: DESAN Removed Redundant WRITE Checks: 1
+
+declare void @__asan_store4(i64)
+declare void @__asan_poison_stack_memory(i64, i64)
+declare void @free(ptr)
+declare void @llvm.lifetime.start.p0(i64, ptr nocapture)
+declare void @llvm.lifetime.end.p0(i64, ptr nocapture)
+
+; CHECK-LABEL: define void @dominated(
+; CHECK:         call void @__asan_store4(i64 %addr)
+; CHECK-NOT:     call void @__asan_store4
+; CHECK:         ret void
+define void @dominated(ptr %p) {
+entry:
+  %addr = ptrtoint ptr %p to i64
+  call void @__asan_store4(i64 %addr)
+  store i32 0, ptr %p, align 4
+  call void @__asan_store4(i64 %addr)
+  store i32 1, ptr %p, align 4
+  ret void
+}
+
+; CHECK-LABEL: define void @freed(
+; CHECK:         call void @free(ptr %p)
+; CHECK-NEXT:    call void @__asan_store4(i64 %addr)
+define void @freed(ptr %p) {
+entry:
+  %addr = ptrtoint ptr %p to i64
+  call void @__asan_store4(i64 %addr)
+  store i32 0, ptr %p, align 4
+  call void @free(ptr %p)
+  call void @__asan_store4(i64 %addr)
+  store i32 1, ptr %p, align 4
+  ret void
+}
+
+; CHECK-LABEL: define void @freed_through_slot(
+; CHECK:         call void @free(ptr %r)
+; CHECK-NEXT:    call void @__asan_store4(i64 %addr)
+define void @freed_through_slot(ptr %p) {
+entry:
+  %p.addr = alloca ptr, align 8
+  store ptr %p, ptr %p.addr, align 8
+  %r = load ptr, ptr %p.addr, align 8
+  %addr = ptrtoint ptr %r to i64
+  call void @__asan_store4(i64 %addr)
+  store i32 0, ptr %r, align 4
+  call void @free(ptr %r)
+  call void @__asan_store4(i64 %addr)
+  store i32 1, ptr %r, align 4
+  ret void
+}
+
+; CHECK-LABEL: define void @out_of_scope(
+; CHECK:         call void @llvm.lifetime.end.p0(i64 4, ptr %slot)
+; CHECK-NEXT:    call void @__asan_store4(i64 %addr)
+define void @out_of_scope() {
+entry:
+  %slot = alloca i32, align 4
+  %addr = ptrtoint ptr %slot to i64
+  call void @llvm.lifetime.start.p0(i64 4, ptr %slot)
+  call void @__asan_store4(i64 %addr)
+  store volatile i32 0, ptr %slot, align 4
+  call void @llvm.lifetime.end.p0(i64 4, ptr %slot)
+  call void @__asan_store4(i64 %addr)
+  store volatile i32 1, ptr %slot, align 4
+  ret void
+}
+
+; CHECK-LABEL: define void @poisoned(
+; CHECK:         call void @__asan_poison_stack_memory(i64 %addr, i64 4)
+; CHECK-NEXT:    call void @__asan_store4(i64 %addr)
+define void @poisoned(ptr %p) {
+entry:
+  %addr = ptrtoint ptr %p to i64
+  call void @__asan_store4(i64 %addr)
+  store i32 0, ptr %p, align 4
+  call void @__asan_poison_stack_memory(i64 %addr, i64 4)
+  call void @__asan_store4(i64 %addr)
+  store i32 1, ptr %p, align 4
+  ret void
+}
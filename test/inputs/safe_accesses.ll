@@ -0,0 +1,135 @@
+; RUN: opt -load-pass-plugin=%plugin -passes=desan-collect-checks -desan-core-top-n=0 -desan-core-min-ratio=0 -desan-eliminate-safe-accesses -S %s -o - 2>&1 | FileCheck %s
+
+; A check at a constant offset inside a static alloca or an instrumented
+; global is removed on its own and kept out of the redundant-check count.
+; An access past the end, an alloca with lifetime markers and an ASan frame
+; whose shadow is written through its integer address all keep their check.
+; An offset added to the integer address counts only when it is constant.
+
+; CHECK:      DESAN Removed Redundant Checks: 0
+; CHECK-NEXT: DESAN Removed Statically Safe Checks: 3
+
+@g = global { [4 x i32], [16 x i8] } zeroinitializer, align 32
+
+declare void @__asan_load4(i64)
+declare void @__asan_store4(i64)
+declare void @__asan_report_load4(i64)
+declare void @__asan_report_store4(i64)
+declare void @llvm.lifetime.start.p0(i64, ptr)
+declare void @llvm.lifetime.end.p0(i64, ptr)
+declare void @use(ptr)
+
+; CHECK-LABEL: define i32 @in_bounds_alloca(
+; CHECK-NOT:     call void @__asan_
+; CHECK:         ret i32 %v
+define i32 @in_bounds_alloca() {
+entry:
+  %buf = alloca [4 x i32], align 4
+  %p = getelementptr inbounds [4 x i32], ptr %buf, i64 0, i64 3
+  %a = ptrtoint ptr %p to i64
+  call void @__asan_store4(i64 %a)
+  store i32 1, ptr %p, align 4
+  call void @use(ptr %buf)
+  %v = load i32, ptr %p, align 4
+  ret i32 %v
+}
+
+; CHECK-LABEL: define i32 @in_bounds_global(
+; CHECK-NOT:     call void @__asan_
+; CHECK:         ret i32 %v
+define i32 @in_bounds_global() {
+entry:
+  %p = getelementptr inbounds [4 x i32], ptr @g, i64 0, i64 3
+  %a = ptrtoint ptr %p to i64
+  call void @__asan_load4(i64 %a)
+  %v = load i32, ptr %p, align 4
+  ret i32 %v
+}
+
+; The redzone of @g is not part of the object.
+; CHECK-LABEL: define i32 @past_global_end(
+; CHECK:         call void @__asan_load4(i64 %a)
+define i32 @past_global_end() {
+entry:
+  %p = getelementptr i8, ptr @g, i64 16
+  %a = ptrtoint ptr %p to i64
+  call void @__asan_load4(i64 %a)
+  %v = load i32, ptr %p, align 4
+  ret i32 %v
+}
+
+; CHECK-LABEL: define i32 @scoped_alloca(
+; CHECK:         call void @__asan_store4(i64 %a)
+define i32 @scoped_alloca() {
+entry:
+  %buf = alloca i32, align 4
+  call void @llvm.lifetime.start.p0(i64 4, ptr %buf)
+  %a = ptrtoint ptr %buf to i64
+  call void @__asan_store4(i64 %a)
+  store i32 1, ptr %buf, align 4
+  call void @use(ptr %buf)
+  %v = load i32, ptr %buf, align 4
+  call void @llvm.lifetime.end.p0(i64 4, ptr %buf)
+  ret i32 %v
+}
+
+; CHECK-LABEL: define i32 @poisoned_frame(
+; CHECK:         call void @__asan_load4(i64 %a)
+define i32 @poisoned_frame() {
+entry:
+  %frame = alloca [64 x i8], align 32
+  %base = ptrtoint ptr %frame to i64
+  %shadow.idx = lshr i64 %base, 3
+  %shadow.int = add i64 %shadow.idx, 2147450880
+  %shadow = inttoptr i64 %shadow.int to ptr
+  store i64 -868082074056920077, ptr %shadow, align 1
+  %x = getelementptr inbounds i8, ptr %frame, i64 32
+  %a = ptrtoint ptr %x to i64
+  call void @__asan_load4(i64 %a)
+  call void @use(ptr %x)
+  %v = load i32, ptr %x, align 4
+  ret i32 %v
+}
+
+; CHECK-LABEL: define i32 @integer_offset_in_bounds(
+; CHECK-NOT:     call void @__asan_
+; CHECK:         ret i32 %v
+define i32 @integer_offset_in_bounds() {
+entry:
+  %buf = alloca [4 x i32], align 4
+  call void @use(ptr %buf)
+  %base = ptrtoint ptr %buf to i64
+  %a = add i64 %base, 12
+  call void @__asan_load4(i64 %a)
+  %p = inttoptr i64 %a to ptr
+  %v = load i32, ptr %p, align 4
+  ret i32 %v
+}
+
+; CHECK-LABEL: define i32 @integer_offset_past_end(
+; CHECK:         call void @__asan_load4(i64 %a)
+define i32 @integer_offset_past_end() {
+entry:
+  %buf = alloca [4 x i32], align 4
+  call void @use(ptr %buf)
+  %base = ptrtoint ptr %buf to i64
+  %a = add i64 %base, 16
+  call void @__asan_load4(i64 %a)
+  %p = inttoptr i64 %a to ptr
+  %v = load i32, ptr %p, align 4
+  ret i32 %v
+}
+
+; CHECK-LABEL: define i32 @dynamic_integer_offset(
+; CHECK:         call void @__asan_load4(i64 %a)
+define i32 @dynamic_integer_offset(i64 %i) {
+entry:
+  %buf = alloca [4 x i32], align 4
+  call void @use(ptr %buf)
+  %base = ptrtoint ptr %buf to i64
+  %a = add i64 %base, %i
+  call void @__asan_load4(i64 %a)
+  %p = inttoptr i64 %a to ptr
+  %v = load i32, ptr %p, align 4
+  ret i32 %v
+}
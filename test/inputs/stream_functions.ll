@@ -0,0 +1,48 @@
+; Streaming scopes each group to one function. A local pointer's checks never
+; span functions, so only the global's second-function READ differs: module
+; mode removes it as covered by @f's check, streaming keeps it.
+;
+; RUN: opt -load-pass-plugin=%plugin -passes=desan-collect-checks -desan-core-top-n=0 -desan-core-min-ratio=0 -desan-dump-removals -disable-output %s 2>&1 | FileCheck %s --check-prefixes=CHECK,MODULE
+; RUN: opt -load-pass-plugin=%plugin -passes=desan-collect-checks -desan-core-top-n=0 -desan-core-min-ratio=0 -desan-dump-removals -desan-stream-functions -desan-threads=4 -disable-output %s 2>&1 | FileCheck %s --check-prefixes=CHECK,STREAM
+
+; CHECK-LABEL: DESAN Redundant Read Check Candidates
+; CHECK:       Check: call void @__asan_load4(i64 %pa)
+; CHECK-NEXT:  Sanitizer: ASan
+; MODULE:      Check: call void @__asan_load4(i64 ptrtoint (ptr @g to i64))
+; STREAM-NOT:  @g
+; CHECK:       Check: call void @__asan_load4(i64 %pa)
+; CHECK-NOT:   Check:
+; MODULE:      DESAN Removed Redundant Checks: 3
+; STREAM:      DESAN Removed Redundant Checks: 2
+
+@g = global [4 x i32] zeroinitializer
+
+declare void @__asan_load4(i64)
+
+define i32 @f(ptr %p) {
+entry:
+  %pa = ptrtoint ptr %p to i64
+  call void @__asan_load4(i64 %pa)
+  %a = load i32, ptr %p, align 4
+  call void @__asan_load4(i64 %pa)
+  %b = load i32, ptr %p, align 4
+  call void @__asan_load4(i64 ptrtoint (ptr @g to i64))
+  %c = load i32, ptr @g, align 4
+  %s = add i32 %a, %b
+  %t = add i32 %s, %c
+  ret i32 %t
+}
+
+define i32 @h(ptr %p) {
+entry:
+  call void @__asan_load4(i64 ptrtoint (ptr @g to i64))
+  %c = load i32, ptr @g, align 4
+  %pa = ptrtoint ptr %p to i64
+  call void @__asan_load4(i64 %pa)
+  %a = load i32, ptr %p, align 4
+  call void @__asan_load4(i64 %pa)
+  %b = load i32, ptr %p, align 4
+  %s = add i32 %a, %b
+  %t = add i32 %s, %c
+  ret i32 %t
+}
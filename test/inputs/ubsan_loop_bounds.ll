@@ -0,0 +1,158 @@
+; RUN: opt -load-pass-plugin=%plugin -passes=desan-collect-checks -desan-core-top-n=0 -desan-core-min-ratio=0 -desan-ubsan-loop-bounds -S %s -o - 2>&1 | FileCheck %s
+
+; A bounds check whose index stays in range for the loop's whole trip count
+; is removed. One that cannot be proven is replaced by a preheader guard on
+; the first and last index, whose cloned handler reports the failing one.
+; An index recurrence that may wrap is neither proven nor guarded, and
+; neither is a check in a loop that may stop early in a call.
+
+; CHECK:      DESAN Removed Redundant Checks: 0
+; CHECK-NEXT: DESAN Removed Loop-Bounds UBSan Checks: 1
+; CHECK-NEXT: DESAN Loop-Entry Bounds Guards: 1 (replaced: 1)
+
+@d = private global { i32 } zeroinitializer
+@g = global [10 x i32] zeroinitializer
+
+declare void @__ubsan_handle_out_of_bounds(ptr, i64)
+declare void @__ubsan_handle_out_of_bounds_abort(ptr, i64)
+declare void @may_exit(i32) nofree nounwind
+
+; CHECK-LABEL: define void @proven(
+; CHECK-NOT:     call void @__ubsan_handle
+; CHECK:         ret void
+define void @proven() {
+entry:
+  br label %loop
+
+loop:
+  %i = phi i64 [ 0, %entry ], [ %inc, %cont ]
+  %ok = icmp ult i64 %i, 10, !nosanitize !0
+  br i1 %ok, label %cont, label %handler, !nosanitize !0
+
+handler:
+  call void @__ubsan_handle_out_of_bounds(ptr @d, i64 %i)
+  br label %cont
+
+cont:
+  %p = getelementptr inbounds [10 x i32], ptr @g, i64 0, i64 %i
+  store i32 0, ptr %p, align 4
+  %inc = add nuw nsw i64 %i, 1
+  %c = icmp ult i64 %inc, 10
+  br i1 %c, label %loop, label %exit
+
+exit:
+  ret void
+}
+
+; CHECK-LABEL: define void @guarded(
+; CHECK:       ph:
+; CHECK:         %desan.bounds.ok = and i1 [[FIRST:%.*]], {{%.*}}
+; CHECK-NEXT:    %desan.bounds.index = select i1 [[FIRST]], i32 {{%.*}}, i32 %s
+; CHECK-NEXT:    br i1 %desan.bounds.ok, label %ph.split, label %handler.guard
+; CHECK:       loop:
+; CHECK-NOT:     call void @__ubsan_handle
+; CHECK:       handler.guard:
+; CHECK-NEXT:    %z.guard = sext i32 %desan.bounds.index to i64
+; CHECK-NEXT:    call void @__ubsan_handle_out_of_bounds_abort(ptr @d, i64 %z.guard)
+; CHECK-NEXT:    unreachable
+define void @guarded(i32 %n, i32 %s) {
+entry:
+  %cmp0 = icmp slt i32 %s, %n
+  br i1 %cmp0, label %ph, label %exit
+
+ph:
+  br label %loop
+
+loop:
+  %i = phi i32 [ %s, %ph ], [ %inc, %cont ]
+  %ok = icmp slt i32 %i, 10, !nosanitize !0
+  br i1 %ok, label %cont, label %handler, !nosanitize !0
+
+handler:
+  %z = sext i32 %i to i64
+  call void @__ubsan_handle_out_of_bounds_abort(ptr @d, i64 %z)
+  unreachable
+
+cont:
+  %z2 = sext i32 %i to i64
+  %p = getelementptr inbounds [10 x i32], ptr @g, i64 0, i64 %z2
+  store i32 0, ptr %p, align 4
+  %inc = add nsw i32 %i, 1
+  %c = icmp slt i32 %inc, %n
+  br i1 %c, label %loop, label %exit
+
+exit:
+  ret void
+}
+
+; The i8 index may wrap past 255 before it reaches %n.
+; CHECK-LABEL: define void @may_wrap(
+; CHECK:       handler:
+; CHECK-NEXT:    %z = zext i8 %i to i64
+; CHECK-NEXT:    call void @__ubsan_handle_out_of_bounds(ptr @d, i64 %z)
+define void @may_wrap(i8 %n, i8 %s) {
+entry:
+  %cmp0 = icmp ne i8 %s, %n
+  br i1 %cmp0, label %ph, label %exit
+
+ph:
+  br label %loop
+
+loop:
+  %i = phi i8 [ %s, %ph ], [ %inc, %cont ]
+  %ok = icmp ult i8 %i, 10, !nosanitize !0
+  br i1 %ok, label %cont, label %handler, !nosanitize !0
+
+handler:
+  %z = zext i8 %i to i64
+  call void @__ubsan_handle_out_of_bounds(ptr @d, i64 %z)
+  br label %cont
+
+cont:
+  %z2 = zext i8 %i to i64
+  %p = getelementptr inbounds [10 x i32], ptr @g, i64 0, i64 %z2
+  store i32 0, ptr %p, align 4
+  %inc = add i8 %i, 1
+  %c = icmp ne i8 %inc, %n
+  br i1 %c, label %loop, label %exit
+
+exit:
+  ret void
+}
+
+; CHECK-LABEL: define void @may_not_return(
+; CHECK:       handler:
+; CHECK-NEXT:    %z = sext i32 %i to i64
+; CHECK-NEXT:    call void @__ubsan_handle_out_of_bounds_abort(ptr @d, i64 %z)
+define void @may_not_return(i32 %n, i32 %s) {
+entry:
+  %cmp0 = icmp slt i32 %s, %n
+  br i1 %cmp0, label %ph, label %exit
+
+ph:
+  br label %loop
+
+loop:
+  %i = phi i32 [ %s, %ph ], [ %inc, %cont ]
+  %ok = icmp slt i32 %i, 10, !nosanitize !0
+  br i1 %ok, label %cont, label %handler, !nosanitize !0
+
+handler:
+  %z = sext i32 %i to i64
+  call void @__ubsan_handle_out_of_bounds_abort(ptr @d, i64 %z)
+  unreachable
+
+cont:
+  %z2 = sext i32 %i to i64
+  %p = getelementptr inbounds [10 x i32], ptr @g, i64 0, i64 %z2
+  store i32 0, ptr %p, align 4
+  call void @may_exit(i32 %i)
+  %inc = add nsw i32 %i, 1
+  %c = icmp slt i32 %inc, %n
+  br i1 %c, label %loop, label %exit
+
+exit:
+  ret void
+}
+
+!0 = !{}
@@ -0,0 +1,118 @@
+; RUN: opt -load-pass-plugin=%plugin -passes=desan-collect-checks -desan-core-top-n=0 -desan-core-min-ratio=0 -desan-eliminate-range-safe-ubsan -S %s -o - 2>&1 | FileCheck %s
+
+; A UBSan handler is removed when value ranges prove that no branch into it
+; is ever taken: a shift amount already masked to the type width, and
+; overflow intrinsics whose operand ranges, also under a dominating guard,
+; cannot wrap. Handlers the ranges leave reachable are kept.
+
+; CHECK:      DESAN Removed Redundant Checks: 0
+; CHECK-NEXT: DESAN Removed Range-Proven UBSan Checks: 3
+
+@d = private global { i32 } zeroinitializer
+
+declare void @__ubsan_handle_shift_out_of_bounds(ptr, i64, i64)
+declare void @__ubsan_handle_add_overflow(ptr, i64, i64)
+declare void @__ubsan_handle_mul_overflow_abort(ptr, i64, i64)
+declare { i32, i1 } @llvm.sadd.with.overflow.i32(i32, i32)
+declare { i32, i1 } @llvm.smul.with.overflow.i32(i32, i32)
+
+; CHECK-LABEL: define i32 @shift_masked(
+; CHECK-NOT:     call void @__ubsan_handle_
+; CHECK:         ret i32
+define i32 @shift_masked(i32 %x, i32 %y) {
+entry:
+  %m = and i32 %y, 31
+  %ok = icmp ule i32 %m, 31, !nosanitize !0
+  br i1 %ok, label %cont, label %handler, !nosanitize !0
+handler:
+  %a = zext i32 %x to i64
+  %b = zext i32 %m to i64
+  call void @__ubsan_handle_shift_out_of_bounds(ptr @d, i64 %a, i64 %b)
+  br label %cont
+cont:
+  %r = shl i32 %x, %m
+  ret i32 %r
+}
+
+; CHECK-LABEL: define i32 @shift_unknown(
+; CHECK:         call void @__ubsan_handle_
+define i32 @shift_unknown(i32 %x, i32 %y) {
+entry:
+  %ok = icmp ule i32 %y, 31, !nosanitize !0
+  br i1 %ok, label %cont, label %handler, !nosanitize !0
+handler:
+  %a = zext i32 %x to i64
+  %b = zext i32 %y to i64
+  call void @__ubsan_handle_shift_out_of_bounds(ptr @d, i64 %a, i64 %b)
+  br label %cont
+cont:
+  %r = shl i32 %x, %y
+  ret i32 %r
+}
+
+; CHECK-LABEL: define i32 @add_small(
+; CHECK-NOT:     call void @__ubsan_handle_
+; CHECK:         ret i32
+define i32 @add_small(i8 %x, i8 %y) {
+entry:
+  %a = zext i8 %x to i32
+  %b = zext i8 %y to i32
+  %s = call { i32, i1 } @llvm.sadd.with.overflow.i32(i32 %a, i32 %b)
+  %v = extractvalue { i32, i1 } %s, 0
+  %o = extractvalue { i32, i1 } %s, 1
+  %n = xor i1 %o, true, !nosanitize !0
+  br i1 %n, label %cont, label %handler, !nosanitize !0
+handler:
+  %ha = zext i32 %a to i64
+  %hb = zext i32 %b to i64
+  call void @__ubsan_handle_add_overflow(ptr @d, i64 %ha, i64 %hb)
+  br label %cont
+cont:
+  ret i32 %v
+}
+
+; CHECK-LABEL: define i32 @mul_big(
+; CHECK:         call void @__ubsan_handle_
+define i32 @mul_big(i32 %x, i16 %y) {
+entry:
+  %b = zext i16 %y to i32
+  %s = call { i32, i1 } @llvm.smul.with.overflow.i32(i32 %x, i32 %b)
+  %v = extractvalue { i32, i1 } %s, 0
+  %o = extractvalue { i32, i1 } %s, 1
+  %n = xor i1 %o, true, !nosanitize !0
+  br i1 %n, label %cont, label %handler, !nosanitize !0
+handler:
+  %ha = zext i32 %x to i64
+  %hb = zext i32 %b to i64
+  call void @__ubsan_handle_mul_overflow_abort(ptr @d, i64 %ha, i64 %hb)
+  unreachable
+cont:
+  ret i32 %v
+}
+
+; CHECK-LABEL: define i32 @guarded(
+; CHECK-NOT:     call void @__ubsan_handle_
+; CHECK:         ret i32
+define i32 @guarded(i32 %x, i32 %y) {
+entry:
+  %small = icmp ult i32 %x, 1000
+  br i1 %small, label %body, label %exit
+body:
+  %y2 = and i32 %y, 1023
+  %s = call { i32, i1 } @llvm.smul.with.overflow.i32(i32 %x, i32 %y2)
+  %v = extractvalue { i32, i1 } %s, 0
+  %o = extractvalue { i32, i1 } %s, 1
+  %n = xor i1 %o, true, !nosanitize !0
+  br i1 %n, label %cont, label %handler, !nosanitize !0
+handler:
+  %ha = zext i32 %x to i64
+  %hb = zext i32 %y2 to i64
+  call void @__ubsan_handle_mul_overflow_abort(ptr @d, i64 %ha, i64 %hb)
+  unreachable
+cont:
+  ret i32 %v
+exit:
+  ret i32 0
+}
+
+!0 = !{}
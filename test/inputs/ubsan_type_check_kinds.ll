@@ -0,0 +1,90 @@
+; RUN: opt -load-pass-plugin=%plugin -passes=desan-collect-checks -desan-core-top-n=0 -desan-core-min-ratio=0 -desan-dump-checked-vars -S %s -o /dev/null 2>&1 | FileCheck %s
+
+; A type_mismatch check takes its access type from the TypeCheckKind in its
+; handler data, whether the data has the original layout with an i64
+; alignment or the _v1 layout with an i8 log-alignment. The checked
+; pointers are only loaded from, so only the kind can make them a WRITE or
+; UNKNOWN. A kind past the known ones falls back to the checked pointer's
+; uses, here a store.
+
+@load.v1 = private global { { ptr, i32, i32 }, ptr, i8, i8 } { { ptr, i32, i32 } zeroinitializer, ptr null, i8 2, i8 0 }
+@store.v1 = private global { { ptr, i32, i32 }, ptr, i8, i8 } { { ptr, i32, i32 } zeroinitializer, ptr null, i8 2, i8 1 }
+@member.call.v1 = private global { { ptr, i32, i32 }, ptr, i8, i8 } { { ptr, i32, i32 } zeroinitializer, ptr null, i8 2, i8 4 }
+@load.orig = private global { { ptr, i32, i32 }, ptr, i64, i8 } { { ptr, i32, i32 } zeroinitializer, ptr null, i64 4, i8 0 }
+@store.orig = private global { { ptr, i32, i32 }, ptr, i64, i8 } { { ptr, i32, i32 } zeroinitializer, ptr null, i64 4, i8 1 }
+@out.of.range.v1 = private global { { ptr, i32, i32 }, ptr, i8, i8 } { { ptr, i32, i32 } zeroinitializer, ptr null, i8 2, i8 12 }
+
+declare void @__ubsan_handle_type_mismatch_v1(ptr, i64)
+declare void @__ubsan_handle_type_mismatch(ptr, i64)
+
+; CHECK-LABEL: Function: load_v1
+; CHECK-NEXT:  Check Type: __ubsan_handle_type_mismatch_v1
+; CHECK-NEXT:  Sanitizer: UBSan
+; CHECK-NEXT:  Access Type: READ
+define i32 @load_v1(ptr %p) {
+entry:
+  %addr = ptrtoint ptr %p to i64
+  call void @__ubsan_handle_type_mismatch_v1(ptr @load.v1, i64 %addr)
+  %v = load i32, ptr %p, align 4
+  ret i32 %v
+}
+
+; CHECK-LABEL: Function: store_v1
+; CHECK-NEXT:  Check Type: __ubsan_handle_type_mismatch_v1
+; CHECK-NEXT:  Sanitizer: UBSan
+; CHECK-NEXT:  Access Type: WRITE
+define i32 @store_v1(ptr %p) {
+entry:
+  %addr = ptrtoint ptr %p to i64
+  call void @__ubsan_handle_type_mismatch_v1(ptr @store.v1, i64 %addr)
+  %v = load i32, ptr %p, align 4
+  ret i32 %v
+}
+
+; CHECK-LABEL: Function: member_call_v1
+; CHECK-NEXT:  Check Type: __ubsan_handle_type_mismatch_v1
+; CHECK-NEXT:  Sanitizer: UBSan
+; CHECK-NEXT:  Access Type: UNKNOWN
+define i32 @member_call_v1(ptr %p) {
+entry:
+  %addr = ptrtoint ptr %p to i64
+  call void @__ubsan_handle_type_mismatch_v1(ptr @member.call.v1, i64 %addr)
+  %v = load i32, ptr %p, align 4
+  ret i32 %v
+}
+
+; CHECK-LABEL: Function: load_orig
+; CHECK-NEXT:  Check Type: __ubsan_handle_type_mismatch
+; CHECK-NEXT:  Sanitizer: UBSan
+; CHECK-NEXT:  Access Type: READ
+define i32 @load_orig(ptr %p) {
+entry:
+  %addr = ptrtoint ptr %p to i64
+  call void @__ubsan_handle_type_mismatch(ptr @load.orig, i64 %addr)
+  %v = load i32, ptr %p, align 4
+  ret i32 %v
+}
+
+; CHECK-LABEL: Function: store_orig
+; CHECK-NEXT:  Check Type: __ubsan_handle_type_mismatch
+; CHECK-NEXT:  Sanitizer: UBSan
+; CHECK-NEXT:  Access Type: WRITE
+define i32 @store_orig(ptr %p) {
+entry:
+  %addr = ptrtoint ptr %p to i64
+  call void @__ubsan_handle_type_mismatch(ptr @store.orig, i64 %addr)
+  %v = load i32, ptr %p, align 4
+  ret i32 %v
+}
+
+; CHECK-LABEL: Function: out_of_range_v1
+; CHECK-NEXT:  Check Type: __ubsan_handle_type_mismatch_v1
+; CHECK-NEXT:  Sanitizer: UBSan
+; CHECK-NEXT:  Access Type: WRITE
+define void @out_of_range_v1(ptr %p) {
+entry:
+  %addr = ptrtoint ptr %p to i64
+  call void @__ubsan_handle_type_mismatch_v1(ptr @out.of.range.v1, i64 %addr)
+  store i32 0, ptr %p, align 4
+  ret void
+}
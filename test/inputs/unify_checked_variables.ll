@@ -0,0 +1,67 @@
+; RUN: opt -load-pass-plugin=%plugin -passes=desan-collect-checks -desan-core-top-n=0 -desan-core-min-ratio=0 -desan-unify-checked-variables -desan-dump-check-graphs -S %s -o - 2>&1 | FileCheck %s --check-prefix=UNIFY
+; RUN: opt -load-pass-plugin=%plugin -passes=desan-collect-checks -desan-core-top-n=0 -desan-core-min-ratio=0 -S %s -o - 2>&1 | FileCheck %s --check-prefix=SLOT
+
+; -O0 style IR reloads every pointer from its stack slot. A reload joins the
+; pointer stored in the slot, so the second check of @reload_merges is
+; redundant. When the slot is reassigned between reloads, each reload keys
+; on the object it reaches and both checks of @reassigned_stays_apart stay.
+
+; UNIFY:      Base: %p
+; UNIFY-NEXT: Offsets: <none>
+; UNIFY-NEXT: Region Start: static-offset=<unknown>
+; UNIFY-NEXT: Node Count: 2
+; UNIFY:      Base: %p
+; UNIFY-NEXT: Offsets: <none>
+; UNIFY-NEXT: Region Start: static-offset=<unknown>
+; UNIFY-NEXT: Node Count: 1
+; UNIFY:      Base: %q
+; UNIFY-NEXT: Offsets: <none>
+; UNIFY-NEXT: Region Start: static-offset=<unknown>
+; UNIFY-NEXT: Node Count: 1
+; UNIFY:      DESAN Removed Redundant Checks: 1
+
+declare void @__asan_load4(i64)
+declare void @__asan_report_load4(i64)
+
+; UNIFY-LABEL: define i32 @reload_merges(
+; UNIFY:         call void @__asan_load4(i64 %a0)
+; UNIFY-NOT:     call void @__asan_load4
+; UNIFY:         ret i32 %s
+; SLOT-LABEL:  define i32 @reload_merges(
+; SLOT:          call void @__asan_load4(i64 %a0)
+; SLOT:          call void @__asan_load4(i64 %a1)
+define i32 @reload_merges(ptr %p) {
+entry:
+  %p.addr = alloca ptr, align 8
+  store ptr %p, ptr %p.addr, align 8
+  %a0 = ptrtoint ptr %p to i64
+  call void @__asan_load4(i64 %a0)
+  %v0 = load i32, ptr %p, align 4
+  %r = load ptr, ptr %p.addr, align 8
+  %a1 = ptrtoint ptr %r to i64
+  call void @__asan_load4(i64 %a1)
+  %v1 = load i32, ptr %r, align 4
+  %s = add i32 %v0, %v1
+  ret i32 %s
+}
+
+; UNIFY-LABEL: define i32 @reassigned_stays_apart(
+; UNIFY:         call void @__asan_load4(i64 %a0)
+; UNIFY:         store ptr %q, ptr %p.addr
+; UNIFY:         call void @__asan_load4(i64 %a1)
+define i32 @reassigned_stays_apart(ptr %p, ptr %q) {
+entry:
+  %p.addr = alloca ptr, align 8
+  store ptr %p, ptr %p.addr, align 8
+  %r0 = load ptr, ptr %p.addr, align 8
+  %a0 = ptrtoint ptr %r0 to i64
+  call void @__asan_load4(i64 %a0)
+  %v0 = load i32, ptr %r0, align 4
+  store ptr %q, ptr %p.addr, align 8
+  %r1 = load ptr, ptr %p.addr, align 8
+  %a1 = ptrtoint ptr %r1 to i64
+  call void @__asan_load4(i64 %a1)
+  %v1 = load i32, ptr %r1, align 4
+  %s = add i32 %v0, %v1
+  ret i32 %s
+}
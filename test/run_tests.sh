@@ -0,0 +1,46 @@
+#!/usr/bin/env bash
+
+# Runs the "; RUN:" lines of every test/inputs/*.ll in the style of lit:
+# %s is the input file and %plugin the pass plugin. Each line runs under
+# bash with pipefail, so a FileCheck mismatch or an opt failure fails the
+# test.
+
+set -uo pipefail
+
+ROOT_DIR="$(cd "$(dirname "${BASH_SOURCE[0]}")/.." && pwd)"
+LLVM_CONFIG="${LLVM_CONFIG:-llvm-config}"
+LLVM_BINDIR="$("${LLVM_CONFIG}" --bindir 2>/dev/null || true)"
+OPT="${OPT:-opt}"
+PLUGIN="${PLUGIN:-${ROOT_DIR}/build/DESANPass.so}"
+if [[ -z "${FILECHECK:-}" ]]; then
+  FILECHECK=FileCheck
+  if [[ -n "${LLVM_BINDIR}" && -x "${LLVM_BINDIR}/FileCheck" ]]; then
+    FILECHECK="${LLVM_BINDIR}/FileCheck"
+  fi
+fi
+
+opt() { ${OPT} "$@"; }
+FileCheck() { ${FILECHECK} "$@"; }
+export -f opt FileCheck
+export OPT FILECHECK
+
+failed=0
+total=0
+for input in "${ROOT_DIR}"/test/inputs/*.ll; do
+  name="${input#"${ROOT_DIR}/"}"
+  while IFS= read -r line; do
+    command="${line#*RUN: }"
+    command="${command//%plugin/${PLUGIN}}"
+    command="${command//%s/${input}}"
+    total=$((total + 1))
+    if ! output="$(bash -o pipefail -c "${command}" 2>&1)"; then
+      failed=$((failed + 1))
+      echo "FAIL: ${name}"
+      echo "  ${command}"
+      printf '%s\n' "${output}" | sed 's/^/  /'
+    fi
+  done < <(grep '^; RUN: ' "${input}")
+done
+
+echo "${total} RUN lines, ${failed} failed"
+[[ "${failed}" -eq 0 ]]